@@ -267,14 +267,22 @@ class ClientMessage(ClientBase):
         response= self.postRequest(ServerRequest.prepareRequest(fields, []))
         return response
 
-    def statusRequest(self, project):
+    def statusRequest(self, project, cmdOffset=None, cmdLimit=None):
         """Fetches an aggregated general information about the server and
-           and its projects. The argument project is optional"""
+           and its projects. The argument project is optional. If cmdLimit
+           is set, the queued and running commands are listed, starting at
+           cmdOffset and with at most cmdLimit commands per list; if it is
+           0, only the numbers of commands are sent. If it is None, all 
+           commands are listed."""
         cmdstring="status"
         fields = []
         fields.append(Input('cmd', cmdstring))
         if project is not None:
             fields.append(Input('project', project))
+        if cmdLimit is not None:
+            fields.append(Input('cmd_limit', str(cmdLimit)))
+            if cmdOffset is not None:
+                fields.append(Input('cmd_offset', str(cmdOffset)))
         fields.append(Input('version', "1"))
         response= self.postRequest(ServerRequest.prepareRequest(fields, []))
         return response
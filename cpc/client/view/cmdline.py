@@ -653,6 +653,34 @@ class CmdLine(object):
                     "       you can see which ones with the command \"cpcc connected-servers\"\n"
                      %(("is" if network['not_connected_local_servers']==1 else "are"),network['not_connected_local_servers'],"s"[network['not_connected_local_servers']==1:]))
 
+        # dataflow task execution: the functions that take most time first
+        if 'task_exec' in message['data']:
+            task_exec = message['data']['task_exec']
+            co.write("Task execution (%d thread%s):\n"%(
+                     task_exec['threads'], "s"[task_exec['threads']==1:]))
+            fns = sorted(task_exec['functions'].iteritems(),
+                         key=lambda x: x[1]['run_avg']*x[1]['count'],
+                         reverse=True)
+            for fn_name, st in fns[:10]:
+                co.write("   %-30.30s %6d runs, wait %.3f s (max %.3f s), "
+                         "run %.3f s (max %.3f s)\n"%(fn_name, st['count'],
+                         st['wait_avg'], st['wait_max'], st['run_avg'],
+                         st['run_max']))
+        if 'command_completion' in message['data']:
+            cc = message['data']['command_completion']
+            co.write("Finished command handling (%d thread%s): %d queued "
+                     "(max. %d, limit %d), %d handled, %d failed, "
+                     "wait %.3f s, run %.3f s\n"%(cc['threads'], 
+                     "s"[cc['threads']==1:], cc['queued'], cc['max_depth'], 
+                     cc['max_queued'], cc['handled'], cc.get('failed', 0), 
+                     cc['wait_avg'], cc['run_avg']))
+        if 'heartbeat_forward' in message['data']:
+            hf = message['data']['heartbeat_forward']
+            co.write("Heartbeat forwarding: %d heartbeats in %d requests, "
+                     "%d failed request%s, %d heartbeats retried\n"%(
+                     hf['heartbeats'], hf['requests'], hf['failed'],
+                     "s"[hf['failed']==1:], hf['retried']))
+
         # projects
         projects = message['data']['projects']
         if len(projects) == 0:
@@ -691,34 +719,44 @@ class CmdLine(object):
                     co.write("        %s get %s%s.msg.warning\n"%('cpcc', 
                                                                   projectGetStr,
                                                                   inst))
+            # state saving
+            if 'state_save' in prj_obj and len(prj_obj['state_save'])>0:
+                save=prj_obj['state_save']
+                co.write("   last state save: %s of %d bytes in %.3f s\n"%(
+                         save['type'], save['bytes'], save['time']))
             # queue
-            if True: 
-                if(len(prj_obj['queue']['queue']) > 0):
-                    co.write("   %d command%s in queue\n"%(
-                        len(prj_obj['queue']['queue']),
-                            "s"[len(prj_obj['queue']['queue'])==1:]))
-                else:
-                    co.write("   no commands in queue\n")
-                if(len(prj_obj['queue']['running']) > 0):
-                    co.write("   %d command%s running\n"%(
-                        len(prj_obj['queue']['running']),
-                        "s"[len(prj_obj['queue']['running'])==1:]))
-                else:
-                    co.write("   no commands running\n")
+            queue=prj_obj['queue']
+            num_queued=queue.get('num_queued', len(queue.get('queue', [])))
+            num_running=queue.get('num_running',
+                                  len(queue.get('running', [])))
+            if num_queued > 0:
+                co.write("   %d command%s in queue\n"%(
+                    num_queued, "s"[num_queued==1:]))
+            else:
+                co.write("   no commands in queue\n")
+            if num_running > 0:
+                co.write("   %d command%s running\n"%(
+                    num_running, "s"[num_running==1:]))
             else:
-                co.write("   Queued commands:\n")
-                if(len(prj_obj['queue']['queue']) > 0):
-                    CmdLine._listQueue(prj_obj['queue']['queue'], co, True,
+                co.write("   no commands running\n")
+            if 'offset' in queue:
+                # a command listing was requested
+                offset=queue['offset']
+                if(len(queue['queue']) > 0):
+                    co.write("   Queued commands %d-%d of %d:\n"%(
+                        offset+1, offset+len(queue['queue']), num_queued))
+                    CmdLine._listQueue(queue['queue'], co, True,
                                         custom_fmtstring=fmtstring)
                 else:
-                    co.write("      none\n")
-                co.write("   Running commands:\n")
-                if(len(prj_obj['queue']['running']) > 0):
-                    CmdLine._listQueue(prj_obj['queue']['running'], co,
-                                    len(prj_obj['queue']['queue']) == 0,
+                    co.write("   Queued commands: none\n")
+                if(len(queue['running']) > 0):
+                    co.write("   Running commands %d-%d of %d:\n"%(
+                        offset+1, offset+len(queue['running']), num_running))
+                    CmdLine._listQueue(queue['running'], co,
+                                    len(queue['queue']) == 0,
                                     custom_fmtstring=fmtstring)
                 else:
-                    co.write("      none\n")
+                    co.write("   Running commands: none\n")
         return co.getvalue()
 
     ##
@@ -196,6 +196,8 @@ class Command(cpc.server.queue.cmdqueue.QueueableItem):
             self.workerServer=workerServer
         else:
             self.workerServer=None
+        if self.task is not None:
+            self.task.getProject().getStatus().updateCommand(self)
 
     def getRunning(self):
         """Return whether the command is running."""
@@ -35,6 +35,17 @@ import logging
 log=logging.getLogger(__name__)
 
 
+def executableKey(name, minVersion, maxVersion):
+    """Get the key for an executable name and version range, as used for
+       the command queue buckets and executable lookups.
+       returns: a tuple of the name and version strings."""
+    if minVersion is not None:
+        minVersion=minVersion.getStr()
+    if maxVersion is not None:
+        maxVersion=maxVersion.getStr()
+    return (name, minVersion, maxVersion)
+
+
 class Executable(object):
     """An executable is an object that points to a platform-specific binary
        that can be executed to run a command."""
@@ -113,11 +124,13 @@ class ExecutableList(object):
     def __init__(self, list=[]):
         self.executables=list
     
-    def readDir(self, bindir, platforms):
+    def readDir(self, bindir, platforms, cache=None):
         """Read a directory (usually in the search path) for all executables.
     
             bindir = the directory name.
-            platforms = the list of availble platforms."""
+            platforms = the list of availble platforms.
+            cache = an optional ExecutableCache with the results of earlier
+                    executable plugin runs."""
         reader=ExecutableReader(bindir)
         
         try:
@@ -136,17 +149,29 @@ class ExecutableList(object):
                 # check whether this is in fact a plugin
                 if (not os.path.isdir(basedir)) and os.access(basedir, os.X_OK):
                     plf=basedir
+                    plfile=basedir
                     pl=cpc.util.plugin.ExecutablePlugin(
                                                     basedir,conf=ServerConf())
                 # or it contains a plugin
                 elif (not os.path.isdir(pfile)) and os.access(pfile, os.X_OK):
                     plf=basedir
+                    plfile=pfile
                     pl=cpc.util.plugin.ExecutablePlugin(
                                                     pfile,conf=ServerConf())
                 if pl is not None:
                     # and run the plugin if it is one
                     for platform in platforms:
-                        (retcode, retst)=pl.run(plf, platform.getName())
+                        ret=None
+                        if cache is not None:
+                            ret=cache.get(plfile, platform.getName(), plf)
+                        if ret is None:
+                            ret=pl.run(plf, platform.getName())
+                            if cache is not None:
+                                cache.put(plfile, platform.getName(), plf,
+                                          ret[0], ret[1])
+                        else:
+                            log.debug("Using cached output of %s"%plfile)
+                        (retcode, retst)=ret
                         log.debug("returned: %s"%retst)
                         if retcode==0:
                             reader.readString(retst, "executable plugin output",
@@ -0,0 +1,170 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import logging
+import os
+import re
+import shlex
+import stat
+import tempfile
+
+
+log=logging.getLogger(__name__)
+
+
+def _fileStamp(path):
+    """Get the modification time and size of a file, or None if it doesn't
+       exist."""
+    try:
+        st=os.stat(path)
+    except OSError:
+        return None
+    return [ st.st_mtime, st.st_size ]
+
+
+class ExecutableCache(object):
+    """A cache of the output of executable plugins, stored in a local file.
+
+       Running executable plugins at worker start can be slow: the gromacs
+       plugin runs every binary it finds to get its version. An entry is
+       valid as long as the plugin file, the platform name, the search path
+       and the binaries named in the plugin output have not changed."""
+    def __init__(self, filename, rescan=False):
+        """Read the cache file.
+           filename = the cache file name
+           rescan = whether to ignore the existing entries."""
+        self.filename=filename
+        self.changed=False
+        self.entries=dict()
+        if rescan or not os.path.exists(filename):
+            return
+        try:
+            fd=os.open(filename, os.O_RDONLY|getattr(os, 'O_NOFOLLOW', 0))
+            inf=os.fdopen(fd, 'r')
+            try:
+                # the cache names the binaries to run: only a file that 
+                # nobody else can have written is trusted.
+                st=os.fstat(fd)
+                if (not stat.S_ISREG(st.st_mode) or 
+                    st.st_uid != os.getuid() or 
+                    (st.st_mode & (stat.S_IWGRP|stat.S_IWOTH)) != 0):
+                    log.warning("Ignoring executable cache %s: it is not a "
+                                "file that only the current user can "
+                                "write"%filename)
+                    return
+                self.entries=json.load(inf)
+            finally:
+                inf.close()
+        except (IOError, OSError, ValueError) as e:
+            log.info("Ignoring executable cache %s: %s"%(filename, str(e)))
+            self.entries=dict()
+
+    def _key(self, pluginFile, platformName):
+        return "%s:%s"%(os.path.abspath(pluginFile), platformName)
+
+    def _searchPath(self):
+        return os.environ.get('PATH', '')
+
+    def _pathStamps(self):
+        """Get the modification times of the search path directories, so that
+           newly installed binaries are noticed."""
+        ret=dict()
+        for dirname in self._searchPath().split(os.pathsep):
+            if dirname != "":
+                ret[dirname]=_fileStamp(dirname)
+        return ret
+
+    def _findBinary(self, name, basedir):
+        """Find the file a command line refers to."""
+        if os.path.isabs(name):
+            return name
+        if os.sep not in name:
+            for dirname in self._searchPath().split(os.pathsep):
+                path=os.path.join(dirname, name)
+                if os.path.isfile(path) and os.access(path, os.X_OK):
+                    return path
+        return os.path.join(basedir, name)
+
+    def _binaryStamps(self, output, basedir):
+        """Get the binaries named in the command lines of a plugin's output,
+           with their modification times and sizes."""
+        ret=dict()
+        for cmdline in re.findall(r'cmdline="([^"]*)"', output):
+            try:
+                words=shlex.split(cmdline)
+            except ValueError:
+                continue
+            for word in words:
+                # skip variables such as $MPIRUN, and launchers
+                if word.startswith('$') or word == 'aprun':
+                    continue
+                path=self._findBinary(word, basedir)
+                ret[word]=[ path, _fileStamp(path) ]
+                break
+        return ret
+
+    def get(self, pluginFile, platformName, basedir):
+        """Get the cached output of a plugin for a platform.
+           pluginFile = the plugin executable
+           platformName = the platform name
+           basedir = the directory the plugin runs in
+           returns: a tuple of the return code and output, or None if there is
+                    no valid entry."""
+        entry=self.entries.get(self._key(pluginFile, platformName))
+        if entry is None:
+            return None
+        if (entry['plugin'] != _fileStamp(pluginFile) or
+            entry['path'] != self._searchPath() or
+            entry['path_dirs'] != self._pathStamps()):
+            return None
+        for word, (path, stamp) in entry['binaries'].iteritems():
+            newPath=self._findBinary(word, basedir)
+            if newPath != path or _fileStamp(newPath) != stamp:
+                return None
+        return (entry['retcode'], entry['output'])
+
+    def put(self, pluginFile, platformName, basedir, retcode, output):
+        """Store the output of a plugin for a platform."""
+        self.entries[self._key(pluginFile, platformName)]={
+                'plugin' : _fileStamp(pluginFile),
+                'path' : self._searchPath(),
+                'path_dirs' : self._pathStamps(),
+                'binaries' : self._binaryStamps(output, basedir),
+                'retcode' : retcode,
+                'output' : output }
+        self.changed=True
+
+    def save(self):
+        """Write the cache file if it changed."""
+        if not self.changed:
+            return
+        dirname=os.path.dirname(os.path.abspath(self.filename))
+        try:
+            fd, tmpname=tempfile.mkstemp(dir=dirname, suffix='.tmp')
+            outf=os.fdopen(fd, 'w')
+            try:
+                json.dump(self.entries, outf)
+            finally:
+                outf.close()
+            os.rename(tmpname, self.filename)
+            self.changed=False
+        except (IOError, OSError) as e:
+            log.info("Couldn't write executable cache %s: %s"%
+                     (self.filename, str(e)))
@@ -0,0 +1,155 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Content-addressed command input files.
+
+   Workers that keep an input cache report the hashes of the files in it
+   when they ask for commands. Large input files of the commands sent to
+   such a worker are then listed by content hash in a manifest, and each
+   file the worker doesn't have is sent once, as a blob named after its
+   hash. The worker links the files into the command directories from its
+   cache."""
+
+import hashlib
+import json
+import logging
+import os
+import stat
+import tarfile
+import threading
+import time
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+
+log=logging.getLogger(__name__)
+
+# the top-level directory in the command tar file with the blobs
+blobDir="_blobs"
+# the manifest file name in the command tar file
+manifestName="input_blobs.json"
+
+# path->(mtime, size, hash) for files that were hashed before
+_hashCache=dict()
+_hashCacheLock=threading.Lock()
+# the maximum number of entries in the hash cache
+_hashCacheMaxSize=65536
+
+
+def fileHash(path, st=None):
+    """Get the content hash of a file. The hash of a file is only
+       calculated again if its modification time or size changed.
+       path = the file name
+       st = the optional result of os.stat(path)
+       returns: the hex digest string."""
+    if st is None:
+        st=os.stat(path)
+    with _hashCacheLock:
+        entry=_hashCache.get(path)
+    if (entry is not None and entry[0] == st.st_mtime and
+        entry[1] == st.st_size):
+        return entry[2]
+    hsh=hashlib.sha1()
+    inf=open(path, 'rb')
+    try:
+        while True:
+            buf=inf.read(1024*1024)
+            if not buf:
+                break
+            hsh.update(buf)
+    finally:
+        inf.close()
+    digest=hsh.hexdigest()
+    with _hashCacheLock:
+        if len(_hashCache) >= _hashCacheMaxSize:
+            _hashCache.clear()
+        _hashCache[path]=(st.st_mtime, st.st_size, digest)
+    return digest
+
+
+class InputPackager(object):
+    """Packs command directories into a command tar file, sending the large
+       files by content hash."""
+    def __init__(self, tf, workerBlobs, minSize):
+        """Initialize with the tar file to write to.
+           tf = the open tarfile object
+           workerBlobs = the hashes of the blobs the worker has, or None if
+                         the worker has no input cache.
+           minSize = the minimum file size in bytes to send by hash."""
+        self.tf=tf
+        if workerBlobs is None:
+            self.workerBlobs=None
+        else:
+            self.workerBlobs=set(workerBlobs)
+        self.minSize=minSize
+        # archive name->hash
+        self.manifest=dict()
+        # the blobs added to the tar file
+        self.sentBlobs=set()
+        self.bytesSent=0
+        self.bytesSaved=0
+
+    def addCommandDir(self, cmddir, arcdir):
+        """Add a command directory.
+           cmddir = the command directory
+           arcdir = the name of the directory in the tar file."""
+        if self.workerBlobs is None:
+            self.tf.add(cmddir, arcname=arcdir, recursive=True)
+            return
+        for dirpath, dirnames, filenames in os.walk(cmddir):
+            dirnames.sort()
+            reldir=os.path.relpath(dirpath, cmddir)
+            if reldir == ".":
+                arcpath=arcdir
+            else:
+                arcpath=os.path.join(arcdir, reldir)
+            self.tf.add(dirpath, arcname=arcpath, recursive=False)
+            for filename in sorted(filenames):
+                path=os.path.join(dirpath, filename)
+                arcname=os.path.join(arcpath, filename)
+                st=os.lstat(path)
+                if not stat.S_ISREG(st.st_mode):
+                    self.tf.add(path, arcname=arcname, recursive=False)
+                elif st.st_size < self.minSize:
+                    self.tf.add(path, arcname=arcname, recursive=False)
+                    self.bytesSent+=st.st_size
+                else:
+                    hsh=fileHash(path, st)
+                    self.manifest[arcname]=hsh
+                    if hsh in self.workerBlobs or hsh in self.sentBlobs:
+                        self.bytesSaved+=st.st_size
+                    else:
+                        self.tf.add(path, arcname=os.path.join(blobDir, hsh),
+                                    recursive=False)
+                        self.sentBlobs.add(hsh)
+                        self.bytesSent+=st.st_size
+
+    def finish(self):
+        """Add the manifest to the tar file, if there is one."""
+        if len(self.manifest) == 0:
+            return
+        data=json.dumps(self.manifest)
+        info=tarfile.TarInfo(manifestName)
+        info.size=len(data)
+        info.mtime=time.time()
+        self.tf.addfile(info, StringIO(data))
+        log.debug("Sent %d bytes of command input, %d bytes were cached"%
+                  (self.bytesSent, self.bytesSaved))
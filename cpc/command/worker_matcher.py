@@ -18,10 +18,12 @@
 
 
 import logging
+import time
 
 import cpc.util
 import cpc.util.log
 import resource
+from executable import executableKey
 
 
 log=logging.getLogger(__name__)
@@ -29,7 +31,14 @@ log=logging.getLogger(__name__)
 class CommandWorkerMatcher(object):
     """Object that stores information about a worker for the 
        matchCommandWorker() function that is used in queue.getUntil()"""
-    def __init__(self, platforms, executableList, workerReqDict):
+    def __init__(self, platforms, executableList, workerReqDict,
+                 execIDs=None):
+        """Initialize the matcher.
+           platforms = the worker's platforms, with its free resources
+           executableList = the worker's executable list
+           workerReqDict = the worker's requirements
+           execIDs = an optional dict of executable ID lookups to share
+                     between matchers for the same worker capabilities."""
         self.platforms=platforms
         self.executableList=executableList
         self.workerReqDict=workerReqDict
@@ -50,6 +59,11 @@ class CommandWorkerMatcher(object):
             self.used[rsrc.name]=resource.Resource(rsrc.name, 0)
         self.type=None
         self.depleted=False
+        # cache of executable IDs (or None) by platform name and queue
+        # bucket key
+        if execIDs is None:
+            execIDs=dict()
+        self.execIDs=execIDs
 
     def checkType(self, type):
         """Check whether the command type is the same as one used before in the
@@ -59,21 +73,39 @@ class CommandWorkerMatcher(object):
             return True
         return type == self.type
 
-    def getExecID(self, cmd):
-        """Check whether the worker has the right executable."""
+    def _findExecID(self, name, minVersion, maxVersion):
+        """Find the ID of the worker's executable for an executable name and
+           version range, or None if the worker doesn't have it."""
         # first try the usePlatform
-        
-        ret=self.executableList.find(cmd.executable, self.usePlatform,
-                                     cmd.minVersion, cmd.maxVersion)
+        ret=self.executableList.find(name, self.usePlatform,
+                                     minVersion, maxVersion)
         if ret is not None:
             return ret.getID()
         for platform in self.platforms:
-            ret=self.executableList.find(cmd.executable, platform,
-                                         cmd.minVersion, cmd.maxVersion)
+            ret=self.executableList.find(name, platform, minVersion, maxVersion)
             if ret is not None:
                 return ret.getID()
         return None
 
+    def _getCachedExecID(self, name, minVersion, maxVersion):
+        """Cached version of _findExecID()"""
+        key=(self.usePlatform.getName(),
+             executableKey(name, minVersion, maxVersion))
+        if key not in self.execIDs:
+            self.execIDs[key]=self._findExecID(name, minVersion, maxVersion)
+        return self.execIDs[key]
+
+    def getExecID(self, cmd):
+        """Check whether the worker has the right executable."""
+        return self._getCachedExecID(cmd.executable, cmd.minVersion,
+                                     cmd.maxVersion)
+
+    def checkBucket(self, bucket):
+        """Check whether the worker has the right executable for the commands
+           in a command queue bucket."""
+        return self._getCachedExecID(bucket.executable, bucket.minVersion,
+                                     bucket.maxVersion) is not None
+
     def checkWorkerRequirements(self, cmd):
         #Check if worker is project dedicated
         if 'project' in self.workerReqDict:
@@ -132,7 +164,48 @@ class CommandWorkerMatcher(object):
     def getWork(self, cmdQueue):
         """Get work from a command queue until the worker is filled or there is
            no more work."""
-        return cmdQueue.getUntil(matchCommandWorker, self)
+        return cmdQueue.getUntil(matchCommandWorker, self, matchBucketWorker)
+
+    def getWorkWait(self, cmdQueue, taskQueue, maxWait, longPoll=0):
+        """Get work from a command queue until the worker is filled. If there
+           isn't enough work right away, wait for the dataflow to queue new
+           commands, for as long as it has tasks pending and for at most 
+           maxWait seconds.
+           cmdQueue = the command queue
+           taskQueue = the dataflow task queue
+           maxWait = the maximum time to wait in seconds
+           longPoll = the time in seconds to wait for any command to be 
+                      queued, if there are none, even if the dataflow is idle.
+           returns: the list of commands."""
+        startTime=time.time()
+        deadline=startTime+maxWait
+        pollDeadline=startTime+longPoll
+        nchanges=cmdQueue.getChangeCount()
+        cmds=self.getWork(cmdQueue)
+        while not self.isDepleted():
+            now=time.time()
+            if len(cmds) == 0 and now < pollDeadline:
+                # long poll: wait for anything to come in.
+                timeLeft=pollDeadline-now
+            else:
+                if taskQueue.isIdle():
+                    # the dataflow has nothing left to do, so there won't be
+                    # any new commands soon.
+                    break
+                timeLeft=deadline-now
+                if timeLeft <= 0:
+                    break
+            newChanges=cmdQueue.waitForChange(nchanges, timeLeft)
+            if newChanges != nchanges:
+                nchanges=newChanges
+                cmds.extend(self.getWork(cmdQueue))
+        return cmds
+
+
+def matchBucketWorker(matcher, bucket):
+    """Function to use in queue.getUntil() to select the command queue 
+       buckets that a worker has executables for."""
+    return matcher.checkBucket(bucket)
 
 
 def matchCommandWorker(matcher, command):
@@ -263,6 +263,7 @@ class ActiveInstance(value.ValueBase):
         # this.
         self.lastUpdateAI=None
         self.lastUpdateSeqNr=-1
+        self._updateStatus()
 
     def writeDebug(self, outf):
         outf.write("Active instance %s\n"%self.getCanonicalName())
@@ -281,6 +282,20 @@ class ActiveInstance(value.ValueBase):
                 ret=ActiveInstance.warning
         return ret
 
+    def getStatusStateStr(self):
+        """Get the current state as a string without locking: for the
+           project status aggregates, which are updated after every change."""
+        state=self.state
+        if state == ActiveInstance.active and self.msg.hasWarning():
+            state=ActiveInstance.warning
+        return str(state)
+
+    def _updateStatus(self):
+        """Update the project status aggregates with this instance's state.
+           Must be called after every state change, without self.lock
+           locked."""
+        self.project.getStatus().updateInstance(self)
+
     def getPropagatedStateStr(self):
         """Get the propagated state associated with this active instance:
            i.e. with any error conditions of sub-instances."""
@@ -316,6 +331,7 @@ class ActiveInstance(value.ValueBase):
         """add used cpu time to this active instance."""
         with self.outputLock:
             self.cputime+=cputime
+        self.markChanged()
 
     def getCputime(self):
         with self.outputLock:
@@ -339,6 +355,7 @@ class ActiveInstance(value.ValueBase):
         """Set the state without side effects"""
         with self.lock:
             self.state=state
+        self._updateStatus()
 
     def setSeqNr(self, seqNr):
         """Set the sequence number"""
@@ -358,6 +375,12 @@ class ActiveInstance(value.ValueBase):
         """Get the log object associated with this active instance, or None"""
         return self.msg.getLog()
 
+    def markChanged(self):
+        """Mark this active instance as changed, so that its state is 
+           written to the project's state journal at the next save."""
+        self.project.markChanged(self)
+        self._updateStatus()
+
     def getBasedir(self):
         """Get the active instance's base directory relative to the project
             dir."""
@@ -495,6 +518,10 @@ class ActiveInstance(value.ValueBase):
         """Remove a task from the list"""
         with self.inputLock:
            self.tasks.remove(task)
+        status=self.project.getStatus()
+        for cmd in task.getCommands():
+            status.removeCommand(cmd)
+        self.markChanged()
 
     def handleTaskOutput(self, sourceTag, seqNr, output, subnetOutput,
                          warnMsg):
@@ -555,6 +582,7 @@ class ActiveInstance(value.ValueBase):
         self.outputVal.setUpdated(False)
         self.subnetOutputVal.setUpdated(False)
         self.msg.setWarning(warnMsg)
+        self.markChanged()
 
     def handleNewInput(self, sourceTag, seqNr, noNewTasks=False):
         """Process new input based on the changing of values.
@@ -596,6 +624,8 @@ class ActiveInstance(value.ValueBase):
                                                     sourceTag, True)
             # now merge it with whether we should already update
             self.updated = self.updated or (upd1 or upd2)
+            if upd1 or upd2:
+                self.markChanged()
             if noNewTasks:
                 # don't set updated flag if it's not needed; noNewTasks
                 # is true when reading in current state, and setting updated
@@ -720,6 +750,8 @@ class ActiveInstance(value.ValueBase):
                 for task in self.tasks:
                     task.activateCommands()
                 self._reactivate()
+        if changed:
+            self.markChanged()
         return changed
 
 
@@ -737,6 +769,8 @@ class ActiveInstance(value.ValueBase):
                     self.state=ActiveInstance.held
                     for task in self.tasks:
                         task.deactivateCommands()
+        if changed:
+            self.markChanged()
         return changed
 
     def unblock(self):
@@ -752,6 +786,8 @@ class ActiveInstance(value.ValueBase):
                     changed=True
             if changed:
                 self._reactivate()
+        if changed:
+            self.markChanged()
 
     def _reactivate(self):
         """Check for new inputs, and run if there are any."""
@@ -774,7 +810,12 @@ class ActiveInstance(value.ValueBase):
                         ret.extend(cmds)
                     task.cancel()
                     self.tasks.remove(task)
-            return ret
+        status=self.project.getStatus()
+        for cmd in ret:
+            status.removeCommand(cmd)
+        if len(ret) > 0:
+            self.markChanged()
+        return ret
 
     def _canRun(self):
         """Whether all inputs are there for the instance to be run.
@@ -831,6 +872,7 @@ class ActiveInstance(value.ValueBase):
         self.activeNetwork.taskQueue.put(tsk)
         self.tasks.append(tsk)
         self.updated=False
+        self.markChanged()
 
     def addTask(self, tsk):
         """Append an existing task to the task list. Useful for reading in"""
@@ -851,12 +893,14 @@ class ActiveInstance(value.ValueBase):
                 log.error(u"Instance %s (fn %s): %s"%(self.instance.getName(),
                                                       self.function.getName(),
                                                       self.msg.getError()))
+        self.markChanged()
 
 
     def setWarning(self, msg):
         """Set warning message."""
         with self.lock:
             self.msg.setWarning(msg)
+        self.markChanged()
 
     def rerun(self, recursive, clearError, outf=None):
         """Force the rerun of this instance, or clear the error if in error
@@ -915,10 +959,13 @@ class ActiveInstance(value.ValueBase):
                     self._genTask()
                 else:
                     log.debug("Cannot do rerun on %s"%self.getCanonicalName())
+        if changed:
+            self.markChanged()
         return ret
 
-    def writeXML(self, outf, indent=0):
-        """write out values as xml."""
+    def writeXML(self, outf, indent=0, recursive=True):
+        """write out values as xml. If recursive is False, the active 
+           instances in the subnet are not written."""
         indstr=cpc.util.indStr*indent
         iindstr=cpc.util.indStr*(indent+1)
         with self.lock:
@@ -952,7 +999,7 @@ class ActiveInstance(value.ValueBase):
             outf.write('%s</subnet-outputs>\n'%(iindstr))
 
             if self.subnet is not None:
-                self.subnet.writeXML(outf, indent+1)
+                self.subnet.writeXML(outf, indent+1, recursive)
             if len(self.tasks) > 0:
                 outf.write('%s<tasks>\n'%iindstr)
                 for tsk in self.tasks:
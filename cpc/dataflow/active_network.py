@@ -139,8 +139,17 @@ class ActiveNetwork(network.Network):
             log.debug("Adding active instance %s"%ai.name)
             self.activeInstances[name]=ai
             network.Network.addInstance(self, inst)
+        self.markChanged()
         return ai
 
+    def markChanged(self):
+        """Mark the structure of this network as changed, so that it is 
+           written out at the next state save."""
+        if self.inActiveInstance is not None:
+            self.inActiveInstance.markChanged()
+        else:
+            self.project.markStructureChanged()
+
     #def removeInstance(self, instance):
     # TODO: implement this
     #    """React to an instance being removed. Called after all its
@@ -373,6 +382,7 @@ class ActiveNetwork(network.Network):
                 #          (conn.dstAcp.value.getFullName(), val.value))
                 conn.dstAcp.update(val, sourceTag, None)
                 conn.dstAcp.propagate(sourceTag, None)
+        self.markChanged()
 
     def activateAll(self):
         """Activate all activeinstances in this network, starting them."""
@@ -417,17 +427,19 @@ class ActiveNetwork(network.Network):
         """Get the first network, or None if none exists."""
         return self
 
-    def writeXML(self, outFile, indent=0):
-        """Write an XML description of the active network."""
+    def writeXML(self, outFile, indent=0, writeActive=True):
+        """Write an XML description of the active network. If writeActive
+           is False, the active instances are not written."""
         indstr=cpc.util.indStr*indent
         with self.lock:
             outFile.write('%s<network>\n'%indstr)
             for inst in self.instances.itervalues():
                 if not inst.isImplicit():
                     inst.writeXML(outFile, indent+1)
-            for ai in self.activeInstances.itervalues():
-                if ai.getName() != keywords.Self:
-                    ai.writeXML(outFile, indent+1)
+            if writeActive:
+                for ai in self.activeInstances.itervalues():
+                    if ai.getName() != keywords.Self:
+                        ai.writeXML(outFile, indent+1)
             for conn in self.connections:
                 if not conn.isImplicit():
                     conn.writeXML(outFile, indent+1)
@@ -0,0 +1,378 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Warm controller host processes for python controllers of external
+   functions.
+
+   Starting a python controller means starting an interpreter and importing
+   cpc, numpy, scipy etc. for every run. A controller host is a process that
+   has already imported these modules. For every run request it receives
+   over its stdin pipe, it forks a child that runs the controller script as
+   __main__, with the request's input as stdin and its output directory as
+   working directory. Each run thus starts from the same clean state as a
+   newly started controller, and produces the same return code, stdout and
+   stderr.
+
+   Run this module as 'python -m cpc.dataflow.controller_host <libdir>
+   [modules]' to start a host; the server side is ControllerPool."""
+
+# the system resource module, not cpc.dataflow.resource
+from __future__ import absolute_import
+
+import distutils.spawn
+import json
+import logging
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import traceback
+
+import cpc.util
+
+
+log=logging.getLogger(__name__)
+
+
+class ControllerHostError(cpc.util.CpcError):
+    pass
+
+
+def isPythonScript(filename):
+    """Check whether an executable is a python script that can be run in a
+       controller host: its interpreter must be the one the server (and 
+       therefore the controller hosts) run with."""
+    try:
+        inf=open(filename, 'r')
+        try:
+            line=inf.readline(256)
+        finally:
+            inf.close()
+    except IOError:
+        return False
+    if not line.startswith('#!'):
+        return False
+    args=line[2:].split()
+    if len(args) == 2 and os.path.basename(args[0]) == 'env':
+        interpreter=distutils.spawn.find_executable(args[1])
+    elif len(args) == 1:
+        interpreter=args[0]
+    else:
+        # no interpreter, or interpreter options
+        return False
+    if interpreter is None:
+        return False
+    return os.path.abspath(interpreter) == os.path.abspath(sys.executable)
+
+
+def _getRss():
+    """Get the maximum resident set size of this process in kB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ControllerHost(object):
+    """The server side of a single controller host process."""
+    def __init__(self, libDir, modules):
+        """Start a controller host process and wait until it has imported
+           its modules.
+           libDir = the function library directory
+           modules = the list of modules to import"""
+        env=dict(os.environ)
+        # make sure the host can import cpc
+        cpcDir=os.path.dirname(os.path.dirname(os.path.abspath(cpc.__file__)))
+        if env.has_key('PYTHONPATH'):
+            env['PYTHONPATH']="%s:%s"%(cpcDir, env['PYTHONPATH'])
+        else:
+            env['PYTHONPATH']=cpcDir
+        self.libDir=libDir
+        self.proc=subprocess.Popen([ sys.executable, '-m', __name__, libDir ]
+                                   + modules,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   close_fds=True, env=env)
+        self.nruns=0
+        try:
+            ready=self._readHeader()
+        except:
+            self.close()
+            raise
+        self.startRss=ready['rss']
+        self.rss=self.startRss
+
+    def _readHeader(self):
+        line=self.proc.stdout.readline()
+        if line == "":
+            raise ControllerHostError("Controller host for %s exited"%
+                                      self.libDir)
+        return json.loads(line)
+
+    def send(self, execPath, cwd, inputStr):
+        """Send a controller run request.
+           execPath = the controller executable
+           cwd = the directory to run it in, or None
+           inputStr = the controller's input"""
+        self.proc.stdin.write(json.dumps({ 'exec' : execPath,
+                                           'cwd' : cwd,
+                                           'size' : len(inputStr) }))
+        self.proc.stdin.write('\n')
+        self.proc.stdin.write(inputStr)
+        self.proc.stdin.flush()
+
+    def receive(self):
+        """Receive the response to a controller run request.
+           returns: a tuple of the return code, stdout and stderr."""
+        resp=self._readHeader()
+        retstdout=self.proc.stdout.read(resp['stdout'])
+        retstderr=self.proc.stdout.read(resp['stderr'])
+        if (len(retstdout) != resp['stdout'] or
+            len(retstderr) != resp['stderr']):
+            raise ControllerHostError("Controller host for %s exited"%
+                                      self.libDir)
+        self.nruns+=1
+        self.rss=resp['rss']
+        return (resp['returncode'], retstdout, retstderr)
+
+    def run(self, execPath, cwd, inputStr):
+        """Run a controller.
+           execPath = the controller executable
+           cwd = the directory to run it in, or None
+           inputStr = the controller's input
+           returns: a tuple of the return code, stdout and stderr."""
+        self.send(execPath, cwd, inputStr)
+        return self.receive()
+
+    def getMemoryGrowth(self):
+        """Get the growth in kB of the memory use of the host, or of its last
+           controller run, since the host started."""
+        return self.rss-self.startRss
+
+    def close(self):
+        """Stop the host process."""
+        try:
+            self.proc.stdin.close()
+            self.proc.wait()
+        except (IOError, OSError):
+            pass
+
+
+class ControllerPool(object):
+    """A pool of controller hosts, with hosts for each function library.
+       Hosts are replaced after a maximum number of runs, or when their
+       memory use has grown too much."""
+    def __init__(self, modules, maxRuns, maxMemory):
+        """Initialize the pool.
+           modules = the modules every host imports at start
+           maxRuns = the number of runs after which a host is replaced
+           maxMemory = the memory growth in kB after which a host is
+                       replaced."""
+        self.modules=modules
+        self.maxRuns=maxRuns
+        self.maxMemory=maxMemory
+        self.lock=threading.Lock()
+        # library dir->list of idle hosts
+        self.idle=dict()
+
+    def run(self, libDir, execPath, cwd, inputStr):
+        """Run a controller in a host for its library.
+           returns: a tuple of the return code, stdout and stderr, or None
+                    if the run request couldn't be delivered to a controller 
+                    host: the controller should then be run directly.
+           raises: ControllerHostError if the host failed after the request
+                   was delivered: the controller may then have run."""
+        host=None
+        with self.lock:
+            hosts=self.idle.get(libDir)
+            if hosts is not None and len(hosts) > 0:
+                host=hosts.pop()
+        try:
+            if host is None:
+                log.debug("Starting controller host for %s"%libDir)
+                host=ControllerHost(libDir, self.modules)
+            host.send(execPath, cwd, inputStr)
+        except (ControllerHostError, IOError, OSError, ValueError) as e:
+            log.info("Controller host for %s failed: %s"%(libDir, str(e)))
+            if host is not None:
+                host.close()
+            return None
+        try:
+            ret=host.receive()
+        except (ControllerHostError, IOError, OSError, ValueError) as e:
+            host.close()
+            raise ControllerHostError(
+                        "Controller host for %s failed while running %s: %s"%
+                        (libDir, execPath, str(e)))
+        if host.nruns >= self.maxRuns or host.getMemoryGrowth() > self.maxMemory:
+            log.debug("Replacing controller host for %s after %d runs"%
+                      (libDir, host.nruns))
+            host.close()
+        else:
+            with self.lock:
+                if libDir not in self.idle:
+                    self.idle[libDir]=[]
+                self.idle[libDir].append(host)
+        return ret
+
+    def stop(self):
+        """Stop all idle hosts."""
+        with self.lock:
+            hosts=[]
+            for libHosts in self.idle.itervalues():
+                hosts.extend(libHosts)
+            self.idle=dict()
+        for host in hosts:
+            host.close()
+
+
+_pool=None
+_poolLock=threading.Lock()
+
+def getControllerPool():
+    """Get the server's controller pool.
+       returns: the ControllerPool object, or None if controller hosts are
+                disabled."""
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            from cpc.util.conf.server_conf import ServerConf
+            conf=ServerConf()
+            if not conf.getControllerPool():
+                return None
+            _pool=ControllerPool(conf.getControllerPreloadModules(),
+                                 conf.getControllerHostMaxRuns(),
+                                 conf.getControllerHostMaxMemory())
+        return _pool
+
+
+def stopControllerPool():
+    """Stop the server's controller pool, if it was started."""
+    with _poolLock:
+        if _pool is not None:
+            _pool.stop()
+
+
+def _runController(execPath, cwd, inputStr, protocolFds):
+    """Run a controller script in a forked child process.
+       returns: a tuple of the return code, stdout, stderr and the maximum
+                resident set size of the child in kB."""
+    inf=tempfile.TemporaryFile()
+    inf.write(inputStr)
+    inf.seek(0)
+    outf=tempfile.TemporaryFile()
+    errf=tempfile.TemporaryFile()
+    pid=os.fork()
+    if pid == 0:
+        code=1
+        try:
+            for fd in protocolFds:
+                os.close(fd)
+            os.dup2(inf.fileno(), 0)
+            os.dup2(outf.fileno(), 1)
+            os.dup2(errf.fileno(), 2)
+            sys.stdin=os.fdopen(0, 'rb')
+            sys.stdout=os.fdopen(1, 'wb')
+            sys.stderr=os.fdopen(2, 'wb')
+            if cwd is not None:
+                os.chdir(cwd)
+            sys.argv=[ execPath ]
+            sys.path.insert(0, os.path.dirname(execPath))
+            try:
+                runpy.run_path(execPath, run_name='__main__')
+                code=0
+            except SystemExit as e:
+                if e.code is None:
+                    code=0
+                elif isinstance(e.code, int):
+                    code=e.code
+                else:
+                    sys.stderr.write("%s\n"%str(e.code))
+                    code=1
+            except:
+                traceback.print_exc()
+                code=1
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+    inf.close()
+    # the runs happen in the child: its memory use is what can grow.
+    pid, status, rusage=os.wait4(pid, 0)
+    if os.WIFSIGNALED(status):
+        returncode=-os.WTERMSIG(status)
+    else:
+        returncode=os.WEXITSTATUS(status)
+    outf.seek(0)
+    errf.seek(0)
+    retstdout=outf.read()
+    retstderr=errf.read()
+    outf.close()
+    errf.close()
+    return (returncode, retstdout, retstderr, rusage.ru_maxrss)
+
+
+def hostMain(libDir, modules):
+    """The controller host main loop."""
+    # move the request and response pipes away from stdin and stdout, so
+    # that nothing that is printed can get mixed into responses.
+    inFd=os.dup(0)
+    outFd=os.dup(1)
+    devnull=os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+    reqf=os.fdopen(inFd, 'rb')
+    respf=os.fdopen(outFd, 'wb')
+
+    sys.path.insert(0, libDir)
+    libModules=[]
+    for fname in sorted(os.listdir(libDir)):
+        if fname.endswith('.py') and fname != '__init__.py':
+            libModules.append(fname[:-3])
+    for module in modules+libModules:
+        try:
+            __import__(module)
+        except:
+            sys.stderr.write("Controller host: can't import %s: %s\n"%
+                             (module, str(sys.exc_info()[1])))
+    respf.write('%s\n'%json.dumps({ 'rss' : _getRss() }))
+    respf.flush()
+    while True:
+        line=reqf.readline()
+        if line == "":
+            break
+        req=json.loads(line)
+        inputStr=reqf.read(req['size'])
+        cwd=req['cwd']
+        if cwd is not None:
+            cwd=cwd.encode('utf-8')
+        returncode, retstdout, retstderr, childRss=_runController(
+                                            req['exec'].encode('utf-8'),
+                                            cwd, inputStr, [inFd, outFd])
+        respf.write('%s\n'%json.dumps({ 'returncode' : returncode,
+                                        'stdout' : len(retstdout),
+                                        'stderr' : len(retstderr),
+                                        'rss' : max(_getRss(), childRss) }))
+        respf.write(retstdout)
+        respf.write(retstderr)
+        respf.flush()
+
+
+if __name__ == "__main__":
+    hostMain(sys.argv[1], sys.argv[2:])
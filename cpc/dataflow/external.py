@@ -32,6 +32,7 @@ import apperror
 import function
 import run
 import atomic
+import controller_host
 
 
 log=logging.getLogger(__name__)
@@ -49,6 +50,7 @@ class ExternalFunction(atomic.AtomicFunction):
         atomic.AtomicFunction.__init__(self, name, lib)
         self.controllerExec=controllerExec
         self.basedir=basedir
+        self.isPython=False
         if self.controllerExec is not None:
             self._checkControllerPath()
         self.outputDirWithoutFiles=True
@@ -79,6 +81,7 @@ class ExternalFunction(atomic.AtomicFunction):
             if not os.path.exists(self.fullpath):
                 raise ExternalFunctionError("Couldn't find controller %s"%
                                             self.fullpath)
+            self.isPython=controller_host.isPythonScript(self.fullpath)
 
     def check(self):
         """Perform a check on whether the function can run and set
@@ -115,6 +118,17 @@ class ExternalFunction(atomic.AtomicFunction):
 
         log.log(cpc.util.log.TRACE,outs.getvalue())
 
+        # python controllers run in a warm controller host if possible; if
+        # the run request can't be delivered to a host, they run directly.
+        if self.isPython:
+            pool=controller_host.getControllerPool()
+            if pool is not None:
+                ret=pool.run(os.path.dirname(self.fullpath), self.fullpath,
+                             inp.getOutputDir(), outs.getvalue())
+                if ret is not None:
+                    outs.close()
+                    return ret
+
         proc=subprocess.Popen(nargs,
                               stdin=subprocess.PIPE,
                               stdout=subprocess.PIPE,
@@ -0,0 +1,203 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import logging
+import os
+import threading
+import xml.etree.cElementTree as ET
+
+import cpc.util
+import keywords
+
+log=logging.getLogger(__name__)
+
+
+class JournalError(cpc.util.CpcError):
+    pass
+
+
+class StateJournal(object):
+    """An append-only journal of project state changes.
+
+       Each record holds the XML state of a single active instance, without
+       the active instances in its subnet, together with its canonical name
+       and a sequence number. A project state snapshot (_state.xml) records
+       the sequence number of the last record it includes, so that
+       recovery only needs to replay newer records on top of the snapshot.
+
+       The file consists of records of the form
+         record <seqnr> <nbytes> <canonical name>\\n<nbytes of xml>\\n
+       so that a record that was only partially written can be detected and
+       ignored."""
+    def __init__(self, filename):
+        """Initialize with the journal file name."""
+        self.filename=filename
+        self.lock=threading.Lock()
+        # the sequence number of the last written record
+        self.seq=0
+
+    def getSeq(self):
+        """Get the sequence number of the last written record."""
+        with self.lock:
+            return self.seq
+
+    def setSeq(self, seq):
+        """Set the sequence number of the last written record. Used when
+           reading state."""
+        with self.lock:
+            self.seq=max(self.seq, seq)
+
+    def getSize(self):
+        """Get the size of the journal file in bytes."""
+        try:
+            return os.path.getsize(self.filename)
+        except OSError:
+            return 0
+
+    def append(self, records):
+        """Append a list of (canonical name, xml string) records and make sure
+           they are on disk.
+           returns: the number of bytes written."""
+        with self.lock:
+            outf=open(self.filename, 'ab')
+            nbytes=0
+            try:
+                for name, xmlStr in records:
+                    if isinstance(xmlStr, unicode):
+                        xmlStr=xmlStr.encode('utf-8')
+                    self.seq+=1
+                    header='record %d %d %s\n'%(self.seq, len(xmlStr), name)
+                    outf.write(header)
+                    outf.write(xmlStr)
+                    outf.write('\n')
+                    nbytes+=len(header)+len(xmlStr)+1
+                outf.flush()
+                os.fsync(outf.fileno())
+            finally:
+                outf.close()
+        return nbytes
+
+    def truncate(self):
+        """Remove all records. Must only be called after a snapshot including
+           all records has been written."""
+        with self.lock:
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+
+    def read(self):
+        """Read all complete records.
+           returns: a list of (sequence number, canonical name, xml string)
+                    tuples."""
+        ret=[]
+        try:
+            inf=open(self.filename, 'rb')
+        except IOError:
+            return ret
+        try:
+            while True:
+                header=inf.readline()
+                if not header.endswith('\n'):
+                    break
+                try:
+                    tag, seq, nbytes, name=header[:-1].split(' ', 3)
+                    seq=int(seq)
+                    nbytes=int(nbytes)
+                except ValueError:
+                    raise JournalError("Corrupt journal record header in %s"%
+                                       self.filename)
+                if tag != 'record':
+                    raise JournalError("Corrupt journal record header in %s"%
+                                       self.filename)
+                xmlStr=inf.read(nbytes)
+                if len(xmlStr) < nbytes or inf.read(1) != '\n':
+                    log.info("Ignoring incomplete journal record %d in %s"%
+                             (seq, self.filename))
+                    break
+                ret.append( (seq, name, xmlStr) )
+        finally:
+            inf.close()
+        return ret
+
+
+def _findActive(network, name):
+    """Find the active instance element with a specific name in a network
+       element, or None."""
+    for child in network:
+        if child.tag == 'active' and child.get('id') == name:
+            return child
+    return None
+
+def _insertActive(network, active):
+    """Insert an active instance element in a network element: after the
+       instance definitions and before the connections."""
+    i=0
+    for child in network:
+        if child.tag == 'connection':
+            break
+        i+=1
+    network.insert(i, active)
+
+def replayJournal(snapshotFile, records):
+    """Apply journal records to a project state snapshot.
+
+       snapshotFile = the file name of the snapshot
+       records = the list of journal records as returned by StateJournal.read()
+       returns: a tuple of the merged state XML string, and the last sequence
+                number included in it."""
+    tree=ET.parse(snapshotFile)
+    root=tree.getroot()
+    lastSeq=int(root.get('journal_seq', '0'))
+    topNetwork=root.find('network')
+    if topNetwork is None:
+        topNetwork=ET.SubElement(root, 'network')
+    for seq, name, xmlStr in records:
+        if seq <= lastSeq:
+            # already included in the snapshot
+            continue
+        lastSeq=seq
+        newActive=ET.fromstring(xmlStr)
+        path=name.split(keywords.InstSep)
+        network=topNetwork
+        for parentName in path[:-1]:
+            parent=_findActive(network, parentName)
+            if parent is None:
+                network=None
+                break
+            network=parent.find('network')
+            if network is None:
+                break
+        if network is None:
+            log.error("Journal record %d: no parent for instance %s"%
+                      (seq, name))
+            continue
+        oldActive=_findActive(network, path[-1])
+        if oldActive is not None:
+            # records don't contain the active instances in their subnet:
+            # carry these over from the old element.
+            oldSubnet=oldActive.find('network')
+            newSubnet=newActive.find('network')
+            if oldSubnet is not None and newSubnet is not None:
+                for subActive in oldSubnet.findall('active'):
+                    _insertActive(newSubnet, subActive)
+            index=list(network).index(oldActive)
+            network.remove(oldActive)
+            network.insert(index, newActive)
+        else:
+            _insertActive(network, newActive)
+    return (ET.tostring(root), lastSeq)
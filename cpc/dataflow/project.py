@@ -21,6 +21,7 @@
 import logging
 import threading
 import os
+import time
 
 try:
     from cStringIO import StringIO
@@ -48,6 +49,8 @@ import task
 import transaction
 import lib
 import readxml
+import journal
+import project_status
 from cpc.dataflow.value import ValError
 
 log=logging.getLogger(__name__)
@@ -84,6 +87,23 @@ class Project(object):
         else:
             self.queue=queue
         self.cmdQueue=cmdQueue
+        # the state journal, and the active instances that have changed since
+        # the last time the state was saved. A structural change (new
+        # functions, imports or top-level instances) forces a full snapshot.
+        self.stateLock=threading.Lock()
+        self.changedLock=threading.Lock()
+        self.changedInstances=set()
+        self.structureChanged=True
+        # the state generation is increased with every change; savedGen is
+        # the generation that was last written out.
+        self.stateGen=1
+        self.savedGen=0
+        # statistics of the last state save
+        self.saveStats=dict()
+        self.journal=journal.StateJournal(os.path.join(self.basedir,
+                                                       "_state.journal"))
+        # the status aggregates
+        self.status=project_status.ProjectStatus()
         # the file list
         self.fileList=value.FileList(basedir)
         # create the active network (the top-level network)
@@ -148,6 +168,7 @@ class Project(object):
             if self.functions.has_key(name):
                 raise ProjectError("function with name %s already exists."%name)
             self.functions[name]=function
+        self.markStructureChanged()
 
     def getImportList(self):
         """Get the function import list."""
@@ -455,6 +476,7 @@ class Project(object):
             reader=readxml.ProjectXMLReader(self.topLevelImport, self.imports,
                                             self)
             reader.readFile(fileObject, filename)
+        self.markStructureChanged()
 
     def importName(self, name):
         """Import a named module."""
@@ -482,6 +504,7 @@ class Project(object):
                 reader=readxml.ProjectXMLReader(newlib, self.imports, self)
                 reader.read(filename)
                 self.imports.add(newlib)
+                self.markStructureChanged()
                 return newlib
             else:
                 return self.imports.get(name)
@@ -546,12 +569,18 @@ class Project(object):
         """Get the task queue."""
         return self.queue
 
-    def writeXML(self, outf, indent=0):
+    def writeXML(self, outf, indent=0, journalSeq=None):
         """Write the function definitions and top-level network description
-           in XML to outf."""
+           in XML to outf. 
+           journalSeq = the last state journal record included in the 
+                        output, if any."""
         indstr=cpc.util.indStr*indent
         iindstr=cpc.util.indStr*(indent+1)
-        outf.write('%s<cpc version="%d">\n'%(indstr, readxml.curVersion))
+        if journalSeq is None:
+            outf.write('%s<cpc version="%d">\n'%(indstr, readxml.curVersion))
+        else:
+            outf.write('%s<cpc version="%d" journal_seq="%d">\n'%
+                       (indstr, readxml.curVersion, journalSeq))
         for name in self.imports.getLibNames():
             outf.write('%s<import name="%s" />\n'%(iindstr,name))
         outf.write('\n')
@@ -563,15 +592,64 @@ class Project(object):
            XML file."""
         outFile.write('  <cpc-project id="%s" dir=""/>\n'%(self.name))
 
+    def markChanged(self, ai):
+        """Mark an active instance as changed since the last state save."""
+        with self.changedLock:
+            self.changedInstances.add(ai)
+            self.stateGen+=1
+
+    def markStructureChanged(self):
+        """Mark the project structure as changed: the next state save will
+           write a full snapshot."""
+        with self.changedLock:
+            self.structureChanged=True
+            self.stateGen+=1
+
+    def isDirty(self):
+        """Return whether the project has changed since its state was last
+           saved."""
+        with self.changedLock:
+            return self.stateGen != self.savedGen
+
+    def getStatus(self):
+        """Get the ProjectStatus object with the project's status
+           aggregates."""
+        return self.status
+
+    def getSaveStats(self):
+        """Get the statistics of the last state save as a dict with the
+           save type ('snapshot' or 'journal'), its duration in seconds and
+           the number of bytes written."""
+        with self.changedLock:
+            return dict(self.saveStats)
+
+    def _markSaved(self, gen, saveType, startTime, nbytes):
+        """Record that the state up to generation gen has been saved."""
+        with self.changedLock:
+            self.savedGen=gen
+            self.saveStats={ 'type' : saveType,
+                             'time' : time.time()-startTime,
+                             'bytes' : nbytes }
+
     def readState(self,stateFile="_state.xml"):
         fname=os.path.join(self.basedir, stateFile)
         if os.path.exists(fname):
             log.debug("Importing project state from %s"%fname)
+            records=[]
+            if stateFile == "_state.xml":
+                records=self.journal.read()
             with self.updateLock:
                 reader=readxml.ProjectXMLReader(self.topLevelImport,
                                                 self.imports,
                                                 self)
-                reader.readFile(fname, fname)
+                if len(records) > 0:
+                    log.debug("Replaying %d state journal records"%
+                              len(records))
+                    (stateXML, lastSeq)=journal.replayJournal(fname, records)
+                    self.journal.setSeq(lastSeq)
+                    reader.readFile(StringIO(stateXML), fname)
+                else:
+                    reader.readFile(fname, fname)
                 tasks=reader.getTaskList()
                 for tsk in tasks:
                     cmds=tsk.getCommands()
@@ -582,19 +660,87 @@ class Project(object):
                         log.debug("Queuing command")
                         for cmd in cmds:
                             self.cmdQueue.add(cmd)
-
-
-    def writeState(self):
+            # the state on disk is only replaced at the next save, with a 
+            # full snapshot.
+            with self.changedLock:
+                self.changedInstances=set()
+                self.structureChanged=True
+                self.stateGen+=1
+
+    def _writeSnapshot(self):
+        """Write a full state snapshot and clear the state journal. 
+           NOTE: assumes a locked stateLock"""
+        startTime=time.time()
         with self.updateLock:
+            with self.changedLock:
+                self.changedInstances=set()
+                self.structureChanged=False
+                gen=self.stateGen
             fname=os.path.join(self.basedir, "_state.xml")
             nfname=os.path.join(self.basedir, "_state.xml.new")
             fout=open(nfname, 'w')
             fout.write('<?xml version="1.0"?>\n')
-            self.writeXML(fout, 0)
+            self.writeXML(fout, 0, self.journal.getSeq())
             fout.close()
             # now we use POSIX file renaming  atomicity to make sure the state
             # is always a consistent file.
             os.rename(nfname, fname)
+            # all journal records are now part of the snapshot
+            self.journal.truncate()
+        self._markSaved(gen, 'snapshot', startTime, os.path.getsize(fname))
+
+    def writeState(self):
+        """Write a full state snapshot. Task execution should be paused, 
+           because the snapshot includes all active instances."""
+        with self.stateLock:
+            self._writeSnapshot()
+
+    def needsSnapshot(self):
+        """Return whether the state must be saved as a full snapshot: if the
+           project structure has changed, or the state journal has grown too
+           large. Snapshots must be written with task execution paused."""
+        with self.changedLock:
+            if self.structureChanged:
+                return True
+        return self.journal.getSize() > self.conf.getStateJournalMaxSize()
+
+    def writeJournal(self):
+        """Write the state of all active instances that have changed since
+           the last save to the state journal. If the project structure has 
+           changed, nothing is written: the changes are left for the next 
+           snapshot (see needsSnapshot()).
+           returns: the number of bytes written to the journal."""
+        with self.stateLock:
+            startTime=time.time()
+            with self.changedLock:
+                if self.structureChanged:
+                    return 0
+                changed=self.changedInstances
+                self.changedInstances=set()
+                gen=self.stateGen
+            if len(changed) == 0:
+                return 0
+            records=[]
+            for ai in changed:
+                if ai.getName() == keywords.Self:
+                    # self instances are not part of the state
+                    continue
+                outf=StringIO()
+                try:
+                    ai.writeXML(outf, 0, recursive=False)
+                except RuntimeError as e:
+                    # the instance's values were changed while being written
+                    # out: try again at the next save.
+                    log.warning("Deferring state save of %s: %s"%
+                                (ai.getCanonicalName(), str(e)))
+                    self.markChanged(ai)
+                    continue
+                records.append( (ai.getCanonicalName(), outf.getvalue()) )
+            # parents must be replayed before their children.
+            records.sort(key=lambda rec: rec[0].count(keywords.InstSep))
+            nbytes=self.journal.append(records)
+            self._markSaved(gen, 'journal', startTime, nbytes)
+            return nbytes
 
     ########################################################
     # Member functions from the ValueBase interface:
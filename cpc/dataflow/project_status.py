@@ -0,0 +1,175 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import logging
+import threading
+from collections import OrderedDict
+
+
+log=logging.getLogger(__name__)
+
+
+class ProjectStatus(object):
+    """Status aggregates of a project, kept up to date as active instances
+       change state and as commands are queued, run and finish, so that
+       the project's status can be reported without walking all of its
+       active instances.
+
+       The aggregates are the number of active instances in each state, the
+       instances in error and warning states, and the queued and running
+       commands."""
+    def __init__(self):
+        self.lock=threading.Lock()
+        # active instance -> state string as last counted
+        self.instStates=dict()
+        # state string -> number of active instances
+        self.stateCounts=dict()
+        self.errors=set()
+        self.warnings=set()
+        # commands, in the order in which they were added. The value
+        # is the running state as last counted.
+        self.commands=OrderedDict()
+        self.nrunning=0
+        # whether the project has been deleted
+        self.cleared=False
+
+    def clear(self):
+        """Remove all instances and commands when the project is deleted,
+           and ignore any later updates."""
+        with self.lock:
+            self.cleared=True
+            self.instStates=dict()
+            self.stateCounts=dict()
+            self.errors=set()
+            self.warnings=set()
+            self.commands=OrderedDict()
+            self.nrunning=0
+
+    def updateInstance(self, ai):
+        """Update the aggregates with the current state of an active
+           instance."""
+        with self.lock:
+            if self.cleared:
+                return
+            # read the state here, so that the last update always counts
+            # the latest state.
+            stateStr=ai.getStatusStateStr()
+            oldStateStr=self.instStates.get(ai)
+            if oldStateStr == stateStr:
+                return
+            self.instStates[ai]=stateStr
+            if oldStateStr is not None:
+                self._count(oldStateStr, ai, -1)
+            self._count(stateStr, ai, 1)
+
+    def _count(self, stateStr, ai, n):
+        """Count (n=1) or uncount (n=-1) an instance in a state."""
+        count=self.stateCounts.get(stateStr, 0) + n
+        if count > 0:
+            self.stateCounts[stateStr]=count
+        else:
+            del self.stateCounts[stateStr]
+        if stateStr == "error":
+            lst=self.errors
+        elif stateStr == "warning":
+            lst=self.warnings
+        else:
+            return
+        if n > 0:
+            lst.add(ai)
+        else:
+            lst.discard(ai)
+
+    def addCommand(self, cmd):
+        """Add a command that belongs to the project."""
+        with self.lock:
+            if self.cleared or cmd in self.commands:
+                return
+            running=cmd.getRunning()
+            self.commands[cmd]=running
+            if running:
+                self.nrunning+=1
+
+    def removeCommand(self, cmd):
+        """Remove a command that has finished or was canceled."""
+        with self.lock:
+            running=self.commands.pop(cmd, None)
+            if running:
+                self.nrunning-=1
+
+    def updateCommand(self, cmd):
+        """Update the aggregates with the running state of a command."""
+        with self.lock:
+            if cmd not in self.commands:
+                return
+            running=cmd.getRunning()
+            if self.commands[cmd] != running:
+                self.commands[cmd]=running
+                if running:
+                    self.nrunning+=1
+                else:
+                    self.nrunning-=1
+
+    def getStateCounts(self):
+        """Get a dict of state string -> number of active instances."""
+        with self.lock:
+            return dict(self.stateCounts)
+
+    def getErrors(self):
+        """Get the sorted canonical names of the instances in error state."""
+        with self.lock:
+            ais=list(self.errors)
+        return sorted( [ ai.getCanonicalName() for ai in ais ] )
+
+    def getWarnings(self):
+        """Get the sorted canonical names of the instances in warning
+           state."""
+        with self.lock:
+            ais=list(self.warnings)
+        return sorted( [ ai.getCanonicalName() for ai in ais ] )
+
+    def getCommandCounts(self):
+        """Get the number of queued and running commands.
+           returns: a tuple of the number of queued and running commands"""
+        with self.lock:
+            return (len(self.commands)-self.nrunning, self.nrunning)
+
+    def getCommands(self, offset, limit):
+        """Get a page of the queued and running command lists.
+           offset = the index of the first command in each list
+           limit = the maximum number of commands in each list, or None
+                   for all commands
+           returns: a tuple of lists of queued and running commands"""
+        queued=[]
+        running=[]
+        nqueued=0
+        nrunning=0
+        with self.lock:
+            for cmd, isRunning in self.commands.iteritems():
+                if isRunning:
+                    if (nrunning >= offset and 
+                        (limit is None or len(running) < limit)):
+                        running.append(cmd)
+                    nrunning+=1
+                else:
+                    if (nqueued >= offset and 
+                        (limit is None or len(queued) < limit)):
+                        queued.append(cmd)
+                    nqueued+=1
+        return (queued, running)
@@ -28,6 +28,7 @@ import traceback
 import sys
 import os
 import threading
+import time
 
 
 import cpc.util
@@ -59,6 +60,7 @@ class TaskQueue(object):
         """Put a task in the queue."""
         # Use a timeout in order to avoid freezing the server completely
         # if the queue is full.
+        task.queuedTime=time.time()
         self.queue.put(task, timeout=15)
 
     def putNone(self):
@@ -68,9 +70,18 @@ class TaskQueue(object):
     def get(self):
         return self.queue.get()
 
+    def taskDone(self):
+        """Signal that a task obtained with get() has been fully handled."""
+        self.queue.task_done()
+
     def empty(self):
         return self.queue.empty()
 
+    def isIdle(self):
+        """Return whether there are no queued or executing tasks."""
+        with self.queue.mutex:
+            return self.queue.unfinished_tasks == 0
+
 
 class Task(object):
     """A task is a queueable and runnable function with inputs."""
@@ -101,16 +112,20 @@ class Task(object):
         self.cmds=[]
         self.cputime=0
         self.canceled=False
+        # the time the task was put in the task queue
+        self.queuedTime=None
 
     def setFnInput(self, fnInput):
         """Replace the fnInput object. Only for readxml"""
         self.fnInput=fnInput
     def addCommands(self, cmds, deactivate):
         """Add commands. Only for readxml"""
+        status=self.project.getStatus()
         for cmd in cmds:
             cmd.setTask(self)
             if deactivate:
                 cmd.deactivate()
+            status.addCommand(cmd)
         self.cmds.extend(cmds)
 
     def getFnInput(self):
@@ -182,6 +197,7 @@ class Task(object):
                 self.fnInput.cmd=None
                 if cmd is not None:
                     self.cmds.remove(cmd)
+                    self.project.getStatus().removeCommand(cmd)
                     # do cpu time accounting.
                     cputime=cmd.getCputime()
                     if cputime > 0:
@@ -201,9 +217,11 @@ class Task(object):
                         str(self.cmds),str(self.fnOutput.cmds)))
 
                 if self.fnOutput.cmds is not None:
+                    status=self.project.getStatus()
                     for cmd in self.fnOutput.cmds:
                         cmd.setTask(self)
                         self.cmds.append(cmd)
+                        status.addCommand(cmd)
                     finished=False
                 else:
                     finished=True
@@ -226,6 +244,8 @@ class Task(object):
                 self.fnOutput.setError(errmsg)
                 #self.activeInstance.markError(errmsg)
                 return (True, None, canceled)
+        # the task's command list is part of the active instance's state
+        self.activeInstance.markChanged()
         return (finished, self.fnOutput.cmds, canceled)
 
     def handleOutput(self):
@@ -283,6 +283,12 @@ class Transaction(run.FunctionRunOutput):
             if not (self.newConnections is None and self.setValues is None):
                 self.project.updateLock.release() 
         log.debug("Finished transaction locks")
+        # record the changed active instances for the state journal
+        if affectedOutputAIs is not None:
+            for ai in affectedOutputAIs | affectedInputAIs:
+                ai.markChanged()
+        elif self.activeInstance is not None:
+            self.activeInstance.markChanged()
         if addedInstances is not None:
             for inst in addedInstances: 
                 inst.activate()
@@ -340,148 +340,125 @@ def checkErr(stde, rsrc, tpr, persDir):
     return not OK
 
 
+def _collectRunFiles(persDir, pattern):
+    """Find the non-empty output files matching a pattern in all run
+       directories. A file replaces an earlier file with the same name,
+       because mdrun wasn't aware of that file when writing.
+       returns: the list of file names, in run order."""
+    files=[]
+    # file base name->index in files
+    index=dict()
+    for fname in sorted(glob.glob(os.path.join(persDir, "run_???",
+                                               pattern))):
+        try:
+            st=os.stat(fname)
+        except OSError:
+            continue
+        if st.st_size>0:
+            base=os.path.split(fname)[1]
+            if base in index:
+                log.debug("Overwriting existing file %s with %s"%
+                          (files[index[base]], fname))
+                files[index[base]]=fname
+            else:
+                index[base]=len(files)
+                files.append(fname)
+    return files
+
+def _linkOrCopy(src, dst):
+    """Make dst a hard link to src, or a copy if that isn't possible.
+       Output files of finished runs are never modified, so they can be
+       shared with the output directory."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+def _catFiles(files, outName, trailer=None):
+    """Concatenate text files by stream-copying them, appending an optional
+       trailer string. A single file without trailer is linked."""
+    if len(files) == 1 and trailer is None:
+        _linkOrCopy(files[0], outName)
+        return
+    outf=open(outName, "w")
+    try:
+        for infile in files:
+            inf=open(infile, "r")
+            try:
+                shutil.copyfileobj(inf, outf, 1024*1024)
+            finally:
+                inf.close()
+        if trailer is not None:
+            outf.write(trailer)
+    finally:
+        outf.close()
+
 def extractData(confout, outDir, persDir, fo):
     """Concatenate all output data from the partial runs into the end results"""
     cmdnames = cmds.GromacsCommands()
-    #outputs=dict()
-    # Concatenate stuff
     confoutPath=os.path.join(outDir, "confout.gro")
-    shutil.copy(confout[0], confoutPath )
-    #outputs['conf'] = Value(confoutPath,
-    #                        inp.function.getOutput('conf').getType())
+    _linkOrCopy(confout[0], confoutPath)
     fo.setOut('conf', FileValue(confoutPath))
-    # fix the xtc files
-    xtcso = sorted(glob.glob(os.path.join(persDir, "run_???",
-                                          "traj.*xtc")))
-    # cull empty files and duplicate trajectory names
-    xtcs=[]
-    xtcbase=[]
-    try:
-        for file in xtcso:
-            st=os.stat(file)
-            base=os.path.split(file)[1]
-            if st.st_size>0:
-                if base not in xtcbase:
-                    xtcs.append(file)
-                    xtcbase.append(base)
-                else:
-                    # there already was a file with this name. Overwrite
-                    # it because mdrun wasn't aware of it when writing.
-                    ind=xtcbase.index(base)
-                    xtcs[ind]=file
-    except OSError:
-        pass
-
-    # concatenate them
-    xtcoutname=os.path.join(outDir, "traj.xtc")
-    if len(xtcs) > 0:
-        cmd = cmdnames.trjcat.split() + ["-f"]
-        cmd.extend(xtcs)
-        cmd.extend(["-o", xtcoutname])
-        stdo=open(os.path.join(persDir,"trjcat_xtc.out"),"w")
-        sp=subprocess.Popen(cmd, stdout=stdo, stderr=subprocess.STDOUT)
-        sp.communicate(None)
-        stdo.close()
-        fo.setOut('xtc', FileValue(xtcoutname))
-    # do the trrs
-    trrso = sorted(glob.glob(os.path.join(persDir, "run_???",
-                                          "traj.*trr")))
-    # cull empty files and duplicate trajectory names
-    trrs=[]
-    trrbase=[]
+    # Start concatenating the trajectories and energy files. The tools run
+    # concurrently with each other and with the collection of the text
+    # outputs. Output from a single run is linked instead.
+    running=[]
     try:
-        for file in trrso:
-            st=os.stat(file)
-            base=os.path.split(file)[1]
-            if st.st_size>0:
-                if base not in trrbase:
-                    trrs.append(file)
-                    trrbase.append(base)
-                else:
-                    # there already was a file with this name. Overwrite
-                    # it because mdrun wasn't aware of it when writing.
-                    ind=trrbase.index(base)
-                    trrs[ind]=file
-    except OSError:
-        pass
-    # concatenate them
-    trroutname=os.path.join(outDir, "traj.trr")
-    if len(trrs) > 0:
-        cmd = cmdnames.trjcat.split() + ["-f"]
-        cmd.extend(trrs)
-        cmd.extend(["-o", trroutname])
-        stdo=open(os.path.join(persDir,"trjcat_trr.out"),"w")
-        sp=subprocess.Popen(cmd, stdout=stdo, stderr=subprocess.STDOUT)
-        sp.communicate(None)
-        stdo.close()
-        fo.setOut('trr', FileValue(trroutname))
-    # and the edrs
-    edrso = glob.glob(os.path.join(persDir, "run_???", "ener.*edr"))
-    # cull empty files and duplicate trajectory names
-    edrs=[]
-    edrbase=[]
-    try:
-        for file in edrso:
-            st=os.stat(file)
-            base=os.path.split(file)[1]
-            if st.st_size>0:
-                if base not in edrbase:
-                    edrs.append(file)
-                    edrbase.append(base)
-                else:
-                    # there already was a file with this name. Overwrite
-                    # it because mdrun wasn't aware of it when writing.
-                    ind=edrbase.index(base)
-                    log.debug("Overwriting existing edr file %s with %s" % (edrs[ind], file))
-                    edrs[ind]=file
-    except OSError:
-        pass
-    edroutname=os.path.join(outDir, "ener.edr")
-    if len(edrs) > 1:
-        log.debug("Concatenating edr files: %s" % edrs)
-    # concatenate them
-    if len(edrs) > 0:
-        cmd = cmdnames.eneconv.split() + ["-f"]
-        cmd.extend(edrs)
-        cmd.extend(["-o", edroutname])
-        stdo=open(os.path.join(persDir,"eneconv.out"),"w")
-        sp=subprocess.Popen(cmd, stdout=stdo, stderr=subprocess.STDOUT)
-        sp.communicate(None)
-        stdo.close()
-        log.debug("Setting edr output to %s" % edroutname)
-        fo.setOut('edr', FileValue(edroutname))
-    # do the stdout
-    stdouto = glob.glob(os.path.join(persDir, "run_???", "stdout"))
-    stdoutname=os.path.join(outDir, "stdout")
-    outf=open(stdoutname,"w")
-    for infile in stdouto:
-        inf=open(infile, "r")
-        outf.write(inf.read())
-        inf.close()
-    outf.write("%s\n"%time.strftime("%a, %d %b %Y %H:%M:%S"))
-    outf.write("%f\n"%time.time())
-    outf.close()
-    fo.setOut('stdout', FileValue(stdoutname))
-    # do the stderr
-    stderro = glob.glob(os.path.join(persDir, "run_???", "stderr"))
-    stderrname=os.path.join(outDir, "stderr")
-    outf=open(stderrname,"w")
-    for infile in stderro:
-        inf=open(infile, "r")
-        outf.write(inf.read())
-        inf.close()
-    outf.close()
-    fo.setOut('stderr', FileValue(stderrname))
-    # and do md.log
-    logo = glob.glob(os.path.join(persDir, "run_???", "md.*log"))
-    logname=os.path.join(outDir, "md.log")
-    outf=open(logname,"w")
-    for infile in logo:
-        inf=open(infile, "r")
-        outf.write(inf.read())
-        inf.close()
-    outf.close()
-    fo.setOut('log', FileValue(logname))
+        for outName, pattern, fileName, tool, toolOut in [
+                ("xtc", "traj.*xtc", "traj.xtc", cmdnames.trjcat,
+                 "trjcat_xtc.out"),
+                ("trr", "traj.*trr", "traj.trr", cmdnames.trjcat,
+                 "trjcat_trr.out"),
+                ("edr", "ener.*edr", "ener.edr", cmdnames.eneconv,
+                 "eneconv.out") ]:
+            files=_collectRunFiles(persDir, pattern)
+            outPath=os.path.join(outDir, fileName)
+            if len(files) == 1:
+                _linkOrCopy(files[0], outPath)
+                fo.setOut(outName, FileValue(outPath))
+            elif len(files) > 1:
+                log.debug("Concatenating %s files: %s"%(outName, files))
+                cmd = tool.split() + ["-f"]
+                cmd.extend(files)
+                cmd.extend(["-o", outPath])
+                stdo=open(os.path.join(persDir, toolOut), "w")
+                try:
+                    sp=subprocess.Popen(cmd, stdout=stdo,
+                                        stderr=subprocess.STDOUT)
+                except:
+                    stdo.close()
+                    raise
+                running.append( (outName, outPath, sp, stdo) )
+        # do the stdout
+        stdoutname=os.path.join(outDir, "stdout")
+        _catFiles(sorted(glob.glob(os.path.join(persDir, "run_???",
+                                                "stdout"))),
+                  stdoutname,
+                  "%s\n%f\n"%(time.strftime("%a, %d %b %Y %H:%M:%S"),
+                               time.time()))
+        fo.setOut('stdout', FileValue(stdoutname))
+        # do the stderr
+        stderrname=os.path.join(outDir, "stderr")
+        _catFiles(sorted(glob.glob(os.path.join(persDir, "run_???",
+                                                "stderr"))),
+                  stderrname)
+        fo.setOut('stderr', FileValue(stderrname))
+        # and do md.log
+        logname=os.path.join(outDir, "md.log")
+        _catFiles(sorted(glob.glob(os.path.join(persDir, "run_???",
+                                                "md.*log"))),
+                  logname)
+        fo.setOut('log', FileValue(logname))
+    finally:
+        # wait for the concatenations to finish
+        for outName, outPath, sp, stdo in running:
+            sp.wait()
+            stdo.close()
+    for outName, outPath, sp, stdo in running:
+        log.debug("Setting %s output to %s"%(outName, outPath))
+        fo.setOut(outName, FileValue(outPath))
 
     log.debug("Returning without command.")
     log.debug("fo.cmds=%s"%str(fo.cmds))
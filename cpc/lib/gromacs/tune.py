@@ -28,6 +28,13 @@ import subprocess
 import logging
 import time
 import math
+import hashlib
+import json
+import tempfile
+import platform
+import threading
+import multiprocessing
+import distutils.spawn
 
 
 log=logging.getLogger(__name__)
@@ -73,6 +80,135 @@ def tryRun(tprFile, runDir, Ncores):
         return (False, stdo)
     return (True, stdo)
 
+class TuneCache(object):
+    """An on-disk cache of tuning results, shared between all projects on a
+       server. Entries are keyed by the content of the tpr file, the platform
+       and the number of cores to start tuning from, and record the mdrun
+       version they were obtained with."""
+    def __init__(self, cacheDir):
+        """Initialize with the cache directory."""
+        self.cacheDir=cacheDir
+
+    def _getFilename(self, key):
+        return os.path.join(self.cacheDir, "%s.json"%key)
+
+    def get(self, key, version):
+        """Get a cached number of cores.
+           key = the cache key
+           version = the mdrun version string
+           returns: the number of cores, or None if there is no valid entry"""
+        try:
+            inf=open(self._getFilename(key), 'r')
+            try:
+                entry=json.load(inf)
+            finally:
+                inf.close()
+        except (IOError, ValueError):
+            return None
+        if entry.get('version') != version:
+            return None
+        return entry.get('cores')
+
+    def put(self, key, version, cores):
+        """Store a number of cores.
+           key = the cache key
+           version = the mdrun version string
+           cores = the number of cores found by tuning"""
+        if not os.path.isdir(self.cacheDir):
+            try:
+                os.makedirs(self.cacheDir)
+            except OSError:
+                # it may have been created concurrently
+                if not os.path.isdir(self.cacheDir):
+                    raise
+        # write to a temporary file first so readers never see partial
+        # entries.
+        fd, tmpname=tempfile.mkstemp(suffix='.tmp', dir=self.cacheDir)
+        outf=os.fdopen(fd, 'w')
+        try:
+            json.dump({ 'version' : version, 'cores' : cores }, outf)
+        finally:
+            outf.close()
+        os.rename(tmpname, self._getFilename(key))
+
+
+def getTuneCache():
+    """Get the server's tune cache. Controllers don't read the server 
+       configuration: the server sets its location in CPC_TUNE_CACHE_DIR.
+       returns: a TuneCache object, or None if there is no cache 
+                directory."""
+    cacheDir=os.environ.get('CPC_TUNE_CACHE_DIR')
+    if cacheDir is None or cacheDir == "":
+        log.debug("No tune cache: CPC_TUNE_CACHE_DIR not set")
+        return None
+    return TuneCache(cacheDir)
+
+
+# (binary path, mtime, size) -> version string
+_mdrunVersions=dict()
+_mdrunVersionsLock=threading.Lock()
+
+def getMdrunVersion():
+    """Get a string that identifies the mdrun executable and its version."""
+    cmdlist = cmds.GromacsCommands().mdrun.split()
+    path=distutils.spawn.find_executable(cmdlist[0])
+    if path is None:
+        path=cmdlist[0]
+    try:
+        st=os.stat(path)
+        statKey=(path, st.st_mtime, st.st_size)
+    except OSError:
+        statKey=(path, None, None)
+    with _mdrunVersionsLock:
+        if statKey in _mdrunVersions:
+            return _mdrunVersions[statKey]
+    proc=subprocess.Popen(cmdlist + [ "-version" ],
+                          stdin=None,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT)
+    (stdo, stde) = proc.communicate(None)
+    # only keep the version and build lines: the rest of the output
+    # contains things like the working directory.
+    lines=[]
+    for line in stdo.splitlines():
+        fields=line.split(':', 1)
+        if len(fields) == 2:
+            name=fields[0].strip().lower()
+            if ('version' in name or 'precision' in name or
+                'built' in name or 'simd' in name):
+                lines.append(line.strip())
+    if len(lines) == 0:
+        version="%s %s %s"%statKey
+    else:
+        version="\n".join(lines)
+    with _mdrunVersionsLock:
+        _mdrunVersions[statKey]=version
+    return version
+
+def getPlatformDescription():
+    """Get a description of the resources tuning runs are done on."""
+    return "%s %s %d"%(platform.system(), platform.machine(),
+                       multiprocessing.cpu_count())
+
+def getTuneKey(tprFile, Nmax):
+    """Get the tune cache key for a tpr file.
+       tprFile = the tpr file name
+       Nmax = the number of cores to start tuning from
+       returns: the key as a hex string"""
+    h=hashlib.sha1()
+    inf=open(tprFile, 'rb')
+    try:
+        while True:
+            buf=inf.read(1024*1024)
+            if len(buf) == 0:
+                break
+            h.update(buf)
+    finally:
+        inf.close()
+    h.update("\0%s\0%d"%(getPlatformDescription(), Nmax))
+    return h.hexdigest()
+
+
 def tune(rsrc, confFile, tprFile, testRunDir, Nmax=None):
     """Set max. run based on configuration file."""
     # TODO: fix this. For now, only count the number of particles and
@@ -98,6 +234,18 @@ def tune(rsrc, confFile, tprFile, testRunDir, Nmax=None):
         Nmax = min(Nsize, NN)
     Nmax = max(1, Nmax)
 
+    cache=getTuneCache()
+    if cache is not None:
+        key=getTuneKey(tprFile, Nmax)
+        version=getMdrunVersion()
+        cores=cache.get(key, version)
+        if cores is not None:
+            log.debug("Using cached tune result for %s: %d cores"%
+                      (tprFile, cores))
+            rsrc.min.set('cores', 1)
+            rsrc.max.set('cores', cores)
+            return
+
     while True:
         # make sure we return a sane number:
         # It's either 4 or smaller, 6, or has at least 3 prime factors. 
@@ -110,6 +258,11 @@ def tune(rsrc, confFile, tprFile, testRunDir, Nmax=None):
         Nmax -= 1 
         if Nmax < 1:
             raise GromacsError("Can't run simulation: %s"%stdo)
+    if cache is not None:
+        try:
+            cache.put(key, version, Nmax)
+        except (IOError, OSError) as e:
+            log.info("Can't write tune cache entry: %s"%str(e))
     rsrc.min.set('cores', 1)
     rsrc.max.set('cores', Nmax)
 
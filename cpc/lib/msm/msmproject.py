@@ -23,6 +23,9 @@ import sys
 import subprocess
 import re
 import logging
+import shutil
+import tempfile
+import multiprocessing
 
 import traceback
 try:
@@ -61,6 +64,39 @@ from cpc.lib.gromacs import cmds
 log=logging.getLogger(__name__)
 
 
+class FrameExtractionError(cpc.dataflow.ApplicationError):
+    pass
+
+
+def extractTrajFrames(job):
+    """Extract a set of frames from a single trajectory in one trjconv pass.
+       job = a tuple of the trjconv command as argument list, the trajectory
+             file name, the tpr file name, the index file name (or None),
+             the group to write, the sorted list of frame numbers, the
+             directory to write the frames to, and the output file name
+             extension (that sets the file format).
+       returns: the list of written file names, in the order of the frame
+                numbers."""
+    trjconv, trajname, tprfile, ndx, group, frames, outdir, ext = job
+    frfile=os.path.join(outdir, 'frames.ndx')
+    outf=open(frfile, 'w')
+    outf.write("[ frames ]\n")
+    for frame in frames:
+        # index files count from 1
+        outf.write("%d\n"%(frame+1))
+    outf.close()
+    args = trjconv + ["-f", trajname, "-s", tprfile, "-fr", frfile, "-sep",
+                      "-o", os.path.join(outdir, 'frame%s'%ext), "-pbc", "mol"]
+    if ndx is not None:
+        args.extend( [ "-n", ndx ] )
+    proc = subprocess.Popen(args, stdin=subprocess.PIPE, 
+                            stdout=sys.stderr, stderr=sys.stderr)
+    proc.communicate(group)
+    # with -sep, trjconv numbers the files in the order it writes them
+    return [ os.path.join(outdir, 'frame%d%s'%(i, ext))
+             for i in xrange(len(frames)) ]
+
+
 class TrajData(object):
     """Information about a trajectory"""
     def __init__(self, lh5, xtc, xtc_nopbc, tpr, dt, frames):
@@ -142,6 +178,70 @@ class MSMProject(object):
 
         random.seed()
 
+        # the number of processes to extract frames with
+        self.nprocs=None
+        nthreads=os.environ.get('CPC_NUM_THREADS')
+        if nthreads is not None:
+            try:
+                self.nprocs=int(nthreads)
+            except ValueError:
+                pass
+        if self.nprocs is None or self.nprocs <= 0:
+            self.nprocs=multiprocessing.cpu_count()
+
+    def extractFrames(self, requests, group, ndx=None):
+        ''' Write trajectory frames to files. All frames of a trajectory are
+            extracted in a single trjconv pass, and different trajectories are
+            processed in parallel.
+            requests = a list of (trajectory file name, frame number, output 
+                       file name) tuples. The same frame may be requested 
+                       more than once. The output files must all have the
+                       same extension.
+            group = the group to write
+            ndx = the index file to read the group from, or None '''
+        if len(requests) == 0:
+            return
+        trajFrames=dict()
+        for trajname, frame_nr, outfn in requests:
+            if trajname not in trajFrames:
+                trajFrames[trajname]=set()
+            trajFrames[trajname].add(frame_nr)
+        jobs=[]
+        trjconv=self.cmdnames.trjconv.split()
+        ext=os.path.splitext(requests[0][2])[1]
+        try:
+            for trajname, frames in trajFrames.iteritems():
+                outdir=tempfile.mkdtemp(dir=self.inp.getOutputDir())
+                jobs.append( (trjconv, trajname, self.tprfile, ndx, group,
+                              sorted(frames), outdir, ext) )
+            sys.stderr.write("Extracting %d frames from %d trajectories.\n"%
+                             (len(requests), len(jobs)))
+            nprocs=min(len(jobs), self.nprocs)
+            if nprocs > 1:
+                pool=multiprocessing.Pool(nprocs)
+                try:
+                    results=pool.map(extractTrajFrames, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results=map(extractTrajFrames, jobs)
+            frameFiles=dict()
+            for job, fnames in zip(jobs, results):
+                trajname, frames = job[1], job[5]
+                for frame_nr, fname in zip(frames, fnames):
+                    frameFiles[(trajname, frame_nr)]=fname
+            for trajname, frame_nr, outfn in requests:
+                fname=frameFiles[(trajname, frame_nr)]
+                if not os.path.exists(fname):
+                    raise FrameExtractionError(
+                                    "Could not extract frame %d from %s"%
+                                    (frame_nr, trajname))
+                shutil.copyfile(fname, outfn)
+        finally:
+            for job in jobs:
+                shutil.rmtree(job[6], ignore_errors=True)
+
 
     #def updateBoxVectors(self):
     #    ''' Fixes new box-vectors on all gro-files in the RandomConfs-dir '''
@@ -344,63 +444,35 @@ class MSMProject(object):
         self.tprfile=self.inp.getInput('trajectories[0].tpr')
         
 
-        # Set a flag to indicate if we have written the maxstate.pdb-file
-        have_maxstate=0
-        
-        for i in xrange(NumStates):
-            traj_num    = RandomConfs[i][0][0]
-            frame_nr    = RandomConfs[i][0][1]
-            lh5name     = Proj.GetTrajFilename(traj_num)            
-            #sys.stderr.write("trajectory name=%s\n"%lh5name)
+        # Write out a pdb of the most populated state
+        if MaxState < NumStates:
+            traj_num    = RandomConfs[MaxState][0][0]
+            frame_nr    = RandomConfs[MaxState][0][1]
+            lh5name     = Proj.GetTrajFilename(traj_num)
             trajdata    = self.trajData[lh5name]
-            trajname    = trajdata.xtc
-            #trajname    = trajname.replace('.nopbc.lh5','.xtc')
-            time        = frame_nr * trajdata.dt #* self.nstxtcout
-
-            #if(i<10*self.num_to_start):
-                #proc = subprocess.Popen(["trjconv","-f","%s"%trajname,"-s","%s"%os.path.join(self.inp.getOutputDir(),'topol.tpr'),"-o",os.path.join(self.inp.getOutputDir(),'micro%d.gro'%i),"-pbc","mol","-dump","%d"%time], stdin=subprocess.PIPE, stdout=sys.stdout, stderr=sys.stderr)
-                
-                #proc.communicate("0")
-
-            # Write out a pdb of the most populated state
-            if(i==MaxState and have_maxstate==0):
-                maxstatefn=os.path.join(self.inp.getOutputDir(), 'maxstate.pdb')
-                sys.stderr.write("writing out pdb of most populated state.\n")
-                args = self.cmdnames.trjconv.split()
-                args += ["-f", trajname, "-s", self.tprfile,
-                         "-o", maxstatefn, "-pbc", "mol", "-dump", "%d" % time]
-                if self.ndx is not None:
-                    args.extend( [ "-n", self.ndx ] )
-                proc = subprocess.Popen(args, stdin=subprocess.PIPE, 
-                                        stdout=sys.stdout, stderr=sys.stderr)
-                proc.communicate(self.grpname)
-                self.out.setOut('maxstate', FileValue(maxstatefn))
-                have_maxstate=1
+            maxstatefn=os.path.join(self.inp.getOutputDir(), 'maxstate.pdb')
+            sys.stderr.write("writing out pdb of most populated state.\n")
+            self.extractFrames([ (trajdata.xtc, frame_nr, maxstatefn) ],
+                               self.grpname, self.ndx)
+            self.out.setOut('maxstate', FileValue(maxstatefn))
 
         # now evenly sample configurations and put them in the array
         # newRuns. If we're later assigning macrosates, we'll overwrite them
         # with adaptive sampling configurations
         self.newRuns=[]
+        requests=[]
         for j in xrange(self.num_to_start*self.num_macro):
             # pick a cluster at random:
-            i=random.random()*int(NumStates)
+            i=int(random.random()*int(NumStates))
             traj_num    = RandomConfs[i][0][0]
             frame_nr    = RandomConfs[i][0][1]
             lh5name     = Proj.GetTrajFilename(traj_num)            
             trajdata    = self.trajData[lh5name]
-            trajname    = trajdata.xtc
-            time        = frame_nr * trajdata.dt 
-            #maxstatefn=os.path.join(self.inp.getOutputDir(), '.conf')
             outfn=os.path.join(self.inp.getOutputDir(), 'new_run_%d.gro'%(j))
-            args = self.cmdnames.trjconv.split()
-            args += ["-f", "%s"%trajname, "-s", self.tprfile, 
-                     "-o", outfn, "-pbc", "mol", "-dump", "%d" % time]
-            sys.stderr.write("writing out new run %s .\n"%outfn)
-            proc = subprocess.Popen(args, stdin=subprocess.PIPE, 
-                                    stdout=sys.stdout, 
-                                    stderr=sys.stderr)
-            proc.communicate('0')
+            requests.append( (trajdata.xtc, frame_nr, outfn) )
             self.newRuns.append(outfn)
+        sys.stderr.write("writing out %d new runs.\n"%len(requests))
+        self.extractFrames(requests, '0')
 
 
         #os.remove('mdout.mdp')
@@ -494,39 +566,24 @@ class MSMProject(object):
        
         self.newRuns=[]
         self.macroConfs=[]
+        requests=[]
         for k,v in StartStates.items():
-            num_started = 0
-            for i in xrange(NumStates):
-                if i==k:
-                    trajnum  = RandomConfs[i][0][0]
-                    frame_nr = RandomConfs[i][0][1]
-                    lh5name  = Proj.GetTrajFilename(trajnum)            
-                    trajdata    = self.trajData[lh5name]
-                    trajname    = trajdata.xtc
-                    time        = frame_nr * trajdata.dt #* self.nstxtcout
-                    #time     = frame_nr * self.dt *self.nstxtcout
-                    #trajname = Proj.GetTrajFilename(trajnum)
-                    #trajname = trajname.replace('.nopbc.lh5','.xtc')
-
-                    first=True
-                    # Use trjconv to write new starting confs
-                    while(num_started < self.num_to_start):
-                        sys.stderr.write("Writing new start confs.\n")
-                        outfn=os.path.join(self.inp.getOutputDir(),
-                                           'macro%d-%d.gro'%(i,num_started))
-                        args = self.cmdnames.trjconv.split()
-                        args += ["-f", "%s" % trajname, "-s", self.tprfile,
-                              "-o", outfn, 
-                              "-pbc", "mol", "-dump", "%d" % time]
-                        proc = subprocess.Popen(args, stdin=subprocess.PIPE, 
-                                                stdout=sys.stdout, 
-                                                stderr=sys.stderr)
-                        proc.communicate('0')
-                        num_started = num_started + 1
-                        self.newRuns.append(outfn)
-                        if first:
-                            self.macroConfs.append(outfn)
-                            first=False
+            if k >= NumStates:
+                continue
+            trajnum  = RandomConfs[k][0][0]
+            frame_nr = RandomConfs[k][0][1]
+            lh5name  = Proj.GetTrajFilename(trajnum)            
+            trajdata = self.trajData[lh5name]
+            # write new starting confs
+            for num_started in xrange(self.num_to_start):
+                outfn=os.path.join(self.inp.getOutputDir(),
+                                   'macro%d-%d.gro'%(k,num_started))
+                requests.append( (trajdata.xtc, frame_nr, outfn) )
+                self.newRuns.append(outfn)
+                if num_started == 0:
+                    self.macroConfs.append(outfn)
+        sys.stderr.write("Writing %d new start confs.\n"%len(requests))
+        self.extractFrames(requests, '0')
 
         # now set the macro state outputs:
         i=0
@@ -7,6 +7,10 @@ import re
 import os
 from math import sqrt,asin,pi
 
+import numpy
+
+import gmx_readers
+
 # parse a .gro file
 # 3 dimensional vector
 class v3d:
@@ -44,20 +48,15 @@ def calc_dihre(a1,a2,a3,a4):
 
 def dihedrals(conf,ndx): 
     # parse the necessary files
-    conf=open(conf,'r').readlines()[2:][:-1]
+    gro=gmx_readers.read_gro(conf)
     ndx=open(ndx,'r').readlines()[1].split()
     if len(ndx)%4 != 0:
       sys.stderr.write('The index contains a number of atoms which is not divisible by 4, thus does not define a set of dihedral angles!')
-    for i in range(len(ndx)):
-      ndx[i]=int(ndx[i])
-    p={}
-    for line in conf:
-      if len(line)>0 and ";"!=line[0]:
-        a=atom(line)
-        p[a.atomnr]=a.coord
-    # call the dihedral function
-    dihres=[]
-    while len(ndx)!=0:
-      dihres.append(calc_dihre(p[ndx[0]],p[ndx[1]],p[ndx[2]],p[ndx[3]]))
-      ndx=ndx[4:]
-    return dihres
+    ndx=numpy.array(ndx[:len(ndx)-len(ndx)%4], dtype=int).reshape(-1,4)
+    missing=numpy.setdiff1d(ndx, gro.atomnr)
+    if len(missing) > 0:
+      raise KeyError(int(missing[0]))
+    p=gro.coords_by_atomnr()
+    # calculate all dihedrals at once
+    return gmx_readers.dihedral_angles(p[ndx[:,0]],p[ndx[:,1]],
+                                       p[ndx[:,2]],p[ndx[:,3]]).tolist()
@@ -0,0 +1,243 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011-2015, Sander Pronk, Iman Pouya, Grant Rotskoff, Bjorn Wesen, Erik Lindahl and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# Vectorized readers for the GROMACS text files used by the swarms scripts.
+#
+# The .gro format has fixed columns (which may touch, so they can't be split
+# on whitespace): residue number, residue name, atom name and atom number in
+# 5-character fields, followed by the x, y, z coordinates in 8-character
+# fields. Instead of converting every field of every line in python, the
+# atom lines are put in a 2D character array and each column block is
+# converted in one go.
+#
+# Topologies, index files and reference configurations are read over and
+# over again by the swarms scripts (for every string point and chain), so
+# their parsed contents are cached, keyed on the file path and its
+# modification time and size.
+
+import os
+import threading
+
+import numpy
+
+
+# (kind, absolute path) -> (mtime, size, parsed contents)
+_cache = {}
+_cache_lock = threading.Lock()
+
+def cached(fn, kind, parse):
+    """Get the parsed contents of a file, only parsing it again if it has
+       changed since the last call.
+       fn = the file name
+       kind = a string describing the type of parse
+       parse = the function that parses the file name into its contents
+       returns: the parsed contents. These are shared between callers and must
+                not be modified."""
+    path = os.path.abspath(fn)
+    st = os.stat(path)
+    key = (kind, path)
+    with _cache_lock:
+        entry = _cache.get(key)
+    if (entry is not None and entry[0] == st.st_mtime and
+        entry[1] == st.st_size):
+        return entry[2]
+    value = parse(fn)
+    with _cache_lock:
+        _cache[key] = (st.st_mtime, st.st_size, value)
+    return value
+
+def clear_cache():
+    """Remove all cached file contents."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _char_array(lines, width):
+    """Put a list of lines in a 2D character array, with one row per line.
+       Lines are padded with spaces or cut to width characters."""
+    arr = numpy.array(lines, dtype='S%d' % width)
+    chars = arr.view('S1').reshape(len(lines), width)
+    # short lines are padded with nulls
+    chars[chars == ''] = ' '
+    return chars
+
+def _columns(chars, start, width, count, dtype):
+    """Convert a block of fixed-width number columns of a character array.
+       chars = the 2D character array
+       start = the first character of the block
+       width = the width of each column
+       count = the number of columns
+       dtype = the number type
+       returns: a 2D array with count columns."""
+    n = chars.shape[0]
+    block = numpy.empty((n, count, width + 1), dtype='S1')
+    block[:, :, :width] = chars[:, start:start + width * count].reshape(
+                                                            n, count, width)
+    # separate touching fields
+    block[:, :, width] = ' '
+    ret = numpy.fromstring(block.tostring(), dtype=dtype, sep=' ')
+    if len(ret) != n * count:
+        raise ValueError('Malformed number column at character %d' % start)
+    return ret.reshape(n, count)
+
+def _names(chars, start, width):
+    """Get a fixed-width text column of a character array, stripped of
+       whitespace."""
+    col = numpy.ascontiguousarray(chars[:, start:start + width])
+    return numpy.char.strip(col.view('S%d' % width).ravel())
+
+
+class GroFile(object):
+    """The contents of a .gro file as arrays, with one entry per atom."""
+    def __init__(self, fn):
+        """Read a .gro file.
+           fn = the file name"""
+        with open(fn, 'r') as gro_f:
+            lines = gro_f.read().splitlines()
+        self.title = lines[0]
+        natoms = int(lines[1])
+        atom_lines = lines[2:2 + natoms]
+        if len(atom_lines) != natoms:
+            raise ValueError('%s: expected %d atoms, found %d' %
+                             (fn, natoms, len(atom_lines)))
+        self.box = lines[2 + natoms] if len(lines) > 2 + natoms else ''
+        self._chars = _char_array(atom_lines, 44)
+        self.resnr = _columns(self._chars, 0, 5, 1, int)[:, 0]
+        self.atomnr = _columns(self._chars, 15, 5, 1, int)[:, 0]
+        self.x = _columns(self._chars, 20, 8, 3, float)
+        self._resname = None
+        self._atomname = None
+        self._sol = None
+
+    def __len__(self):
+        return len(self.resnr)
+
+    # the text columns are only converted when they are used
+    @property
+    def resname(self):
+        if self._resname is None:
+            self._resname = _names(self._chars, 5, 5)
+        return self._resname
+
+    @property
+    def atomname(self):
+        if self._atomname is None:
+            self._atomname = _names(self._chars, 10, 5)
+        return self._atomname
+
+    @property
+    def sol(self):
+        """A boolean mask of the lines containing 'SOL': the same test as
+           res_selection.protein() uses to skip water."""
+        if self._sol is None:
+            c = self._chars
+            self._sol = numpy.zeros(len(c), dtype=bool)
+            for i in range(c.shape[1] - 2):
+                self._sol |= ((c[:, i] == 'S') & (c[:, i + 1] == 'O') &
+                              (c[:, i + 2] == 'L'))
+        return self._sol
+
+    def unwrapped(self):
+        """Get the number of atoms before the atom numbers wrap around.
+           Atom numbers in .gro files have 5 digits, so in large systems they
+           restart at 0 after 99999 and are no longer unique."""
+        wraps = numpy.flatnonzero(numpy.diff(self.atomnr) < 0)
+        if len(wraps) == 0:
+            return len(self.atomnr)
+        return wraps[0] + 1
+
+    def select(self, atoms_ndx):
+        """Get a boolean mask of the atoms with the given atom numbers.
+           Only atoms before the atom numbers wrap around are selected.
+           atoms_ndx = the list or array of atom numbers"""
+        mask = numpy.in1d(self.atomnr, numpy.asarray(atoms_ndx, dtype=int))
+        mask[self.unwrapped():] = False
+        return mask
+
+    def coords_by_atomnr(self):
+        """Get the coordinates as an array indexed on atom number, with the
+           last atom with a given number taking precedence."""
+        ret = numpy.zeros((max(numpy.max(self.atomnr) + 1, 1), 3))
+        ret[self.atomnr] = self.x
+        return ret
+
+
+def read_gro(fn, cache=False):
+    """Read a .gro file.
+       fn = the file name
+       cache = whether to use the parse cache. Only use this for files that
+               are read repeatedly, such as reference configurations.
+       returns: a GroFile object"""
+    if cache:
+        return cached(fn, 'gro', GroFile)
+    return GroFile(fn)
+
+
+def _parse_ndx(fn):
+    with open(fn, 'r') as ndx_f:
+        # skip the group name on the first line
+        ndx_f.readline()
+        return numpy.fromstring(ndx_f.read(), dtype=int, sep=' ')
+
+def read_ndx(fn):
+    """Read an index file with a single group.
+       returns: an array of atom numbers."""
+    return cached(fn, 'ndx', _parse_ndx)
+
+
+class XvgDihedrals(object):
+    """The output of g_rama as arrays: a phi, psi pair and a residue number
+       for each line. If there are several chains, the residues repeat."""
+    def __init__(self, fn):
+        with open(fn, 'r') as xvg_f:
+            lines = [ line for line in xvg_f
+                      if line[0] != '@' and line[0] != '#' and line.strip() ]
+        if len(lines) == 0:
+            self.phipsi = numpy.zeros((0, 2))
+            self.resnr = numpy.zeros(0, dtype=int)
+            return
+        fields = numpy.array(''.join(lines).split()).reshape(-1, 3)
+        self.phipsi = fields[:, 0:2].astype(float)
+        # ARG-8 => 8
+        self.resnr = numpy.char.rpartition(fields[:, 2], '-')[:, 2].astype(int)
+
+    def select(self, rsel):
+        """Get a boolean mask of the lines for the selected residues.
+           rsel = a list or set of residue numbers"""
+        return numpy.in1d(self.resnr, numpy.fromiter(rsel, dtype=int))
+
+
+def read_xvg_dihedrals(fn):
+    """Read the phi/psi dihedrals written by g_rama.
+       returns: an XvgDihedrals object."""
+    return XvgDihedrals(fn)
+
+
+def dihedral_angles(a1, a2, a3, a4):
+    """Calculate dihedral angles for arrays of atom positions.
+       a1, a2, a3, a4 = the (N,3) arrays of positions of the four atoms of
+                        each dihedral
+       returns: an array of N angles in degrees, from the angle between the
+                normals of the two planes (in the range 0-90)."""
+    n1 = numpy.cross(a1 - a2, a3 - a2)
+    n2 = numpy.cross(a4 - a3, a2 - a3)
+    cross = numpy.sqrt(numpy.sum(numpy.cross(n1, n2)**2, axis=1))
+    norms = (numpy.sqrt(numpy.sum(n1**2, axis=1)) *
+             numpy.sqrt(numpy.sum(n2**2, axis=1)))
+    # rounding can give values slightly larger than 1
+    return numpy.degrees(numpy.arcsin(numpy.minimum(cross / norms, 1.)))
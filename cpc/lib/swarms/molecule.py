@@ -9,6 +9,8 @@ import sys
 import re
 import os
 
+import gmx_readers
+
 class atom:
     # read an atom from a line
     def __init__(self, line):
@@ -21,7 +23,7 @@ class atom:
 
 
 # read a .top file into a structure description
-def molecule(top): 
+def _read_molecule(top):
     top=open(top,'r').read()
     # isolate the [ atoms ] section
     top=top.split('[ atoms ]')
@@ -33,3 +35,8 @@ def molecule(top):
                 prot.append(atom(line))
     return prot
 
+
+# Topologies are read for every string point and chain, so the parsed atoms
+# are cached; they are shared and must not be modified.
+def molecule(top):
+    return gmx_readers.cached(top, 'molecule', _read_molecule)
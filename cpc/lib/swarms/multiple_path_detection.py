@@ -14,6 +14,7 @@ import sys
 import re
 import os
 import res_selection
+from string_rep import reparametrize_string
 from selection import molecule
 
 # helper functions
@@ -27,56 +28,6 @@ def scale(k,v):
 
 def mapadd(x,y): return map(add,x,y)
 
-def sub(x,y): return y-x
-
-def dist(v1,v2):
-        return sum([x**2 for x in map(sub,v1,v2)])**(.5)
-
-# path length upto the nth interpolant
-# 1-based indexing following Maragliano
-def L(n,path):
-        if n==0: return 1
-        else:
-                pathlength = 0
-                for i in range(n-1):
-                        pathlength+=dist(path[i],path[i+1])
-                return pathlength
-
-def s(m,path):
-        R=len(path)-1
-        return (m-1)*L(R,path)/(R-1)
-
-def dir(v1,v2):
-        normed = []
-        d = dist(v1,v2)
-        for x in map(sub,v1,v2):
-                normed+=[x/d]
-        return normed
-
-# reparametrize the points
-# see Maragliano et al, J. Chem Phys (125), 2006
-# we use a linear interpolation in Euclidean space
-# adjusted to ensure equidistance points
-# each item in newpts is a point an r*2 dimensional point in colvars space,
-# where r is the number of residues in the selection
-def rep_pts(newpts):
-    adjusted=[newpts[0],newpts[len(newpts)-1]]
-    for i in range(2,len(newpts)): 
-            k=2
-            while (L(k-1,newpts)>=s(i,newpts) or s(i,newpts)>L(k,newpts)):
-               k+=1
-            v=dir(newpts[k-2],newpts[k-1])
-            reppt=(map(add,newpts[k-2],scale((s(i,newpts)-L(k-1,newpts)),v)))
-            adjusted.insert(i-1,reppt)
-            #sys.stderr.write('The swarm point %d is: %s'%(i,newpts[i-1]))
-            #print('The swarm point %d is: %s'%(i,newpts[i-1]))
-            #sys.stderr.write('The reparametrized point %d is: %s\n'%(i,reppt))
-            #print('The reparametrized point %d is: %s\n'%(i,reppt))
-    #i=0 
-    #for i in range(len(newpts)-1):
-    #    print dist(adjusted[i],adjusted[i+1])
-    return adjusted
-
 def reparametrize(diheds, selection, start_conf, start_xvg, end_conf, end_xvg, top): 
     Nswarms = len(diheds[0])
     rsel = res_selection.res_select('%s'%start_conf,'%s'%selection)
@@ -119,23 +70,15 @@ def reparametrize(diheds, selection, start_conf, start_xvg, end_conf, end_xvg, t
                             phi_val = float(line.split()[0])
                             psi_val = float(line.split()[1])
                             targetpt+=[phi_val,psi_val]
-    # something with 1 indexing makes this padding necessary.
-    paddingpt=[0]*len(initpt)
     newpts.insert(0,initpt)
     newpts.append(targetpt)
-    newpts.append(paddingpt)
     sys.stderr.write('The new list of points is: %s\n' %newpts)
     for pt in newpts:
         sys.stderr.write('%s %s\n'%(pt[0],pt[1]))
-    adjusted=rep_pts(newpts)
+    # reparametrize the points, with a fixed number of iterations
     # TODO implement a dist_treshold=1.0
-    iters=[adjusted]
-    for i in range(100):
-        iters.append(rep_pts(iters[i]))
-
-    adjusted=iters[-1]
-    # delete the padding point
-    adjusted=adjusted[:-1]
+    adjusted, maxspread, niter=reparametrize_string(newpts, maxiter=100,
+                                                    tolerance=None)
     sys.stderr.write('The adjusted points are:\n')
     for pt in adjusted:
         sys.stderr.write('%s %s\n'%(pt[0],pt[1]))
@@ -1,40 +1,29 @@
 ## Bjorn Wesen 2014
 
+import gmx_readers
+
 def readxvg(xvg, rsel):
+    # Each line has a phi and psi val and a residue number, and after looping over all
+    # residues the loops can repeat if there are many chains in the protein. The array
+    # we build is indexed on residue, and then there are Nchains sub-indices with a 
+    # phi,psi pair each.
+    dih = gmx_readers.read_xvg_dihedrals(xvg)
+    mask = dih.select(rsel)
     d = {}
-    with open(xvg, 'r') as xvg_f:
-        # Each line has a phi and psi val and a residue number, and after looping over all
-        # residues the loops can repeat if there are many chains in the protein. The array
-        # we build is indexed on residue, and then there are Nchains sub-indices with a 
-        # phi,psi pair each.
-        for line in xvg_f:
-            if line[0] != '@' and line[0] != '#':   # skip comment rows in the xvg
-                parts = line.split()
-                phipsi = [ float(parts[0]), float(parts[1]) ]  # phi psi
-                residue = int(parts[2].split('-')[1])   # ARG-8 => 8
-                if residue in rsel:
-                    try:
-                        d[residue].append(phipsi)  # => add one more ch
-                    except KeyError:
-                        d[residue] = [ phipsi ]    # => d[r][ch] = [ phi, psi ]
-    #print d
+    for residue, phipsi in zip(dih.resnr[mask].tolist(),
+                               dih.phipsi[mask].tolist()):
+        try:
+            d[residue].append(phipsi)  # => add one more ch
+        except KeyError:
+            d[residue] = [ phipsi ]    # => d[r][ch] = [ phi, psi ]
     return d
 
 
-# Same function but output all values into a 1-dimensional array, on residue, chain, phi/psi
+# Same function but output all values into a 1-dimensional numpy array, on residue, chain, phi/psi
 
 def readxvg_flat(xvg, rsel):
-    d = []
-    with open(xvg, 'r') as xvg_f:
-        for line in xvg_f:
-            if line[0] != '@' and line[0] != '#':   # skip comment rows in the xvg
-                parts = line.split()
-                phipsi = [ float(parts[0]), float(parts[1]) ]  # phi psi
-                residue = int(parts[2].split('-')[1])   # ARG-8 => 8
-                if residue in rsel:
-                    d += phipsi
-    #print d
-    return d
+    dih = gmx_readers.read_xvg_dihedrals(xvg)
+    return dih.phipsi[dih.select(rsel)].ravel()
 
 
 # Read the dihedral restraint section from an .itp file and return the angles in a flat array
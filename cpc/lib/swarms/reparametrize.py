@@ -38,157 +38,8 @@ import readxvg
 import rwgro
 from molecule import molecule
 
-# These are needed for the external C-based rep helper
-import subprocess
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from StringIO import StringIO
-
-# helper functions
-def add(x, y): return x + y
-
-def scale(k, v):
-        scaled = []
-        for vi in v:
-                scaled += [k * vi]
-        return scaled
-
-def mapadd(x, y): return map(add, x, y)
-
-def sub(x, y): return y - x
-
-def dist(v1, v2):
-        return sum([x**2 for x in map(sub, v1, v2)])**(.5)
-
-# path length upto the nth interpolant
-# 1-based indexing following Maragliano
-def L(n, path):
-        if n==0: 
-                return 1
-        else:
-                pathlength = 0
-                for i in range(n - 1):
-                        pathlength += dist(path[i], path[i + 1])
-                return pathlength
-
-def s(m, path):
-        R = len(path) - 1
-        return (m - 1) * L(R, path) / (R - 1)
-
-def dir(v1, v2):
-        normed = []
-        d = dist(v1, v2)
-        for x in map(sub, v1, v2):
-                normed += [x / d]
-        return normed
-
-# Reparametrize the points
-# see Maragliano et al, J. Chem Phys (125), 2006
-# we use a linear interpolation in Euclidean space
-# adjusted to ensure equidistance points
-# each item in newpts is a K-length list corresponding to a point in the K-dimensional CV-space
-# (for example, K = 2*num_selected_residues for phi/psi dihedrals)
-#
-# TODO: evaluate if a spline-fit here produces a better reparametrization
-
-def rep_pts(newpts):
-    adjusted = [ newpts[0], newpts[ len(newpts) - 1 ] ]
-    for i in range(2, len(newpts)): 
-            k = 2
-            while (L(k - 1, newpts) >= s(i, newpts) or s(i, newpts) > L(k, newpts)):
-               k += 1
-            v = dir(newpts[k - 2], newpts[k - 1])
-            reppt = (map(add, newpts[k - 2], scale((s(i, newpts) - L(k - 1, newpts)), v)))
-            adjusted.insert(i - 1, reppt)
-            #sys.stderr.write('The swarm point %d is: %s'%(i,newpts[i-1]))
-            #print('The swarm point %d is: %s'%(i,newpts[i-1]))
-            #sys.stderr.write('The reparametrized point %d is: %s\n'%(i,reppt))
-            #print('The reparametrized point %d is: %s\n'%(i,reppt))
-
-    # Calculate the CV distance between the stringpoints (this is the thing we're trying to equalize
-    # during the reparametrization) and the average distance
-    dists = []
-    avgdist = 0.0
-    # Note: there is a zeroed padding-point appended on the end here, which we shouldn't
-    # consider (TODO: check if this is necessary due to the iterations above or why...)
-    for i in range(len(newpts) - 2):
-            d = dist(adjusted[i], adjusted[i + 1])
-            dists += [ d ]
-            avgdist += d
-            #sys.stderr.write('%d to %d: dist %f\n' % (i, i+1, d))
-    avgdist = avgdist / (len(newpts) - 1)
-
-    # Another pass to check the spread against the average, remember the largest diff
-    # Same note as above, re padding point
-    maxspread = 0.0
-    for i in range(len(newpts) - 2):
-            spread = abs(dists[i] - avgdist)   # L1 
-            if spread > maxspread:
-                    maxspread = spread
-
-    #sys.stderr.write('  => minspread is %f (average dist %f)\n' % (minspread, avgdist))
-
-    # Return the max spread and the adjusted points as elements in a list
-    return [ maxspread, adjusted ]
-
-# Version of the rep_pts() function which uses an external C-program for the inner loop, speeding
-# up the iteration severely.
-
-def ext_rep_pts(newpts):
-        FNULL = open(os.devnull, 'w') # sink for output spam
-        # Have to locate the C-helper executable which is in the same dir as this python file (but the
-        # actual current working dir is somewhere else!)
-        # Don't forget to do a make in the dir so rep.cc compiles to rep.
-        prochandle = subprocess.Popen([ '%s/rep' % (os.path.dirname(os.path.realpath(__file__))) ], 
-                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=FNULL)
-        numpts = len(newpts)
-        numcvs = len(newpts[0])
-        #sys.stderr.write('  sending %d pts of %d cvs to the rep\n' % (numpts, numcvs))
-        writeStdin = StringIO()
-        writeStdin.write('%d %d\n' % (numpts, numcvs))
-        for p in range(0, numpts):  # python range() is exclusive on the end
-                point = newpts[p]
-                for i in range(0, numcvs):
-                        writeStdin.write('%f\n' % point[i])
-        repres = prochandle.communicate(writeStdin.getvalue())  # returns a (stdout,stderr) tuple
-        # stdout will be the flattened reparametrized array, in the same order as the flattened input we
-        # just created, with \n between each value. split and re-create as an adjusted[] array.
-        flatres = repres[0].split()
-        fidx = 0
-        adjusted = [ ]
-        for p in range(0, numpts):
-                point = [ ]
-                for i in range(0, numcvs):
-                        point += [ float(flatres[fidx]) ]
-                        fidx += 1
-                adjusted += [ point ]
-
-        # Calculate the CV distance between the stringpoints (this is the thing we're trying to equalize
-        # during the reparametrization) and the average distance
-        dists = []
-        avgdist = 0.0
-        # Note: there is a zeroed padding-point appended on the end here, which we shouldn't
-        # consider (TODO: check if this is necessary due to the iterations above or why...)
-        for i in range(len(newpts) - 2):
-                d = dist(adjusted[i], adjusted[i + 1])
-                dists += [ d ]
-                avgdist += d
-                #sys.stderr.write('%d to %d: dist %f\n' % (i, i+1, d))
-        avgdist = avgdist / (len(newpts) - 1)
-
-        # Another pass to check the spread against the average, remember the largest diff
-        # Same note as above, re padding point
-        maxspread = 0.0
-        for i in range(len(newpts) - 2):
-                spread = abs(dists[i] - avgdist)   # L1
-                if spread > maxspread:
-                        maxspread = spread
-
-        #sys.stderr.write('  => maxspread is %f (average dist %f)\n' % (maxspread, avgdist))
-
-        # Return the max spread and the adjusted points as elements in a list
-        return [ maxspread, adjusted ]
+import numpy
+from string_rep import reparametrize_string
 
 # start/end_xvg will be None for the posres case
 # last_resconfs[] will be None for dihedrals. It also begins at index 0, corresponding to the path point 1.
@@ -237,16 +88,15 @@ def reparametrize(use_posres, fix_endpoints, cvs, ndx_file, Nchains,
                     else:
                             zpt = readxvg.readxvg_flat(cvs[pathpt][i], rsel)
                     swarmpts.append(zpt)
-            zptsum = reduce(mapadd, swarmpts)
-            avgdrift = scale((1 / float(Nswarms)), zptsum)
+            avgdrift = numpy.sum(swarmpts, axis=0) / float(Nswarms)
             newpts.append(avgdrift)
 
     # Read in the fixed start and end CV values, for the fix_endpoints case (otherwise the start/end will
     # be allowed to drift just like the other points, and they will already then be a part of the newpts array)
     if fix_endpoints == 1:
         if use_posres == 1:
-            # TODO: the start/end_conf are full Systems so the atom numbering aliases for the ndx_atoms array :/
-            # Currently fixed in readgro_flat temporary, hardcoded for the GLIC Protein number. 
+            # The start/end_conf are full Systems so the atom numbering aliases for the ndx_atoms array;
+            # readgro_flat only selects atoms before the numbering wraps around.
             initpt = rwgro.readgro_flat(start_conf, ndx_atoms)
             targetpt = rwgro.readgro_flat(end_conf, ndx_atoms)
         else:
@@ -259,48 +109,19 @@ def reparametrize(use_posres, fix_endpoints, cvs, ndx_file, Nchains,
         newpts.insert(0, initpt)
         newpts.append(targetpt)
 
-    # something with 1 indexing makes this padding necessary. TODO: check if this is needed anymore
-    paddingpt = [0] * len(newpts[0])
-    newpts.append(paddingpt)
-
     # Do the actual reparameterization
-    # newpts is a 2D list, first level is one per stringpoint, second is the linear list of CVs
-
-    # rep_pts returns the maximum spread of the CV distances between points in [0] and the adjusted
-    # points in [1]
-
-    # Initial iteration
-    rep_it1 = ext_rep_pts(newpts)
-    adjusted = rep_it1[1]   # get the points only, ignore the spread result
-
-    # Keep iterating, feeding the result of the previous result into rep_pts again
-    # Note that with long CV vectors (> 4000 dimensions) iterations takes a long time
-    # (at least 45 min for 25 iterations on a single-core 3.5 GHz) when using the python rep_pts.
-    # We can abort early when the maximum spread between points in the updated string goes
-    # below a threshold
-    iters = [ adjusted ]
-    i = 0
-    maxspread = 100.0
+    # newpts is one row per stringpoint, each row the linear list of CVs.
+    # Keep iterating, feeding the result of the previous pass into the next
+    # one. Each pass moves the points along the string, so we can abort
+    # early when the maximum spread between points in the updated string
+    # goes below a threshold.
     # Do max 150 iterations even if we don't reach our goal
-    while i < 150 and maxspread > 0.012:
-        sys.stderr.write('Rep iter %d: \n' % i)
-        sys.stderr.flush()
-        rep_it = ext_rep_pts(iters[i])
-        maxspread = rep_it[0]
-        sys.stderr.write('  maxspread was %f\n' % maxspread)
-        # Remember the adjusted points
-        iters.append(rep_it[1])
-        i = i + 1
+    adjusted, maxspread, i = reparametrize_string(newpts, maxiter=150,
+                                                  tolerance=0.012,
+                                                  log=sys.stderr)
 
     sys.stderr.write('Final maximum spread %f after %d iterations.\n' % (maxspread, i))
 
-    # Get the final iteration's result
-    adjusted = iters[-1]
- 
-    # delete the padding point
-    adjusted = adjusted[:-1]
-    newpts = newpts[:-1]
-
     #sys.stderr.write('Pts before repa:\n %s\n' % newpts)
     #sys.stderr.write('The adjusted pts:\n %s\n' % adjusted)
 
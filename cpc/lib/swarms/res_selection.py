@@ -12,6 +12,10 @@ import sys
 import re
 import os
 
+import numpy
+
+import gmx_readers
+
 class atom:
     # read an atom from a line
     def __init__(self, line):
@@ -34,7 +38,7 @@ class atom:
 
 
 # read a .gro file into atom types
-def protein(conf): 
+def _read_protein(conf):
     conf=open(conf,'r').readlines()
     j=2 # skip the header of the .gro file
     prot = []
@@ -44,24 +48,25 @@ def protein(conf):
             j+=1
     return prot
 
+# The reference configuration is read for every string point, so the
+# parsed atoms are cached; they are shared and must not be modified.
+def protein(conf):
+    return gmx_readers.cached(conf, 'protein', _read_protein)
+
 # Read the index file and return the atoms as a list
 # The index file must have one group only
 
 def read_ndx(index_fn):
-    with open(index_fn, 'r') as ndx_f:
-        ndx = ''.join(ndx_f.readlines()[1:]).split()
-        # Convert all members to integers before returning the list
-        return map(int, ndx)
+    return gmx_readers.read_ndx(index_fn).tolist()
 
 # Take a list of atoms belonging to the residues to select, and output the list of
 # affected residues. this is designed so that the user can use make_ndx, select the desired residues
 # and it will output a list of atoms (and not residues).
 # Use read_ndx to read the atom index from a .ndx file
 def res_select(conf, atom_index):
-    prot = protein(conf)
-    res_selection = []
-    for a in atom_index:
-            res_selection += [prot[a - 1].resnr]
-    res_selection = list(set(res_selection)) # remove redundant copies of the resnr
+    gro = gmx_readers.read_gro(conf, cache=True)
+    # the atom index counts the atoms that aren't water
+    resnr = gro.resnr[~gro.sol]
+    res_selection = resnr[numpy.asarray(atom_index, dtype=int) - 1]
+    res_selection = list(set(res_selection.tolist())) # remove redundant copies of the resnr
     return res_selection
-
@@ -0,0 +1,109 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011-2015, Sander Pronk, Iman Pouya, Grant Rotskoff, Bjorn Wesen, Erik Lindahl and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# String reparametrization shared by the swarms scripts.
+#
+# See Maragliano et al, J. Chem Phys (125), 2006: the points of a string in
+# CV space are redistributed so that they are equidistant along the string,
+# using a linear interpolation in Euclidean space. A string is a 2D array
+# with one row per string point; each row is a K-length vector in the
+# K-dimensional CV-space (for example, K = 2*num_selected_residues for
+# phi/psi dihedrals, or 3*num_atoms for position restraints).
+#
+# This replaces the pure-python rep_pts() (which recomputed the path length
+# for every point) and the external rep helper program.
+
+import numpy
+
+
+def arc_length(pts):
+    """Calculate the cumulative arc length along a string.
+       pts = the string, as a 2D array
+       returns: a 1D array with the path length up to each string point."""
+    seglen = numpy.sqrt(numpy.sum(numpy.diff(pts, axis=0)**2, axis=1))
+    cum = numpy.empty(len(pts))
+    cum[0] = 0.
+    numpy.cumsum(seglen, out=cum[1:])
+    return cum
+
+def rep_pts(pts):
+    """Do one reparametrization pass: place the string points at equal arc
+       length intervals along the piecewise linear path through the input
+       points. The first and last points stay fixed.
+       pts = the string, as a 2D array (or a list of lists)
+       returns: the reparametrized string as a new 2D array."""
+    pts = numpy.array(pts, dtype=numpy.float64)
+    npts = len(pts)
+    if npts < 3:
+        return pts
+    cum = arc_length(pts)
+    if cum[-1] <= 0.:
+        return pts
+    targets = numpy.linspace(0., cum[-1], npts)[1:-1]
+    # the segment each target falls in: cum[k-1] < target <= cum[k]
+    k = numpy.searchsorted(cum, targets, side='left')
+    k = numpy.clip(k, 1, npts - 1)
+    seglen = cum[k] - cum[k - 1]
+    # zero-length segments can only be hit through rounding
+    frac = numpy.where(seglen > 0.,
+                       (targets - cum[k - 1]) / numpy.where(seglen > 0.,
+                                                            seglen, 1.),
+                       0.)
+    adjusted = pts.copy()
+    adjusted[1:-1] = pts[k - 1] + frac[:, numpy.newaxis] * (pts[k] - pts[k - 1])
+    return adjusted
+
+def max_spread(pts):
+    """Calculate the largest difference between the distance of neighbouring
+       string points and the average distance.
+       As in the original implementation, the average distance is the string
+       length divided by the number of points, which keeps the convergence
+       criterion the same.
+       returns: the maximum spread."""
+    seglen = numpy.diff(arc_length(pts))
+    if len(seglen) == 0:
+        return 0.
+    avgdist = numpy.sum(seglen) / len(pts)
+    return float(numpy.max(numpy.abs(seglen - avgdist)))
+
+def reparametrize_string(pts, maxiter=150, tolerance=0.012, log=None):
+    """Reparametrize a string, iterating until the spread of the distances
+       between neighbouring points falls below a tolerance.
+       pts = the string, as a 2D array (or a list of lists)
+       maxiter = the maximum number of iterations after the first pass
+       tolerance = the maximum spread to stop at. If None, exactly maxiter
+                   iterations are done.
+       log = an optional file object to write progress to
+       returns: a tuple of the reparametrized string as a 2D array, the final
+                maximum spread and the number of iterations done."""
+    adjusted = rep_pts(pts)
+    i = 0
+    maxspread = None
+    while i < maxiter:
+        if (tolerance is not None and maxspread is not None and
+            maxspread <= tolerance):
+            break
+        adjusted = rep_pts(adjusted)
+        if tolerance is not None:
+            maxspread = max_spread(adjusted)
+            if log is not None:
+                log.write('Rep iter %d: maxspread was %f\n' % (i, maxspread))
+        i += 1
+    if maxspread is None:
+        maxspread = max_spread(adjusted)
+    return (adjusted, maxspread, i)
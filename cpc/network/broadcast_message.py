@@ -93,9 +93,11 @@ class BroadcastMessage(ServerToServerMessage):
         node = Node.getSelfNode(ServerConf())
 
         
-        topology.removeNode(node.getId())     
-        for node in topology.nodes.itervalues():
-            self._sendMessage(node,fields,files,headers)
+        # the topology is shared with the cache: don't modify it
+        selfId = node.getId()
+        for node in topology.nodes.values():
+            if node.getId() != selfId:
+                self._sendMessage(node,fields,files,headers)
 
 
     def broadcastToNeighboursOnly(self,fields,files = [],headers=dict()):
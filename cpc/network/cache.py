@@ -30,6 +30,7 @@ import copy
 import threading
 import time
 from cpc.util import json_serializer
+from cpc.network.node import Nodes
 import cpc.util.log
 
 log=logging.getLogger(__name__)
@@ -99,6 +100,38 @@ class Cache(object):
             return len(self.cache)
 
 
+class NetworkTopologyEntry(object):
+    """A cached network topology together with its routing table: the
+       next node on the shortest route to each destination."""
+    def __init__(self, topology, previous=None):
+        """Initialize.
+           topology = the Nodes object
+           previous = the entry this one replaces, or None. If the links in
+                      the topology didn't change, its routing tables are
+                      kept."""
+        self.topology = topology
+        self.adjacency = topology.getAdjacency()
+        self.lock = threading.Lock()
+        # start node id -> dict of end node id -> next node id
+        self.nextHops = dict()
+        if previous is not None and previous.adjacency == self.adjacency:
+            with previous.lock:
+                self.nextHops = dict(previous.nextHops)
+
+    def getNextHop(self, startId, endId):
+        """Get the next node on the shortest route between two nodes.
+           returns: the Node object, or None if there is no route."""
+        with self.lock:
+            nextHops = self.nextHops.get(startId)
+            if nextHops is None:
+                nextHops = Nodes.findNextHops(startId, self.adjacency)
+                self.nextHops[startId] = nextHops
+        hopId = nextHops.get(endId)
+        if hopId is None:
+            return None
+        return self.topology.get(hopId)
+
+
 class NetworkTopologyCache(Cache):
     def __init__(self):
         Cache.__init__(self)
@@ -107,30 +140,50 @@ class NetworkTopologyCache(Cache):
 
     def add(self,value):
         """
+        The topology is stored as is, and must not be modified after this.
         inputs:
             value:Nodes
         """
-        jsonStr = json.dumps(value,default = json_serializer.toJson,
-            indent=4)
+        with self.cacheLock:
+            previous = self.cache.get(self.cacheKey)
+        if previous is not None:
+            previous = previous[0]
+        entry = NetworkTopologyEntry(value, previous)
+        if previous is not None and previous.adjacency != entry.adjacency:
+            log.log(cpc.util.log.TRACE,'network links changed: routing '
+                                       'table invalidated')
 
         #5 minutes cache limit
         ttl = 300
-        Cache.add(self,self.cacheKey,jsonStr,ttl)
+        Cache.add(self,self.cacheKey,entry,ttl)
+
+    def getEntry(self):
+        """
+        returns:
+            NetworkTopologyEntry, or False if there is no cached topology
+        """
+        return Cache.get(self,self.cacheKey)
 
     def get(self):
         """
         returns:
             Nodes
         """
-        jsonStr = Cache.get(self,self.cacheKey)
-        if jsonStr:
-            topology = json.loads(jsonStr,
-                object_hook=json_serializer.fromJson)
-            return topology
+        entry = self.getEntry()
+        if entry:
+            return entry.topology
         else:
             return False
 
+    def getNextHop(self, startId, endId):
+        """Get the next node on the shortest route between two nodes in the
+           cached topology.
+           returns: the Node object, None if there is no route, or False if
+                    there is no cached topology"""
+        entry = self.getEntry()
+        if not entry:
+            return False
+        return entry.getNextHop(startId, endId)
+
     def remove(self):
         Cache.remove(self,self.cacheKey)
-
-
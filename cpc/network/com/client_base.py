@@ -67,40 +67,83 @@ class ClientBase(object):
         self.conf = conf
         self.require_certificate_authentication = None
         self.useNoSSLFalback=False
+        self.keepAlive=False
 
     def putRequest(self, req, require_certificate_authentication=None, disable_cookies=False):
-        self.__connect(require_certificate_authentication, disable_cookies)
-        try:
-
-            ret=self.conn.sendRequest(req,"PUT")
-        except httplib.HTTPException as e:
-            raise ClientConnectionError(e,self.host,self.port)
-        except socket.error as e:
-            raise ClientConnectionError(e,self.host,self.port)
-        return ret
+        return self.__sendRequest(req, "PUT", require_certificate_authentication,
+                                  disable_cookies)
 
     def postRequest(self, req, require_certificate_authentication=None, disable_cookies=False):
-        self.__connect(require_certificate_authentication, disable_cookies)
-        try:
-            ret=self.conn.sendRequest(req)
-        except httplib.HTTPException as e:
-            raise ClientConnectionError(e,self.host,self.port)
-        except socket.error as e:
-            raise ClientConnectionError(e,self.host,self.port)
-        return ret
+        return self.__sendRequest(req, "POST",
+                                  require_certificate_authentication,
+                                  disable_cookies)
 
     def closeClient(self):
         self.conn.conn.close()
 
+    def __sendRequest(self, req, method, require_certificate_authentication,
+                      disable_cookies):
+        """Send a request, on a kept-alive connection if possible. If that
+           connection turns out to have been closed by the server before
+           it could have handled the request, the request is sent again 
+           on a new connection."""
+        reused=self.__connect(require_certificate_authentication,
+                              disable_cookies)
+        try:
+            ret=self.conn.sendRequest(req,method)
+        except (httplib.HTTPException, socket.error) as e:
+            self.conn.close()
+            if (not reused or not self.__isStale(e) or 
+                not self.__rewind(req)):
+                raise ClientConnectionError(e,self.host,self.port)
+            log.debug("Kept-alive connection to %s:%s failed: %s. "
+                      "Reconnecting."%(self.host, self.port, str(e)))
+            self.__connect(require_certificate_authentication,
+                           disable_cookies, reuse=False)
+            try:
+                ret=self.conn.sendRequest(req,method)
+            except (httplib.HTTPException, socket.error) as e:
+                self.conn.close()
+                raise ClientConnectionError(e,self.host,self.port)
+        if self.conn.keepAlive:
+            client_connection.KeepAliveConnectionPool().putConnection(
+                                            self.conn, self.host, self.port)
+        return ret
+
+    def __isStale(self, e):
+        """Check whether a request failed because its connection had been
+           closed by the server: either the request couldn't be written, or
+           the server closed the connection without any response. Failures 
+           after that (e.g. while reading the response) are not retried, 
+           because the request may have been handled.
+           returns: whether the request can safely be sent again."""
+        if not self.conn.requestSent:
+            return isinstance(e, socket.error)
+        return isinstance(e, httplib.BadStatusLine)
+
+    def __rewind(self, req):
+        """Prepare a request's body to be sent again.
+           returns: whether that is possible."""
+        if req.msg is None or isinstance(req.msg, basestring):
+            return True
+        if hasattr(req.msg, 'rewind'):
+            req.msg.rewind()
+            return True
+        return False
+
     # the order in which we determine whether to require certificate from server for authentication is
     # 1, overrides lower priorities : argument require_certificate_authentication
     # 2, if self.require_certificate_authentication is set
     # default to true
-    def __connect(self, require_certificate_authentication=None, disable_cookies=False):
+    def __connect(self, require_certificate_authentication=None, disable_cookies=False,
+                  reuse=True):
 
         '''
         inputs:
              require_certificate_authentication:boolean  requires a certificate from the server
+             reuse:boolean  whether an idle kept-alive connection may be used
+        returns:
+             whether an idle kept-alive connection is used
         '''
         if require_certificate_authentication is not None:
             require_certificate_authentication = require_certificate_authentication
@@ -112,10 +155,22 @@ class ClientBase(object):
                     require_certificate_authentication = True
             except AttributeError:
                 require_certificate_authentication = True
+        # only connections with certificate authentication are kept alive:
+        # these are the ones used by workers.
+        keepAlive = (getattr(self, 'keepAlive', False) and
+                     require_certificate_authentication)
+        if keepAlive and reuse:
+            conn=client_connection.KeepAliveConnectionPool().getConnection(
+                                                        self.host, self.port)
+            if conn is not None:
+                log.log(cpc.util.log.TRACE,"Reusing kept-alive connection")
+                self.conn=conn
+                return True
         try:
             if require_certificate_authentication:
                 log.log(cpc.util.log.TRACE,"Connecting HTTPS with cert authentication")
-                self.conn=client_connection.ClientConnectionRequireCert(self.conf)
+                self.conn=client_connection.ClientConnectionRequireCert(
+                            self.conf, keepAlive)
             else:
                 log.log(cpc.util.log.TRACE,"Connecting HTTPS with no cert authentication")
                 self.conn=client_connection.ClientConnectionNoCertRequired(
@@ -125,3 +180,4 @@ class ClientBase(object):
             raise ClientConnectionError(e,self.host,self.port)
         except socket.error as e:
             raise ClientConnectionError(e,self.host,self.port)
+        return False
@@ -20,6 +20,8 @@
 import logging
 import socket
 import os
+import threading
+import time
 from cpc.network.com.connection_base import ConnectionBase
 
 import cpc.util
@@ -51,10 +53,79 @@ class CookieHandler(object):
 
 
 
+class KeepAliveConnectionPool(object):
+    """
+    Singleton that keeps idle keep-alive client connections, so that they
+    can be reused for later requests to the same host and port instead of
+    setting up a new HTTPS connection for every request.
+    """
+    __shared_state = {}
+    def __init__(self):
+        self.__dict__ = self.__shared_state
+
+        if len(self.__shared_state)>0:
+            return
+
+        self.lock=threading.Lock()
+        # (host, port)->list of (connection, time it became idle)
+        self.pool=dict()
+        self.maxIdle=2
+        self.idleTime=60.
+
+    def setLimits(self, maxIdle, idleTime):
+        """Set the maximum number of idle connections per host and port, and
+           the time in seconds after which an idle connection is closed."""
+        with self.lock:
+            self.maxIdle=maxIdle
+            self.idleTime=idleTime
+
+    def getConnection(self, host, port):
+        """Get an idle connection to a host and port.
+           returns: a connected ClientConnectionBase object, or None"""
+        now=time.time()
+        stale=[]
+        ret=None
+        with self.lock:
+            conns=self.pool.get((host, port), [])
+            while len(conns) > 0:
+                conn, since=conns.pop()
+                # connections that were idle for too long may have been
+                # closed by the server.
+                if now-since < self.idleTime and conn.isReusable():
+                    ret=conn
+                    break
+                stale.append(conn)
+        for conn in stale:
+            conn.close()
+        return ret
+
+    def putConnection(self, conn, host, port):
+        """Return a connection after use. It is closed if it can't be
+           reused, or if there are enough idle connections."""
+        if conn.isReusable():
+            with self.lock:
+                conns=self.pool.setdefault((host, port), [])
+                if len(conns) < self.maxIdle:
+                    conns.append( (conn, time.time()) )
+                    return
+        conn.close()
+
+    def closeAll(self):
+        """Close all idle connections."""
+        with self.lock:
+            pool=self.pool
+            self.pool=dict()
+        for conns in pool.itervalues():
+            for conn, since in conns:
+                conn.close()
+
+
 class ClientConnectionBase(ConnectionBase):
     """
     Abstract base class for client connections, must be extended.
     """
+    # whether to ask the server to keep the connection open
+    keepAlive=False
 
     def __init__(self):
         ConnectionBase.__init__(self)
@@ -71,9 +142,23 @@ class ClientConnectionBase(ConnectionBase):
             if cookie is not None:
                 request.headers['cookie'] = cookie
 
-        request.headers["Connection"]= "close"
+        if self.keepAlive:
+            request.headers["Connection"]= "keep-alive"
+        else:
+            request.headers["Connection"]= "close"
         return request
 
+    def isReusable(self):
+        """Check whether the connection is still open and can be used for
+           another request."""
+        return (self.keepAlive and self.connected and
+                self.conn.sock is not None)
+
+    def close(self):
+        """Close the connection."""
+        self.conn.close()
+        self.connected=False
+
 
     def handleResponseHeaders(self,response):
         cookie = response.getheader('set-cookie', None)
@@ -89,10 +174,11 @@ class ClientConnectionRequireCert(ClientConnectionBase):
     Used for HTTPS connections with cert authentication both on client server
     This one is used by the worker and the client when passing connection bundles
     """
-    def __init__(self, conf):
+    def __init__(self, conf, keepAlive=False):
         self.connected=False
         self.conf = conf
         self.cookieHandler = None # We disallow this for now
+        self.keepAlive = keepAlive
 
     def connect(self,host,port):
 
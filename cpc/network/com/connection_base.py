@@ -1,5 +1,6 @@
 import mmap
 from cpc.network.com.client_response import ClientResponse
+from cpc.network.http.messaging import CHUNK_SIZE
 from cpc.util import ClientError, cpc
 
 import logging
@@ -9,6 +10,8 @@ class ConnectionBase:
     Abstract class
     Responsible for sending a request and receiving a response
     """
+    # whether the last request was completely written to the connection
+    requestSent=False
 
     def connect(self,host,port):
         raise NotImplementedError("Not implemented by subclass")
@@ -30,12 +33,33 @@ class ConnectionBase:
     def handleResponseHeaders(self,response):
         raise NotImplementedError("not implemented by subclass")
 
+    def _sendBody(self, body):
+        """Send a message body, a string or file-like object, in blocks."""
+        if body is None:
+            return
+        if not hasattr(body, 'read'):
+            self.conn.send(body)
+            return
+        while True:
+            data=body.read(CHUNK_SIZE)
+            if len(data) == 0:
+                break
+            self.conn.send(data)
+
     def sendRequest(self,req,method="POST"):
         req = self.prepareHeaders(req)
 
-        self.conn.request(method, "/copernicus",req.msg,req.headers)
+        self.requestSent=False
+        self.conn.putrequest(method, "/copernicus")
+        for (key, val) in req.headers.iteritems():
+            self.conn.putheader(key, val)
+        self.conn.endheaders()
+        self._sendBody(req.msg)
+        self.requestSent=True
         response=self.conn.getresponse()
         if response.status!=200:
+            # read the body so that a kept-alive connection can be reused
+            response.read()
             errorStr = "ERROR: %d: %s"%(response.status, response.reason)
             resp_mmap = mmap.mmap(-1, int(len(errorStr)), mmap.ACCESS_WRITE)
             resp_mmap.write(errorStr)
@@ -59,7 +83,13 @@ class ConnectionBase:
                 length  = 1
             resp_mmap = mmap.mmap(-1, int(length), access=mmap.ACCESS_WRITE)
 
-            resp_mmap.write(response.read(length))
+            remaining=int(length)
+            while remaining > 0:
+                data=response.read(min(CHUNK_SIZE, remaining))
+                if len(data) == 0:
+                    break
+                resp_mmap.write(data)
+                remaining-=len(data)
 
         resp_mmap.seek(0)
         headerTuples = response.getheaders()
@@ -17,23 +17,20 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
-import mmap
+import os
 from cpc.network.com.input import Input
 
 class FileInput(Input):
     '''
-    classdocs
+    A file to send as part of a multipart message. The file is read while
+    the message is sent.
     '''
 
 
     def __init__(self,name,filename,file):
         self.name = name       
-        file.seek(0)
         self.file = file                
-        self.value =  mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+        file.seek(0, os.SEEK_END)
+        self.size = file.tell()
+        file.seek(0)
         self.filename = filename
-        
-        
-        
-#TODO destructor that closes the files i.e removes the temporary files
-        
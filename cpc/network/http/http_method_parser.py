@@ -25,6 +25,7 @@ import logging
 import shutil
 import filecmp
 import os
+import cpc.util
 import cpc.util.log
 '''
 Created on Mar 7, 2011
@@ -32,10 +33,139 @@ Created on Mar 7, 2011
 @author: iman
 '''
 from cpc.network.server_request import ServerRequest
+from cpc.network.http.messaging import CHUNK_SIZE
 import urlparse
+from cStringIO import StringIO
 
 
 log=logging.getLogger(__name__)
+
+
+class MultipartError(cpc.util.CpcError):
+    pass
+
+
+class MultipartReader(object):
+    """Reads a multipart message body from a stream in fixed-size chunks.
+       Part contents are written directly to their output file objects;
+       part delimiters are found by searching the buffered chunk, keeping
+       enough of its tail to find delimiters that span two chunks."""
+    def __init__(self, stream, boundary, length=None):
+        """Initialize.
+           stream = the input stream
+           boundary = the multipart boundary (without leading dashes)
+           length = the length of the message body, or None if unknown. The
+                    stream is never read beyond this length."""
+        self.stream=stream
+        self.boundary="--"+boundary
+        # the delimiter that ends a part's content
+        self.delimiter="\r\n"+self.boundary
+        self.remaining=length
+        self.buf=''
+        self.eof=False
+
+    def _fill(self):
+        """Read the next chunk into the buffer.
+           returns: False if there is no more data"""
+        if self.eof:
+            return False
+        if self.remaining is None:
+            # without a length, make sure we don't block on data that 
+            # isn't there: readline() returns at the end of the message.
+            data=self.stream.readline(CHUNK_SIZE)
+        else:
+            data=self.stream.read(min(CHUNK_SIZE, self.remaining))
+            self.remaining-=len(data)
+        if len(data) == 0:
+            self.eof=True
+            return False
+        if len(self.buf) > 0:
+            self.buf+=data
+        else:
+            self.buf=data
+        return True
+
+    def readline(self):
+        """Read a line, including its line ending."""
+        while True:
+            i=self.buf.find('\n')
+            if i >= 0:
+                line=self.buf[:i+1]
+                self.buf=self.buf[i+1:]
+                return line
+            if not self._fill():
+                line=self.buf
+                self.buf=''
+                return line
+
+    def start(self):
+        """Skip everything up to and including the first boundary line."""
+        while True:
+            line=self.readline()
+            if line == '':
+                raise MultipartError("No multipart boundary found")
+            if line.rstrip() == self.boundary:
+                return
+
+    def readHeaders(self):
+        """Read the headers of a part.
+           returns: a mimetools.Message object"""
+        lines=[]
+        while True:
+            line=self.readline()
+            if line == '':
+                raise MultipartError("Incomplete multipart headers")
+            lines.append(line)
+            if line == '\r\n' or line == '\n':
+                break
+        return mimetools.Message(StringIO(''.join(lines)))
+
+    def _copy(self, outf, nbytes):
+        """Copy nbytes of content directly to outf."""
+        while nbytes > 0:
+            if len(self.buf) == 0 and not self._fill():
+                raise MultipartError("Incomplete multipart message")
+            if len(self.buf) <= nbytes:
+                outf.write(self.buf)
+                nbytes-=len(self.buf)
+                self.buf=''
+            else:
+                outf.write(self.buf[:nbytes])
+                self.buf=self.buf[nbytes:]
+                nbytes=0
+
+    def readContent(self, outf, length=None):
+        """Read the content of a part up to the next delimiter into outf.
+           outf = the output file object
+           length = the content length given in the part's headers, or None
+           returns: True if this was the last part"""
+        if length is not None:
+            self._copy(outf, length)
+        dlen=len(self.delimiter)
+        while True:
+            i=self.buf.find(self.delimiter)
+            if i >= 0:
+                if i > 0:
+                    outf.write(self.buf[:i])
+                self.buf=self.buf[i+dlen:]
+                break
+            # keep the tail that could be the start of a delimiter
+            keep=dlen-1
+            if len(self.buf) > keep:
+                outf.write(self.buf[:-keep])
+                self.buf=self.buf[-keep:]
+            if not self._fill():
+                raise MultipartError("Incomplete multipart message")
+        # the rest of the delimiter line tells whether this was the last part
+        line=self.readline()
+        return line.startswith('--')
+
+    def finish(self):
+        """Skip anything after the last part, so that the stream is at the
+           end of the message."""
+        self.buf=''
+        while self._fill():
+            self.buf=''
 #handles parsing of the HTTP methods
 class HttpMethodParser(object):
     '''
@@ -108,95 +238,44 @@ class HttpMethodParser(object):
     
     @staticmethod
     def handleMultipart(mainHeaders,msgStream):
+        """Parse a multipart message, writing file parts directly to 
+           temporary files.
+           returns: a ServerRequest object"""
         files = dict()
         params = dict()
 
-        BOUNDARY = "--"+HttpMethodParser.extractBoundary(mainHeaders)        
-        stopBoundary = BOUNDARY+"--"
-        terminateBoundary = ''
-        
-        msgStream.readline() #has an empty line at start that we want to get rid of
-          
-        while terminateBoundary != stopBoundary:
-            headers = mimetools.Message(msgStream)
-            
-            terminateBoundary = ''
+        boundary = HttpMethodParser.extractBoundary(mainHeaders)
+        length = None
+        for key in ('content-length', 'Content-Length'):
+            if key in mainHeaders:
+                length = long(mainHeaders[key])
+                break
+        reader = MultipartReader(msgStream, boundary, length)
+        reader.start()
+        last = False
+        while not last:
+            headers = reader.readHeaders()
             log.log(cpc.util.log.TRACE,'multipart headers are %s'%headers.headers)
-            
-            if(ServerRequest.isFile(headers['Content-Disposition'])):
-                file = tempfile.TemporaryFile(mode="w+b")
-            
-            name =  ServerRequest.getFieldName(headers['Content-Disposition'])            
-            notused,contentDispositionParams = cgi.parse_header(headers['Content-Disposition'])                        
+            notused,contentDispositionParams = cgi.parse_header(
+                                            headers['Content-Disposition'])
             name = contentDispositionParams['name']
-             
-            
-            #if we have a content length we just read it and store the data
-            
             contentLength = headers.getheader('Content-Length')
-            if(contentLength):   # If a content length is sent we parse the nice way
-                bytes = int(contentLength)
-                if(ServerRequest.isFile(headers['Content-Disposition'])):
-                    file.write(msgStream.read(bytes))
-                    
-                else: 
-                    line  = msgStream.read(bytes)
-                    log.log(cpc.util.log.TRACE,"line is "+line)
-                    params[name] = line  
-                    
-                msgStream.readline()    ## we will have a trailin CRLF that we just want to get rid of
-            
+            if contentLength is not None:
+                contentLength = long(contentLength)
+
             if(ServerRequest.isFile(headers['Content-Disposition'])):
-                readBytes = 0
-                while(True):
-                    line = msgStream.readline()                    
-                    if re.search(BOUNDARY,line):
-                        #time to wrap it up
-                        
-                        if(line[-2:] == '\r\n'):                          
-                            line = line[:-2]
-                        elif(line[-1:] == '\n'):                     
-                            line = line[:-1]
-                        
-                        terminateBoundary = line                                               
-                        
-                        file.seek(0)
-                        skipBytes = 2
-
-                        realFile = tempfile.TemporaryFile(mode="w+b")
-                        realFile.write(file.read(readBytes-skipBytes))
-                        
-                        file.close()                        
-                        realFile.seek(0)
-                        
-                        #For testing during dev only!!
-                        #runTest(realFile)                                                      
-                        
-                        files[name]= realFile
-                        break
-                    else:
-                        readBytes +=len(line)
-                        file.write(line)   
-                
-            else:  
-                while(True):
-                    line = msgStream.readline()
-
-                    if(line[-2:] == '\r\n'):                      
-                        line = line[:-2]
-                    elif(line[-1:] == '\n'):                     
-                        line = line[:-1]
-                                            
-                    if re.search(BOUNDARY,line):       
-                        terminateBoundary = line   
-                        break;                                 
-                    
-                    else:
-                        if name in params:
-                            params[name]+= line
-                        else: 
-                            params[name] = line    
-            
+                file = tempfile.TemporaryFile(mode="w+b")
+                last = reader.readContent(file, contentLength)
+                file.seek(0)
+                files[name] = file
+            else:
+                value = StringIO()
+                last = reader.readContent(value, contentLength)
+                params[name] = value.getvalue()
+                log.log(cpc.util.log.TRACE,"param %s is %s"%(name, 
+                                                             params[name]))
+        if length is not None:
+            reader.finish()
         return ServerRequest(mainHeaders,None,params,files)
 
     
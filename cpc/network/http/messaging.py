@@ -18,8 +18,63 @@
 
 
 import mimetypes
-import mmap
-import tempfile
+import os
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+
+# the block size used to send and receive message bodies
+CHUNK_SIZE=256*1024
+
+class MultipartBody(object):
+    """A file-like multipart message body, made of strings and file objects.
+       The file contents are only read when the body is read, so files can be
+       sent without first copying them into the message."""
+    def __init__(self):
+        self.parts=[]
+        # the start position of each part
+        self.starts=[]
+        self.length=0
+        self.index=0
+
+    def addString(self, string):
+        """Add a string part."""
+        if isinstance(string, unicode):
+            string=string.encode('utf-8')
+        self.parts.append(StringIO(string))
+        self.starts.append(0)
+        self.length+=len(string)
+
+    def addFile(self, fileobj, size):
+        """Add the contents of a file object, from its current position.
+           size = the number of bytes to read from the file."""
+        self.parts.append(fileobj)
+        self.starts.append(fileobj.tell())
+        self.length+=size
+
+    def rewind(self):
+        """Go back to the start of the body, so that it can be sent again."""
+        for part, start in zip(self.parts, self.starts):
+            part.seek(start)
+        self.index=0
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        """Read at most size bytes, or everything if size is negative."""
+        ret=[]
+        while self.index < len(self.parts) and size != 0:
+            data=self.parts[self.index].read(size)
+            if len(data) == 0 or size < 0:
+                self.index+=1
+            else:
+                size-=len(data)
+            ret.append(data)
+        return ''.join(ret)
+
 
 class Messaging:
     '''
@@ -32,47 +87,36 @@ class Messaging:
 
     @staticmethod
     def encode_multipart_formdata(fields = [], files = [],headers = []):
+        """Encode fields and files as a multipart/form-data message body.
+           returns: a file-like MultipartBody object that reads the files 
+                    while it is being sent."""
         CRLF = "\r\n"
-        L = []
-
-        #create an mmap object
-
         BOUNDARY = Messaging.BOUNDARY
+        body=MultipartBody()
         for input in fields:
-            L.append("--"+BOUNDARY)
-            L.append('Content-Disposition: form-data; name="%s"' %input.name)
-            L.append('Content-Length: %s' %len(input.value))
-            L.append('')
-            L.append(input.value)
+            value=input.value
+            if isinstance(value, unicode):
+                value=value.encode('utf-8')
+            body.addString(CRLF.join([ "--"+BOUNDARY,
+                          'Content-Disposition: form-data; name="%s"' % 
+                          input.name,
+                          'Content-Length: %s' %len(value),
+                          '', 
+                          value, 
+                          '' ]))
         for input in files:
-            L.append('--'+BOUNDARY)
-            L.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (input.name,input.filename))
-            L.append('Content-Type: %s' % Messaging.get_content_type(input.filename))
-            L.append('Content-Length: %s' %len(input.value))
-            L.append('')
-            L.append(input.value)
-        L.append("--"+BOUNDARY+"--")
-
-        file = tempfile.TemporaryFile(mode="w+b")
-        
-        
-
-        elemCount = len(L)
-        for i in xrange(elemCount):
-            file.write(L[i])
-            if i!= elemCount-1:
-                file.write(CRLF)
-
-        file.write(CRLF)
-        file.seek(0)
-        
-        #for debug during dev only
-#        reqfile = open("/Users/iman/Desktop/tempreq.txt",'w+b')       
-#        shutil.copyfileobj(file,reqfile)
-#        reqfile.close()
-        #################
-        
-        body = mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+            body.addString(CRLF.join([ '--'+BOUNDARY,
+                          'Content-Disposition: form-data; name="%s"; '
+                          'filename="%s"' % (input.name,input.filename),
+                          'Content-Type: %s' % 
+                          Messaging.get_content_type(input.filename),
+                          'Content-Length: %s' %input.size,
+                          '',
+                          '' ]))
+            input.file.seek(0)
+            body.addFile(input.file, input.size)
+            body.addString(CRLF)
+        body.addString("--"+BOUNDARY+"--"+CRLF)
         return body
 
     @staticmethod
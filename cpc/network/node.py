@@ -22,7 +22,6 @@ Created on Feb 2, 2011
 
 @author: iman
 '''
-from operator import itemgetter
 import threading
 import logging
 from cpc.util import CpcError
@@ -98,60 +97,84 @@ class Nodes(object):
 
 
 
+    def getAdjacency(self):
+        """Get the links between the nodes in this topology.
+           returns: a dict of node id -> sorted list of the ids of its 
+                    neighbours that are in this topology"""
+        ret=dict()
+        for node in self.nodes.itervalues():
+            ret[node.getId()]=sorted( [ neighborId for neighborId in
+                                        node.getNodes().nodes.iterkeys()
+                                        if neighborId in self.nodes ] )
+        return ret
+
+    @staticmethod
+    def findPredecessors(startId, adjacency):
+        """Find the shortest routes from a node to all other nodes with a 
+           breadth-first search. Every link has length 1.
+           startId = the id of the start node
+           adjacency = the links, as returned by getAdjacency()
+           returns: a dict of node id -> the id of the previous node on the
+                    shortest route to it"""
+        previous=dict()
+        visited=set([startId])
+        front=[startId]
+        while len(front) > 0:
+            nextFront=[]
+            for nodeId in front:
+                for neighborId in adjacency.get(nodeId, []):
+                    if neighborId not in visited:
+                        visited.add(neighborId)
+                        previous[neighborId]=nodeId
+                        nextFront.append(neighborId)
+            front=nextFront
+        return previous
+
+    @staticmethod
+    def findNextHops(startId, adjacency):
+        """Find the first node on the shortest route to every reachable node.
+           startId = the id of the start node
+           adjacency = the links, as returned by getAdjacency()
+           returns: a dict of destination node id -> next node id"""
+        previous=Nodes.findPredecessors(startId, adjacency)
+        nextHops=dict()
+        for endId in previous.iterkeys():
+            # walk back towards the start, reusing what we already found
+            route=[]
+            nodeId=endId
+            while nodeId not in nextHops and previous[nodeId] != startId:
+                route.append(nodeId)
+                nodeId=previous[nodeId]
+            if nodeId in nextHops:
+                hop=nextHops[nodeId]
+            else:
+                hop=nodeId
+            nextHops[nodeId]=hop
+            for nodeId in route:
+                nextHops[nodeId]=hop
+        return nextHops
+
     #@param start:a Node Object
     #param end: a Node Object
     #param topology: a Nodes object     
     @staticmethod
     def findRoute(start,end,topology):
-        # Dijkstras algorithm , we might need to change this once we need prioority based routing
-
-        distances = dict()
-        previous = dict()  #key is a node values is a node visited prior
-
-        distances[start.getId()] = 0
-
-        while topology.size()>0:
-        #find node that has the shortest distance and exists in topology
-            #A list of tuples (nodename,distance)
-            ds = sorted(distances.items(), key=itemgetter(1))
-
-            for elem in ds:
-                nodeId = elem[0]
-                if topology.exists(nodeId):
-                    currentNode = topology.get(nodeId)
-                    break
-
-
-            topology.removeNode(currentNode.getId())
-
-            # if we have found the end node
-            if currentNode.getId() == end.getId():
-                route = []
-                n = end
-                while n.getId() in previous:
-                    route.append(n)
-                    n = previous[n.getId()]
-                route.append(start)
-                route.reverse()
-                return route
-                # we have a route
-
-
-            for neighborNode in currentNode.getNodes().nodes.itervalues():
-                # neighbournodes have backreferences that we are not interested in
-                # also they do not exist in the topology as we are removing nodes as we traverse
-                if topology.exists(neighborNode.getId()):
-                    tmpDistance = distances[currentNode.getId()] + 1  # 1 is the distance between each node for now
-                    if neighborNode.getId() in distances:
-                        if  tmpDistance< distances[neighborNode.getId()]:
-                            distances[neighborNode.getId()] = tmpDistance
-                            previous[neighborNode.getId()] = currentNode
-                    else:
-                        distances[neighborNode.getId()] = tmpDistance;
-                        previous[neighborNode.getId()] = currentNode
-
-
-        return []  #no route found
+        """Find the shortest route between two nodes. 
+           returns: a list of Node objects from start to end, or an empty
+                    list if there is no route."""
+        previous=Nodes.findPredecessors(start.getId(), topology.getAdjacency())
+        if end.getId() == start.getId():
+            return [ start ]
+        if end.getId() not in previous:
+            return []  #no route found
+        route = []
+        nodeId = end.getId()
+        while nodeId != start.getId():
+            route.append(topology.get(nodeId))
+            nodeId = previous[nodeId]
+        route.append(start)
+        route.reverse()
+        return route
 
 
 class Node(object):
@@ -118,7 +118,8 @@ class handler_base(BaseHTTPServer.BaseHTTPRequestHandler):
         #process the message
         if(self.isApplicationRoot()):
             request = HttpMethodParser.parsePOST(self.headers.dict,self.rfile)
-            self.processMessage(request)
+            self.processMessage(request,
+                                closeConnection=not self._workerKeepAlive())
 
         else:
             self.processMessage() #this is not a valid command i.e we did not find the resource
@@ -134,6 +135,9 @@ class handler_base(BaseHTTPServer.BaseHTTPRequestHandler):
         conf = ServerConf()
         self.log.log(cpc.util.log.TRACE,'%s %s'%(self.command,self.path))
         self.log.log(cpc.util.log.TRACE,"Headers are: '%s'\n"%self.headers)
+        # PUT connections are kept open; this sets the idle timeout for
+        # those of workers.
+        self._workerKeepAlive()
 
         if self.headers.has_key('persistent-connection'):
             if not self.headers.has_key('originating-server-id'):
@@ -200,6 +204,13 @@ class handler_base(BaseHTTPServer.BaseHTTPRequestHandler):
                     revertSocket=self.request.revertSocket)
 
 
+    def _workerKeepAlive(self):
+        """Check whether a worker has asked to keep its connection open for
+           further requests. Only the server port keeps worker connections
+           open.
+           returns: True if the connection should be kept open"""
+        return False
+
     def _generateCookie(self):
         #TODO Evaluate randomness of algorithm
         cookie = str(uuid.uuid4())
@@ -379,6 +390,17 @@ class handlerForRequestWithCertReq(handler_base):
         handler_base.setup(self)
         self.log=logging.getLogger(__name__)
 
+    def _workerKeepAlive(self):
+        # server-to-server connections identify their server and are
+        # handled separately.
+        if (self.headers.has_key('originating-server-id') or
+            self.headers.get('connection', '').lower() != 'keep-alive'):
+            return False
+        # idle worker connections shouldn't hold on to a handler thread
+        # forever: a read time-out ends the request handling loop.
+        self.connection.settimeout(ServerConf().getWorkerKeepaliveTimeout())
+        return True
+
     def _handleSession(self, request):
         handler_base._handleSession(self,request)
         if 'user' not in request.session:
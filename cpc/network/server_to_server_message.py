@@ -62,25 +62,24 @@ class ServerToServerMessage(ServerConnection):
     #figures out what node to connect to in order to reach the end node
     def initialize(self,endNodeId):
 
-        topology=self.getNetworkTopology()
-
-        if not topology:
-            log.error("Cannot get network topology")
-            return
-
         # this is myself:
         startNode = Node.getSelfNode(self.conf)
 
-        self.endNode = topology.nodes.get(endNodeId)
-
-        log.log(cpc.util.log.TRACE,"Finding route between %s(%s %s) and %s(%s "
-                                   "%s"")"%(startNode.server_id,startNode.getHostname(),
-                                    startNode.getServerSecurePort(),
-                                    self.endNode.server_id,
-                                    self.endNode.getHostname(),self.endNode.getServerSecurePort()))
-        route = Nodes.findRoute(startNode, self.endNode,topology)
-
-        self.hostNode = route[1]   #route[0] is the current host
+        hostNode = NetworkTopologyCache().getNextHop(startNode.getId(),
+                                                     endNodeId)
+        if hostNode is False:
+            # no cached topology; get it and try again
+            topology=self.getNetworkTopology()
+            if not topology:
+                log.error("Cannot get network topology")
+                return
+            hostNode = NetworkTopologyCache().getNextHop(startNode.getId(),
+                                                         endNodeId)
+        if not hostNode:
+            raise ServerToServerMessageError("No route from %s to %s"%
+                                             (startNode.getId(), endNodeId))
+
+        self.hostNode = hostNode
         self.host = self.hostNode.getHostname()
         self.port = self.hostNode.getServerSecurePort()
         self.serverId = self.hostNode.getId()
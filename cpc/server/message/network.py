@@ -94,9 +94,10 @@ class SCNetworkTopologyUpdate(ServerCommand):
         ServerCommand.__init__(self, "network-topology-update")
 
     def run(self, serverState, request, response):
-        NetworkTopologyCache().remove()
         topology = json.loads(request.getParam('topology'),
             object_hook=json_serializer.fromJson)
+        # replacing the cached topology keeps the routing table if the
+        # links didn't change.
         NetworkTopologyCache().add(topology)
         response.add("Updated network topology")
         log.info("Update network topology done")
@@ -566,25 +566,39 @@ class SCStatus(ProjectServerCommand):
                 projects = lst=serverState.getProjectList().list()
             else:
                 projects = UserHandler().getProjectListForUser(user)
+        # command listings are paginated if cmd_limit is set; cmd_limit=0
+        # only sends the command counts. Without it, all commands are 
+        # listed, as before there were counts.
+        cmd_limit = None
+        cmd_offset = 0
+        if request.hasParam('cmd_limit'):
+            cmd_limit = int(request.getParam('cmd_limit'))
+            if request.hasParam('cmd_offset'):
+                cmd_offset = int(request.getParam('cmd_offset'))
         ret_prj_dict = {}
 
         for prj_str in projects:
-            ret_prj_dict[prj_str] = dict()
-            queue = {'queue' : [], 'running': []}
-            state_count = {}
-            err_list=[]
-            warn_list=[]
             prj_obj = serverState.getProjectList().get(prj_str)
-            # we iterate over the childred rather than calling _traverseInstance
-            # here to avoid the project itself being counted as an instance
-            for child in prj_obj.getSubValueIterList():
-                self._traverseInstance(prj_obj.getSubValue([child]), 
-                                       state_count, queue, err_list, 
-                                       warn_list)
-            ret_prj_dict[prj_str]['states'] = state_count
+            # the project keeps these aggregates up to date, so we don't
+            # need to traverse its instances.
+            status = prj_obj.getStatus()
+            num_queued, num_running = status.getCommandCounts()
+            queue = { 'num_queued' : num_queued,
+                      'num_running' : num_running,
+                      'queue' : [],
+                      'running' : [] }
+            if cmd_limit != 0:
+                queued, running = status.getCommands(cmd_offset, cmd_limit)
+                queue['queue'] = [ cmd.toJSON() for cmd in queued ]
+                queue['running'] = [ cmd.toJSON() for cmd in running ]
+                if cmd_limit is not None:
+                    queue['offset'] = cmd_offset
+            ret_prj_dict[prj_str] = dict()
+            ret_prj_dict[prj_str]['states'] = status.getStateCounts()
             ret_prj_dict[prj_str]['queue']  = queue
-            ret_prj_dict[prj_str]['errors'] = err_list
-            ret_prj_dict[prj_str]['warnings'] = warn_list
+            ret_prj_dict[prj_str]['errors'] = status.getErrors()
+            ret_prj_dict[prj_str]['warnings'] = status.getWarnings()
+            ret_prj_dict[prj_str]['state_save'] = prj_obj.getSaveStats()
             if prj_str == request.session.get('default_project_name', None):
                 ret_prj_dict[prj_str]['default']=True
         ret_dict['projects'] = ret_prj_dict
@@ -625,36 +639,18 @@ class SCStatus(ProjectServerCommand):
             'local_servers': numLocalServers,
             'not_connected_local_servers':numNotConnectedLocalServers
         }
+        # dataflow task execution
+        if serverState.taskExecThreads is not None:
+            ret_dict['task_exec'] = {
+                'threads': serverState.taskExecThreads.getNThreads(),
+                'functions': serverState.taskExecThreads.getStats()
+            }
+        # handling of finished commands
+        ret_dict['command_completion'] = \
+                    serverState.getCompletionPipeline().getStats()
+        # forwarding of worker heartbeats to other servers
+        if serverState.getHeartbeatForwarder() is not None:
+            ret_dict['heartbeat_forward'] = \
+                    serverState.getHeartbeatForwarder().getStats()
 
         response.add("", ret_dict)
-
-    def _handle_instance(self, instance, state_count, queue, 
-                         err_list, warn_list):
-        """ Parse an instance: check for errors, state etc """
-        stateStr=instance.getStateStr()
-        if stateStr in state_count:
-            state_count[stateStr] += 1
-        else:
-            state_count[stateStr] = 1
-        if stateStr == "error":
-            err_list.append(instance.getCanonicalName())
-        elif stateStr == "warning":
-            warn_list.append(instance.getCanonicalName())
-        for task in instance.getTasks():
-            for cmd in task.getCommands():
-                if cmd.getRunning():
-                    queue['running'].append(cmd.toJSON())
-                else:
-                    queue['queue'].append(cmd.toJSON())
-
-    def _traverseInstance(self, instance, state_count, queue, 
-                          err_list, warn_list):
-        """Recursively traverse the instance tree, depth first search"""
-        self._handle_instance(instance, state_count, queue, err_list, warn_list)
-        for child_str in instance.getSubValueIterList():
-            child_obj = instance.getSubValue([child_str])
-            if child_obj is not None:
-                if child_obj.getType() == instanceType:
-                    self._traverseInstance(child_obj,state_count, queue, 
-                                           err_list, warn_list)
-
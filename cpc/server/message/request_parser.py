@@ -108,6 +108,7 @@ scSecureList.add(state.SCReadConf())
 scSecureList.add(state.SCServerInfo())
 
 # worker workload requests
+scSecureList.add(worker.SCWorkerRegister())
 scSecureList.add(worker.SCWorkerReady())  
 scSecureList.add(worker.SCWorkerReadyForwarded())  
 scSecureList.add(worker.SCCommandFinished())
@@ -116,6 +117,7 @@ scSecureList.add(worker.SCCommandFailed())
 # heartbeat requests
 scSecureList.add(worker.SCWorkerHeartbeat())
 scSecureList.add(worker.SCHeartbeatForwarded())
+scSecureList.add(worker.SCHeartbeatForwardedBatch())
 scSecureList.add(worker.SCDeadWorkerFetch())
 # overlay network topology
 scSecureList.add(network.ScAddNode())
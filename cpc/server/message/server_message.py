@@ -53,7 +53,8 @@ class ServerMessage(ServerToServerMessage):
 
     def workerReadyForwardedRequest(self, workerID, archdata, topology,
                                     originatingServer, heartbeatInterval,
-                                    originatingClient=None):
+                                    originatingClient=None, inputBlobs=None,
+                                    freeResources=None):
         cmdstring='worker-ready-forward'
         fields = []
         fields.append(Input('cmd', cmdstring))
@@ -67,6 +68,10 @@ class ServerMessage(ServerToServerMessage):
                 default = json_serializer.toJson,
                 indent=4))
         fields.append(topologyInput)
+        if inputBlobs is not None:
+            fields.append(Input('input_blobs', inputBlobs))
+        if freeResources is not None:
+            fields.append(Input('free_resources', freeResources))
         headers = dict()
         headers['originating-server-id'] = originatingServer
         if originatingClient is not None:
@@ -131,15 +136,34 @@ class ServerMessage(ServerToServerMessage):
             headers))
         return response
 
-    def deadWorkerFetchRequest(self, workerDir, runDir):
+    def heartbeatBatchForwardedRequest(self, workerServer, heartbeats):
+        """A server-to-server request with the heartbeat signals of a number
+           of workers.
+           workerServer = the ID of the workers' server
+           heartbeats = a JSON string with a list of dicts with the worker_id,
+                        worker_dir, iteration and heartbeat_items of each
+                        worker."""
+        cmdstring='heartbeat-forward-batch'
+        fields = []
+        fields.append(Input('cmd', cmdstring))
+        fields.append(Input('version', "1"))
+        fields.append(Input('worker_server', workerServer))
+        fields.append(Input('heartbeats', heartbeats))
+        response= self.putRequest(ServerRequest.prepareRequest(fields, []))
+        return response
+
+    def deadWorkerFetchRequest(self, runDirs):
         """A server-to-sever request for fetching a set of run directories
-           from a dead worker's output."""
+           from dead workers' output.
+           runDirs = a list of (worker directory, run directory) tuples. 
+           The response tar file holds the contents of each run directory 
+           that could be fetched in a directory named after its index in
+           runDirs."""
         cmdstring='dead-worker-fetch'
         fields = []
         fields.append(Input('cmd', cmdstring))
-        fields.append(Input('version', "1"))
-        fields.append(Input('worker_dir', workerDir))
-        fields.append(Input('run_dir', runDir))
+        fields.append(Input('version', "2"))
+        fields.append(Input('run_dirs', json.dumps(runDirs)))
         files = []
         headers = dict()
         #self.connect()
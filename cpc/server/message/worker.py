@@ -33,12 +33,10 @@ except ImportError:
 
 
 
-import cpc.command.platform_exec_reader
+import cpc.command.input_blobs
 import cpc.util
 import cpc.util.log
 
-from cpc.command.worker_matcher import CommandWorkerMatcher
-
 from cpc.network.com.client_response import ProcessedResponse
 from cpc.util import json_serializer
 from cpc.network.node import Nodes
@@ -64,27 +62,47 @@ class WorkerReadyBase(ServerCommand):
        the server, not the client."""
 
     def run(self, serverState, request, response):
-        # first read platform capabilities and executables
-        rdr=cpc.command.platform_exec_reader.PlatformExecutableReader()
-        workerData=request.getParam('worker')
         if request.hasParam('worker-id'):
             workerID=request.getParam('worker-id')
         else:
             workerID='(none)'
-        log.debug("Worker platform + executables: %s"%workerData)
-        rdr.readString(workerData,"Worker-reported platform + executables")
+        # first get the platform capabilities and executables: either
+        # registered before, or sent with the request.
+        capabilityCache=serverState.getWorkerCapabilityCache()
+        if request.hasParam('capabilities'):
+            caps=capabilityCache.get(request.getParam('capabilities'))
+            if caps is None:
+                log.debug("Unknown capabilities from worker %s"%workerID)
+                response.add("Unknown worker capabilities",
+                             data={ 'register' : True }, status="ERROR")
+                return
+        else:
+            workerData=request.getParam('worker')
+            log.debug("Worker platform + executables: %s"%workerData)
+            caps=capabilityCache.register(workerData)
+        workerData=caps.workerData
+        freeResources=None
+        if request.hasParam('free_resources'):
+            freeResources=json.loads(request.getParam('free_resources'))
+        inputBlobs=None
+        if request.hasParam('input_blobs'):
+            inputBlobs=json.loads(request.getParam('input_blobs'))
         # match queued commands to executables.
-        cwm=CommandWorkerMatcher(rdr.getPlatforms(),
-                                 rdr.getExecutableList(),
-                                 rdr.getWorkerRequirements())
-        cmds=cwm.getWork(serverState.getCmdQueue())
-        if not cwm.isDepleted():
-            # now sleep for 5 seconds to give the dataflow time to react to any
-            # new state.
-            time.sleep(5)
-            cmds.extend(cwm.getWork(serverState.getCmdQueue()))
-        # now check the forwarded variables
+        cwm=caps.getMatcher(freeResources)
+        # get work, giving the dataflow time to react to any new state.
         conf=serverState.conf
+        # a worker can ask to wait for work to come in (long polling)
+        longPoll=0
+        if request.hasParam('max_wait'):
+            longPoll=min(float(request.getParam('max_wait')),
+                         conf.getWorkerReadyMaxLongPoll())
+        startTime=time.time()
+        cmds=cwm.getWorkWait(serverState.getCmdQueue(),
+                             serverState.getProjectList().getTaskQueue(),
+                             conf.getWorkerReadyMaxWait(), longPoll)
+        log.debug("Dispatching %d commands to worker %s took %.3f s"%
+                  (len(cmds), workerID, time.time()-startTime))
+        # now check the forwarded variables
         originatingServer=None
         heartbeatInterval=None
         try:
@@ -122,6 +140,10 @@ class WorkerReadyBase(ServerCommand):
             # construct the tar file with the workloads.
             tff=tempfile.TemporaryFile()
             tf=tarfile.open(fileobj=tff, mode="w:gz")
+            # large input files the worker has in its input cache are not
+            # sent again.
+            packager=cpc.command.input_blobs.InputPackager(tf, inputBlobs,
+                                                conf.getInputBlobMinSize())
             # make the commands ready
             for cmd in cmds:
                 log.debug("Adding command id %s to tar file."%cmd.id)
@@ -139,8 +161,9 @@ class WorkerReadyBase(ServerCommand):
                 outf=open(os.path.join(cmddir, "command.xml"), "w")
                 cmd.writeWorkerXML(outf)
                 outf.close()
-                tf.add(cmddir, arcname=arcdir, recursive=True)
+                packager.addCommandDir(cmddir, arcdir)
                 # set the state of the command.
+            packager.finish()
             tf.close()
             del(tf)
             tff.seek(0)
@@ -161,6 +184,13 @@ class WorkerReadyBase(ServerCommand):
             thisNode.nodes = conf.getNodes()
             topology.addNode(thisNode)
 
+            inputBlobsParam=None
+            if request.hasParam('input_blobs'):
+                inputBlobsParam=request.getParam('input_blobs')
+            freeResourcesParam=None
+            if request.hasParam('free_resources'):
+                freeResourcesParam=request.getParam('free_resources')
+
             hasJob =False # temporary flag that should be removed
             for node in nodes:
                 if topology.exists(node.getId()) == False:
@@ -171,7 +201,9 @@ class WorkerReadyBase(ServerCommand):
                                         topology,
                                         originatingServer,
                                         heartbeatInterval,
-                                        request.headers['originating-client'])
+                                        request.headers['originating-client'],
+                                        inputBlobsParam,
+                                        freeResourcesParam)
 
                     if clientResponse.getType() == 'application/x-tar':
 
@@ -215,6 +247,19 @@ class SCWorkerReadyForwarded(WorkerReadyBase):
         self.forwarded=True
         ServerCommand.__init__(self, "worker-ready-forward")
 
+class SCWorkerRegister(ServerCommand):
+    """Register a worker's platforms and executables. The worker gets a
+       capability token to send with its worker-ready requests instead of
+       the full description."""
+    def __init__(self):
+        ServerCommand.__init__(self, "worker-register")
+
+    def run(self, serverState, request, response):
+        workerData=request.getParam('worker')
+        caps=serverState.getWorkerCapabilityCache().register(workerData)
+        response.add("Registered worker capabilities",
+                     data={ 'token' : caps.token })
+
 class CommandFinishError(cpc.util.CpcError):
     pass
 
@@ -295,9 +340,11 @@ class CommandFinishedBase(ServerCommand):
                 rundata = Tracker.getCommandOutputData(cmdID, workerServer)
                 if rundata != None:
                     runfile = rundata.getRawData()
-            # now handle the finished command.
-            runningCmdList=serverState.getRunningCmdList()
-            runningCmdList.handleFinished(cmdID, returncode, cputime, runfile)
+            # now hand the finished command to the completion pipeline: it
+            # is acknowledged once the results are safely on disk, and
+            # handled later.
+            completionPipeline=serverState.getCompletionPipeline()
+            completionPipeline.receive(cmdID, returncode, cputime, runfile)
 
 class SCCommandFinishedForward(CommandFinishedBase):
     """Handle forwarded finished command. The command output is not sent in
@@ -376,32 +423,19 @@ class SCWorkerHeartbeat(ServerCommand):
         serverState.setWorkerState(WorkerStatus.WORKER_STATUS_CONNECTED,workerID,
                                    request.headers['originating-client'])
         # now iterate over the destinations, and send them their heartbeat
-        # items.
-        # Once we have many workers, this would be a place to pool heartbeat
-        # items and send them as one big request.
+        # items. Items for other servers are collected from all workers and
+        # forwarded in the background; the items they reported as faulty
+        # since the worker's last heartbeat are returned now.
         faultyItems=[]
+        forwarder=serverState.getHeartbeatForwarder()
         for dest, items in destList.iteritems():
             if dest == selfName:
                 ret=serverState.getRunningCmdList().ping(workerID, workerDir,
                                                          iteration, items, True,
                                                          faultyItems)
             else:
-                msg=ServerMessage(dest)
-                co=StringIO()
-                co.write('<heartbeat worker_id="%s" worker_server_id="%s">'%
-                         (workerID, selfName))
-                for item in items:
-                    item.writeXML(co)
-                co.write('</heartbeat>')
-                resp = msg.heartbeatForwardedRequest(workerID, workerDir,
-                                                     selfName, iteration,
-                                                     co.getvalue())
-                presp=ProcessedResponse(resp)
-                if presp.getStatus() != "OK":
-                    log.info("Heartbeat response from %s not OK"%dest)
-                    retitems=presp.getData()
-                    for item in retitems:
-                        faultyItems.append(item)
+                forwarder.add(dest, workerID, workerDir, iteration, items)
+        faultyItems.extend(forwarder.takeFaulty(workerID))
         if version > 1:
             retData = { 'heartbeat-time' : serverState.conf.
                                                 getHeartbeatTime(),
@@ -442,41 +476,84 @@ class SCHeartbeatForwarded(ServerCommand):
             response.add('Heatbeat NOT OK', status="ERROR", data=faultyItems)
         log.info("Handled %d forwarded heartbeat signal items."%(Nhandled))
 
+class SCHeartbeatForwardedBatch(ServerCommand):
+    """Handle the heartbeat signals of a number of workers, forwarded by
+       their worker server in a single request."""
+    def __init__(self):
+        ServerCommand.__init__(self, "heartbeat-forward-batch")
+
+    def run(self, serverState, request, response):
+        heartbeats=json.loads(request.getParam('heartbeats'))
+        runningCmdList=serverState.getRunningCmdList()
+        # worker ID->list of faulty command IDs
+        faulty=dict()
+        Nhandled=0
+        for hb in heartbeats:
+            hwr=cpc.command.heartbeat.HeartbeatItemReader()
+            hwr.readString(hb['heartbeat_items'], "worker heartbeat items")
+            faultyItems=[]
+            runningCmdList.ping(hb['worker_id'], hb['worker_dir'],
+                                hb['iteration'], hwr.getItems(), False,
+                                faultyItems)
+            if len(faultyItems) > 0:
+                faulty[hb['worker_id']]=faultyItems
+            Nhandled+=len(hwr.getItems())
+        response.add('', data=faulty)
+        log.info("Handled %d forwarded heartbeat signal items from %d workers."%
+                 (Nhandled, len(heartbeats)))
+
 class SCDeadWorkerFetch(ServerCommand):
-    """Attempt to fetch the data from a dead worker."""
+    """Attempt to fetch the data from dead workers."""
     def __init__(self):
         ServerCommand.__init__(self, "dead-worker-fetch")
 
     def run(self, serverState, request, response):
         # TODO: some verification that the request comes from the server that
         # owns the file
-        workerDir=request.getParam('worker_dir')
-        runDir=request.getParam('run_dir')
-        workerDataList=serverState.getWorkerDataList()
-        # check the directory and throw an exception if not allowed
-        if workerDataList.checkDirectory(workerDir, [runDir]):
-            # first check whether we have any of these files
-            if os.path.isdir(runDir):
-                tff=tempfile.TemporaryFile()
-                tf=tarfile.open(fileobj=tff, mode="w:gz")
-                tf.add(runDir, arcname=".", recursive=True)
-                tf.close()
-                del(tf)
-                tff.seek(0)
-                response.setFile(tff,'application/x-tar')
-                request.setFlag('remove', True)
-            response.add('Returning data')
-            log.info("Fetched data from dead worker")
+        version=1
+        if request.hasParam('version'):
+            version=int(request.getParam('version'))
+        if version > 1:
+            runDirs=json.loads(request.getParam('run_dirs'))
         else:
-            log.info("Did not fetch data from dead worker")
+            runDirs=[ (request.getParam('worker_dir'),
+                       request.getParam('run_dir')) ]
+        workerDataList=serverState.getWorkerDataList()
+        fetchDirs=[]
+        for i, (workerDir, runDir) in enumerate(runDirs):
+            # check the directory and throw an exception if not allowed
+            try:
+                if (workerDataList.checkDirectory(workerDir, [runDir]) and
+                    os.path.isdir(runDir)):
+                    fetchDirs.append( (i, runDir) )
+            except cpc.util.CpcError as e:
+                if version < 2:
+                    raise
+                log.info("Not fetching %s: %s"%(runDir, str(e)))
+        if len(fetchDirs) > 0:
+            tff=tempfile.TemporaryFile()
+            tf=tarfile.open(fileobj=tff, mode="w:gz")
+            for i, runDir in fetchDirs:
+                if version > 1:
+                    tf.add(runDir, arcname=str(i), recursive=True)
+                else:
+                    tf.add(runDir, arcname=".", recursive=True)
+            tf.close()
+            del(tf)
+            tff.seek(0)
+            response.setFile(tff,'application/x-tar')
+            request.setFlag('remove', [ runDir for i, runDir in fetchDirs ])
+        response.add('Returning data')
+        log.info("Fetched data for %d of %d commands from dead workers"%
+                 (len(fetchDirs), len(runDirs)))
 
     def finish(self, serverState, request):
         """Now delete the directories associated with that run.
 
            This will only be run if the run() method threw no exception"""
-        doRemove=request.getFlag('remove')
-        if doRemove is not None and doRemove:
-            runDir=request.getParam('run_dir')
-            shutil.rmtree(runDir)
+        removeDirs=request.getFlag('remove')
+        if removeDirs is not None:
+            for runDir in removeDirs:
+                shutil.rmtree(runDir)
 
 
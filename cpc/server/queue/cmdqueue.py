@@ -17,8 +17,9 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
-from collections import deque
-from threading import Lock
+from collections import OrderedDict
+from threading import Lock, Condition
+import heapq
 import logging
 
 log=logging.getLogger(__name__)
@@ -33,34 +34,104 @@ class QueueableItem(object):
     def __init__(self):
         self.active=True
         self.queue=None
+        self.cmdQueue=None
+        self.bucket=None
+        self.queueSeq=None
 
     def deactivate(self):
         self.active=False
+        if self.cmdQueue is not None:
+            self.cmdQueue._deactivateCommand(self)
 
     def activate(self):
         self.active=True
         if self.cmdQueue is not None:
             self.cmdQueue._activateCommand(self)
 
-    def setQueue(self, cmdQueue, queue):
-        """Set the item to be part of a specific queue."""
+    def setQueue(self, cmdQueue, queue, bucket=None):
+        """Set the item to be part of a specific queue (and bucket)."""
         self.cmdQueue=cmdQueue
         self.queue=queue
+        self.bucket=bucket
+
+
+class CmdQueueBucket(object):
+    """A secondary queue holding all active commands with the same executable
+       name and version range, ordered by priority. Workers only need to look
+       at the buckets they have an executable for."""
+    def __init__(self, executable, minVersion, maxVersion, nprio):
+        """Initialize with
+           executable = the executable name
+           minVersion = the minimum version (or None)
+           maxVersion = the maximum version (or None)
+           nprio = the number of priority levels"""
+        self.executable=executable
+        self.minVersion=minVersion
+        self.maxVersion=maxVersion
+        # per priority level (highest first): ordered dict of cmd ID->command
+        self.queue = [ OrderedDict() for x in xrange(nprio) ]
+        # the priority level index of each command ID
+        self.prio = dict()
+
+    @staticmethod
+    def getKey(executable, minVersion, maxVersion):
+        """Get the bucket key for an executable name and version range."""
+        # imported here because cpc.command imports this module.
+        from cpc.command.executable import executableKey
+        return executableKey(executable, minVersion, maxVersion)
+
+    def add(self, command, p):
+        """Add a command at priority level index p."""
+        self.queue[p][command.id]=command
+        self.prio[command.id]=p
+
+    def remove(self, command):
+        """Remove a command."""
+        p=self.prio.pop(command.id)
+        del self.queue[p][command.id]
+
+    def getSize(self):
+        """Get the number of commands in the bucket."""
+        return len(self.prio)
 
 
 class CmdQueue(object):
+    """The command queue. 
+
+       Commands are kept in one ordered dict (keyed by command ID) per 
+       priority, so that they are handed out in priority order and first-in, 
+       first-out within a priority. Active commands are also kept in buckets
+       by executable name and version range (see CmdQueueBucket). In addition,
+       the queue keeps indexes on command ID, project and executable name, so
+       that removal, lookup, activation and project purges don't need to scan
+       the queue."""
     PRIO_LOW_BOUND = -30 #Constant
     PRIO_HIGH_BOUND = 30 #Constant
 
     def __init__(self):
-        self.data = []
-        # this is a list of deques with the highest priority queue first.
-        self.queue = [ deque() for x in xrange(CmdQueue.PRIO_LOW_BOUND-1,
-                                               CmdQueue.PRIO_HIGH_BOUND)]
+        # this is a list of ordered dicts with the highest priority queue 
+        # first. Each maps command IDs to commands.
+        self.queue = [ OrderedDict() for x in xrange(CmdQueue.PRIO_LOW_BOUND-1,
+                                                     CmdQueue.PRIO_HIGH_BOUND)]
         # TODO: finer grained locks. For now we have a single global lock.
         self.lock=Lock()
-        # The set of items popped from the queue that were inactive.
-        self.inactiveItems = deque()
+        # condition variable signaled on changes that can produce new work
+        self.changed=Condition(self.lock)
+        # counter of the number of such changes
+        self.nchanges=0
+        # The set of items that are inactive.
+        self.inactiveItems = OrderedDict()
+        # the buckets of active commands, by bucket key
+        self.buckets = dict()
+        # sequence number of the last placed command; used to keep first-in, 
+        # first-out order when combining buckets.
+        self.seq=0
+        # index of all queued items (active and inactive) by command ID
+        self.cmdIndex = dict()
+        # index of command ID->command dicts by project
+        self.projectIndex = dict()
+        # index of command ID->command dicts by executable name
+        self.executableIndex = dict()
 
     def getSize(self):
         """Count the number of elements in the queue."""
@@ -70,18 +141,87 @@ class CmdQueue(object):
                 size+=len(dq)
         return size
 
-    def _getDeque(self, prio):
-        """Low-level function that gets the deque associated with a priority
+    def _getPrioIndex(self, prio):
+        """Low-level function that gets the index of the queue associated 
+           with a priority
            prio = the priority (out-of-bound priorities are mapped onto maximum
                                 and minimum priorities).
-           returns: a deque. """
+           returns: an index into self.queue"""
         if prio < CmdQueue.PRIO_LOW_BOUND:
             prio = CmdQueue.PRIO_LOW_BOUND
         if prio > CmdQueue.PRIO_HIGH_BOUND:
             prio = CmdQueue.PRIO_HIGH_BOUND
         # the highest priority queue is first
-        p= (CmdQueue.PRIO_HIGH_BOUND - prio)
-        return self.queue[p]
+        return (CmdQueue.PRIO_HIGH_BOUND - prio)
+
+    def _getDeque(self, prio):
+        """Low-level function that gets the queue associated with a priority
+           prio = the priority (out-of-bound priorities are mapped onto maximum
+                                and minimum priorities).
+           returns: an ordered dict of command ID->command. """
+        return self.queue[self._getPrioIndex(prio)]
+
+    @staticmethod
+    def _getProject(command):
+        """Get the project a command belongs to (or None)."""
+        if command.task is None:
+            return None
+        return command.task.project
+
+    def _place(self, command):
+        """Non-locking function that puts an already indexed command in the 
+           active or inactive queue, depending on its state.
+           returns: whether the command was put in an active queue."""
+        if command.active:
+            p=self._getPrioIndex(command.getFullPriority())
+            key=CmdQueueBucket.getKey(command.executable, command.minVersion,
+                                      command.maxVersion)
+            bucket=self.buckets.get(key)
+            if bucket is None:
+                bucket=CmdQueueBucket(command.executable, command.minVersion,
+                                      command.maxVersion, len(self.queue))
+                self.buckets[key]=bucket
+            self.seq+=1
+            command.queueSeq=self.seq
+            self.queue[p][command.id]=command
+            bucket.add(command, p)
+            command.setQueue(self, self.queue[p], bucket)
+        else:
+            self.inactiveItems[command.id]=command
+            command.setQueue(self, self.inactiveItems)
+        return command.active
+
+    def _displace(self, command):
+        """Non-locking function that takes a command out of its queue and 
+           bucket, without changing the indexes."""
+        del command.queue[command.id]
+        bucket=command.bucket
+        if bucket is not None:
+            bucket.remove(command)
+            if bucket.getSize() == 0:
+                del self.buckets[CmdQueueBucket.getKey(bucket.executable,
+                                                       bucket.minVersion,
+                                                       bucket.maxVersion)]
+        command.setQueue(None, None)
+
+    def _unlink(self, command):
+        """Non-locking function that removes a command from its queue and
+           from all indexes."""
+        self._displace(command)
+        self._unindex(command)
+
+    def _unindex(self, command):
+        """Non-locking function that removes a command from all indexes."""
+        del self.cmdIndex[command.id]
+        project=self._getProject(command)
+        prjCmds=self.projectIndex[project]
+        del prjCmds[command.id]
+        if len(prjCmds) == 0:
+            del self.projectIndex[project]
+        execCmds=self.executableIndex[command.executable]
+        del execCmds[command.id]
+        if len(execCmds) == 0:
+            del self.executableIndex[command.executable]
 
     def add(self,command):
         """
@@ -90,42 +230,59 @@ class CmdQueue(object):
             result : command put in queue, queue sorted in priority order of
                      commands, return true
         """
-        ret=False
         # an ID lives for as long as a command is queued/running
         command.tryGenID()
         with self.lock:
-            if command.active:
-                prio=command.getFullPriority()
-                dq=self._getDeque(prio)
-                dq.append(command)
-                command.setQueue(self, dq)
-                ret=True
-            else:
-                self.inactiveItems.append(command)
-                command.setQueue(self, self.inactiveItems)
-                ret=False
+            if command.id in self.cmdIndex:
+                # re-adding a queued command moves it to the back.
+                self._unlink(command)
+            self.cmdIndex[command.id]=command
+            project=self._getProject(command)
+            if project not in self.projectIndex:
+                self.projectIndex[project]=dict()
+            self.projectIndex[project][command.id]=command
+            if command.executable not in self.executableIndex:
+                self.executableIndex[command.executable]=dict()
+            self.executableIndex[command.executable][command.id]=command
+            if self._place(command):
+                self._signalChange()
         return True
 
 
+    def _signalChange(self):
+        """Non-locking function that signals any waiters for new work."""
+        self.nchanges+=1
+        self.changed.notifyAll()
+
+    def signalChange(self):
+        """Signal any threads waiting for new work (for example after a 
+           dataflow task has finished executing)."""
+        with self.lock:
+            self._signalChange()
+
+    def getChangeCount(self):
+        """Get the number of changes signaled so far."""
+        with self.lock:
+            return self.nchanges
+
+    def waitForChange(self, nchanges, timeout):
+        """Wait until a change is signaled. 
+           nchanges = the change count as returned by getChangeCount() (or 
+                      by this function) when the queue was last looked at. If
+                      the count has already changed, this returns immediately.
+           timeout = the maximum time to wait in seconds.
+           returns: the new change count."""
+        with self.lock:
+            if self.nchanges == nchanges:
+                self.changed.wait(timeout)
+            return self.nchanges
+
     def remove(self, cmd):
-        """Remove a specific command.
-           NOTE: this is an O(N) operation for N=number of items in the queue"""
-        nremoved=0
+        """Remove a specific command."""
         with self.lock:
-            dq=cmd.queue
-            if not dq in self.queue:
+            if self.cmdIndex.get(cmd.id) is not cmd:
                 raise QueueError("Tried to remove item from wrong queue.")
-            #for dq in self.queue:
-            n=len(dq)
-            for i in xrange(n):
-                if dq[0] == cmd:
-                    nremoved+=1
-                    dq[0].setQueue(None, None)
-                    dq.popleft()
-                else:
-                    dq.rotate(-1)
-            #if nremoved > 0:
-            #    return
+            self._unlink(cmd)
 
     def get(self):
         """ description: gets a single element with the highest priority from
@@ -138,15 +295,25 @@ class CmdQueue(object):
         with self.lock:
             for dq in self.queue:
                 while len(dq)>0:
-                    item=dq.popleft()
+                    item=dq.itervalues().next()
+                    self._displace(item)
                     if item.active:
+                        self._unindex(item)
                         return item
                     else:
-                        item.setQueue(self, self.inactiveItems)
-                        self.inactiveItems.append(item)
+                        self._place(item)
             return None
 
-    def getUntil(self, fn, parm):
+    def _iterPriority(self, p, buckets):
+        """Iterate over the items with priority index p in a list of buckets,
+           in the order in which they were queued."""
+        iters=[ ((item.queueSeq, item) for item in bucket.queue[p].itervalues())
+                for bucket in buckets if len(bucket.queue[p]) > 0 ]
+        if len(iters) == 1:
+            return (item for (seq, item) in iters[0])
+        return (item for (seq, item) in heapq.merge(*iters))
+
+    def getUntil(self, fn, parm, bucketFn=None):
         """Get a number of items from the queue, based on the output of a
            function (given as parameter).
            fn = the function to test each item with. Should return a tuple of
@@ -156,49 +323,58 @@ class CmdQueue(object):
            parm = a parameter for the function fn. It will be called with
                     fn(parm, queueItem), where queueItem is the queued item
                     being looked at.
+           bucketFn = an optional function to select buckets with. It will be
+                      called as bucketFn(parm, bucket) for each bucket, and 
+                      only items in buckets for which it returns True will be
+                      passed on to fn.
            returns: the list of items removed from the queue."""
         ret=[]
         cont=True
         with self.lock:
-            for dq in self.queue:
-                n=len(dq)
-                nback=0
-                for i in xrange(n):
-                    if dq[0].active:
-                        cont, doPop=fn(parm, dq[0])
+            if bucketFn is not None:
+                buckets=[ bucket for bucket in self.buckets.itervalues() 
+                          if bucketFn(parm, bucket) ]
+            inactive=[]
+            for p in xrange(len(self.queue)):
+                if bucketFn is None:
+                    items=self.queue[p].itervalues()
+                else:
+                    items=self._iterPriority(p, buckets)
+                for item in items:
+                    if item.active:
+                        cont, doPop=fn(parm, item)
                         if doPop:
-                            dq[0].setQueue(None, None)
-                            ret.append(dq.popleft())
-                        else:
-                            dq.rotate(-1)
-                            nback+=1
+                            ret.append(item)
                         if not cont:
                             break
                     else:
-                        # append the inactive item to the inactiveItems queue
-                        dq[0].setQueue(self, self.inactiveItems)
-                        self.inactiveItems.append(dq.popleft())
-                dq.rotate(nback)
+                        inactive.append(item)
                 if not cont:
                     break
+            for item in ret:
+                self._unlink(item)
+            # move inactive items we came across to the inactive queue
+            for item in inactive:
+                self._displace(item)
+                self._place(item)
         return ret
 
+    def take(self, commandID):
+        """Remove a command by its ID.
+           returns: the command, or None if it isn't queued."""
+        with self.lock:
+            cmd=self.cmdIndex.get(commandID)
+            if cmd is not None:
+                self._unlink(cmd)
+            return cmd
+
     def _exists(self, commandID):
         # non-locking version of public exists()
-        #NOTE could be slow
-        for value in self.queue.itervalues():
-            for it in value:
-                if(it.id == commandID):
-                    return True
-        # check the inactive items
-        for it in self.inactiveItems:
-            if(it.id == commandID):
-                return True
-        return False
+        return commandID in self.cmdIndex
 
     def exists(self,commandID):
-        """Check whether commandID exists in the queue.
-           NOTE: this is an O(N) operation for N=number of items in the queue"""
+        """Check whether commandID exists in the queue (as an active or 
+           inactive item)."""
         with self.lock:
             return self._exists(commandID)
 
@@ -207,53 +383,65 @@ class CmdQueue(object):
         ret=[]
         with self.lock:
             for dq in self.queue:
-                for item in dq:
+                for item in dq.itervalues():
                     if item.active:
                         ret.append(item)
         return ret
 
+    def listByProject(self, project):
+        """Return a list with all queued items (active and inactive) of a 
+           project."""
+        with self.lock:
+            prjCmds=self.projectIndex.get(project)
+            if prjCmds is None:
+                return []
+            return prjCmds.values()
 
-    def _purgeQueueProject(self, queue, project):
-        """Purge a single queue from a project."""
-        n=len(queue)
-        nremoved=0
-        for i in xrange(n):
-            if queue[0].task.project == project:
-                nremoved+=1
-                queue[0].setQueue(None, None)
-                queue.popleft()
-            else:
-                queue.rotate(-1)
-        return nremoved
+    def listByExecutable(self, executable):
+        """Return a list with all queued items (active and inactive) with a 
+           specific executable name."""
+        with self.lock:
+            execCmds=self.executableIndex.get(executable)
+            if execCmds is None:
+                return []
+            return execCmds.values()
 
     def deleteByProject(self, project):
         """Delete all commands related to a project. Returns number of commands
-           deleted.
-
-           NOTE: this is an O(N) operation for N=number of items in the queue"""
-        nremoved=0
+           deleted."""
         with self.lock:
-            for dq in self.queue:
-                nremoved+=self._purgeQueueProject(dq, project)
-            nremoved+=self._purgeQueueProject(self.inactiveItems, project)
-        return nremoved
+            prjCmds=self.projectIndex.get(project)
+            if prjCmds is None:
+                return 0
+            # _unlink() modifies the project index, so iterate over a copy.
+            cmds=prjCmds.values()
+            for cmd in cmds:
+                self._unlink(cmd)
+        return len(cmds)
 
     def _activateCommand(self, command):
         """Activate the command."""
-        if command.queue == self.inactiveItems:
-            with self.lock:
-                self.inactiveItems.remove(command)
-            self.add(command)
+        with self.lock:
+            if command.queue is self.inactiveItems:
+                self._displace(command)
+                if self._place(command):
+                    self._signalChange()
+
+    def _deactivateCommand(self, command):
+        """Deactivate the command."""
+        with self.lock:
+            if (command.queue is not None and 
+                command.queue is not self.inactiveItems):
+                self._displace(command)
+                self._place(command)
 
     #Helper function for unit tests
     def indexOfCommand(self,command):
         i=0
         with self.lock:
             for dq in self.queue:
-                for item in dq:
+                for item in dq.itervalues():
                     if(item == command):
                         return i
                     i+=1
         return None
-
-
@@ -25,6 +25,7 @@ except ImportError:
     from StringIO import StringIO
 import sys
 import os
+import time
 import traceback
 
 
@@ -37,13 +38,21 @@ class ExecThreadError(cpc.util.CpcError):
     pass
 
 class TaskExecThreads(object):
-    """A collection of taskexec threads."""
+    """A collection of taskexec threads.
+
+       The threads take tasks from a shared task queue. Tasks belonging to
+       the same active instance are run one at a time and in queue order:
+       if a thread takes a task whose active instance already has a task
+       running in another thread, it hands the task to that thread (see
+       TaskOrdering)."""
     def __init__(self, conf, N, taskQueue, cmdQueue):
         self.taskQueue=taskQueue
         self.cmdQueue=cmdQueue
+        self.ordering=TaskOrdering()
+        self.stats=TaskStats()
         self.threads=[]
         for i in xrange(N):
-            te=TaskExecThread(taskQueue, cmdQueue)
+            te=TaskExecThread(taskQueue, cmdQueue, self.ordering, self.stats)
             self.threads.append(te)
         self.lock=threading.Lock()
         self.tw=None
@@ -51,6 +60,18 @@ class TaskExecThreads(object):
         if nc>0:
             log.debug("Setting CPC_NUM_THREADS (max. #cores) to %d"%nc)
             os.environ['CPC_NUM_THREADS']=str(nc)
+        tuneCacheDir=conf.getTuneCacheDir()
+        log.debug("Setting CPC_TUNE_CACHE_DIR to %s"%tuneCacheDir)
+        os.environ['CPC_TUNE_CACHE_DIR']=tuneCacheDir
+
+    def getNThreads(self):
+        """Get the number of task exec threads."""
+        return len(self.threads)
+
+    def getStats(self):
+        """Get the task queue wait time and run time statistics per function
+           (see TaskStats.get())."""
+        return self.stats.get()
 
     def pause(self):
         """Pause all task exec threads. Returns when they have
@@ -120,15 +141,108 @@ class ThreadWaiter(object):
 
 
 
+class TaskOrdering(object):
+    """Keeps tasks of the same active instance in order when there are
+       multiple exec threads: the thread that runs a task of an active
+       instance also runs all the tasks of that instance that other threads
+       took from the queue in the meantime."""
+    def __init__(self):
+        self.lock=threading.Lock()
+        # active instance->list of tasks waiting for the running one
+        self.running=dict()
+
+    def claim(self, task):
+        """Claim a task's active instance for running the task.
+           returns: True if the task can be run now, False if it has been
+                    handed to the thread running a task of the same active 
+                    instance."""
+        with self.lock:
+            waiting=self.running.get(task.activeInstance)
+            if waiting is not None:
+                waiting.append(task)
+                return False
+            self.running[task.activeInstance]=[]
+            return True
+
+    def next(self, task):
+        """Get the next task of the same active instance as a finished task,
+           or release the active instance if there is none.
+           returns: the next task to run, or None"""
+        return self.resume(task.activeInstance)
+
+    def resume(self, activeInstance):
+        """Get the next task of a claimed active instance, or release the 
+           active instance if there is none.
+           returns: the next task to run, or None"""
+        with self.lock:
+            waiting=self.running[activeInstance]
+            if len(waiting) > 0:
+                return waiting.pop(0)
+            del self.running[activeInstance]
+            return None
+
+    def putBack(self, task):
+        """Put a task obtained with next() back as the first task to run of 
+           its (still claimed) active instance."""
+        with self.lock:
+            self.running[task.activeInstance].insert(0, task)
+
+
+class TaskStats(object):
+    """Per-function statistics of the time tasks wait in the task queue and
+       the time it takes to run them."""
+    def __init__(self):
+        self.lock=threading.Lock()
+        # function name->[count, total wait, max wait, total run, max run]
+        self.stats=dict()
+
+    def add(self, fnName, waitTime, runTime):
+        """Add the times of a single task."""
+        with self.lock:
+            st=self.stats.get(fnName)
+            if st is None:
+                st=[0, 0., 0., 0., 0.]
+                self.stats[fnName]=st
+            st[0]+=1
+            st[1]+=waitTime
+            st[2]=max(st[2], waitTime)
+            st[3]+=runTime
+            st[4]=max(st[4], runTime)
+
+    def get(self):
+        """Get the statistics.
+           returns: a dict of function name->dict with the number of tasks 
+                    run ('count'), and the average and maximum queue wait 
+                    and run times in seconds ('wait_avg', 'wait_max', 
+                    'run_avg', 'run_max')"""
+        ret=dict()
+        with self.lock:
+            for fnName, st in self.stats.iteritems():
+                ret[fnName]={ 'count' : st[0],
+                              'wait_avg' : st[1]/st[0],
+                              'wait_max' : st[2],
+                              'run_avg' : st[3]/st[0],
+                              'run_max' : st[4] }
+        return ret
+
+
 class TaskExecThread(object):
     """A dataflow task execution thread; executes any tasks that are not 
        commands, and queues commands into a command queue."""
-    def __init__(self, taskQueue, cmdQueue):
+    def __init__(self, taskQueue, cmdQueue, ordering=None, stats=None):
         """Start the task exec thread with a task queue and a command queue.
             taskQueue = the task queue to take tasks from
-            cmdQueue = the command queue to add commands to"""
+            cmdQueue = the command queue to add commands to
+            ordering = the TaskOrdering object shared by all exec threads
+            stats = the TaskStats object to add task times to"""
         self.taskQueue=taskQueue
         self.cmdQueue=cmdQueue
+        if ordering is None:
+            ordering=TaskOrdering()
+        self.ordering=ordering
+        if stats is None:
+            stats=TaskStats()
+        self.stats=stats
         self.lock=threading.Lock()
         # the condtion predicates
         self.stop=False
@@ -153,6 +267,9 @@ class TaskExecThread(object):
 
     def execLoop(self):
         """The execution loop for the exec thread."""
+        # the claimed active instance whose handed-off tasks were put back 
+        # in the ordering by a pause.
+        claimed=None
         while True:
             try:
                 with self.lock:
@@ -162,21 +279,35 @@ class TaskExecThread(object):
                         # signal that we're waiting, and wait
                         #log.debug("Pausing...")
                         self.waiter.releaseAndWait()
-                #log.debug("Waiting for queued task..")
-                task=self.taskQueue.get()
-                if task is not None:
-                    #log.debug("Got queued task.")
-                    (finished, newcmds, cancelcmds)=task.run()
-                    if newcmds is not None:
-                        for cmd in newcmds:
-                            log.debug("Queuing command")
-                            self.cmdQueue.add(cmd)
-                    if cancelcmds is not None:
-                        for cmd in cancelcmds:
-                            log.debug("Canceling command")
-                            self.cmdQueue.remove(cmd)
-                    if finished:
-                        task.handleOutput()
+                        self.pause=False
+                if claimed is not None:
+                    task=self.ordering.resume(claimed)
+                    claimed=None
+                else:
+                    #log.debug("Waiting for queued task..")
+                    task=self.taskQueue.get()
+                    if task is None:
+                        self.taskQueue.taskDone()
+                        continue
+                    if not self.ordering.claim(task):
+                        # another thread is running a task of the same 
+                        # active instance, and will run this one after it.
+                        continue
+                while task is not None:
+                    try:
+                        self.runTask(task)
+                    finally:
+                        self.taskQueue.taskDone()
+                        # wake up any worker requests waiting for the 
+                        # dataflow to produce new commands.
+                        self.cmdQueue.signalChange()
+                    task=self.ordering.next(task)
+                    if task is not None and self.isPausedOrStopped():
+                        # keep the active instance claimed, and run its
+                        # remaining tasks after the pause.
+                        self.ordering.putBack(task)
+                        claimed=task.activeInstance
+                        break
             except:
                 fo=StringIO()
                 traceback.print_exception(sys.exc_info()[0], sys.exc_info()[1],
@@ -184,6 +315,40 @@ class TaskExecThread(object):
                 errmsg="Exec thread exception: %s"%(fo.getvalue())
                 log.error(errmsg)
 
+    def isPausedOrStopped(self):
+        """Return whether the thread has been asked to pause or stop."""
+        with self.lock:
+            return self.pause or self.stop
+
+    def runTask(self, task):
+        """Run a single task, queue its commands and handle its output."""
+        startTime=time.time()
+        try:
+            #log.debug("Got queued task.")
+            (finished, newcmds, cancelcmds)=task.run()
+            if newcmds is not None:
+                for cmd in newcmds:
+                    log.debug("Queuing command")
+                    self.cmdQueue.add(cmd)
+            if cancelcmds is not None:
+                for cmd in cancelcmds:
+                    log.debug("Canceling command")
+                    self.cmdQueue.remove(cmd)
+            if finished:
+                task.handleOutput()
+        except:
+            fo=StringIO()
+            traceback.print_exception(sys.exc_info()[0], sys.exc_info()[1],
+                                      sys.exc_info()[2], file=fo)
+            errmsg="Exec thread exception: %s"%(fo.getvalue())
+            log.error(errmsg)
+        endTime=time.time()
+        if task.queuedTime is not None:
+            waitTime=startTime-task.queuedTime
+        else:
+            waitTime=0.
+        self.stats.add(task.getFunctionName(), waitTime, endTime-startTime)
+
 def taskExecThreadStarter(taskExecThread):
     """Thread starter function for TaskExecThread object."""
     log.debug("Started task exec thread.")
@@ -0,0 +1,283 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2012, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import logging
+import os
+import Queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+log=logging.getLogger(__name__)
+
+
+class CompletionItem(object):
+    """A finished command waiting to be handled."""
+    def __init__(self, cmd, returncode, cputime, spoolFile):
+        self.cmd=cmd
+        self.returncode=returncode
+        self.cputime=cputime
+        # the file holding the run data
+        self.spoolFile=spoolFile
+        self.submitTime=time.time()
+
+
+class CompletionPipeline(object):
+    """Handles the results of finished commands in stages, so that the
+       command finished request of a worker doesn't have to wait for the
+       command's task to run:
+
+       1. receive: in the request handling thread, the command is taken from
+          the running command list and its run data is written to a spool
+          file. Once that file is on disk, the request is acknowledged.
+       2. extract and run: completion threads extract the run data into the
+          command directory, and run the command's task.
+
+       The queue between the stages is bounded: if it is full, receiving
+       blocks, which slows down the workers sending results. Spooled results
+       that haven't been handled when the server stops are picked up again
+       when it starts (see recover())."""
+    def __init__(self, runningCmdList, spoolDir, nthreads, maxQueued):
+        """Initialize the pipeline.
+           runningCmdList = the server's RunningCmdList
+           spoolDir = the directory to keep run data in until it is handled
+           nthreads = the number of completion threads
+           maxQueued = the maximum number of queued results"""
+        self.runningCmdList=runningCmdList
+        self.spoolDir=spoolDir
+        self.nthreads=max(1, nthreads)
+        self.maxQueued=maxQueued
+        self.queue=Queue.Queue(maxsize=maxQueued)
+        self.lock=threading.Lock()
+        self.threads=[]
+        # statistics
+        self.maxDepth=0
+        self.nhandled=0
+        self.nfailed=0
+        self.waitTime=0.
+        self.runTime=0.
+
+    def start(self):
+        """Start the completion threads."""
+        if not os.path.isdir(self.spoolDir):
+            os.makedirs(self.spoolDir)
+        for i in range(self.nthreads):
+            th=threading.Thread(target=completionThreadFn, args=(self,),
+                                name="CompletionThread-%d"%i)
+            th.daemon=True
+            th.start()
+            self.threads.append(th)
+
+    def stop(self):
+        """Wait for all queued results to be handled and stop the completion
+           threads."""
+        self.queue.join()
+        for th in self.threads:
+            self.queue.put(None)
+        for th in self.threads:
+            th.join()
+        self.threads=[]
+
+    def receive(self, cmdID, returncode, cputime, runfile):
+        """Receive the results of a finished command: the first stage.
+           Blocks while the queue is full.
+           cmdID = the command ID
+           returncode = the return code, or None
+           cputime = the used cpu time
+           runfile = None or a file object with the tarfile of run data"""
+        cmd=self.runningCmdList.takeFinished(cmdID)
+        if runfile is None:
+            # there is nothing to extract: the command is queued again
+            # right away.
+            self.runningCmdList.finishCommand(cmd, returncode, cputime, None)
+            return
+        try:
+            spoolFile=self._spool(cmd, returncode, cputime, runfile)
+        except (IOError, OSError) as e:
+            log.error("Can't spool results of %s: %s"%(cmdID, str(e)))
+            # handle it directly instead
+            runfile.seek(0)
+            self.runningCmdList.finishCommand(cmd, returncode, cputime,
+                                              runfile)
+            return
+        self._put(CompletionItem(cmd, returncode, cputime, spoolFile))
+
+    def _put(self, item):
+        """Queue an item for the completion threads."""
+        self.queue.put(item)
+        depth=self.queue.qsize()
+        with self.lock:
+            self.maxDepth=max(self.maxDepth, depth)
+        log.debug("Queued results of %s; %d results waiting to be handled"%
+                  (item.cmd.id, depth))
+
+    def _getSpoolName(self, cmdID):
+        """Get the base name of the spool files of a command."""
+        # command IDs are hashes; make sure nothing else gets in file names.
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', cmdID)
+
+    def _spool(self, cmd, returncode, cputime, runfile):
+        """Write the run data of a command to the spool directory, followed
+           by a description file that makes it recoverable.
+           returns: the name of the run data file."""
+        base=os.path.join(self.spoolDir, self._getSpoolName(cmd.id))
+        dataFile="%s.tar.gz"%base
+        outf=open(dataFile, "wb")
+        try:
+            shutil.copyfileobj(runfile, outf, 1024*1024)
+            outf.flush()
+            os.fsync(outf.fileno())
+        finally:
+            outf.close()
+        fd, tmpName=tempfile.mkstemp(dir=self.spoolDir, suffix=".tmp")
+        outf=os.fdopen(fd, "w")
+        try:
+            json.dump({ 'cmd_id' : cmd.id,
+                        'return_code' : returncode,
+                        'cputime' : cputime,
+                        'data' : os.path.basename(dataFile) }, outf)
+            outf.flush()
+            os.fsync(outf.fileno())
+        finally:
+            outf.close()
+        os.rename(tmpName, "%s.json"%base)
+        # make sure the new directory entries are on disk too
+        fd=os.open(self.spoolDir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return dataFile
+
+    def _removeSpool(self, cmdID):
+        """Remove the spool files of a command."""
+        base=os.path.join(self.spoolDir, self._getSpoolName(cmdID))
+        for fname in [ "%s.json"%base, "%s.tar.gz"%base ]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def recover(self, cmdQueue):
+        """Queue the spooled results that weren't handled before the server
+           stopped. Their commands have been queued again when the projects
+           were read, and are taken out of the command queue.
+           cmdQueue = the command queue
+           returns: the number of recovered results"""
+        if not os.path.isdir(self.spoolDir):
+            return 0
+        n=0
+        for fname in sorted(os.listdir(self.spoolDir)):
+            path=os.path.join(self.spoolDir, fname)
+            if fname.endswith(".tmp"):
+                os.remove(path)
+                continue
+            if not fname.endswith(".json"):
+                continue
+            try:
+                inf=open(path, "r")
+                try:
+                    desc=json.load(inf)
+                finally:
+                    inf.close()
+                cmdID=desc['cmd_id']
+                dataFile=os.path.join(self.spoolDir, desc['data'])
+            except (IOError, ValueError, KeyError) as e:
+                log.error("Can't read spooled results %s: %s"%(path, str(e)))
+                continue
+            cmd=cmdQueue.take(cmdID)
+            if cmd is None or not os.path.exists(dataFile):
+                log.info("Discarding spooled results of unknown command %s"%
+                         cmdID)
+                self._removeSpool(cmdID)
+                continue
+            cmd.setRunning(False)
+            log.info("Recovered spooled results of command %s"%cmdID)
+            self._put(CompletionItem(cmd, desc['return_code'],
+                                     desc['cputime'], dataFile))
+            n+=1
+        # remove run data without description
+        for fname in os.listdir(self.spoolDir):
+            if fname.endswith(".tar.gz"):
+                base=os.path.join(self.spoolDir, fname[:-len(".tar.gz")])
+                if not os.path.exists("%s.json"%base):
+                    os.remove(os.path.join(self.spoolDir, fname))
+        return n
+
+    def handle(self, item):
+        """Extract the run data of a finished command and run its task: the
+           second stage."""
+        startTime=time.time()
+        try:
+            runfile=open(item.spoolFile, "rb")
+            try:
+                self.runningCmdList.finishCommand(item.cmd, item.returncode,
+                                                  item.cputime, runfile)
+            finally:
+                runfile.close()
+        except Exception:
+            # the spooled results are kept, so that they are handled again
+            # if the server restarts before the command finishes again.
+            log.exception("Error handling results of command %s; keeping "
+                          "them in %s"%(item.cmd.id, self.spoolDir))
+            if self.runningCmdList.requeueCommand(item.cmd):
+                log.info("Queued command %s again"%item.cmd.id)
+            with self.lock:
+                self.nfailed+=1
+        else:
+            self._removeSpool(item.cmd.id)
+        finally:
+            endTime=time.time()
+            with self.lock:
+                self.nhandled+=1
+                self.waitTime+=startTime-item.submitTime
+                self.runTime+=endTime-startTime
+
+    def getStats(self):
+        """Get the queue depth and handling statistics.
+           returns: a dict"""
+        with self.lock:
+            n=max(self.nhandled, 1)
+            return { 'threads' : len(self.threads),
+                     'queued' : self.queue.qsize(),
+                     'max_queued' : self.maxQueued,
+                     'max_depth' : self.maxDepth,
+                     'handled' : self.nhandled,
+                     'failed' : self.nfailed,
+                     'wait_avg' : self.waitTime/n,
+                     'run_avg' : self.runTime/n }
+
+
+def completionThreadFn(pipeline):
+    """The completion thread function."""
+    while True:
+        item=pipeline.queue.get()
+        try:
+            if item is None:
+                return
+            try:
+                pipeline.handle(item)
+            except:
+                log.exception("Error handling results of command %s"%
+                              item.cmd.id)
+        finally:
+            pipeline.queue.task_done()
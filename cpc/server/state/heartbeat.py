@@ -18,6 +18,7 @@
 
 import threading
 import time
+import heapq
 import logging
 import shutil
 import os
@@ -31,6 +32,8 @@ except ImportError:
 
 
 import cpc.util
+import cpc.util.file
+import cpc.util.threadpool
 import cpc.command.heartbeat
 #from cpc.util.conf.server_conf import ServerConf
 from cpc.server.message.server_message import ServerMessage
@@ -105,6 +108,11 @@ class RunningCommand(object):
         # calculate how long we can sleep before we need to check again.
         return int(self.lastHeard + 2*self.heartbeatInterval - now)
 
+    def getExpiryTime(self):
+        """Get the absolute time (as from time.time()) at which this 
+           command's heartbeat expires."""
+        return self.lastHeard + 2*self.heartbeatInterval
+
     def toJSON(self):
         ret=dict()
         ret['cmd_id']=self.cmd.id
@@ -206,6 +214,13 @@ class RunningCmdList(object):
         self.conf=conf
         self.cmdQueue=cmdQueue
         self.runningCommands=dict()
+        # A heap of (expiry time, command ID, RunningCommand) tuples, so the
+        # heartbeat thread only needs to look at the earliest expiries. Pings
+        # don't update the heap: an entry that turns out to have been pinged
+        # since it was pushed is pushed again with its new expiry time, and
+        # entries for commands that are no longer running are dropped when 
+        # they come up.
+        self.expiryHeap=[]
         self.workerData=workerData
         self.lock=threading.Lock()
         self.thread=None
@@ -230,6 +245,8 @@ class RunningCmdList(object):
                 rc=RunningCommand(cmd, None, None, None, workerServer,
                                   heartbeatInterval)
                 self.runningCommands[cmd.id] = rc
+                heapq.heappush(self.expiryHeap, 
+                               (rc.getExpiryTime(), cmd.id, rc))
                 cmd.setRunning(True, workerServer)
 
     def remove(self, cmd):
@@ -249,7 +266,14 @@ class RunningCmdList(object):
            returncode = the return code
            runfile = None or a file handle to the tarfile containing run data
            """
-        task=None
+        cmd=self.takeFinished(cmdID)
+        self.finishCommand(cmd, returncode, cputime, runfile)
+
+    def takeFinished(self, cmdID):
+        """Remove a finished command from the list, so that the calling thread
+           owns it.
+           cmdID = the command ID
+           returns: the command"""
         with self.lock:
             # remove it from the list
             if cmdID not in self.runningCommands:
@@ -257,7 +281,14 @@ class RunningCmdList(object):
             cmd=self.runningCommands[cmdID].cmd
             del self.runningCommands[cmdID]
             cmd.setRunning(False)
-        # the command is now removed from the list so we can stop locking.
+        return cmd
+
+    def finishCommand(self, cmd, returncode, cputime, runfile):
+        """Handle a command that has been removed from the list with
+           takeFinished(): extract its run data and run its task, or queue it
+           again if there is no run data.
+           runfile = None or a file handle to the tarfile containing run data
+           """
         if runfile is not None:
             log.debug("extracting file for %s to dir %s"%(cmd.id,cmd.getDir()))
             cpc.util.file.extractSafely(cmd.getDir(), fileobj=runfile)
@@ -267,6 +298,17 @@ class RunningCmdList(object):
             cmd.addCputime(cputime)
             self.cmdQueue.add(cmd)
 
+    def requeueCommand(self, cmd):
+        """Queue a command that has been removed from the list with
+           takeFinished() again, after handling its results failed. That
+           is only done if its task hasn't handled the command yet.
+           returns: whether the command was queued."""
+        task=cmd.getTask()
+        if task is not None and cmd not in task.getCommands():
+            return False
+        self.cmdQueue.add(cmd)
+        return True
+
     def _handleFinishedCmd(self, cmd, returncode, cputime):
         """Handle the command finishing itself. The command must be removed
            from the list first using self.lock, so no two threads own this
@@ -310,37 +352,38 @@ class RunningCmdList(object):
                      server
            faultyItems = a list containing faulty heartbeat items
            """
-        response=[]
         OK=True
-        for item in heartbeatItems:
-            with self.lock:
+        # all items are handled with a single lock acquisition.
+        with self.lock:
+            for item in heartbeatItems:
                 cmdid=item.getCmdID()
-                log.debug("Heartbeat signal for command %s"%cmdid)
-                if cmdid not in self.runningCommands:
+                rc=self.runningCommands.get(cmdid)
+                if rc is None:
                     item.setState(item.stateNotFound)
                     log.info("Heartbeat item %s not found"%cmdid)
                     faultyItems.append(item.cmdID)
                     OK=False
-                else:
-                    cwid=self.runningCommands[cmdid].getWorkerID()
-                    if (cwid is not None) and (cwid != workerID):
-                        item.setState(item.stateWrongWorker)
-                        log.info("Worker ID for %s not found"%cmdid)
-                        OK=False
-                        faultyItems.append(item.cmdID)
-                    else:
-                        item.setState(item.stateOK)
-                        rc=self.runningCommands[cmdid]
-                        if cwid is None:
-                            rc.setWorkerID(workerID)
-                        rc.setWorkerDir(workerDir)
-                        rc.setRunDir(item.getRunDir())
-                        rc.setIsLocal(isLocal)
-                        haveData=item.getHaveRunDir()
-                        if haveData is None:
-                            haveData=False
-                        rc.setHaveData(haveData)
-                        rc.ping()
+                    continue
+                cwid=rc.getWorkerID()
+                if (cwid is not None) and (cwid != workerID):
+                    item.setState(item.stateWrongWorker)
+                    log.info("Worker ID for %s not found"%cmdid)
+                    OK=False
+                    faultyItems.append(item.cmdID)
+                    continue
+                item.setState(item.stateOK)
+                if cwid is None:
+                    rc.setWorkerID(workerID)
+                rc.setWorkerDir(workerDir)
+                rc.setRunDir(item.getRunDir())
+                rc.setIsLocal(isLocal)
+                haveData=item.getHaveRunDir()
+                if haveData is None:
+                    haveData=False
+                rc.setHaveData(haveData)
+                rc.ping()
+        log.debug("Heartbeat signal for %d commands from worker %s"%
+                  (len(heartbeatItems), workerID))
         return OK
 
     def toJSON(self):
@@ -357,25 +400,31 @@ class RunningCmdList(object):
     def writeState(self):
         pass
 
-    def _fetchRemoteRunFiles(self, rc):
-        """Get the result files from a remote run directory to a local
-            command directory.
-            Return true if successful. May throw exception in case of failure"""
-        if rc.haveData:
-            log.debug("Fetching remote results directory %s to %s"%
-                      (rc.runDir, rc.cmd.getDir()))
-            # the data is remote: we must fetch data through a
-            # server-to-server command.
-            msg=ServerMessage(rc.workerServer)
-            resp=msg.deadWorkerFetchRequest(rc.workerDir, rc.runDir)
-            if resp.getType() == "application/x-tar":
-                # untar the return data and  use it.
-                runfile=resp.getRawData()
-                log.debug("extracting file for %s to dir %s"%
-                          (rc.cmd.id,rc.cmd.getDir()))
-                cpc.util.file.extractSafely(rc.cmd.getDir(), fileobj=runfile)
-                return True
-        return False
+    def _fetchRemoteRunFiles(self, workerServer, rcs):
+        """Get the result files from remote run directories on a single 
+            worker server to local command directories, with a single
+            request.
+            Return the set of running commands for which the data was fetched.
+            May throw exception in case of failure"""
+        rcs=[ rc for rc in rcs if rc.haveData ]
+        if len(rcs) == 0:
+            return set()
+        log.debug("Fetching %d remote results directories from %s"%
+                  (len(rcs), workerServer))
+        # the data is remote: we must fetch data through a
+        # server-to-server command.
+        msg=ServerMessage(workerServer)
+        resp=msg.deadWorkerFetchRequest([ (rc.workerDir, rc.runDir) 
+                                          for rc in rcs ])
+        if resp.getType() == "application/x-tar":
+            # untar the return data while it comes in, and use it.
+            destDirs=dict()
+            for i, rc in enumerate(rcs):
+                destDirs[str(i)]=rc.cmd.getDir()
+            extracted=cpc.util.file.extractSafelyMulti(destDirs,
+                                                       resp.getRawData())
+            return set([ rcs[int(i)] for i in extracted ])
+        return set()
 
     def _moveRunFiles(self, rc):
         """Move the result files from a local run directory to a local
@@ -441,55 +490,96 @@ class RunningCmdList(object):
             todelete=[]
             firstExpiry=interval
             now=time.time()
-            for rc in self.runningCommands.itervalues():
-                expiry = rc.expiry(now)
-                if expiry < 0:
+            heap=self.expiryHeap
+            while len(heap) > 0 and heap[0][0] < now:
+                (expiryTime, cmdID, rc)=heapq.heappop(heap)
+                if self.runningCommands.get(cmdID) is not rc:
+                    # the command has finished or was removed.
+                    continue
+                expiryTime=rc.getExpiryTime()
+                if expiryTime < now:
+                    # first remove the expired running commands from the
+                    # running list
                     todelete.append(rc)
-                elif expiry < firstExpiry:
-                    firstExpiry = expiry + 1
-            # first remove the expired running commands from the
-            # running list
-            for rc in todelete:
-                del self.runningCommands[rc.cmd.id]
-                rc.cmd.setRunning(False)
+                    del self.runningCommands[cmdID]
+                    rc.cmd.setRunning(False)
+                else:
+                    # it has been pinged since it was pushed
+                    heapq.heappush(heap, (expiryTime, cmdID, rc))
+            if len(heap) > 0:
+                firstExpiry = min(firstExpiry, int(heap[0][0] - now) + 1)
         # then handle their failure
         if len(todelete)>0:
-            # first try to get the data
+            # Group the dead commands by worker server, so that each worker
+            # server gets a single request for all its commands' data, and 
+            # handle the worker servers concurrently.
+            groups=dict()
             for rc in todelete:
-                finishedReported=False
-                # TODO: consolidate all requests for each worker server into
-                # one request
-                try:
-                    if not rc.isLocal:
-                        haveDir=self._fetchRemoteRunFiles(rc)
-                    else:
-                        # the data is local. Copy the directory
-                        haveDir=self._moveRunFiles(rc)
-                    if haveDir:
-                        self._handleFinishedCmd(rc.cmd, None, 0)
-                        finishedReported=True
-                except cpc.util.CpcError as e:
-                    log.error(e.__str__())
-                except:
-                    # we can ignore these, because they are simply associated
-                    # with fetching output data.
-                    fo=StringIO()
-                    traceback.print_exception(sys.exc_info()[0],
-                                              sys.exc_info()[1],
-                                              sys.exc_info()[2], file=fo)
-                    log.error("Heartbeat exception: %s"%(fo.getvalue()))
-                finally:
-                    if not finishedReported:
-                        log.info(
-                               "Running command %s died: didn't get its data."%
-                               rc.cmd.id)
-                        # just add it back into the queue
-                        self.cmdQueue.add(rc.cmd)
-                    else:
-                        log.info("Running command %s died: got its data."%
-                                 rc.cmd.id)
+                if rc.isLocal:
+                    key=None
+                else:
+                    key=rc.workerServer
+                if key in groups:
+                    groups[key].append(rc)
+                else:
+                    groups[key]=[rc]
+            nthreads=self.conf.getDeadCommandFetchThreads()
+            cpc.util.threadpool.runConcurrently(self._recoverCommands,
+                                                groups.items(), nthreads)
         return firstExpiry
 
+    def _recoverCommands(self, group):
+        """Try to get the data of a group of dead commands that ran through 
+           the same worker server, and handle them as finished. Commands
+           without data are put back in the queue.
+           group = a tuple of the worker server name (or None for this
+                   server) and the list of its dead running commands."""
+        workerServer, rcs=group
+        recovered=set()
+        try:
+            if workerServer is not None:
+                recovered=self._fetchRemoteRunFiles(workerServer, rcs)
+            else:
+                # the data is local. Move the directories
+                for rc in rcs:
+                    try:
+                        if self._moveRunFiles(rc):
+                            recovered.add(rc)
+                    except cpc.util.CpcError as e:
+                        log.error(e.__str__())
+        except cpc.util.CpcError as e:
+            log.error(e.__str__())
+        except:
+            # we can ignore these, because they are simply associated
+            # with fetching output data.
+            fo=StringIO()
+            traceback.print_exception(sys.exc_info()[0],
+                                      sys.exc_info()[1],
+                                      sys.exc_info()[2], file=fo)
+            log.error("Heartbeat exception: %s"%(fo.getvalue()))
+        for rc in rcs:
+            finishedReported=False
+            try:
+                if rc in recovered:
+                    self._handleFinishedCmd(rc.cmd, None, 0)
+                    finishedReported=True
+            except:
+                fo=StringIO()
+                traceback.print_exception(sys.exc_info()[0],
+                                          sys.exc_info()[1],
+                                          sys.exc_info()[2], file=fo)
+                log.error("Heartbeat exception: %s"%(fo.getvalue()))
+            finally:
+                if not finishedReported:
+                    log.info("Running command %s died: didn't get its data."%
+                             rc.cmd.id)
+                    # just add it back into the queue
+                    self.cmdQueue.add(rc.cmd)
+                else:
+                    log.info("Running command %s died: got its data."%
+                             rc.cmd.id)
+
+
 def heartbeatServerThread(runningCommandList, conf):
     """The hearbeat thread's endless loop.
        runningCommandList = the heartbeat list associated with this loop."""
@@ -0,0 +1,258 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import logging
+import threading
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+from cpc.network.com.client_response import ProcessedResponse
+from cpc.server.message.server_message import ServerMessage
+
+
+log=logging.getLogger(__name__)
+
+
+class WorkerHeartbeat(object):
+    """The heartbeat items of a single worker for a single destination
+       server."""
+    def __init__(self, workerID, workerDir, iteration, items):
+        self.workerID=workerID
+        self.workerDir=workerDir
+        self.iteration=iteration
+        self.items=items
+        # the number of failed attempts to send the items
+        self.failures=0
+
+    def getItemsXML(self, workerServer):
+        co=StringIO()
+        co.write('<heartbeat worker_id="%s" worker_server_id="%s">'%
+                 (self.workerID, workerServer))
+        for item in self.items:
+            item.writeXML(co)
+        co.write('</heartbeat>')
+        return co.getvalue()
+
+
+def sendHeartbeats(dest, workerServer, heartbeats):
+    """Send the heartbeats of a number of workers to a destination server
+       with a single request.
+       dest = the destination server ID
+       workerServer = the ID of this server
+       heartbeats = a list of WorkerHeartbeat objects
+       returns: a dict of worker ID->list of faulty command IDs."""
+    msg=ServerMessage(dest)
+    hbList=[ { 'worker_id' : hb.workerID,
+               'worker_dir' : hb.workerDir,
+               'iteration' : hb.iteration,
+               'heartbeat_items' : hb.getItemsXML(workerServer) }
+             for hb in heartbeats ]
+    presp=ProcessedResponse(msg.heartbeatBatchForwardedRequest(workerServer,
+                                                       json.dumps(hbList)))
+    if presp.getStatus() == "OK":
+        return presp.getData()
+    # servers without batched heartbeats: send them one by one
+    log.debug("Batched heartbeat to %s failed: %s"%(dest, presp.getMessage()))
+    faulty=dict()
+    for hb in heartbeats:
+        msg=ServerMessage(dest)
+        presp=ProcessedResponse(msg.heartbeatForwardedRequest(hb.workerID,
+                                        hb.workerDir, workerServer,
+                                        hb.iteration,
+                                        hb.getItemsXML(workerServer)))
+        if presp.getStatus() != "OK":
+            faulty[hb.workerID]=presp.getData()
+    return faulty
+
+
+class HeartbeatForwarder(object):
+    """Forwards worker heartbeat items to the servers the commands came
+       from.
+
+       Items for the same destination server are collected from all workers
+       during a short window, and then sent with a single request per
+       server, in the background: a worker's heartbeat doesn't wait for the
+       other servers. Each destination has at most one request in flight;
+       items for a server that is still busy wait for the next window.
+       Faulty items reported back are returned to the originating worker
+       with its next heartbeat. Items that couldn't be sent are sent again
+       with the next window, unless the worker sent newer ones."""
+    def __init__(self, workerServer, window, sendFn=sendHeartbeats,
+                 maxRetries=3):
+        """Initialize the forwarder.
+           workerServer = the ID of this server
+           window = the time in seconds to collect items before sending them
+           sendFn = the function that sends heartbeats to a server, with the
+                    signature of sendHeartbeats().
+           maxRetries = the number of times items that couldn't be sent are
+                        sent again."""
+        self.workerServer=workerServer
+        self.window=window
+        self.sendFn=sendFn
+        self.maxRetries=maxRetries
+        self.lock=threading.Lock()
+        self.cond=threading.Condition(self.lock)
+        # signaled when a request in flight is done
+        self.sendDone=threading.Condition(self.lock)
+        # destination->dict of worker ID->WorkerHeartbeat
+        self.pending=dict()
+        # the destinations with a request in flight
+        self.sending=set()
+        # worker ID->set of faulty command IDs
+        self.faulty=dict()
+        self.quit=False
+        self.thread=None
+        # statistics
+        self.nrequests=0
+        self.nheartbeats=0
+        self.nfailed=0
+        self.nretried=0
+
+    def start(self):
+        """Start the thread that sends the collected items."""
+        self.thread=threading.Thread(target=heartbeatForwardThreadFn,
+                                     args=(self,))
+        self.thread.daemon=True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the sending thread after sending any collected items."""
+        with self.lock:
+            self.quit=True
+            self.cond.notifyAll()
+        if self.thread is not None:
+            self.thread.join()
+
+    def add(self, dest, workerID, workerDir, iteration, items):
+        """Add a worker's heartbeat items for a destination server. They
+           replace any items of the same worker that haven't been sent yet."""
+        with self.lock:
+            if dest not in self.pending:
+                self.pending[dest]=dict()
+            self.pending[dest][workerID]=WorkerHeartbeat(workerID, workerDir,
+                                                         iteration, items)
+
+    def takeFaulty(self, workerID):
+        """Get the command IDs that destination servers reported as faulty
+           for a worker since its last heartbeat.
+           returns: a list of command IDs."""
+        with self.lock:
+            faulty=self.faulty.pop(workerID, None)
+        if faulty is None:
+            return []
+        return list(faulty)
+
+    def getStats(self):
+        """Get the number of requests sent, heartbeats forwarded, failed 
+           requests and heartbeats sent again.
+           returns: a dict"""
+        with self.lock:
+            return { 'requests' : self.nrequests,
+                     'heartbeats' : self.nheartbeats,
+                     'failed' : self.nfailed,
+                     'retried' : self.nretried }
+
+    def flush(self):
+        """Start sending the collected items to each destination server that
+           doesn't have a request in flight.
+           returns: the list of started sending threads."""
+        threads=[]
+        with self.lock:
+            for dest in self.pending.keys():
+                if dest in self.sending:
+                    continue
+                heartbeats=self.pending.pop(dest).values()
+                self.sending.add(dest)
+                self.nrequests+=1
+                self.nheartbeats+=len(heartbeats)
+                th=threading.Thread(target=self._send,
+                                    args=(dest, heartbeats))
+                th.daemon=True
+                threads.append(th)
+        for th in threads:
+            th.start()
+        return threads
+
+    def _send(self, dest, heartbeats):
+        """Send heartbeats to a destination server, and record the faulty
+           items."""
+        failed=False
+        try:
+            faulty=self.sendFn(dest, self.workerServer, heartbeats)
+        except:
+            log.exception("Forwarding %d heartbeats to %s failed"%
+                          (len(heartbeats), dest))
+            faulty=None
+            failed=True
+        with self.lock:
+            self.sending.discard(dest)
+            self.sendDone.notifyAll()
+            if failed:
+                self.nfailed+=1
+                self._requeue(dest, heartbeats)
+            if faulty:
+                for workerID, cmdIDs in faulty.iteritems():
+                    if not cmdIDs:
+                        continue
+                    log.info("Heartbeat items of %s not OK at %s"%
+                             (workerID, dest))
+                    if workerID not in self.faulty:
+                        self.faulty[workerID]=set()
+                    self.faulty[workerID].update(cmdIDs)
+
+    def _requeue(self, dest, heartbeats):
+        """Put heartbeats that couldn't be sent back in the pending items
+           for a destination server, unless the worker sent newer items
+           in the meantime.
+           NOTE: assumes a locked lock."""
+        for hb in heartbeats:
+            hb.failures+=1
+            if hb.failures > self.maxRetries:
+                log.info("Dropping heartbeat items of %s for %s after %d "
+                         "failed attempts"%(hb.workerID, dest, hb.failures))
+                continue
+            if dest not in self.pending:
+                self.pending[dest]=dict()
+            if hb.workerID in self.pending[dest]:
+                continue
+            self.pending[dest][hb.workerID]=hb
+            self.nretried+=1
+
+
+def heartbeatForwardThreadFn(forwarder):
+    """The heartbeat forwarding thread: sends the collected items every
+       window."""
+    while True:
+        with forwarder.lock:
+            if not forwarder.quit:
+                forwarder.cond.wait(forwarder.window)
+            quit=forwarder.quit
+        if quit:
+            # send what is left once the requests in flight are done
+            with forwarder.lock:
+                while len(forwarder.sending) > 0:
+                    forwarder.sendDone.wait()
+            for th in forwarder.flush():
+                th.join()
+            return
+        forwarder.flush()
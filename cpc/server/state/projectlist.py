@@ -27,6 +27,7 @@ import shutil
 import cpc.dataflow.project
 from cpc.util.conf.server_conf import ServerConf
 import cpc.util.file
+import cpc.util.threadpool
 import cpc.util
 
 log=logging.getLogger(__name__)
@@ -103,6 +104,8 @@ class ProjectList(object):
         dirname = None
         with self.lock:
             project.cancel()
+            # the project's instances are deleted with it.
+            project.getStatus().clear()
             del self.projects[project.getName()]
             dirname = project.getBasedir()
         if delDir and (dirname is not None):
@@ -127,11 +130,49 @@ class ProjectList(object):
             self._writeState(filename)
 
     def writeFullState(self, projectListFilename):
-        """Write out each project's state."""
+        """Write out the state of each project that changed since the last
+           save."""
         with self.lock:
             self._writeState(projectListFilename)
+            projects=[ proj for proj in self.projects.itervalues() 
+                       if proj.isDirty() ]
+        self._writeProjects(projects, 'writeState')
+
+    def writeChanges(self, projectListFilename):
+        """Write out the project list and the changes to each project's
+           state since the last save, without requiring a pause in task 
+           execution."""
+        with self.lock:
+            self._writeState(projectListFilename)
+            projects=[ proj for proj in self.projects.itervalues() 
+                       if proj.isDirty() ]
+        self._writeProjects(projects, 'writeJournal')
+
+    def writeSnapshots(self):
+        """Write a full state snapshot of each project that needs one (see
+           Project.needsSnapshot()). Task execution should be paused."""
+        with self.lock:
+            projects=[ proj for proj in self.projects.itervalues() 
+                       if proj.needsSnapshot() ]
+        self._writeProjects(projects, 'writeState')
+
+    def needsSnapshots(self):
+        """Return whether any of the projects needs a full state snapshot."""
+        with self.lock:
             for proj in self.projects.itervalues():
-                proj.writeState()
+                if proj.needsSnapshot():
+                    return True
+        return False
+
+    def _writeProjects(self, projects, writeFn):
+        """Call the project method named writeFn for a list of projects, 
+           concurrently in at most state_save_threads threads."""
+        def writeProject(proj):
+            getattr(proj, writeFn)()
+            log.debug("Saved state of project %s: %s"%(proj.getName(), 
+                                                       proj.getSaveStats()))
+        cpc.util.threadpool.runConcurrently(writeProject, projects,
+                                            self.conf.getStateSaveThreads())
 
     #def writeProjectTasks(self, serverState):
     #    with self.lock:
@@ -34,8 +34,12 @@ from cpc.util.conf.server_conf import ServerConf
 import projectlist
 import cpc.server.queue
 import heartbeat
+import heartbeat_forward
+import completion
+import worker_capabilities
 import cpc.server.queue
 import cpc.util.plugin
+import cpc.dataflow.controller_host
 import localassets
 import remoteassets
 from cpc.util.worker_state import WorkerState
@@ -63,6 +67,14 @@ class ServerState:
         self.workerDataList=heartbeat.WorkerDataList()
         self.runningCmdList=heartbeat.RunningCmdList(conf, self.cmdQueue,
                                                      self.workerDataList)
+        self.completionPipeline=completion.CompletionPipeline(
+                                        self.runningCmdList,
+                                        conf.getCompletionSpoolDir(),
+                                        conf.getCompletionThreads(),
+                                        conf.getCompletionQueueSize())
+        self.workerCapabilityCache=worker_capabilities.WorkerCapabilityCache(
+                                        conf.getWorkerCapabilityCacheSize())
+        self.heartbeatForwarder=None
         self.localAssets=localassets.LocalAssets()
         self.remoteAssets=remoteassets.RemoteAssets()
         self.sessionHandler=SessionHandler()
@@ -78,7 +90,9 @@ class ServerState:
 
     def startExecThreads(self):
         """Start the exec threads."""
-        self.taskExecThreads=cpc.server.queue.TaskExecThreads(self.conf, 1,
+        nthreads=max(1, self.conf.getTaskExecThreads())
+        self.taskExecThreads=cpc.server.queue.TaskExecThreads(self.conf,
+                                                nthreads,
                                                 self.projectlist.getTaskQueue(),
                                                 self.cmdQueue)
         self.stateSaveThread=threading.Thread(target=stateSaveLoop,
@@ -87,6 +101,15 @@ class ServerState:
         self.stateSaveThread.start()
         log.debug("Starting state save thread.")
         self.runningCmdList.startHeartbeatThread()
+        self.completionPipeline.start()
+        self.heartbeatForwarder=heartbeat_forward.HeartbeatForwarder(
+                                    Node.getSelfNode(self.conf).getId(),
+                                    self.conf.getHeartbeatForwardWindow())
+        self.heartbeatForwarder.start()
+        # results that were received but not handled before a restart
+        nrecovered=self.completionPipeline.recover(self.cmdQueue)
+        if nrecovered > 0:
+            log.info("Recovered %d finished command results"%nrecovered)
 
 
     def startConnectServerThread(self):
@@ -114,6 +137,9 @@ class ServerState:
         """set the quit state to true"""
         with self.quitlock:
             self.taskExecThreads.stop()
+            cpc.dataflow.controller_host.stopControllerPool()
+            if self.heartbeatForwarder is not None:
+                self.heartbeatForwarder.stop()
             self._write()
             self.quit=True
             doProfile = self.conf.getProfiling()
@@ -160,6 +186,18 @@ class ServerState:
         """Get the running command list."""
         return self.runningCmdList
 
+    def getCompletionPipeline(self):
+        """Get the pipeline that handles finished commands."""
+        return self.completionPipeline
+
+    def getHeartbeatForwarder(self):
+        """Get the forwarder of heartbeat items to other servers."""
+        return self.heartbeatForwarder
+
+    def getWorkerCapabilityCache(self):
+        """Get the cache of registered worker capabilities."""
+        return self.workerCapabilityCache
+
     def getWorkerDataList(self):
         """Get the worker directory list."""
         return self.workerDataList
@@ -185,9 +223,15 @@ class ServerState:
         conf = ServerConf()
         try:
             self.taskExecThreads.pause()
-            self._write()
-            projectFolder = "%s/%s"%(conf.getRunDir(),project)
-            if(os.path.isdir(projectFolder)):
+            try:
+                self._write()
+                projectFolder = "%s/%s"%(conf.getRunDir(),project)
+                if not os.path.isdir(projectFolder):
+                    raise Exception("Project does not exist")
+                # a project that is clean may have its latest changes only
+                # in the state journal, which is not read back from the
+                # backup: write a full snapshot first.
+                self.projectlist.get(project).writeState()
                 #tar the project folder but keep the old files also, this is
                 # only a backup!!!
                 #copy _state.xml to _state.bak.xml
@@ -200,15 +244,30 @@ class ServerState:
                 del(tf)
                 tff.seek(0)
                 os.remove(stateBackupFile)
+            finally:
                 self.taskExecThreads.cont()
-            else:
-                self.taskExecThreads.cont()
-                raise Exception("Project does not exist")
         finally:
             self.taskExecThreads.release()
 
         return tff
 
+    def writeChanges(self):
+        """Write the changes in server state since the last save: this
+           only pauses task execution if a project needs a full state
+           snapshot."""
+        self.projectlist.writeChanges(self.conf.getProjectFile())
+        if self.projectlist.needsSnapshots():
+            self.taskExecThreads.acquire()
+            try:
+                self.taskExecThreads.pause()
+                try:
+                    self.projectlist.writeSnapshots()
+                finally:
+                    self.taskExecThreads.cont()
+            finally:
+                self.taskExecThreads.release()
+        self.runningCmdList.writeState()
+
     def _write(self):
         self.projectlist.writeFullState(self.conf.getProjectFile())
         #self.taskQueue.writeFullState(self.conf.getTaskFile())
@@ -254,7 +313,7 @@ def stateSaveLoop(serverState, conf):
         time.sleep(conf.getStateSaveInterval())
         if not serverState.getQuit():
             log.debug("Saving server state.")
-            serverState.write()
+            serverState.writeChanges()
 
 
 def establishConnections(serverState):
@@ -0,0 +1,118 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import collections
+import copy
+import hashlib
+import logging
+import threading
+
+import cpc.command.platform_exec_reader
+from cpc.command.worker_matcher import CommandWorkerMatcher
+
+
+log=logging.getLogger(__name__)
+
+
+def capabilityToken(workerData):
+    """Get the token for a worker capability description: its hash, so that
+       workers with the same capabilities share the token."""
+    if isinstance(workerData, unicode):
+        workerData=workerData.encode('utf-8')
+    return hashlib.sha1(workerData).hexdigest()
+
+
+class WorkerCapabilities(object):
+    """The parsed platforms, executables and requirements that a worker
+       registered, together with the executable lookups done for it."""
+    def __init__(self, workerData):
+        """Parse a worker capability description.
+           workerData = the platform + executables XML string."""
+        self.workerData=workerData
+        self.token=capabilityToken(workerData)
+        rdr=cpc.command.platform_exec_reader.PlatformExecutableReader()
+        rdr.readString(workerData, "Worker-reported platform + executables")
+        self.platforms=rdr.getPlatforms()
+        self.executableList=rdr.getExecutableList()
+        self.workerRequirements=rdr.getWorkerRequirements()
+        # executable ID lookups shared by all matchers for these capabilities
+        self.execIDs=dict()
+
+    def getPlatforms(self, freeResources=None):
+        """Get a copy of the platforms with the worker's free resources.
+           freeResources = a dict of platform name->dict of resource
+                           name->free amount, or None to use the maximum
+                           resources.
+           returns: a list of platforms."""
+        platforms=copy.deepcopy(self.platforms)
+        if freeResources is not None:
+            for platform in platforms:
+                free=freeResources.get(platform.getName())
+                if free is None:
+                    continue
+                for rsrc in platform.getMaxResources().itervalues():
+                    if rsrc.name in free:
+                        rsrc.value=int(free[rsrc.name])
+        return platforms
+
+    def getMatcher(self, freeResources=None):
+        """Get a command-worker matcher for the worker's free resources."""
+        return CommandWorkerMatcher(self.getPlatforms(freeResources),
+                                    self.executableList,
+                                    self.workerRequirements,
+                                    self.execIDs)
+
+
+class WorkerCapabilityCache(object):
+    """A bounded cache of worker capabilities, indexed by token. The least
+       recently used capabilities are removed first; workers whose token
+       is unknown register again."""
+    def __init__(self, maxSize):
+        self.maxSize=maxSize
+        self.lock=threading.Lock()
+        # token->WorkerCapabilities, from least to most recently used
+        self.capabilities=collections.OrderedDict()
+
+    def register(self, workerData):
+        """Register a worker capability description, parsing it if it is
+           new.
+           returns: the WorkerCapabilities object."""
+        token=capabilityToken(workerData)
+        with self.lock:
+            caps=self.capabilities.pop(token, None)
+            if caps is not None:
+                self.capabilities[token]=caps
+                return caps
+        caps=WorkerCapabilities(workerData)
+        with self.lock:
+            self.capabilities[token]=caps
+            while len(self.capabilities) > self.maxSize:
+                self.capabilities.popitem(last=False)
+        log.debug("Registered worker capabilities %s"%token)
+        return caps
+
+    def get(self, token):
+        """Get the capabilities for a token.
+           returns: the WorkerCapabilities object, or None if the token is
+                    not known."""
+        with self.lock:
+            caps=self.capabilities.pop(token, None)
+            if caps is not None:
+                self.capabilities[token]=caps
+            return caps
@@ -149,6 +149,34 @@ class ConnectionBundle(Conf):
             "The run directory for the run client",
             True, writable=False)
 
+        self._add('worker_poll_time', 30,
+            "Maximum time in seconds for a worker with free resources to wait for new commands",
+            True, validation='\d+')
+        self._add('result_coalesce_time', 1,
+            "Time in seconds a worker waits for other commands to finish, so their results are returned together",
+            True, validation='\d+(\.\d*)?')
+        self._add('result_upload_threads', 2,
+            "Number of threads that send results back to the server",
+            True, validation='\d+')
+        self._add('result_upload_queue_size', 16,
+            "Maximum number of finished commands waiting for their results to be sent back",
+            True, validation='\d+')
+        self._add('result_upload_retries', 5,
+            "Number of times sending back results is retried",
+            True, validation='\d+')
+        self._add('worker_keepalive_connections', 2,
+            "Maximum number of idle connections a worker keeps open to its server for reuse",
+            True, validation='\d+')
+        self._add('worker_keepalive_idle_time', 60,
+            "Time in seconds after which a worker closes an idle kept-alive connection; it should be shorter than the server's worker_keepalive_timeout",
+            True, validation='\d+(\.\d*)?')
+        self._add('executable_cache_file', "executables-cache.json",
+            "Local file caching the executables found at worker start (relative to conf_dir); empty to disable the cache",
+            True, relTo='conf_dir', writable=False)
+        self._add('input_cache_size', 1024,
+            "Maximum size in MB of a worker's cache of command input files; 0 disables the cache",
+            True, validation='\d+')
+
 
     def getClientHost(self):
         return self.get('client_host')
@@ -171,6 +199,35 @@ class ConnectionBundle(Conf):
     def getRunDir(self):
         return self.get("run_dir")
 
+    def getWorkerPollTime(self):
+        return float(self.get("worker_poll_time"))
+
+    def getResultCoalesceTime(self):
+        return float(self.get("result_coalesce_time"))
+
+    def getResultUploadThreads(self):
+        return int(self.get("result_upload_threads"))
+
+    def getResultUploadQueueSize(self):
+        return int(self.get("result_upload_queue_size"))
+
+    def getResultUploadRetries(self):
+        return int(self.get("result_upload_retries"))
+
+    def getWorkerKeepaliveConnections(self):
+        return int(self.get("worker_keepalive_connections"))
+
+    def getWorkerKeepaliveIdleTime(self):
+        return float(self.get("worker_keepalive_idle_time"))
+
+    def getExecutableCacheFile(self):
+        if self.get("executable_cache_file") == "":
+            return ""
+        return self.getFile("executable_cache_file")
+
+    def getInputCacheSize(self):
+        return int(self.get("input_cache_size"))
+
     def getHostName(self):
         ''' The fully qualified domain name of the client  '''
         return socket.getfqdn()
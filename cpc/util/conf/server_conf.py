@@ -169,6 +169,12 @@ class ServerConf(conf_base.Conf):
         self._add('state_save_interval', 240,
                   "Time in seconds between state saves",
                   True, validation='\d+')
+        self._add('state_journal_max_size', 16,
+                  "Maximum size in MB of a project's state journal before it is compacted into a full state snapshot",
+                  True, validation='\d+')
+        self._add('state_save_threads', 4,
+                  "Number of threads that write project states concurrently",
+                  True, validation='\d+')
 
         self._add('import_path', "",
                   "Colon-separated list of directories to search for imports, in addition to cpc/lib, .copernicus/lib and .copernicus/<hostname>/lib",
@@ -203,15 +209,51 @@ class ServerConf(conf_base.Conf):
         self._add('heartbeat_time', 120,
                   "Time in seconds between heartbeats",
                   True, validation='\d+')
+        self._add('heartbeat_forward_window', 1,
+                  "Time in seconds during which heartbeat items of workers for another server are collected, to be forwarded with a single request",
+                  True, validation='\d+(\.\d*)?')
         self._add('heartbeat_file', "heartbeatlist.xml",
                   "Heartbeat monitor list", False,
                   relTo='conf_dir')
+        self._add('dead_command_fetch_threads', 4,
+                  "Number of worker servers to fetch dead commands' data from concurrently",
+                  True, validation='\d+')
 
         # Task exec queue size. If it exceeds this size, the dataflow
         # propagation blocks.
         self._add('task_queue_size', 1024,
                   "Dataflow execution task queue size",
                   True, validation='\d+')
+        self._add('controller_pool', 'false',
+                  "Run python controllers of external functions in pre-started controller host processes that keep common modules imported",
+                  True, None, None, ['false', 'true'])
+        self._add('controller_preload_modules', 'cpc.dataflow,cpc.util,numpy,scipy',
+                  "Comma-separated list of modules that controller hosts import at start, in addition to the python modules of the function library",
+                  True)
+        self._add('controller_host_max_runs', 100,
+                  "Number of controller runs after which a controller host process is replaced",
+                  True, validation='\d+')
+        self._add('controller_host_max_memory', 256,
+                  "Memory growth in MB of a controller host process, or of a controller run in it, after which the host is replaced",
+                  True, validation='\d+')
+        self._add('task_exec_threads', 1,
+                  "Number of threads that run dataflow tasks (controllers and output handling). Tasks of the same function instance always run in order.",
+                  True, validation='\d+')
+
+        # Maximum time a worker-ready request waits for the dataflow to 
+        # produce enough commands to fill the worker.
+        self._add('worker_ready_max_wait', 5,
+                  "Maximum time in seconds a worker request waits for new commands",
+                  True, validation='\d+')
+        self._add('worker_ready_max_long_poll', 30,
+                  "Maximum time in seconds a worker request without any commands can be held until new commands are queued",
+                  True, validation='\d+')
+        self._add('worker_capability_cache_size', 1024,
+                  "Maximum number of registered worker platform and executable descriptions the server keeps",
+                  True, validation='\d+')
+        self._add('input_blob_min_size', 65536,
+                  "Minimum size in bytes of command input files that are sent by content hash, so that workers with a copy in their input cache don't receive them again",
+                  True, validation='\d+')
 
                 #static configuration
         self._add('web_root', 'web',
@@ -223,6 +265,24 @@ class ServerConf(conf_base.Conf):
                   True,
                   relTo='conf_dir')
 
+        self._add('tune_cache_dir', "tune_cache",
+                  "Directory containing cached mdrun tuning results, shared between projects",
+                  True,
+                  relTo='conf_dir')
+
+        # Finished commands are received, and acknowledged to the worker,
+        # before they are handled by the completion threads.
+        self._add('completion_threads', 4,
+                  "Number of threads that handle the results of finished commands (extraction and running their tasks)",
+                  True, validation='\d+')
+        self._add('completion_queue_size', 64,
+                  "Maximum number of received command results waiting to be handled; command finished requests wait while the queue is full",
+                  True, validation='\d+')
+        self._add('completion_spool_dir', "completion_spool",
+                  "Directory where results of finished commands are kept until they have been handled",
+                  True,
+                  relTo='conf_dir')
+
 
         self._add('server_cores', -1,
                   "Number of cores to use on the server (for OpenMP tasks).",
@@ -243,6 +303,11 @@ class ServerConf(conf_base.Conf):
             "value is in seconds"
             ,userSettable=True)
 
+        self._add('worker_keepalive_timeout',120,
+            "Time in seconds after which an idle kept-alive connection "
+            "from a worker is closed"
+            ,userSettable=True, validation='\d+')
+
         self._add('server_verification',True,
                   "By default servers should always require ssl certificate from both directions" \
                   "setting this to true will let the sending server to use the client port and disregard" \
@@ -358,12 +423,28 @@ class ServerConf(conf_base.Conf):
         with self.lock:
             return int(self.conf['state_save_interval'].get())
 
+    def getStateJournalMaxSize(self):
+        """Get the maximum state journal size in bytes."""
+        with self.lock:
+            return int(self.conf['state_journal_max_size'].get())*1024*1024
+
+    def getStateSaveThreads(self):
+        with self.lock:
+            return int(self.conf['state_save_threads'].get())
+
     def getHeartbeatTime(self):
         with self.lock:
             return int(self.conf['heartbeat_time'].get())
+    def getHeartbeatForwardWindow(self):
+        with self.lock:
+            return float(self.conf['heartbeat_forward_window'].get())
     def getHeartbeatFile(self):
         return self.getFile('heartbeat_file')
 
+    def getDeadCommandFetchThreads(self):
+        with self.lock:
+            return int(self.conf['dead_command_fetch_threads'].get())
+
     def getServerCores(self):
         with self.lock:
             return int(self.conf['server_cores'].get())
@@ -452,6 +533,45 @@ class ServerConf(conf_base.Conf):
         with self.lock:
             return self.conf['task_queue_size'].get()
 
+    def getTaskExecThreads(self):
+        with self.lock:
+            return int(self.conf['task_exec_threads'].get())
+
+    def getControllerPool(self):
+        with self.lock:
+            strMode = self.conf['controller_pool'].get()
+        return strMode == 'true'
+
+    def getControllerPreloadModules(self):
+        with self.lock:
+            mods = self.conf['controller_preload_modules'].get()
+        return [ m.strip() for m in mods.split(',') if m.strip() != "" ]
+
+    def getControllerHostMaxRuns(self):
+        with self.lock:
+            return int(self.conf['controller_host_max_runs'].get())
+
+    def getControllerHostMaxMemory(self):
+        """Get the maximum controller host memory growth in kB."""
+        with self.lock:
+            return int(self.conf['controller_host_max_memory'].get())*1024
+
+    def getWorkerReadyMaxWait(self):
+        with self.lock:
+            return float(self.conf['worker_ready_max_wait'].get())
+
+    def getWorkerReadyMaxLongPoll(self):
+        with self.lock:
+            return float(self.conf['worker_ready_max_long_poll'].get())
+
+    def getWorkerCapabilityCacheSize(self):
+        with self.lock:
+            return int(self.conf['worker_capability_cache_size'].get())
+
+    def getInputBlobMinSize(self):
+        with self.lock:
+            return int(self.conf['input_blob_min_size'].get())
+
     def getWebRootPath(self):
         return os.path.join(self.execBasedir,self.get('web_root'))
 
@@ -473,6 +593,18 @@ class ServerConf(conf_base.Conf):
     def getLocalAssetsDir(self):
         return self.getFile('local_assets_dir')
 
+    def getTuneCacheDir(self):
+        return self.getFile('tune_cache_dir')
+
+    def getCompletionThreads(self):
+        return int(self.conf['completion_threads'].get())
+
+    def getCompletionQueueSize(self):
+        return int(self.conf['completion_queue_size'].get())
+
+    def getCompletionSpoolDir(self):
+        return self.getFile('completion_spool_dir')
+
 
     def getServerIdFileName(self):
         return os.path.join(self.getConfDir(),"server.id")
@@ -494,5 +626,8 @@ class ServerConf(conf_base.Conf):
     def getReconnectInterval(self):
         return int(self.conf['reconnect_interval'].get())
 
+    def getWorkerKeepaliveTimeout(self):
+        return int(self.conf['worker_keepalive_timeout'].get())
+
     def getNumPersistentConnections(self):
         return int(self.conf['num_persistent_connections'].get())
@@ -53,6 +53,41 @@ def extractSafely(destdir, filename=None, fileobj=None):
         del(tf)
 
 
+def extractSafelyMulti(destdirs, fileobj):
+    """Extract a streamed tar.gz file holding several directories, each in 
+       its own top-level directory, into separate destination directories.
+
+       destdirs = a dict of destination directories, indexed by the name of
+                  the top-level directory in the tar file.
+       fileobj = the file object to read the tar file from. It is read
+                 sequentially, so it can be a network stream.
+       returns: the set of top-level directory names that were extracted."""
+    extracted=set()
+    try:
+        tf=tarfile.open(fileobj=fileobj, mode='r|gz')
+        try:
+            for member in tf:
+                name=os.path.normpath(member.name)
+                if os.path.isabs(name) or name.startswith(".."):
+                    continue
+                parts=name.split(os.sep, 1)
+                if parts[0] not in destdirs:
+                    continue
+                extracted.add(parts[0])
+                if len(parts) < 2:
+                    # the top-level directory itself
+                    continue
+                member.name=parts[1]
+                tf.extract(member, destdirs[parts[0]])
+        finally:
+            tf.close()
+    except OSError as e:
+        raise TarfileError("%s"%(e.strerror))
+    except tarfile.TarError:
+        raise TarfileError("Couldnt read tar.gz file")
+    return extracted
+
+
 def backupFile(filename, Nmax=4):
     for i in range(Nmax-1,-1,-1):
         if i>1:
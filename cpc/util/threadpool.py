@@ -0,0 +1,70 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import logging
+import threading
+import Queue
+
+log=logging.getLogger(__name__)
+
+
+def _runLoop(fn, itemQueue):
+    """Thread function for runConcurrently: handle items until the queue is
+       empty."""
+    while True:
+        try:
+            item=itemQueue.get_nowait()
+        except Queue.Empty:
+            return
+        _run(fn, item)
+
+def _run(fn, item):
+    """Call fn(item), logging any exception."""
+    try:
+        fn(item)
+    except:
+        log.exception("Error in concurrent call of %s for %s"%
+                      (fn.__name__, str(item)))
+
+def runConcurrently(fn, items, maxThreads):
+    """Call fn(item) for each item in a list, in at most maxThreads threads,
+       and wait for all calls to finish. Exceptions are logged, and don't 
+       stop the handling of other items.
+
+       fn = the function to call
+       items = the list of items
+       maxThreads = the maximum number of concurrent threads. If this is 
+                    less than 2, all items are handled in the calling 
+                    thread."""
+    nthreads=min(len(items), maxThreads)
+    if nthreads < 2:
+        for item in items:
+            _run(fn, item)
+        return
+    itemQueue=Queue.Queue()
+    for item in items:
+        itemQueue.put(item)
+    threads=[]
+    for i in range(nthreads):
+        thread=threading.Thread(target=_runLoop, args=(fn, itemQueue))
+        thread.daemon=True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
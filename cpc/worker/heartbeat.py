@@ -144,6 +144,9 @@ class HeartbeatSender(object):
                     item.hbi.writeXML(co)
                     for subwl in item.joinedTo:
                         subwl.hbi.writeXML(co)
+            # finished workloads whose results are still being sent back
+            for item in self.worker._getPendingUploads():
+                item.hbi.writeXML(co)
             co.write("</heartbeat>")
         clnt=WorkerMessage()
         resp=clnt.workerHeartbeatRequest(self.workerID, self.workerDir, 
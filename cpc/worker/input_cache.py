@@ -0,0 +1,156 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+#
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import collections
+import json
+import logging
+import os
+import shutil
+import stat
+
+import cpc.util
+from cpc.command.input_blobs import blobDir, manifestName
+
+
+log=logging.getLogger(__name__)
+
+
+class InputCacheError(cpc.util.CpcError):
+    pass
+
+
+class InputCache(object):
+    """A bounded cache of command input files, indexed by content hash.
+       The least recently used files are removed first when the cache is
+       full. Cached files are read-only, and are hard-linked into the
+       command directories."""
+    def __init__(self, cacheDir, maxSize):
+        """Initialize the cache.
+           cacheDir = the directory to keep the cached files in
+           maxSize = the maximum total size of the cached files in bytes."""
+        self.cacheDir=cacheDir
+        self.maxSize=maxSize
+        if not os.path.exists(cacheDir):
+            os.mkdir(cacheDir)
+        # hash->size, from least to most recently used
+        self.blobs=collections.OrderedDict()
+        self.size=0
+        # statistics
+        self.hits=0
+        self.misses=0
+        self.bytesSaved=0
+        self.bytesReceived=0
+
+    def getHashes(self):
+        """Get the list of hashes of the cached files."""
+        return self.blobs.keys()
+
+    def _blobPath(self, hsh):
+        return os.path.join(self.cacheDir, hsh)
+
+    def _use(self, hsh):
+        """Mark a cached file as most recently used."""
+        size=self.blobs.pop(hsh)
+        self.blobs[hsh]=size
+        return size
+
+    def _add(self, hsh, path):
+        """Move a file into the cache, removing the least recently used
+           files if the cache grows too large.
+           returns: the path of the file to link from."""
+        size=os.path.getsize(path)
+        if hsh in self.blobs:
+            self._use(hsh)
+            return self._blobPath(hsh)
+        if size > self.maxSize:
+            return path
+        while self.size+size > self.maxSize and len(self.blobs) > 0:
+            oldHsh, oldSize=self.blobs.popitem(last=False)
+            os.remove(self._blobPath(oldHsh))
+            self.size-=oldSize
+        dst=self._blobPath(hsh)
+        os.rename(path, dst)
+        os.chmod(dst, stat.S_IRUSR|stat.S_IRGRP|stat.S_IROTH)
+        self.blobs[hsh]=size
+        self.size+=size
+        return dst
+
+    def _link(self, src, dst):
+        dstDir=os.path.dirname(dst)
+        if not os.path.exists(dstDir):
+            os.makedirs(dstDir)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy(src, dst)
+
+    def unpack(self, rundir):
+        """Put the input files listed in the manifest of an extracted command
+           tar file in place, and add the blobs that came with it to the
+           cache.
+           rundir = the directory the command tar file was extracted in."""
+        manifestFile=os.path.join(rundir, manifestName)
+        if not os.path.exists(manifestFile):
+            return
+        inf=open(manifestFile, 'r')
+        try:
+            manifest=json.load(inf)
+        finally:
+            inf.close()
+        os.remove(manifestFile)
+        received=os.path.join(rundir, blobDir)
+        newBlobs=collections.defaultdict(list)
+        # first link the cached files: adding new ones may remove them.
+        for arcname, hsh in manifest.iteritems():
+            if (os.path.isabs(arcname) or
+                os.path.normpath(arcname).startswith("..")):
+                raise InputCacheError("Illegal input file name %s"%arcname)
+            dst=os.path.join(rundir, arcname)
+            if os.path.exists(os.path.join(received, hsh)):
+                newBlobs[hsh].append(dst)
+            elif hsh in self.blobs:
+                self._link(self._blobPath(hsh), dst)
+                size=self._use(hsh)
+                self.hits+=1
+                self.bytesSaved+=size
+            else:
+                raise InputCacheError("Input file %s not in cache"%arcname)
+        for hsh, dsts in newBlobs.iteritems():
+            src=self._add(hsh, os.path.join(received, hsh))
+            size=os.path.getsize(src)
+            for dst in dsts:
+                self._link(src, dst)
+            self.misses+=1
+            self.bytesReceived+=size
+            # the other files with the same content were not sent again
+            self.hits+=len(dsts)-1
+            self.bytesSaved+=(len(dsts)-1)*size
+        if os.path.exists(received):
+            shutil.rmtree(received)
+        log.info("Input cache: %d hits, %d misses (%.0f%% hit rate), "
+                 "%d bytes saved, %d bytes received, %d bytes cached"%
+                 (self.hits, self.misses, 100.*self.getHitRate(),
+                  self.bytesSaved, self.bytesReceived, self.size))
+
+    def getHitRate(self):
+        """Get the fraction of input files that were found in the cache."""
+        total=self.hits+self.misses
+        if total == 0:
+            return 0.
+        return float(self.hits)/total
@@ -22,6 +22,7 @@ Created on Mar 10, 2011
 
 @author: iman
 '''
+import json
 import logging
 from cpc.network.com.client_base import ClientBase
 from cpc.network.com.input import Input
@@ -47,16 +48,50 @@ class WorkerMessage(ClientBase):
             self.port = self.conf.getServerSecurePort()
 
         self.require_certificate_authentication=True
+        # workers reuse their connections to the server
+        self.keepAlive=True
         self.privateKey = self.conf.getPrivateKey()
         self.keychain = self.conf.getCaChainFile()
 
-    def workerRequest(self, workerID, archdata):
-        cmdstring='worker-ready'
+    def workerRegisterRequest(self, workerID, archdata):
+        """Register the worker's platforms and executables, to get a
+           capability token for worker requests."""
+        cmdstring='worker-register'
         fields = []
         fields.append(Input('cmd', cmdstring))
         fields.append(Input('version', "1"))
         fields.append(Input('worker', archdata))
         fields.append(Input('worker-id', workerID))
+        response= self.putRequest(ServerRequest.prepareRequest(fields, []))
+        return response
+
+    def workerRequest(self, workerID, archdata, maxWait=None,
+                      inputBlobs=None, capabilities=None, freeResources=None):
+        """Ask for commands to run. 
+           archdata = the platforms and executables XML, or None if a
+                      capability token is given.
+           maxWait = the optional time in seconds the server may wait for
+                     new commands if there are none.
+           inputBlobs = the optional list of hashes of the files in the
+                        worker's input cache.
+           capabilities = the optional capability token from registration
+           freeResources = the free resources with the capability token, as
+                           a dict of platform name->dict of resource
+                           name->value."""
+        cmdstring='worker-ready'
+        fields = []
+        fields.append(Input('cmd', cmdstring))
+        fields.append(Input('version', "1"))
+        if capabilities is not None:
+            fields.append(Input('capabilities', capabilities))
+            fields.append(Input('free_resources', json.dumps(freeResources)))
+        else:
+            fields.append(Input('worker', archdata))
+        fields.append(Input('worker-id', workerID))
+        if maxWait is not None:
+            fields.append(Input('max_wait', str(maxWait)))
+        if inputBlobs is not None:
+            fields.append(Input('input_blobs', json.dumps(inputBlobs)))
         headers = dict()
         response= self.putRequest(ServerRequest.prepareRequest(fields, [],
                                                                headers))
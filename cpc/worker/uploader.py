@@ -0,0 +1,166 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import logging
+import threading
+import time
+import os
+import Queue
+
+log=logging.getLogger(__name__)
+
+
+class ResultUploader(object):
+    """Packs and sends back the results of finished workloads in background
+       threads, so that the worker can continue running new workloads.
+
+       The queue of workloads waiting to be uploaded is bounded: if it is 
+       full, submit() blocks until there is room. Failed uploads are retried
+       with an increasing delay."""
+    def __init__(self, condVar, nthreads, maxQueued, maxRetries, 
+                 retryDelay=2., doneFn=None):
+        """Initialize the uploader.
+           condVar = the worker's run condition variable, which protects the
+                     workloads' state.
+           nthreads = the number of upload threads
+           maxQueued = the maximum number of queued uploads
+           maxRetries = the number of times a failed upload is retried
+           retryDelay = the delay in seconds before the first retry. It is 
+                        doubled with every retry.
+           doneFn = an optional function to call with a workload after its 
+                    upload has finished or failed."""
+        self.condVar=condVar
+        self.nthreads=nthreads
+        self.maxRetries=maxRetries
+        self.retryDelay=retryDelay
+        self.doneFn=doneFn
+        self.queue=Queue.Queue(maxsize=maxQueued)
+        # the workloads whose results haven't been sent yet
+        self.pending=[]
+        self.lock=threading.Lock()
+        self.threads=[]
+
+    def start(self):
+        """Start the upload threads."""
+        for i in range(self.nthreads):
+            th=threading.Thread(target=uploadThreadFn, args=(self,))
+            th.daemon=True
+            th.start()
+            self.threads.append(th)
+
+    def addPending(self, workload):
+        """Mark the results of a workload, and of the workloads joined to 
+           it, as waiting to be sent back, so that they stay visible to the 
+           heartbeat before submit() queues them. 
+           NOTE: assumes a locked condVar."""
+        workloads=[workload]
+        workloads.extend(workload.joinedTo)
+        with self.lock:
+            for wl in workloads:
+                if not wl.uploadPending:
+                    wl.uploadPending=True
+                    self.pending.append(wl)
+
+    def submit(self, workload):
+        """Queue the results of a workload, and of the workloads joined to 
+           it, for upload. Blocks while the upload queue is full; the 
+           workloads are pending from the start."""
+        with self.condVar:
+            self.addPending(workload)
+        self.queue.put(workload)
+        for wl in workload.joinedTo:
+            self.queue.put(wl)
+
+    def getPending(self):
+        """Get the list of workloads with results that haven't been sent 
+           yet."""
+        with self.lock:
+            return list(self.pending)
+
+    def stop(self):
+        """Wait for all queued uploads to finish, and stop the upload 
+           threads."""
+        self.queue.join()
+        for th in self.threads:
+            self.queue.put(None)
+        for th in self.threads:
+            th.join()
+        self.threads=[]
+
+    def upload(self, workload):
+        """Pack and send a workload's results, retrying on failure.
+           returns: whether the upload succeeded."""
+        startTime=time.time()
+        tff=workload.packResults()
+        try:
+            tff.seek(0, os.SEEK_END)
+            size=tff.tell()
+            packTime=time.time()-startTime
+            delay=self.retryDelay
+            attempt=0
+            while True:
+                try:
+                    sendStartTime=time.time()
+                    tff.seek(0)
+                    workload.sendResults(tff)
+                    break
+                except Exception as e:
+                    attempt+=1
+                    if attempt > self.maxRetries:
+                        log.error("Giving up returning results of %s: %s"%
+                                  (workload.cmd.id, str(e)))
+                        return False
+                    log.info("Error returning results of %s: %s. Retrying "
+                             "in %g seconds."%(workload.cmd.id, str(e), delay))
+                    time.sleep(delay)
+                    delay*=2
+            sendTime=time.time()-sendStartTime
+        finally:
+            tff.close()
+        log.info("Returned results of %s: %d kB packed in %.2f s, sent in "
+                 "%.2f s (%.1f kB/s); %d uploads queued."%
+                 (workload.cmd.id, size/1024, packTime, sendTime, 
+                  size/(1024*max(sendTime, 1e-6)), self.queue.qsize()))
+        return True
+
+    def _finished(self, workload):
+        """Mark a workload's upload as finished."""
+        with self.lock:
+            self.pending.remove(workload)
+        with self.condVar:
+            workload.uploadPending=False
+        if self.doneFn is not None:
+            self.doneFn(workload)
+
+
+def uploadThreadFn(uploader):
+    """The upload thread function."""
+    while True:
+        workload=uploader.queue.get()
+        try:
+            if workload is None:
+                return
+            try:
+                uploader.upload(workload)
+            except:
+                log.exception("Error returning results of %s"%
+                              workload.cmd.id)
+            uploader._finished(workload)
+        finally:
+            uploader.queue.task_done()
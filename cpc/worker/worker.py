@@ -29,10 +29,15 @@ import time
 import cpc.util.file
 import cpc.command
 from cpc.command.platform_reservation import PlatformReservation
+from cpc.command.executable_cache import ExecutableCache
 from cpc.util.plugin import PlatformPlugin
 import workload
 import heartbeat
+import uploader
+import input_cache
 from cpc.worker.message import WorkerMessage
+from cpc.network.com.client_response import ProcessedResponse, ResponseError
+from cpc.network.com.client_connection import KeepAliveConnectionPool
 
 log=logging.getLogger(__name__)
 import sys
@@ -146,8 +151,23 @@ class Worker(object):
                    "Run cpc-worker from a user-writeable directory (e.g. /tmp)")
             raise WorkerError("Can't create directory '%s' %s."%
                               (self.mainDir, absn))
+        KeepAliveConnectionPool().setLimits(
+                                self.conf.getWorkerKeepaliveConnections(),
+                                self.conf.getWorkerKeepaliveIdleTime())
+        # the cache of command input files
+        self.inputCache=None
+        if self.conf.getInputCacheSize() > 0:
+            self.inputCache=input_cache.InputCache(
+                                    os.path.join(self.mainDir, "input_cache"),
+                                    self.conf.getInputCacheSize()*1024*1024)
         self.heartbeat=heartbeat.HeartbeatSender(self, #self.id, self.mainDir,
                                                  self.runCondVar)
+        # results are sent back in the background
+        self.uploader=uploader.ResultUploader(self.runCondVar,
+                                        self.conf.getResultUploadThreads(),
+                                        self.conf.getResultUploadQueueSize(),
+                                        self.conf.getResultUploadRetries(),
+                                        doneFn=self._uploadDone)
         # First get our architecture(s) (hw + sw) from the plugin
         self.plugin=PlatformPlugin(self.type, self.mainDir, self.conf)
         canRun=self.plugin.canRun()
@@ -166,6 +186,10 @@ class Worker(object):
             sys.exit(1)
 
         self._printAvailableExes()
+        # the capability token we get when registering our platforms and
+        # executables with the server
+        self.capabilityToken=None
+        self.registerCapabilities=True
         self.workloads=[]
         self.iteration=0
         self.acceptCommands = True
@@ -184,6 +208,16 @@ class Worker(object):
         """Get the list of workloads, assuming a locked runCondVar."""
         return self.workloads
 
+    def _getPendingUploads(self):
+        """Get the list of finished workloads with results that haven't 
+           been sent back yet."""
+        return self.uploader.getPending()
+
+    def _uploadDone(self, workload):
+        """Called by the uploader when a workload's results have been sent
+           back."""
+        self.heartbeat.delWorkloads([workload])
+
 
     def killWorkload(self, cmdID):
         """Kill a workload by command ID."""
@@ -206,13 +240,23 @@ class Worker(object):
     def run(self):
         """Ask for tasks until told to quit."""
         noWorkSeconds=0
+        pollTime=self.conf.getWorkerPollTime()
+        coalesceTime=self.conf.getResultCoalesceTime()
+        self.uploader.start()
         while not self.quit:
             # send a request for a command to run
             startWaitingTime=time.time()
+            gotWork=False
             with self.runCondVar:
                 acceptCommands=self.acceptCommands
             if acceptCommands:
-                resp=self._obtainCommands()
+                # only let the server hold the request until there is work 
+                # if we're idle: otherwise finished workloads would have to 
+                # wait for it.
+                if len(self.workloads) == 0:
+                    resp=self._obtainCommands(pollTime)
+                else:
+                    resp=self._obtainCommands()
                 # and extract the command and run directory
                 workloads=self._extractCommands(resp)
                 log.info("Got %d commands."%len(workloads))
@@ -226,6 +270,7 @@ class Worker(object):
                         raise WorkerError("Executable not found")
                     workload.reservePlatform()
                 if len(workloads)>0:
+                    gotWork=True
                     # We first prepare
                     self._prepareWorkloads(workloads)
                     # add the new workloads to our lists
@@ -241,41 +286,13 @@ class Worker(object):
                     if acceptCommands:
                         for workload in workloads:
                             workload.run(self.plugin, self.args)
-            # now wait until a workload finishes
-            finishedWorkloads = []
-            self.runCondVar.acquire()
-            continueWaiting=True
-            while continueWaiting:
-                haveFinishedWorkloads=False
-                for workload in self.workloads:
-                    if not workload.running:
-                        haveFinishedWorkloads=True
-                        break
-                if self.acceptCommands and not haveFinishedWorkloads:
-                    haveRemainingResources=self._haveRemainingResources()
-                    if haveRemainingResources:
-                        log.info("Have free resources. Waiting 30 seconds")
-                        self.runCondVar.wait(30)
-                        continueWaiting=False
-                    else:
-                        # we can't ask for new jobs, so we wait indefinitely
-                        self.runCondVar.wait()
-                else:
-                    continueWaiting=False
-                # now sleep one second to make sure that jobs stopping around
-                # the same time are reported back at once.
-                time.sleep(1)
-                # loop over all workloads
-                for workload in self.workloads:
-                    if not workload.running:
-                        finishedWorkloads.append(workload)
-                        log.info("Command id %s finished"%workload.cmd.id)
-                        continueWaiting=False
-                    #else:
-                    #    log.debug("Command %s still running"%workload.cmd.id)
-                #log.debug("End of waiting loop")
-            #log.debug("Out of waiting loop")
-            self.runCondVar.release()
+            # now wait until a workload finishes, or until we should ask for
+            # new work.
+            finishedWorkloads = self._waitForWorkloads(startWaitingTime,
+                                                       gotWork, pollTime,
+                                                       coalesceTime)
+            for workload in finishedWorkloads:
+                log.info("Command id %s finished"%workload.cmd.id)
             stopWaitingTime=time.time()
             # check whether there was work to do. If not, start counting
             # the amount of time we waited.
@@ -288,21 +305,75 @@ class Worker(object):
                         self.acceptCommands=False
             else:
                 noWorkSeconds = 0
-            # now deal with finished workloads.
+            # now deal with finished workloads. Their results are sent back
+            # in the background, and their heartbeats continue until then.
             for workload in finishedWorkloads:
                 workload.finish(self.plugin, self.args)
-                workload.returnResults()
                 workload.releasePlatform()
             if len(finishedWorkloads)>0:
-                self.heartbeat.delWorkloads(finishedWorkloads)
+                # they must be pending before submit() can block on a full
+                # upload queue, or the heartbeat would lose them.
+                with self.runCondVar:
+                    for workload in finishedWorkloads:
+                        self.uploader.addPending(workload)
+                        self.workloads.remove(workload)
                 for workload in finishedWorkloads:
-                    self.workloads.remove(workload)
+                    self.uploader.submit(workload)
             with self.runCondVar:
                 acceptCommands=self.acceptCommands
             if not acceptCommands and len(self.workloads)==0:
                 self.quit = True
+        # wait for all results to be sent back
+        self.uploader.stop()
         self.heartbeat.stop()
-
+        KeepAliveConnectionPool().closeAll()
+
+
+    def _waitForWorkloads(self, requestTime, gotWork, pollTime,
+                          coalesceTime):
+        """Wait until workloads finish, or until new work should be requested.
+           requestTime = the time at which the last request for work was sent
+           gotWork = whether that request returned work
+           pollTime = the maximum time between requests for work if there
+                      are free resources
+           coalesceTime = the time to wait after a workload finishes, for 
+                          other workloads to finish so their results can be
+                          returned together.
+           returns: the list of finished workloads."""
+        firstFinishTime=None
+        with self.runCondVar:
+            while True:
+                now=time.time()
+                finishedWorkloads=[ workload for workload in self.workloads 
+                                    if not workload.running ]
+                if len(finishedWorkloads) > 0:
+                    if firstFinishTime is None:
+                        firstFinishTime=now
+                    timeLeft=firstFinishTime+coalesceTime-now
+                    if ( timeLeft <= 0 or 
+                         len(finishedWorkloads) == len(self.workloads) ):
+                        return finishedWorkloads
+                    # give workloads that finish around the same time the
+                    # chance to be reported back at once.
+                    self.runCondVar.wait(timeLeft)
+                elif self.acceptCommands and self._haveRemainingResources():
+                    if gotWork:
+                        # there may be more: ask right away.
+                        return finishedWorkloads
+                    # the server can hold our request until there is work, 
+                    # so this only waits if it didn't.
+                    timeLeft=requestTime+pollTime-now
+                    if timeLeft <= 0:
+                        return finishedWorkloads
+                    log.debug("Have free resources. Waiting %.1f seconds"%
+                              timeLeft)
+                    self.runCondVar.wait(timeLeft)
+                elif not self.acceptCommands and len(self.workloads) == 0:
+                    return finishedWorkloads
+                else:
+                    # we can't ask for new jobs, so we wait until a workload
+                    # finishes.
+                    self.runCondVar.wait()
 
     def cleanup(self):
         shutil.rmtree(self.mainDir)
@@ -343,20 +414,26 @@ class Worker(object):
         """Get a list of executables as an ExecutableList object."""
         execdirs=self.conf.getExecutablesPath()
         self.exelist=cpc.command.ExecutableList()
+        # the results of executable plugins are cached between worker runs
+        cache=None
+        if self.conf.getExecutableCacheFile() != "":
+            cache=ExecutableCache(self.conf.getExecutableCacheFile(),
+                                  self.opts.get('rescan', False))
         for execdir in execdirs:
-            self.exelist.readDir(execdir, self.platforms)
+            self.exelist.readDir(execdir, self.platforms, cache)
+        if cache is not None:
+            cache.save()
         self.exelist.genIDs()
 
         log.debug("Found %d executables."%(len(self.exelist.executables)))
 
-    def _obtainCommands(self):
-        """Obtain a command from the up-most server given a list of
-           platforms and exelist. Returns the client response object."""
-        # Send a run request with our arch+binaries
+    def _getCapabilityXML(self, platforms):
+        """Get the XML description of a list of platforms with the
+           executables and the worker requirements."""
         req=u'<?xml version="1.0"?>\n'
         req+=u'<worker-request>\n'
         req+=u'<worker-arch-capabilities>\n'
-        for platform in self.remainingPlatforms:
+        for platform in platforms:
             req+=platform.printXML()
         req+='\n'
         req+=self.exelist.printPartialXML()
@@ -367,9 +444,72 @@ class Worker(object):
             req+=u'  <option key="project" value="%s"/>\n'%self.opts['project']
         req+=u'</worker-requirements>\n'
         req+=u'</worker-request>\n'
-        log.debug('request string is: %s'%req)
+        return req
+
+    def _getFreeResources(self):
+        """Get the free resources as a dict of platform name->dict of
+           resource name->value."""
+        ret=dict()
+        for platform in self.remainingPlatforms:
+            ret[platform.getName()]=dict( (rsrc.name, rsrc.value) for rsrc in
+                                   platform.getMaxResources().itervalues() )
+        return ret
+
+    def _register(self):
+        """Register our platforms and executables with the server, and get
+           the capability token for worker requests. Servers that don't
+           support registration get the full description with every
+           request."""
+        req=self._getCapabilityXML(self.platforms)
+        log.debug('registration string is: %s'%req)
+        clnt=WorkerMessage()
+        try:
+            presp=ProcessedResponse(clnt.workerRegisterRequest(self.id, req))
+        except ResponseError:
+            presp=None
+        if presp is None or presp.getStatus() != "OK":
+            log.info("Server doesn't support worker registration")
+            self.registerCapabilities=False
+            return
+        self.capabilityToken=presp.getData()['token']
+        log.debug("Got capability token %s"%self.capabilityToken)
+
+    def _obtainCommands(self, maxWait=None):
+        """Obtain a command from the up-most server given a list of
+           platforms and exelist. Returns the client response object.
+           maxWait = the time in seconds the server may wait for commands 
+                     to come in, if there are none."""
+        inputBlobs=None
+        if self.inputCache is not None:
+            inputBlobs=self.inputCache.getHashes()
         runreq_clnt=WorkerMessage()
-        resp=runreq_clnt.workerRequest(self.id,req)
+        if self.registerCapabilities and self.capabilityToken is None:
+            self._register()
+        if self.capabilityToken is not None:
+            # send only our capability token and free resources
+            resp=runreq_clnt.workerRequest(self.id, None, maxWait, inputBlobs,
+                                           self.capabilityToken,
+                                           self._getFreeResources())
+            if resp.getType() != "text/json":
+                return resp
+            presp=ProcessedResponse(resp)
+            data=presp.getData()
+            if (presp.getStatus() == "OK" or not isinstance(data, dict) or
+                not data.get('register')):
+                return resp
+            # the server doesn't know our token (anymore): register again
+            log.debug("Capability token unknown to server")
+            self.capabilityToken=None
+            self._register()
+            if self.capabilityToken is not None:
+                return runreq_clnt.workerRequest(self.id, None, maxWait,
+                                                 inputBlobs,
+                                                 self.capabilityToken,
+                                                 self._getFreeResources())
+        # Send a run request with our arch+binaries
+        req=self._getCapabilityXML(self.remainingPlatforms)
+        log.debug('request string is: %s'%req)
+        resp=runreq_clnt.workerRequest(self.id, req, maxWait, inputBlobs)
         #print "Got %s"%(resp.read(len(resp)))
         return resp
 
@@ -394,6 +534,8 @@ class Worker(object):
             log.debug("run directory: %s"%rundir)
             #os.mkdir(rundir)
             cpc.util.file.extractSafely(rundir, fileobj=resp.getRawData())
+            if self.inputCache is not None:
+                self.inputCache.unpack(rundir)
             # get the commands.
             i=0
             for subdir in os.listdir(rundir):
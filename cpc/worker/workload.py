@@ -86,6 +86,7 @@ class WorkLoad(object):
         # the following data should be protected by a lock, given by the worker:
         self.joinedTo=[] # the workloads that this workload joins
         self.running=False
+        self.uploadPending=False # whether the results are still to be sent
         self.failed=False # whether the run caused an exception
         self.realTimeSpent=0
         self.args=None # the argument list for low level run
@@ -192,34 +193,50 @@ class WorkLoad(object):
         retstr=vars.expandStr(initialArgStr)
         return retstr
 
+    def packResults(self):
+        """Pack the output files in the run directory into a gzipped tar file
+           and remove the run directory. The workload must have finished, so
+           no lock is held while packing.
+           returns: the temporary tar file object."""
+        log.debug("Packing run data for cmd id %s"%self.cmd.id)
+        tff=tempfile.TemporaryFile()
+        outputFiles=self.cmd.getOutputFiles()
+        tf=tarfile.open(fileobj=tff, mode="w:gz")
+        if outputFiles is None or len(outputFiles)==0:
+            tf.add(self.rundir, arcname=".", recursive=True)
+        else:
+            outputFiles.append('stdout')
+            outputFiles.append('stderr')
+            for name in outputFiles:
+                fname=os.path.join(self.rundir,name)
+                if os.path.exists(fname):
+                    tf.add(fname, arcname=name, recursive=False)
+        tf.close()
+        del(tf)
+        tff.seek(0)
+        shutil.rmtree(self.rundir, ignore_errors=True)
+        return tff
+
+    def sendResults(self, tff):
+        """Send packed results (as returned by packResults()) back to the
+           originating server."""
+        log.debug("Returning run data for cmd id %s"%self.cmd.id)
+        clnt= WorkerMessage()
+        # the cmddir, taskID and projectID together define a unique command.
+        clnt.commandFinishedRequest(self.cmd.id, self.originatingServer, 
+                                    self.returncode, self._getCputime(), 
+                                    tff)
+
     def returnResults(self):
-        with self.condVar:
-            log.debug("Returning run data for cmd id %s"%self.cmd.id)
-            tff=tempfile.TemporaryFile()
-            outputFiles=self.cmd.getOutputFiles()
-            tf=tarfile.open(fileobj=tff, mode="w:gz")
-            if outputFiles is None or len(outputFiles)==0:
-                tf.add(self.rundir, arcname=".", recursive=True)
-            else:
-                outputFiles.append('stdout')
-                outputFiles.append('stderr')
-                for name in outputFiles:
-                    fname=os.path.join(self.rundir,name)
-                    if os.path.exists(fname):
-                        tf.add(fname, arcname=name, recursive=False)
-            tf.close()
-            del(tf)
-            tff.seek(0)
-            shutil.rmtree(self.rundir, ignore_errors=True)
-            # and send it back 
-            clnt= WorkerMessage()
-            # the cmddir, taskID and projectID together define a unique command.
-            clnt.commandFinishedRequest(self.cmd.id, self.originatingServer, 
-                                        self.returncode, self._getCputime(), 
-                                        tff)
+        """Pack and send back the results of this workload and the workloads
+           joined to it."""
+        tff=self.packResults()
+        try:
+            self.sendResults(tff)
+        finally:
             tff.close()
-            for workload in self.joinedTo:
-                workload.returnResults()
+        for workload in self.joinedTo:
+            workload.returnResults()
 
     def run(self, plugin, pluginArgs):
         """Run the workload in a separate thread. Signal the condvar when
@@ -0,0 +1,66 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+"""Throughput of multipart message encoding and parsing for large command
+   results. Run as 'python -m test.benchmark.messaging_throughput [MB]'."""
+
+import sys
+import tempfile
+import time
+from cpc.network.com.input import Input
+from cpc.network.com.file_input import FileInput
+from cpc.network.http.messaging import Messaging
+from cpc.network.http.http_method_parser import HttpMethodParser
+
+
+def measure(size):
+    """Encode and parse a message with a file of size bytes.
+       returns: the time in seconds."""
+    block=''.join(chr(i%256) for i in range(1024*1024))
+    bigfile=tempfile.TemporaryFile()
+    try:
+        for i in range(size/len(block)):
+            bigfile.write(block)
+        fields=[ Input('cmd', 'command-finished') ]
+        files=[ FileInput('run_data', 'cmd.tar.gz', bigfile) ]
+        body=Messaging.encode_multipart_formdata(fields, files)
+        headers={ 'content-type' : 'multipart/form-data; boundary=%s'%
+                                   Messaging.BOUNDARY,
+                  'content-length' : str(len(body)) }
+        start=time.time()
+        req=HttpMethodParser.handleMultipart(headers, body)
+        elapsed=time.time()-start
+        outf=req.getFile('run_data')
+        outf.seek(0, 2)
+        if outf.tell() != size:
+            raise Exception("Parsed file has %d bytes instead of %d"%
+                            (outf.tell(), size))
+    finally:
+        bigfile.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    mb=256
+    if len(sys.argv) > 1:
+        mb=int(sys.argv[1])
+    elapsed=measure(mb*1024*1024)
+    print("multipart encode+decode of %d MB: %.2f s, %.1f MB/s"%
+          (mb, elapsed, mb/elapsed))
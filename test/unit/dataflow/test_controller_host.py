@@ -0,0 +1,168 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from cpc.dataflow.controller_host import ControllerPool, ControllerHostError
+from cpc.dataflow.controller_host import isPythonScript
+
+
+controllers={
+    'echo' : """#!/usr/bin/env python
+import os
+import sys
+inp=sys.stdin.read()
+sys.stdout.write("in %s: %s"%(os.getcwd(), inp))
+sys.stderr.write("finished\\n")
+""",
+    'exitcode' : """#!/usr/bin/env python
+import sys
+sys.stdout.write("exiting")
+sys.exit(3)
+""",
+    'error' : """#!/usr/bin/env python
+raise ValueError("controller error")
+""",
+    'state' : """#!/usr/bin/env python
+import sys
+import ctrlmod
+ctrlmod.runs.append(1)
+sys.stdout.write("%d %d"%(len(ctrlmod.runs), __name__ == "__main__"))
+""",
+    'ctrlmod.py' : """runs=[]
+""",
+    'shell' : """#!/bin/sh
+echo shell
+""",
+    'memory' : """#!/usr/bin/env python
+import sys
+data="x"*(64*1024*1024)
+sys.stdout.write("%d"%len(data))
+""",
+    'killhost' : """#!/usr/bin/env python
+import os
+import signal
+os.kill(os.getppid(), signal.SIGKILL)
+""",
+    'otherpython' : """#!/nonexistent/bin/python
+""",
+    'options' : """#!/usr/bin/env python -O
+""",
+}
+
+
+class TestControllerHost(unittest.TestCase):
+    def setUp(self):
+        self.libDir=tempfile.mkdtemp()
+        self.runDir=tempfile.mkdtemp()
+        for name, script in controllers.iteritems():
+            fname=os.path.join(self.libDir, name)
+            outf=open(fname, 'w')
+            # the controllers use the interpreter of the controller hosts
+            outf.write(script.replace("#!/usr/bin/env python\n", 
+                                      "#!%s\n"%sys.executable))
+            outf.close()
+            os.chmod(fname, 0755)
+        self.pool=ControllerPool([ "cpc.dataflow" ], 3, 32*1024)
+
+    def tearDown(self):
+        self.pool.stop()
+        shutil.rmtree(self.libDir)
+        shutil.rmtree(self.runDir)
+
+    def runHost(self, name, inputStr=""):
+        return self.pool.run(self.libDir, os.path.join(self.libDir, name),
+                             self.runDir, inputStr)
+
+    def runDirect(self, name, inputStr=""):
+        proc=subprocess.Popen([ os.path.join(self.libDir, name) ],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, cwd=self.runDir,
+                              close_fds=True)
+        retst=proc.communicate(inputStr)
+        return (proc.returncode, retst[0], retst[1])
+
+    def testIsPython(self):
+        self.assertTrue(isPythonScript(os.path.join(self.libDir, 'echo')))
+        self.assertFalse(isPythonScript(os.path.join(self.libDir, 'shell')))
+        # other interpreters can't run in the controller hosts
+        self.assertFalse(isPythonScript(os.path.join(self.libDir, 
+                                                     'otherpython')))
+        self.assertFalse(isPythonScript(os.path.join(self.libDir, 'options')))
+
+    def testSameAsDirect(self):
+        inputStr="<input>%s</input>"%("x"*100000)
+        self.assertEqual(self.runHost('echo', inputStr),
+                         self.runDirect('echo', inputStr))
+        self.assertEqual(self.runHost('exitcode'), self.runDirect('exitcode'))
+
+    def testError(self):
+        returncode, retstdout, retstderr=self.runHost('error')
+        self.assertEqual(returncode, 1)
+        self.assertTrue("controller error" in retstderr)
+
+    def testCleanState(self):
+        # every run starts with freshly imported modules
+        for i in range(3):
+            self.assertEqual(self.runHost('state'), (0, "1 1", ""))
+
+    def testRecycle(self):
+        self.runHost('echo')
+        host=self.pool.idle[self.libDir][0]
+        self.runHost('echo')
+        self.assertTrue(self.pool.idle[self.libDir][0] is host)
+        # the third run reaches the maximum number of runs
+        self.runHost('echo')
+        self.assertEqual(self.pool.idle[self.libDir], [])
+        self.assertNotEqual(host.proc.returncode, None)
+
+    def testRecycleMemory(self):
+        self.runHost('echo')
+        host=self.pool.idle[self.libDir][0]
+        self.assertTrue(host.getMemoryGrowth() < 32*1024)
+        # a run that uses more memory than allowed replaces the host
+        self.assertEqual(self.runHost('memory')[0], 0)
+        self.assertTrue(host.getMemoryGrowth() > 32*1024)
+        self.assertEqual(self.pool.idle[self.libDir], [])
+        self.assertNotEqual(host.proc.returncode, None)
+
+    def testNotDelivered(self):
+        self.runHost('echo')
+        host=self.pool.idle[self.libDir][0]
+        host.proc.kill()
+        host.proc.wait()
+        # the request can't be sent to the idle host: the controller should
+        # be run directly.
+        self.assertEqual(self.runHost('echo'), None)
+        self.assertEqual(self.pool.idle[self.libDir], [])
+
+    def testHostLost(self):
+        # the host exits after receiving the request: the controller must
+        # not be run again.
+        self.assertRaises(ControllerHostError, self.runHost, 'killhost')
+        self.assertEqual(self.runHost('exitcode'), self.runDirect('exitcode'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import tempfile
+import shutil
+import os
+import xml.etree.cElementTree as ET
+from cpc.dataflow.journal import StateJournal, replayJournal
+
+
+snapshot='''<?xml version="1.0"?>
+<cpc version="2" journal_seq="%d">
+  <network>
+    <instance id="a" function="fa" />
+    <active id="a" state="active" seqnr="1" cputime="0">
+      <inputs />
+      <network>
+        <instance id="b" function="fb" />
+        <active id="b" state="active" seqnr="1" cputime="0" />
+      </network>
+    </active>
+    <connection src="a:out.x" dest="self:ext_out.x" />
+  </network>
+</cpc>
+'''
+
+
+def activeRecord(name, seqnr, subnet=False):
+    if subnet:
+        return ('<active id="%s" state="active" seqnr="%d" cputime="0">'
+                '<network><instance id="b" function="fb" /></network>'
+                '</active>'%(name, seqnr))
+    return '<active id="%s" state="active" seqnr="%d" cputime="0" />'%(name,
+                                                                       seqnr)
+
+def findActive(elem, name):
+    for child in elem.findall('active'):
+        if child.get('id') == name:
+            return child
+    return None
+
+
+class TestStateJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.journalFile=os.path.join(self.dir, "_state.journal")
+        self.snapshotFile=os.path.join(self.dir, "_state.xml")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeSnapshot(self, journalSeq=0):
+        outf=open(self.snapshotFile, 'w')
+        outf.write(snapshot%journalSeq)
+        outf.close()
+
+    def testAppendRead(self):
+        jnl=StateJournal(self.journalFile)
+        jnl.append([ ('a', activeRecord('a', 2)) ])
+        jnl.append([ ('a:b', activeRecord('b', 3)), 
+                     ('c', activeRecord('c', 1)) ])
+        self.assertEqual(jnl.getSeq(), 3)
+        records=StateJournal(self.journalFile).read()
+        self.assertEqual([ (seq, name) for seq, name, xmlStr in records ],
+                         [ (1, 'a'), (2, 'a:b'), (3, 'c') ])
+        self.assertEqual(records[1][2], activeRecord('b', 3))
+        jnl.truncate()
+        self.assertEqual(jnl.read(), [])
+        self.assertEqual(jnl.getSize(), 0)
+
+    def testIncompleteRecord(self):
+        jnl=StateJournal(self.journalFile)
+        jnl.append([ ('a', activeRecord('a', 2)), ('c', activeRecord('c', 1))])
+        # simulate a crash halfway through writing the last record
+        size=os.path.getsize(self.journalFile)
+        outf=open(self.journalFile, 'r+b')
+        outf.truncate(size-10)
+        outf.close()
+        records=jnl.read()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][1], 'a')
+
+    def testReplay(self):
+        self.writeSnapshot(0)
+        jnl=StateJournal(self.journalFile)
+        jnl.append([ ('a', activeRecord('a', 5, subnet=True)),
+                     ('a:b', activeRecord('b', 7)),
+                     ('c', activeRecord('c', 1)) ])
+        stateXML, lastSeq=replayJournal(self.snapshotFile, jnl.read())
+        self.assertEqual(lastSeq, 3)
+        root=ET.fromstring(stateXML)
+        network=root.find('network')
+        a=findActive(network, 'a')
+        self.assertEqual(a.get('seqnr'), '5')
+        # the subnet's active instance is carried over and updated
+        b=findActive(a.find('network'), 'b')
+        self.assertEqual(b.get('seqnr'), '7')
+        # new instances go before the connections
+        tags=[ child.tag for child in network ]
+        self.assertEqual(tags, ['instance', 'active', 'active', 'connection'])
+        self.assertTrue(findActive(network, 'c') is not None)
+
+    def testReplaySkipsSnapshotRecords(self):
+        jnl=StateJournal(self.journalFile)
+        jnl.append([ ('a', activeRecord('a', 5)) ])
+        self.writeSnapshot(jnl.getSeq())
+        jnl.append([ ('c', activeRecord('c', 1)) ])
+        stateXML, lastSeq=replayJournal(self.snapshotFile, jnl.read())
+        self.assertEqual(lastSeq, 2)
+        network=ET.fromstring(stateXML).find('network')
+        self.assertEqual(findActive(network, 'a').get('seqnr'), '1')
+        self.assertTrue(findActive(network, 'c') is not None)
+
+    def testJournalWriteSize(self):
+        """Compare the size of the journal of a small number of changed 
+           instances with a full snapshot of a large project."""
+        ninstances=2000
+        nchanged=10
+        records=[ ('i%d'%i, activeRecord('i%d'%i, 1)*20) 
+                  for i in range(ninstances) ]
+        outf=open(self.snapshotFile, 'w')
+        outf.write('<cpc version="2">\n<network>\n')
+        for name, xmlStr in records:
+            outf.write(xmlStr)
+        outf.write('</network>\n</cpc>\n')
+        outf.flush()
+        os.fsync(outf.fileno())
+        outf.close()
+        jnl=StateJournal(self.journalFile)
+        jnl.append(records[:nchanged])
+        self.assertTrue(jnl.getSize() < os.path.getsize(self.snapshotFile))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+from cpc.dataflow.project_status import ProjectStatus
+from cpc.command.command import Command
+
+
+class FakeInstance(object):
+    def __init__(self, name, state="held"):
+        self.name=name
+        self.state=state
+    def getStatusStateStr(self):
+        return self.state
+    def getCanonicalName(self):
+        return self.name
+
+class FakeProject(object):
+    def __init__(self):
+        self.status=ProjectStatus()
+    def getStatus(self):
+        return self.status
+
+class FakeTask(object):
+    def __init__(self, project):
+        self.project=project
+    def getProject(self):
+        return self.project
+
+
+class TestProjectStatus(unittest.TestCase):
+    def setUp(self):
+        self.status=ProjectStatus()
+
+    def testStates(self):
+        ais=[ FakeInstance("inst%d"%i) for i in range(10) ]
+        for ai in ais:
+            self.status.updateInstance(ai)
+        self.assertEqual(self.status.getStateCounts(), { "held" : 10 })
+        for ai in ais[:6]:
+            ai.state="active"
+            self.status.updateInstance(ai)
+        ais[0].state="error"
+        ais[1].state="warning"
+        ais[2].state="error"
+        for ai in ais:
+            # repeated updates without a change shouldn't count
+            self.status.updateInstance(ai)
+            self.status.updateInstance(ai)
+        self.assertEqual(self.status.getStateCounts(), 
+                         { "held" : 4, "active" : 3, "error" : 2,
+                           "warning" : 1 })
+        self.assertEqual(self.status.getErrors(), [ "inst0", "inst2" ])
+        self.assertEqual(self.status.getWarnings(), [ "inst1" ])
+        ais[0].state="active"
+        self.status.updateInstance(ais[0])
+        self.assertEqual(self.status.getErrors(), [ "inst2" ])
+        self.assertEqual(self.status.getStateCounts()["active"], 4)
+
+    def testCommands(self):
+        project=FakeProject()
+        status=project.getStatus()
+        task=FakeTask(project)
+        cmds=[]
+        for i in range(10):
+            cmd=Command("dir", "mdrun", [])
+            cmd.setTask(task)
+            status.addCommand(cmd)
+            cmds.append(cmd)
+        self.assertEqual(status.getCommandCounts(), (10, 0))
+        for cmd in cmds[:4]:
+            cmd.setRunning(True, "server")
+        self.assertEqual(status.getCommandCounts(), (6, 4))
+        cmds[0].setRunning(False)
+        status.removeCommand(cmds[0])
+        status.removeCommand(cmds[1])
+        status.removeCommand(cmds[1])
+        self.assertEqual(status.getCommandCounts(), (6, 2))
+        queued, running=status.getCommands(0, 4)
+        self.assertEqual(queued, cmds[4:8])
+        self.assertEqual(running, cmds[2:4])
+        queued, running=status.getCommands(4, 4)
+        self.assertEqual(queued, cmds[8:10])
+        self.assertEqual(running, [])
+        queued, running=status.getCommands(0, None)
+        self.assertEqual(queued, cmds[4:10])
+        self.assertEqual(running, cmds[2:4])
+
+    def testClear(self):
+        project=FakeProject()
+        status=project.getStatus()
+        ais=[ FakeInstance("inst%d"%i, "error") for i in range(3) ]
+        for ai in ais:
+            status.updateInstance(ai)
+        cmd=Command("dir", "mdrun", [])
+        cmd.setTask(FakeTask(project))
+        status.addCommand(cmd)
+        # the project is deleted with its instances
+        status.clear()
+        self.assertEqual(status.instStates, dict())
+        self.assertEqual(status.getStateCounts(), dict())
+        self.assertEqual(status.getErrors(), [])
+        self.assertEqual(status.getCommandCounts(), (0, 0))
+        # late updates of the deleted instances aren't counted
+        ais[0].state="active"
+        status.updateInstance(ais[0])
+        status.addCommand(Command("dir", "mdrun", []))
+        self.assertEqual(status.instStates, dict())
+        self.assertEqual(status.getCommandCounts(), (0, 0))
@@ -0,0 +1,164 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from cpc.lib.gromacs.mdrun import extractData
+
+
+# A stand-in for the gmx binary: concatenates its -f inputs into the -o
+# output after a delay.
+FAKE_GMX="""#!/bin/sh
+if [ "$1" = "-version" ]; then exit 0; fi
+shift
+out=""
+files=""
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -f) ;;
+        -o) shift; out="$1" ;;
+        *) files="$files $1" ;;
+    esac
+    shift
+done
+sleep %(delay)s
+cat $files > "$out"
+"""
+
+class FakeOutput(object):
+    def __init__(self):
+        self.outputs=dict()
+        self.cmds=[]
+    def setOut(self, name, val):
+        self.outputs[name]=val.value
+
+
+class TestExtractData(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.persDir=os.path.join(self.dir, 'pers')
+        self.outDir=os.path.join(self.dir, 'out')
+        os.mkdir(self.persDir)
+        os.mkdir(self.outDir)
+        binDir=os.path.join(self.dir, 'bin')
+        os.mkdir(binDir)
+        self.delay=1
+        gmx=os.path.join(binDir, 'gmx')
+        outf=open(gmx, 'w')
+        outf.write(FAKE_GMX%{ 'delay' : self.delay })
+        outf.close()
+        os.chmod(gmx, 0755)
+        self.path=os.environ['PATH']
+        os.environ['PATH']="%s:%s"%(binDir, self.path)
+
+    def tearDown(self):
+        os.environ['PATH']=self.path
+        shutil.rmtree(self.dir)
+
+    def writeRun(self, i, files):
+        runDir=os.path.join(self.persDir, "run_%03d"%i)
+        if not os.path.exists(runDir):
+            os.mkdir(runDir)
+        for name, contents in files.iteritems():
+            outf=open(os.path.join(runDir, name), 'w')
+            outf.write(contents)
+            outf.close()
+        return runDir
+
+    def read(self, name):
+        inf=open(os.path.join(self.outDir, name), 'r')
+        ret=inf.read()
+        inf.close()
+        return ret
+
+    def testSegments(self):
+        for i in range(3):
+            self.writeRun(i, { 'traj.part%04d.xtc'%(i+1) : 'xtc%d'%i,
+                               'traj.part%04d.trr'%(i+1) : 'trr%d'%i,
+                               'ener.part%04d.edr'%(i+1) : 'edr%d'%i,
+                               'md.part%04d.log'%(i+1) : 'log%d\n'%i,
+                               'stdout' : 'out%d\n'%i,
+                               'stderr' : 'err%d\n'%i })
+        # an empty file and a file that replaces one of an earlier run
+        self.writeRun(2, { 'traj.part0004.xtc' : '' })
+        confout=self.writeRun(3, { 'traj.part0003.xtc' : 'xtc3',
+                                   'confout.part0004.gro' : 'conf' })
+        fo=FakeOutput()
+        start=time.time()
+        extractData([os.path.join(confout, 'confout.part0004.gro')],
+                    self.outDir, self.persDir, fo)
+        elapsed=time.time()-start
+        # the three concatenations run concurrently
+        self.assertTrue(elapsed < 2.5*self.delay)
+        self.assertEqual(self.read('traj.xtc'), 'xtc0xtc1xtc3')
+        self.assertEqual(self.read('traj.trr'), 'trr0trr1trr2')
+        self.assertEqual(self.read('ener.edr'), 'edr0edr1edr2')
+        self.assertEqual(self.read('md.log'), 'log0\nlog1\nlog2\n')
+        self.assertEqual(self.read('stderr'), 'err0\nerr1\nerr2\n')
+        self.assertTrue(self.read('stdout').startswith('out0\nout1\nout2\n'))
+        self.assertEqual(sorted(fo.outputs.keys()),
+                         [ 'conf', 'edr', 'log', 'stderr', 'stdout', 'trr',
+                           'xtc' ])
+
+    def testSingleSegment(self):
+        runDir=self.writeRun(0, { 'traj.part0001.xtc' : 'xtc',
+                                  'ener.part0001.edr' : 'edr',
+                                  'md.part0001.log' : 'log\n',
+                                  'stdout' : 'out\n',
+                                  'stderr' : 'err\n',
+                                  'confout.part0001.gro' : 'conf' })
+        fo=FakeOutput()
+        start=time.time()
+        extractData([os.path.join(runDir, 'confout.part0001.gro')],
+                    self.outDir, self.persDir, fo)
+        # nothing to concatenate, so the tools aren't run
+        self.assertTrue(time.time()-start < self.delay)
+        for outName, runName in [ ('traj.xtc', 'traj.part0001.xtc'),
+                                  ('ener.edr', 'ener.part0001.edr'),
+                                  ('md.log', 'md.part0001.log'),
+                                  ('stderr', 'stderr'),
+                                  ('confout.gro', 'confout.part0001.gro') ]:
+            self.assertTrue(os.path.samefile(os.path.join(self.outDir,
+                                                          outName),
+                                             os.path.join(runDir, runName)))
+        self.assertTrue('trr' not in fo.outputs)
+        # stdout gets a time stamp, so it is a copy
+        self.assertTrue(self.read('stdout').startswith('out\n'))
+        inf=open(os.path.join(runDir, 'stdout'), 'r')
+        self.assertEqual(inf.read(), 'out\n')
+        inf.close()
+
+    def testStartError(self):
+        for i in range(2):
+            self.writeRun(i, { 'traj.part%04d.xtc'%(i+1) : 'xtc%d'%i,
+                               'traj.part%04d.trr'%(i+1) : 'trr%d'%i,
+                               'ener.part%04d.edr'%(i+1) : 'edr%d'%i })
+        confout=self.writeRun(1, { 'confout.part0002.gro' : 'conf' })
+        # the output of the last tool can't be opened
+        os.mkdir(os.path.join(self.persDir, 'eneconv.out'))
+        fo=FakeOutput()
+        self.assertRaises(IOError, extractData,
+                          [ os.path.join(confout, 'confout.part0002.gro') ],
+                          self.outDir, self.persDir, fo)
+        # the tools that were started have finished
+        self.assertEqual(self.read('traj.xtc'), 'xtc0xtc1')
+        self.assertEqual(self.read('traj.trr'), 'trr0trr1')
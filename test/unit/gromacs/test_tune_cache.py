@@ -0,0 +1,99 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import os
+import shutil
+import tempfile
+from cpc.dataflow import Resources
+from cpc.lib.gromacs import tune
+
+
+class TestTuneCache(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.cacheDir=os.path.join(self.dir, 'tune_cache')
+        self.confFile=os.path.join(self.dir, 'conf.gro')
+        outf=open(self.confFile, 'w')
+        outf.write("test system\n5000\n   5.00000   5.00000   5.00000\n")
+        outf.close()
+        self.tprFile=os.path.join(self.dir, 'topol.tpr')
+        self.writeTpr("tpr contents")
+        self.tries=[]
+        self.version="VERSION 5.0"
+        self.orig=(tune.tryRun, tune.getMdrunVersion)
+        tune.tryRun=self.tryRun
+        tune.getMdrunVersion=lambda: self.version
+        # the cache is found the way a controller finds it
+        self.origCacheDir=os.environ.get('CPC_TUNE_CACHE_DIR')
+        os.environ['CPC_TUNE_CACHE_DIR']=self.cacheDir
+
+    def tearDown(self):
+        tune.tryRun, tune.getMdrunVersion=self.orig
+        if self.origCacheDir is None:
+            os.environ.pop('CPC_TUNE_CACHE_DIR', None)
+        else:
+            os.environ['CPC_TUNE_CACHE_DIR']=self.origCacheDir
+        shutil.rmtree(self.dir)
+
+    def writeTpr(self, contents):
+        outf=open(self.tprFile, 'w')
+        outf.write(contents)
+        outf.close()
+
+    def tryRun(self, tprFile, runDir, Ncores):
+        self.tries.append(Ncores)
+        return (Ncores <= 8, "")
+
+    def tune(self, Nmax=None):
+        rsrc=Resources()
+        tune.tune(rsrc, self.confFile, self.tprFile, self.dir, Nmax)
+        return rsrc.max.get('cores')
+
+    def testCacheHit(self):
+        self.assertEqual(self.tune(), 8)
+        self.assertTrue(len(self.tries) > 1)
+        self.tries=[]
+        self.assertEqual(self.tune(), 8)
+        self.assertEqual(self.tries, [])
+
+    def testDifferentTpr(self):
+        self.tune()
+        self.tries=[]
+        self.writeTpr("other tpr contents")
+        self.assertEqual(self.tune(), 8)
+        self.assertTrue(len(self.tries) > 0)
+
+    def testDifferentNmax(self):
+        self.tune()
+        self.tries=[]
+        self.assertEqual(self.tune(4), 4)
+        self.assertEqual(self.tries, [4])
+
+    def testVersionChange(self):
+        self.tune()
+        self.tries=[]
+        self.version="VERSION 5.1"
+        self.assertEqual(self.tune(), 8)
+        self.assertTrue(len(self.tries) > 0)
+
+    def testNoCache(self):
+        del os.environ['CPC_TUNE_CACHE_DIR']
+        self.assertEqual(self.tune(), 8)
+        self.assertFalse(os.path.exists(self.cacheDir))
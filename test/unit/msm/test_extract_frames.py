@@ -0,0 +1,160 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+
+import unittest
+import imp
+import os
+import shutil
+import sys
+import tempfile
+
+
+# msmproject.py is loaded by itself: the cpc.lib.msm package imports its 
+# lh5 conversion sub-library, which isn't needed here.
+try:
+    msmproject=imp.load_source("msmproject", 
+                               os.path.join(os.path.dirname(__file__), 
+                                            "..", "..", "..", "cpc", "lib", 
+                                            "msm", "msmproject.py"))
+except ImportError as e:
+    msmproject=None
+    importError=str(e)
+else:
+    importError=None
+
+
+# a trjconv that writes the requested frames with -sep, as text files that 
+# name the trajectory, the frame number and the group. It logs its 
+# arguments and frame index file to the file named by its first argument.
+fakeTrjconv="""
+import os
+import sys
+logFile=sys.argv[1]
+args=sys.argv[2:]
+def arg(name):
+    return args[args.index(name)+1]
+group=sys.stdin.read().strip()
+lines=open(arg("-fr")).read().splitlines()
+logf=open(logFile, 'a')
+logf.write(" ".join(args)+"|"+",".join(lines)+"\\n")
+logf.close()
+base, ext=os.path.splitext(arg("-o"))
+for i, line in enumerate(lines[1:]):
+    outf=open(base+str(i)+ext, 'w')
+    outf.write("%s %d %s"%(arg("-f"), int(line)-1, group))
+    outf.close()
+"""
+
+
+class FakeInput(object):
+    def __init__(self, outputDir):
+        self.outputDir=outputDir
+    def getOutputDir(self):
+        return self.outputDir
+
+
+class FakeCmdNames(object):
+    def __init__(self, trjconv):
+        self.trjconv=trjconv
+
+
+@unittest.skipIf(msmproject is None, "can't import msmproject: %s"%importError)
+class TestExtractFrames(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.outDir=os.path.join(self.dir, "out")
+        os.mkdir(self.outDir)
+        self.logFile=os.path.join(self.dir, "trjconv.log")
+        trjconv=os.path.join(self.dir, "trjconv.py")
+        outf=open(trjconv, 'w')
+        outf.write(fakeTrjconv)
+        outf.close()
+        self.proj=msmproject.MSMProject.__new__(msmproject.MSMProject)
+        self.proj.inp=FakeInput(self.outDir)
+        self.proj.nprocs=1
+        self.proj.tprfile="topol.tpr"
+        self.proj.cmdnames=FakeCmdNames("%s %s %s"%(sys.executable, trjconv,
+                                                    self.logFile))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def readLog(self):
+        """Get the trjconv runs as a dict of trajectory->(arguments, 
+           index file lines)."""
+        runs=dict()
+        for line in open(self.logFile).read().splitlines():
+            args, frames=line.split("|")
+            args=args.split()
+            runs[args[args.index("-f")+1]]=(args, frames.split(","))
+        return runs
+
+    def outFile(self, name):
+        return os.path.join(self.dir, name)
+
+    def testNoRequests(self):
+        # no frames to extract: nothing is run and no files are written.
+        self.proj.extractFrames([], "System")
+        self.assertEqual(os.listdir(self.outDir), [])
+        self.assertFalse(os.path.exists(self.logFile))
+
+    def checkExtract(self, nprocs):
+        self.proj.nprocs=nprocs
+        requests=[ ("a.xtc", 7, self.outFile("a7.gro")),
+                   ("b.xtc", 0, self.outFile("b0.gro")),
+                   ("a.xtc", 2, self.outFile("a2.gro")),
+                   ("a.xtc", 7, self.outFile("a7_again.gro")),
+                   ("b.xtc", 11, self.outFile("b11.gro")) ]
+        self.proj.extractFrames(requests, "Protein", "index.ndx")
+        # one trjconv run per trajectory, with all its frames 
+        runs=self.readLog()
+        self.assertEqual(sorted(runs.keys()), ["a.xtc", "b.xtc"])
+        self.assertEqual(runs["a.xtc"][1], ["[ frames ]", "3", "8"])
+        self.assertEqual(runs["b.xtc"][1], ["[ frames ]", "1", "12"])
+        for args, frames in runs.itervalues():
+            self.assertTrue("-sep" in args)
+            self.assertEqual(args[args.index("-s")+1], "topol.tpr")
+            self.assertEqual(args[args.index("-n")+1], "index.ndx")
+        # the output files hold the requested frames
+        for trajname, frame_nr, outfn in requests:
+            self.assertEqual(open(outfn).read(), 
+                             "%s %d Protein"%(trajname, frame_nr))
+        # the temporary trjconv output is removed
+        self.assertEqual(os.listdir(self.outDir), [])
+
+    def testExtract(self):
+        self.checkExtract(1)
+
+    def testExtractParallel(self):
+        self.checkExtract(2)
+
+    def testMissingFrame(self):
+        # trjconv writes fewer frames than requested (e.g. a frame beyond
+        # the end of the trajectory).
+        self.proj.cmdnames=FakeCmdNames("true")
+        self.assertRaises(msmproject.FrameExtractionError,
+                          self.proj.extractFrames,
+                          [ ("a.xtc", 1, self.outFile("a1.gro")) ], "System")
+        self.assertEqual(os.listdir(self.outDir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import BaseHTTPServer
+import SocketServer
+import httplib
+import socket
+import struct
+import tempfile
+import threading
+from cpc.network.com import client_connection
+from cpc.network.com.client_base import ClientBase, ClientConnectionError
+from cpc.network.com.input import Input
+from cpc.network.com.file_input import FileInput
+from cpc.network.server_request import ServerRequest
+
+
+class PlainConnection(httplib.HTTPConnection):
+    """Stands in for HttpsConnectionWithCertReq, without SSL."""
+    def __init__(self, host, port, privateKeyFile=None, caFile=None,
+                 certFile=None):
+        httplib.HTTPConnection.__init__(self, host, int(port))
+        self.auto_open = False
+
+
+class FakeConf(object):
+    def getPrivateKey(self):
+        return "key"
+    def getCaChainFile(self):
+        return "ca"
+    def getCertFile(self):
+        return "cert"
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version="HTTP/1.1"
+
+    def do_PUT(self):
+        body=self.rfile.read(int(self.headers['content-length']))
+        with self.server.lock:
+            self.server.bodies.append(body)
+            self.server.nrequests+=1
+            # simulate the server timing out idle connections
+            close=(self.server.closeAfter is not None and
+                   self.server.nrequests%self.server.closeAfter == 0)
+        if "reset" in body:
+            # fail after the request was received: reset the connection
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                       struct.pack('ii', 1, 0))
+            self.connection.close()
+            self.close_connection=1
+            return
+        resp="OK %d"%len(body)
+        self.send_response(200)
+        self.send_header("content-length", len(resp))
+        if self.headers.get('connection', '').lower() == 'keep-alive':
+            self.send_header("Connection", "keep-alive")
+        else:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(resp)
+        if close:
+            # close without telling the client
+            self.close_connection=1
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads=True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.lock=threading.Lock()
+        self.bodies=[]
+        self.nrequests=0
+        self.nconnections=0
+        self.closeAfter=None
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.nconnections+=1
+        SocketServer.ThreadingMixIn.process_request(self, request,
+                                                    client_address)
+
+
+class TestClient(ClientBase):
+    def __init__(self, port, keepAlive):
+        ClientBase.__init__(self, '127.0.0.1', port, FakeConf())
+        self.keepAlive=keepAlive
+
+    def send(self, value, fileobj=None):
+        files=[]
+        if fileobj is not None:
+            files=[ FileInput('data', 'data.bin', fileobj) ]
+        return self.putRequest(ServerRequest.prepareRequest(
+                                    [ Input('cmd', value) ], files))
+
+
+class TestKeepAlive(unittest.TestCase):
+    def setUp(self):
+        self.orig=client_connection.HttpsConnectionWithCertReq
+        client_connection.HttpsConnectionWithCertReq=PlainConnection
+        self.server=Server()
+        self.port=self.server.server_address[1]
+        self.thread=threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon=True
+        self.thread.start()
+        client_connection.KeepAliveConnectionPool().closeAll()
+        client_connection.KeepAliveConnectionPool().setLimits(2, 60.)
+
+    def tearDown(self):
+        client_connection.KeepAliveConnectionPool().closeAll()
+        self.server.shutdown()
+        self.server.server_close()
+        client_connection.HttpsConnectionWithCertReq=self.orig
+
+    def testReuse(self):
+        for i in range(10):
+            resp=TestClient(self.port, True).send("request %d"%i)
+            self.assertTrue(resp.message.read(len(resp.message)).
+                            startswith("OK"))
+        self.assertEqual(self.server.nrequests, 10)
+        self.assertEqual(self.server.nconnections, 1)
+
+    def testNoKeepAlive(self):
+        for i in range(3):
+            TestClient(self.port, False).send("request %d"%i)
+        self.assertEqual(self.server.nconnections, 3)
+
+    def testReconnect(self):
+        # the server closes the connection after every second request,
+        # and the file contents must be sent again in full
+        self.server.closeAfter=2
+        for i in range(6):
+            inf=tempfile.TemporaryFile()
+            inf.write("file contents %d"%i)
+            inf.seek(0)
+            TestClient(self.port, True).send("request %d"%i, inf)
+            inf.close()
+        # the requests on closed connections never reached the server
+        self.assertEqual(self.server.nrequests, 6)
+        self.assertEqual(self.server.nconnections, 3)
+        # the resent requests were complete
+        for i in range(6):
+            self.assertTrue("file contents %d"%i in self.server.bodies[i])
+            self.assertTrue(self.server.bodies[i].endswith("--\r\n"))
+
+    def testNoResend(self):
+        # a request that fails after it was sent on a kept-alive connection
+        # isn't sent again: the server may have handled it.
+        TestClient(self.port, True).send("request")
+        client=TestClient(self.port, True)
+        self.assertRaises(ClientConnectionError, client.send, "reset")
+        self.assertEqual(self.server.nrequests, 2)
+        self.assertEqual(self.server.nconnections, 1)
+
+    def testConcurrent(self):
+        # concurrent requests each get a connection; only two are kept
+        errors=[]
+        def run():
+            try:
+                for i in range(5):
+                    TestClient(self.port, True).send("request")
+            except Exception as e:
+                errors.append(e)
+        threads=[ threading.Thread(target=run) for i in range(4) ]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.server.nrequests, 20)
+        pool=client_connection.KeepAliveConnectionPool()
+        self.assertTrue(len(pool.pool[('127.0.0.1', self.port)]) <= 2)
+
+    def testIdleTime(self):
+        client_connection.KeepAliveConnectionPool().setLimits(2, 0.)
+        for i in range(3):
+            TestClient(self.port, True).send("request %d"%i)
+        self.assertEqual(self.server.nconnections, 3)
+
+    def testConnectionError(self):
+        # a port nothing listens on
+        sock=socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port=sock.getsockname()[1]
+        sock.close()
+        client=TestClient(port, True)
+        self.assertRaises(ClientConnectionError, client.send, "request")
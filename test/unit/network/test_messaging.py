@@ -0,0 +1,137 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import unittest
+import tempfile
+from cStringIO import StringIO
+import cpc.network.http.http_method_parser
+from cpc.network.com.input import Input
+from cpc.network.com.file_input import FileInput
+from cpc.network.http.messaging import Messaging
+from cpc.network.http.http_method_parser import HttpMethodParser
+
+
+class TestMultipart(unittest.TestCase):
+    def setUp(self):
+        self.data=''.join(chr(i%256) for i in range(100000))
+        self.tmpfile=tempfile.TemporaryFile()
+        self.tmpfile.write(self.data)
+
+    def tearDown(self):
+        self.tmpfile.close()
+
+    def encode(self):
+        fields=[ Input('cmd', 'command-finished'), Input('cmd_id', u'12') ]
+        files=[ FileInput('run_data', 'cmd.tar.gz', self.tmpfile) ]
+        return Messaging.encode_multipart_formdata(fields, files)
+
+    def testLength(self):
+        body=self.encode()
+        self.assertEqual(len(body.read()), len(body))
+
+    def testBlockRead(self):
+        body=self.encode()
+        blocks=[]
+        while True:
+            block=body.read(8192)
+            if len(block) == 0:
+                break
+            self.assertTrue(len(block) <= 8192)
+            blocks.append(block)
+        self.assertEqual(len(''.join(blocks)), len(body))
+        self.assertTrue(self.data in ''.join(blocks))
+
+    def testParse(self):
+        body=self.encode()
+        headers={ 'Content-Type' : 'multipart/form-data; boundary=%s'%
+                                   Messaging.BOUNDARY }
+        req=HttpMethodParser.handleMultipart(headers,
+                                             StringIO(body.read()))
+        self.assertEqual(req.getParam('cmd'), 'command-finished')
+        self.assertEqual(req.getParam('cmd_id'), '12')
+        self.assertEqual(req.getFile('run_data').read(), self.data)
+
+    def parseStream(self, stream, length):
+        headers={ 'content-type' : 'multipart/form-data; boundary=%s'%
+                                   Messaging.BOUNDARY,
+                  'content-length' : str(length) }
+        return HttpMethodParser.handleMultipart(headers, stream)
+
+    def testParseStream(self):
+        body=self.encode()
+        # the next request on a keep-alive connection must not be read
+        stream=StringIO(body.read()+"next request")
+        req=self.parseStream(stream, len(body))
+        self.assertEqual(req.getParam('cmd'), 'command-finished')
+        self.assertEqual(req.getFile('run_data').read(), self.data)
+        self.assertEqual(stream.read(), "next request")
+
+    def testSmallChunks(self):
+        # delimiters that span chunk boundaries
+        orig=cpc.network.http.http_method_parser.CHUNK_SIZE
+        cpc.network.http.http_method_parser.CHUNK_SIZE=7
+        try:
+            body=self.encode()
+            req=self.parseStream(StringIO(body.read()), len(body))
+            self.assertEqual(req.getParam('cmd_id'), '12')
+            self.assertEqual(req.getFile('run_data').read(), self.data)
+        finally:
+            cpc.network.http.http_method_parser.CHUNK_SIZE=orig
+
+    def testNoPartLength(self):
+        # as sent by browsers: no content lengths in the parts
+        data="line 1\r\n--not the boundary\r\n\r\n--"
+        msg="\r\n".join([ "--"+Messaging.BOUNDARY,
+                           'Content-Disposition: form-data; name="value"',
+                           '',
+                           'multi\r\nline',
+                           "--"+Messaging.BOUNDARY,
+                           'Content-Disposition: form-data; name="upload"; '
+                           'filename="a.txt"',
+                           'Content-Type: text/plain',
+                           '',
+                           data,
+                           "--"+Messaging.BOUNDARY+"--",
+                           '' ])
+        req=self.parseStream(StringIO(msg), len(msg))
+        self.assertEqual(req.getParam('value'), 'multi\r\nline')
+        self.assertEqual(req.getFile('upload').read(), data)
+
+    def testLargeFile(self):
+        # files of a few MB, and sizes around the parser's chunk size
+        chunk=cpc.network.http.http_method_parser.CHUNK_SIZE
+        block=''.join(chr(i%251) for i in range(1024*1024))
+        # a partial delimiter in the data, close to the chunk boundary
+        delim=block[:chunk-8]+"\r\n--"+Messaging.BOUNDARY[:20]+block
+        for data in [ block[:chunk-1], block[:chunk], block[:chunk+1],
+                      delim, block*3+block[:17] ]:
+            self.tmpfile.seek(0)
+            self.tmpfile.truncate()
+            self.tmpfile.write(data)
+            body=self.encode()
+            stream=StringIO(body.read()+"next request")
+            req=self.parseStream(stream, len(body))
+            self.assertEqual(req.getParam('cmd_id'), '12')
+            self.assertTrue(req.getFile('run_data').read() == data)
+            self.assertEqual(stream.read(), "next request")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+from cpc.network.node import Node, Nodes
+from cpc.network.cache import NetworkTopologyCache
+
+
+def makeTopology(links):
+    """Make a topology from a dict of node id -> list of neighbour ids."""
+    topology=Nodes()
+    nodes=dict()
+    for nodeId in links.iterkeys():
+        nodes[nodeId]=Node(nodeId, 13807, 14807, nodeId, nodeId)
+        topology.addNode(nodes[nodeId])
+    for nodeId, neighbours in links.iteritems():
+        neighbourNodes=Nodes()
+        for neighbourId in neighbours:
+            neighbourNodes.addNode(Node(neighbourId, 13807, 14807,
+                                        neighbourId, neighbourId))
+        nodes[nodeId].setNodes(neighbourNodes)
+    return topology
+
+
+# a - b - c - d, with a shortcut a - e - d and an unreachable f
+links={ 'a' : [ 'b', 'e' ],
+        'b' : [ 'a', 'c' ],
+        'c' : [ 'b', 'd' ],
+        'd' : [ 'c', 'e' ],
+        'e' : [ 'a', 'd' ],
+        'f' : [] }
+
+
+class TestRouting(unittest.TestCase):
+    def setUp(self):
+        NetworkTopologyCache().remove()
+
+    def tearDown(self):
+        NetworkTopologyCache().remove()
+
+    def testNextHops(self):
+        topology=makeTopology(links)
+        nextHops=Nodes.findNextHops('a', topology.getAdjacency())
+        self.assertEqual(nextHops, { 'b' : 'b', 'c' : 'b', 'd' : 'e',
+                                     'e' : 'e' })
+
+    def testFindRoute(self):
+        topology=makeTopology(links)
+        route=Nodes.findRoute(topology.get('a'), topology.get('c'), topology)
+        self.assertEqual([ node.getId() for node in route ], [ 'a', 'b', 'c' ])
+        self.assertEqual(Nodes.findRoute(topology.get('a'), topology.get('f'),
+                                         topology), [])
+        # the topology must be left intact
+        self.assertEqual(topology.size(), len(links))
+
+    def testCache(self):
+        cache=NetworkTopologyCache()
+        self.assertTrue(cache.getNextHop('a', 'd') is False)
+        cache.add(makeTopology(links))
+        self.assertEqual(cache.getNextHop('a', 'd').getId(), 'e')
+        self.assertEqual(cache.getNextHop('a', 'c').getId(), 'b')
+        self.assertTrue(cache.getNextHop('a', 'f') is None)
+        # an update with the same links keeps the routing table
+        entry=cache.getEntry()
+        cache.add(makeTopology(links))
+        self.assertEqual(cache.getEntry().nextHops, entry.nextHops)
+        self.assertEqual(cache.getNextHop('a', 'd').getId(), 'e')
+        # changing links invalidates it
+        newLinks=dict(links)
+        newLinks['a']=[ 'b' ]
+        cache.add(makeTopology(newLinks))
+        self.assertEqual(cache.getEntry().nextHops, {})
+        self.assertEqual(cache.getNextHop('a', 'd').getId(), 'b')
@@ -0,0 +1,194 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import os
+import random
+import time
+from cpc.command import Command
+from cpc.server.queue import CmdQueue, QueueError
+
+
+class FakeProject(object):
+    def __init__(self, name):
+        self.name=name
+    def getName(self):
+        return self.name
+
+class FakeTask(object):
+    def __init__(self, project, priority=0, functionName="test"):
+        self.project=project
+        self.priority=priority
+        self.functionName=functionName
+    def getProject(self):
+        return self.project
+    def getFunctionName(self):
+        return self.functionName
+
+def makeCommand(project, priority=0, executable="mdrun"):
+    cmd=Command(None, executable, [])
+    cmd.task=FakeTask(project, priority)
+    return cmd
+
+
+class TestCmdQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue=CmdQueue()
+        self.prj1=FakeProject("prj1")
+        self.prj2=FakeProject("prj2")
+
+    def testPriorityOrder(self):
+        low=makeCommand(self.prj1, -5)
+        high=makeCommand(self.prj1, 5)
+        mid1=makeCommand(self.prj1, 0)
+        mid2=makeCommand(self.prj1, 0)
+        for cmd in [ low, mid1, high, mid2 ]:
+            self.queue.add(cmd)
+        self.assertEquals(self.queue.getSize(), 4)
+        self.assertTrue(self.queue.get() is high)
+        self.assertTrue(self.queue.get() is mid1)
+        self.assertTrue(self.queue.get() is mid2)
+        self.assertTrue(self.queue.get() is low)
+        self.assertTrue(self.queue.get() is None)
+
+    def testRemoveExists(self):
+        cmds=[ makeCommand(self.prj1) for i in xrange(10) ]
+        for cmd in cmds:
+            self.queue.add(cmd)
+        self.assertTrue(self.queue.exists(cmds[3].id))
+        self.queue.remove(cmds[3])
+        self.assertFalse(self.queue.exists(cmds[3].id))
+        self.assertTrue(cmds[3].queue is None)
+        self.assertRaises(QueueError, self.queue.remove, cmds[3])
+        self.assertEquals(self.queue.getSize(), 9)
+        self.assertEquals(len(self.queue.listByExecutable("mdrun")), 9)
+
+    def testDeactivateActivate(self):
+        cmd1=makeCommand(self.prj1)
+        cmd2=makeCommand(self.prj1)
+        self.queue.add(cmd1)
+        self.queue.add(cmd2)
+        cmd1.deactivate()
+        self.assertTrue(self.queue.exists(cmd1.id))
+        self.assertEquals(self.queue.list(), [cmd2])
+        self.assertTrue(self.queue.get() is cmd2)
+        self.assertTrue(self.queue.get() is None)
+        cmd1.activate()
+        self.assertTrue(self.queue.get() is cmd1)
+        self.assertFalse(self.queue.exists(cmd1.id))
+
+    def testDeleteByProject(self):
+        for i in xrange(5):
+            self.queue.add(makeCommand(self.prj1))
+            self.queue.add(makeCommand(self.prj2))
+        inactive=makeCommand(self.prj1)
+        inactive.deactivate()
+        self.queue.add(inactive)
+        self.assertEquals(len(self.queue.listByProject(self.prj1)), 6)
+        self.assertEquals(self.queue.deleteByProject(self.prj1), 6)
+        self.assertEquals(self.queue.deleteByProject(self.prj1), 0)
+        self.assertFalse(self.queue.exists(inactive.id))
+        self.assertEquals(self.queue.getSize(), 5)
+        for cmd in self.queue.list():
+            self.assertTrue(cmd.task.project is self.prj2)
+
+    def testGetUntil(self):
+        cmds=[ makeCommand(self.prj1, i%3) for i in xrange(12) ]
+        for cmd in cmds:
+            self.queue.add(cmd)
+        cmds[0].deactivate()
+        def takeEven(parm, item):
+            parm.append(item)
+            return (len(parm) < 6, cmds.index(item)%2 == 0)
+        seen=[]
+        ret=self.queue.getUntil(takeEven, seen)
+        self.assertEquals(len(seen), 6)
+        self.assertEquals(ret, [ c for c in seen if cmds.index(c)%2 == 0 ])
+        for cmd in ret:
+            self.assertFalse(self.queue.exists(cmd.id))
+        self.assertEquals(self.queue.getSize(), 12-1-len(ret))
+
+
+@unittest.skipUnless(os.environ.get('CPC_BENCHMARKS'),
+                     "set CPC_BENCHMARKS to run benchmarks")
+class TestCmdQueueScaling(unittest.TestCase):
+    """Microbenchmark of the queue operations as a function of queue size.
+       Each operation should take (nearly) constant time per command."""
+    sizes=[ 1000, 10000, 100000 ]
+    nops=1000
+    # maximum allowed ratio of the time per operation on the largest and
+    # the smallest queue. A linear scan would give a ratio of ~100.
+    maxRatio=10.
+
+    def fillQueue(self, size):
+        queue=CmdQueue()
+        projects=[ FakeProject("prj%d"%i) for i in xrange(100) ]
+        cmds=[]
+        for i in xrange(size):
+            cmd=makeCommand(projects[i%len(projects)],
+                            random.randint(CmdQueue.PRIO_LOW_BOUND,
+                                           CmdQueue.PRIO_HIGH_BOUND),
+                            "exe%d"%(i%10))
+            queue.add(cmd)
+            cmds.append(cmd)
+        return queue, cmds
+
+    def timeOps(self, size):
+        queue, cmds=self.fillQueue(size)
+        sample=random.sample(cmds, self.nops)
+        times=dict()
+        t0=time.time()
+        for cmd in sample:
+            queue.exists(cmd.id)
+        times['exists']=time.time()-t0
+        t0=time.time()
+        for cmd in sample:
+            cmd.deactivate()
+        times['deactivate']=time.time()-t0
+        t0=time.time()
+        for cmd in sample:
+            cmd.activate()
+        times['activate']=time.time()-t0
+        t0=time.time()
+        for cmd in sample:
+            queue.remove(cmd)
+        times['remove']=time.time()-t0
+        # purge one project: its size scales with the queue, so normalize 
+        # by the number of commands removed.
+        prj=cmds[0].task.project
+        t0=time.time()
+        n=queue.deleteByProject(prj)
+        times['deleteByProject']=(time.time()-t0)*self.nops/max(n, 1)
+        return times
+
+    def testScaling(self):
+        results=[ (size, self.timeOps(size)) for size in self.sizes ]
+        smallest=results[0][1]
+        largest=results[-1][1]
+        for name, t in largest.iteritems():
+            # guard against timer resolution on very fast operations
+            ref=max(smallest[name], 1e-3)
+            self.assertTrue(t/ref < self.maxRatio,
+                            "%s does not scale: %g s vs. %g s"%
+                            (name, t, smallest[name]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+from cpc.util.conf.server_conf import ServerConf
+from cpc.server.queue import CmdQueue, TaskExecThreads
+from cpc.dataflow.task import TaskQueue
+from cpc.lib.gromacs import tune
+
+
+class FakeConf(object):
+    def __init__(self, tuneCacheDir):
+        self.tuneCacheDir=tuneCacheDir
+    def getServerCores(self):
+        return -1
+    def getTuneCacheDir(self):
+        return self.tuneCacheDir
+
+
+class FakeActiveInstance(object):
+    def __init__(self, name):
+        self.name=name
+
+
+class RecordingTask(object):
+    """A task that records when it runs."""
+    running=0
+    maxRunning=0
+    lock=threading.Lock()
+    log=[]
+
+    def __init__(self, activeInstance, seqNr, runTime):
+        self.activeInstance=activeInstance
+        self.seqNr=seqNr
+        self.runTime=runTime
+        self.queuedTime=None
+    def getFunctionName(self):
+        return "fn_%s"%self.activeInstance.name
+    def run(self):
+        cls=RecordingTask
+        with cls.lock:
+            cls.running+=1
+            cls.maxRunning=max(cls.maxRunning, cls.running)
+            cls.log.append((self.activeInstance, self.seqNr, "start"))
+        time.sleep(self.runTime)
+        with cls.lock:
+            cls.running-=1
+            cls.log.append((self.activeInstance, self.seqNr, "end"))
+        return (True, None, None)
+    def handleOutput(self):
+        pass
+
+
+class GatedTask(RecordingTask):
+    """A recording task that only runs once its gate is opened."""
+    def __init__(self, activeInstance, seqNr, gate):
+        RecordingTask.__init__(self, activeInstance, seqNr, 0.)
+        self.gate=gate
+    def run(self):
+        self.gate.wait()
+        return RecordingTask.run(self)
+
+
+class TestTaskExecThreads(unittest.TestCase):
+    def setUp(self):
+        self.confDir=tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.confDir, "server"))
+        open(os.path.join(self.confDir, "server", "server.conf"), "w").close()
+        ServerConf(confdir=self.confDir)
+        self.cmdQueue=CmdQueue()
+        self.taskQueue=TaskQueue(self.cmdQueue)
+        self.tuneCacheDir=os.path.join(self.confDir, "tune_cache")
+        self.execThreads=TaskExecThreads(FakeConf(self.tuneCacheDir), 4,
+                                         self.taskQueue, self.cmdQueue)
+        RecordingTask.running=0
+        RecordingTask.maxRunning=0
+        RecordingTask.log=[]
+
+    def tearDown(self):
+        self.execThreads.stop()
+        for th in self.execThreads.threads:
+            th.thread.join()
+        shutil.rmtree(self.confDir)
+
+    def waitIdle(self):
+        while not self.taskQueue.isIdle():
+            time.sleep(0.01)
+
+    def testInstanceOrder(self):
+        ais=[ FakeActiveInstance(str(i)) for i in range(3) ]
+        for seqNr in range(6):
+            for ai in ais:
+                self.taskQueue.put(RecordingTask(ai, seqNr, 0.02))
+        self.waitIdle()
+        # different instances run concurrently
+        self.assertTrue(RecordingTask.maxRunning > 1)
+        for ai in ais:
+            events=[ (seqNr, ev) for (a, seqNr, ev) in RecordingTask.log
+                     if a is ai ]
+            # tasks of one instance never overlap, and run in queue order
+            expected=[]
+            for seqNr in range(6):
+                expected.extend([ (seqNr, "start"), (seqNr, "end") ])
+            self.assertEqual(events, expected)
+
+    def testSlowInstance(self):
+        slow=FakeActiveInstance("slow")
+        self.taskQueue.put(RecordingTask(slow, 0, 0.5))
+        self.taskQueue.put(RecordingTask(slow, 1, 0.))
+        fast=[ FakeActiveInstance("fast%d"%i) for i in range(10) ]
+        for ai in fast:
+            self.taskQueue.put(RecordingTask(ai, 0, 0.))
+        self.waitIdle()
+        ends=[ a for (a, seqNr, ev) in RecordingTask.log if ev == "end" ]
+        # the slow controller doesn't hold up the other instances
+        self.assertEqual(set(ends[:len(fast)]), set(fast))
+        self.assertEqual(ends[-1], slow)
+
+    def testStats(self):
+        ai=FakeActiveInstance("a")
+        for seqNr in range(3):
+            self.taskQueue.put(RecordingTask(ai, seqNr, 0.05))
+        self.waitIdle()
+        stats=self.execThreads.getStats()["fn_a"]
+        self.assertEqual(stats['count'], 3)
+        self.assertTrue(stats['run_avg'] >= 0.04)
+        # the last task waited for the first two
+        self.assertTrue(stats['wait_max'] >= 0.09)
+
+    def testPause(self):
+        ai=FakeActiveInstance("a")
+        for seqNr in range(4):
+            self.taskQueue.put(RecordingTask(ai, seqNr, 0.02))
+        self.execThreads.acquire()
+        try:
+            self.execThreads.pause()
+            nlog=len(RecordingTask.log)
+            self.assertEqual(RecordingTask.running, 0)
+            time.sleep(0.05)
+            self.assertEqual(len(RecordingTask.log), nlog)
+            self.execThreads.cont()
+        finally:
+            self.execThreads.release()
+        self.waitIdle()
+        self.assertEqual(len(RecordingTask.log), 8)
+
+    def testPauseHandOff(self):
+        ai=FakeActiveInstance("a")
+        gate=threading.Event()
+        self.taskQueue.put(GatedTask(ai, 0, gate))
+        for seqNr in range(1, 4):
+            self.taskQueue.put(RecordingTask(ai, seqNr, 0.))
+        ordering=self.execThreads.ordering
+        # wait until the other threads have handed their tasks to the thread
+        # running the first one.
+        while len(ordering.running.get(ai, [])) < 3:
+            time.sleep(0.01)
+        self.execThreads.acquire()
+        try:
+            pauser=threading.Thread(target=self.execThreads.pause)
+            pauser.start()
+            # (paused threads hold their lock, so the flags are read 
+            # directly)
+            while not all([ th.pause for th in self.execThreads.threads ]):
+                time.sleep(0.01)
+            gate.set()
+            pauser.join()
+            # the handed-off tasks wait for the end of the pause
+            ends=[ seqNr for (a, seqNr, ev) in RecordingTask.log 
+                   if ev == "end" ]
+            self.assertEqual(ends, [0])
+            self.assertEqual(len(ordering.running[ai]), 3)
+            self.execThreads.cont()
+        finally:
+            self.execThreads.release()
+        self.waitIdle()
+        ends=[ seqNr for (a, seqNr, ev) in RecordingTask.log if ev == "end" ]
+        self.assertEqual(ends, [0, 1, 2, 3])
+
+    def testTuneCacheDir(self):
+        # controllers find the server's tune cache through the environment
+        self.assertEqual(os.environ['CPC_TUNE_CACHE_DIR'], self.tuneCacheDir)
+        self.assertEqual(tune.getTuneCache().cacheDir, self.tuneCacheDir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import os
+import random
+import time
+from cpc.command.platform_exec_reader import PlatformExecutableReader
+from cpc.command.worker_matcher import CommandWorkerMatcher
+from cpc.command.worker_matcher import matchCommandWorker, matchBucketWorker
+from cpc.command.version import Version
+from cpc.server.queue import CmdQueue
+from test.unit.queue.test_cmdqueue import FakeProject, makeCommand
+
+
+def workerDoc(executables, ncores=4):
+    """Construct a worker capability document with a single platform."""
+    req=u'<?xml version="1.0"?>\n'
+    req+=u'<worker-request>\n'
+    req+=u'<worker-arch-capabilities>\n'
+    req+=u'<platform name="smp" arch="">\n'
+    req+=u' <resources>\n'
+    req+=u'  <max>\n'
+    req+=u'   <resource name="cores" value="%d" />\n'%ncores
+    req+=u'  </max>\n'
+    req+=u'  <min>\n'
+    req+=u'  </min>\n'
+    req+=u'  <pref>\n'
+    req+=u'   <resource name="cores" value="1" />\n'
+    req+=u'  </pref>\n'
+    req+=u' </resources>\n'
+    req+=u'</platform>\n'
+    for i, (name, version) in enumerate(executables):
+        req+=(u'<executable name="%s" platform="smp" arch="" version="%s" '
+              u'id="%d" />\n'%(name, version, i))
+    req+=u'</worker-arch-capabilities>\n'
+    req+=u'<worker-requirements>\n'
+    req+=u'</worker-requirements>\n'
+    req+=u'</worker-request>\n'
+    return req
+
+def makeMatcher(doc):
+    rdr=PlatformExecutableReader()
+    rdr.readString(doc, "test worker")
+    return CommandWorkerMatcher(rdr.getPlatforms(), rdr.getExecutableList(),
+                                rdr.getWorkerRequirements())
+
+class CountingMatcher(object):
+    """Wrapper for matchCommandWorker that counts the visited commands."""
+    def __init__(self, matcher):
+        self.matcher=matcher
+        self.visited=0
+
+def countingMatchCommandWorker(cm, command):
+    cm.visited+=1
+    return matchCommandWorker(cm.matcher, command)
+
+def countingMatchBucketWorker(cm, bucket):
+    return matchBucketWorker(cm.matcher, bucket)
+
+
+class TestWorkerMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.queue=CmdQueue()
+        self.prj=FakeProject("prj")
+
+    def testOnlyMatchingBuckets(self):
+        for i in xrange(100):
+            self.queue.add(makeCommand(self.prj, 0, "grompp"))
+        mdrun=makeCommand(self.prj, -1, "mdrun")
+        self.queue.add(mdrun)
+        cm=CountingMatcher(makeMatcher(workerDoc([("mdrun", "4.5")])))
+        cmds=self.queue.getUntil(countingMatchCommandWorker, cm,
+                                 countingMatchBucketWorker)
+        self.assertEquals(cmds, [mdrun])
+        self.assertEquals(cm.visited, 1)
+        # a worker without any of the queued executables visits nothing
+        cm=CountingMatcher(makeMatcher(workerDoc([("g_bar", "4.5")])))
+        cmds=self.queue.getUntil(countingMatchCommandWorker, cm,
+                                 countingMatchBucketWorker)
+        self.assertEquals(cmds, [])
+        self.assertEquals(cm.visited, 0)
+
+    def testVersionRange(self):
+        cmd=makeCommand(self.prj, 0, "mdrun")
+        cmd.minVersion=Version("5")
+        self.queue.add(cmd)
+        matcher=makeMatcher(workerDoc([("mdrun", "4")]))
+        self.assertEquals(matcher.getWork(self.queue), [])
+        matcher=makeMatcher(workerDoc([("mdrun", "5")]))
+        self.assertEquals(matcher.getWork(self.queue), [cmd])
+        self.assertEquals(self.queue.getSize(), 0)
+
+    def testFifoAcrossBuckets(self):
+        cmds=[]
+        for i in xrange(8):
+            cmd=makeCommand(self.prj, 0, "mdrun")
+            if i%2 == 0:
+                cmd.maxVersion=Version("5")
+            cmds.append(cmd)
+            self.queue.add(cmd)
+        matcher=makeMatcher(workerDoc([("mdrun", "4")], ncores=4))
+        self.assertEquals(matcher.getWork(self.queue), cmds[:4])
+
+
+class TestWorkerMatcherScaling(unittest.TestCase):
+    """Worker-ready matching: many simulated workers with 
+       different executable lists request work from a large queue."""
+    nexecutables=20
+    nqueued=2000
+    nworkers=40
+
+    def fillQueue(self):
+        queue=CmdQueue()
+        projects=[ FakeProject("prj%d"%i) for i in xrange(10) ]
+        for i in xrange(self.nqueued):
+            queue.add(makeCommand(projects[i%len(projects)],
+                                  random.randint(-5, 5),
+                                  "exe%d"%(i%self.nexecutables)))
+        return queue
+
+    def workerDocs(self):
+        """Worker documents: most workers have a single executable, and 
+           one in four has an executable that no command needs."""
+        docs=[]
+        for i in xrange(self.nworkers):
+            if i%4 == 0:
+                exes=[ ("other", "1") ]
+            else:
+                exes=[ ("exe%d"%(i%self.nexecutables), "1") ]
+            docs.append(workerDoc(exes))
+        return docs
+
+    def runWorkers(self, useBuckets):
+        random.seed(1)
+        queue=self.fillQueue()
+        docs=self.workerDocs()
+        visited=0
+        matched=0
+        t0=time.time()
+        for doc in docs:
+            cm=CountingMatcher(makeMatcher(doc))
+            if useBuckets:
+                cmds=queue.getUntil(countingMatchCommandWorker, cm,
+                                    countingMatchBucketWorker)
+            else:
+                cmds=queue.getUntil(countingMatchCommandWorker, cm)
+            visited+=cm.visited
+            matched+=len(cmds)
+        return (time.time()-t0, visited, matched)
+
+    def testVisited(self):
+        tScan, visitedScan, matchedScan=self.runWorkers(False)
+        tBucket, visitedBucket, matchedBucket=self.runWorkers(True)
+        self.assertEquals(matchedScan, matchedBucket)
+        # every visited command is taken, except the one per worker that 
+        # doesn't fit anymore.
+        self.assertTrue(visitedBucket <= matchedBucket+self.nworkers)
+        self.assertTrue(visitedBucket < visitedScan)
+
+    @unittest.skipUnless(os.environ.get('CPC_BENCHMARKS'),
+                         "set CPC_BENCHMARKS to run benchmarks")
+    def testSpeed(self):
+        self.nqueued=10000
+        self.nworkers=200
+        tScan, visitedScan, matchedScan=self.runWorkers(False)
+        tBucket, visitedBucket, matchedBucket=self.runWorkers(True)
+        self.assertTrue(tBucket < tScan)
+
+
+if __name__ == "__main__":
+    unittest.main()
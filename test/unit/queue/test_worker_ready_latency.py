@@ -0,0 +1,177 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from cpc.util.conf.server_conf import ServerConf
+from cpc.server.queue import CmdQueue, TaskExecThread
+from cpc.dataflow.task import TaskQueue
+from test.unit.queue.test_cmdqueue import FakeProject, makeCommand
+from test.unit.queue.test_worker_matcher import makeMatcher, workerDoc
+
+# the time in seconds after which a test is considered stuck.
+timeout=10.
+
+
+class GatedTask(object):
+    """A dataflow task that only produces its commands once its gate is 
+       opened."""
+    def __init__(self, cmds):
+        self.cmds=cmds
+        self.gate=threading.Event()
+        self.activeInstance=None
+        self.queuedTime=None
+    def getFunctionName(self):
+        return "gated"
+    def run(self):
+        self.gate.wait(timeout)
+        return (False, self.cmds, None)
+
+
+class WaitCountingCmdQueue(CmdQueue):
+    """A command queue that counts and signals the waits for changes."""
+    def __init__(self):
+        CmdQueue.__init__(self)
+        self.nwaits=0
+        self.waiting=threading.Event()
+    def waitForChange(self, nchanges, timeout):
+        self.nwaits+=1
+        self.waiting.set()
+        return CmdQueue.waitForChange(self, nchanges, timeout)
+
+
+class TestWorkerReadyLatency(unittest.TestCase):
+    """Worker-ready requests: whether dispatching commands to a worker waits
+       for the dataflow in different dataflow states."""
+    def setUp(self):
+        self.confDir=tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.confDir, "server"))
+        open(os.path.join(self.confDir, "server", "server.conf"), "w").close()
+        ServerConf(confdir=self.confDir)
+        self.cmdQueue=WaitCountingCmdQueue()
+        self.taskQueue=TaskQueue(self.cmdQueue)
+        self.execThread=TaskExecThread(self.taskQueue, self.cmdQueue)
+        self.prj=FakeProject("prj")
+        self.tasks=[]
+
+    def tearDown(self):
+        for task in self.tasks:
+            task.gate.set()
+        self.execThread.doStop()
+        self.execThread.queueNone()
+        self.execThread.thread.join()
+        shutil.rmtree(self.confDir)
+
+    def putTask(self, cmds):
+        task=GatedTask(cmds)
+        self.tasks.append(task)
+        self.taskQueue.put(task)
+        return task
+
+    def onWait(self, fn, *args):
+        """Call fn(*args) from another thread once the worker request waits 
+           for a change."""
+        def waitAndCall():
+            if self.cmdQueue.waiting.wait(timeout):
+                fn(*args)
+        thread=threading.Thread(target=waitAndCall)
+        thread.start()
+        return thread
+
+    def dispatch(self, ncores=4, maxWait=timeout, longPoll=0):
+        matcher=makeMatcher(workerDoc([("mdrun", "4.5")], ncores))
+        return matcher.getWorkWait(self.cmdQueue, self.taskQueue, maxWait,
+                                   longPoll)
+
+    def testChangeCount(self):
+        nchanges=self.cmdQueue.getChangeCount()
+        self.cmdQueue.add(makeCommand(self.prj))
+        self.assertEquals(self.cmdQueue.getChangeCount(), nchanges+1)
+        # the count has already changed, so this doesn't wait.
+        self.assertEquals(self.cmdQueue.waitForChange(nchanges, timeout), 
+                          nchanges+1)
+        self.cmdQueue.signalChange()
+        self.assertEquals(self.cmdQueue.getChangeCount(), nchanges+2)
+
+    def testSignalChange(self):
+        nchanges=self.cmdQueue.getChangeCount()
+        woken=threading.Event()
+        result=[]
+        def waiter():
+            result.append(self.cmdQueue.waitForChange(nchanges, timeout))
+            woken.set()
+        self.onWait(self.cmdQueue.signalChange)
+        thread=threading.Thread(target=waiter)
+        thread.start()
+        self.assertTrue(woken.wait(timeout))
+        thread.join()
+        self.assertEquals(result, [nchanges+1])
+
+    def testIdleDataflow(self):
+        self.assertEquals(self.dispatch(), [])
+        self.cmdQueue.add(makeCommand(self.prj))
+        self.assertEquals(len(self.dispatch()), 1)
+        self.assertEquals(self.cmdQueue.nwaits, 0)
+
+    def testFilledQueue(self):
+        for i in xrange(8):
+            self.cmdQueue.add(makeCommand(self.prj))
+        self.putTask([])
+        self.assertEquals(len(self.dispatch()), 4)
+        self.assertEquals(self.cmdQueue.nwaits, 0)
+
+    def testNewCommands(self):
+        task=self.putTask([ makeCommand(self.prj) for i in xrange(4) ])
+        thread=self.onWait(task.gate.set)
+        self.assertEquals(len(self.dispatch()), 4)
+        thread.join()
+        self.assertTrue(self.cmdQueue.nwaits > 0)
+
+    def testNoNewCommands(self):
+        # the request stops waiting as soon as the dataflow becomes idle.
+        task=self.putTask([])
+        thread=self.onWait(task.gate.set)
+        self.assertEquals(self.dispatch(), [])
+        thread.join()
+        self.assertTrue(self.cmdQueue.nwaits > 0)
+        self.assertTrue(self.taskQueue.isIdle())
+
+    def testMaxWait(self):
+        self.putTask([])
+        self.assertEquals(self.dispatch(maxWait=0.01), [])
+        self.assertTrue(self.cmdQueue.nwaits > 0)
+
+    def testLongPoll(self):
+        thread=self.onWait(self.cmdQueue.add, makeCommand(self.prj))
+        self.assertEquals(len(self.dispatch(longPoll=timeout)), 1)
+        thread.join()
+        self.assertTrue(self.cmdQueue.nwaits > 0)
+        # without a long poll, an idle dataflow doesn't wait.
+        self.cmdQueue.nwaits=0
+        self.assertEquals(self.dispatch(), [])
+        self.assertEquals(self.cmdQueue.nwaits, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
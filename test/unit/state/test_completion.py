@@ -0,0 +1,240 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import time
+import threading
+import tempfile
+import tarfile
+import shutil
+import os
+from cStringIO import StringIO
+from cpc.server.state.heartbeat import RunningCmdList
+from cpc.server.state.completion import CompletionPipeline
+
+
+class FakeCmd(object):
+    def __init__(self, id, cmdDir):
+        self.id=id
+        self.dir=cmdDir
+        self.running=False
+        self.cputime=0
+        self.task=None
+    def getTask(self):
+        return self.task
+    def setRunning(self, running, server=None):
+        self.running=running
+    def getDir(self):
+        return self.dir
+    def addCputime(self, cputime):
+        self.cputime+=cputime
+
+
+class FakeCmdQueue(object):
+    def __init__(self):
+        self.cmds=[]
+    def add(self, cmd):
+        self.cmds.append(cmd)
+    def take(self, cmdID):
+        for cmd in self.cmds:
+            if cmd.id == cmdID:
+                self.cmds.remove(cmd)
+                return cmd
+        return None
+
+
+class FakeConf(object):
+    def getDeadCommandFetchThreads(self):
+        return 4
+
+
+class SlowCmdList(RunningCmdList):
+    """A running command list with slow task runs, which can be held up."""
+    def __init__(self, cmdQueue, delay=0.):
+        RunningCmdList.__init__(self, FakeConf(), cmdQueue, None)
+        self.delay=delay
+        self.finished=[]
+        self.go=threading.Event()
+        self.go.set()
+        self.finishedLock=threading.Lock()
+    def _handleFinishedCmd(self, cmd, returncode, cputime):
+        self.go.wait()
+        time.sleep(self.delay)
+        with self.finishedLock:
+            self.finished.append( (cmd, returncode) )
+
+
+class FakeTask(object):
+    def __init__(self, cmds):
+        self.cmds=cmds
+    def getCommands(self):
+        return self.cmds
+
+
+class FailingCmdList(SlowCmdList):
+    """A running command list whose task runs fail."""
+    def _handleFinishedCmd(self, cmd, returncode, cputime):
+        raise IOError("disk full")
+
+
+def makeRunData(contents):
+    """Make a tar.gz file object with a single file."""
+    tff=tempfile.TemporaryFile()
+    tf=tarfile.open(fileobj=tff, mode="w:gz")
+    info=tarfile.TarInfo("out.txt")
+    info.size=len(contents)
+    tf.addfile(info, StringIO(contents))
+    tf.close()
+    tff.seek(0)
+    return tff
+
+
+class TestCompletionPipeline(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.spoolDir=os.path.join(self.dir, "spool")
+        self.cmdQueue=FakeCmdQueue()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def makeCmds(self, rcl, n):
+        cmds=[]
+        for i in range(n):
+            cmdDir=os.path.join(self.dir, "cmd%d"%i)
+            os.mkdir(cmdDir)
+            cmd=FakeCmd("cmd%d"%i, cmdDir)
+            rcl.add([cmd], "server", 10)
+            cmds.append(cmd)
+        return cmds
+
+    def waitFinished(self, rcl, n, timeout=10.):
+        end=time.time()+timeout
+        while len(rcl.finished) < n and time.time() < end:
+            time.sleep(0.01)
+
+    def testAsync(self):
+        rcl=SlowCmdList(self.cmdQueue, delay=0.3)
+        pipeline=CompletionPipeline(rcl, self.spoolDir, 2, 16)
+        pipeline.start()
+        cmds=self.makeCmds(rcl, 4)
+        start=time.time()
+        for i, cmd in enumerate(cmds):
+            pipeline.receive(cmd.id, 0, 1., makeRunData("output %d"%i))
+        # receiving doesn't wait for the tasks to run
+        self.assertTrue(time.time()-start < 0.3)
+        self.assertTrue(pipeline.getStats()['queued'] > 0)
+        pipeline.stop()
+        self.assertEqual(len(rcl.finished), 4)
+        for i, cmd in enumerate(cmds):
+            self.assertFalse(cmd.running)
+            inf=open(os.path.join(cmd.getDir(), "out.txt"))
+            self.assertEqual(inf.read(), "output %d"%i)
+            inf.close()
+        # the spool is cleaned up
+        self.assertEqual(os.listdir(self.spoolDir), [])
+        stats=pipeline.getStats()
+        self.assertEqual(stats['handled'], 4)
+        self.assertTrue(stats['max_depth'] >= 2)
+
+    def testNoRunData(self):
+        rcl=SlowCmdList(self.cmdQueue)
+        pipeline=CompletionPipeline(rcl, self.spoolDir, 1, 16)
+        pipeline.start()
+        cmd=self.makeCmds(rcl, 1)[0]
+        pipeline.receive(cmd.id, None, 2., None)
+        # queued again right away
+        self.assertEqual(self.cmdQueue.cmds, [cmd])
+        self.assertEqual(cmd.cputime, 2.)
+        pipeline.stop()
+
+    def testHandleError(self):
+        rcl=FailingCmdList(self.cmdQueue)
+        pipeline=CompletionPipeline(rcl, self.spoolDir, 1, 16)
+        pipeline.start()
+        cmds=self.makeCmds(rcl, 2)
+        # the task of cmd1 has already handled it when the error happens
+        cmds[1].task=FakeTask([])
+        for i, cmd in enumerate(cmds):
+            pipeline.receive(cmd.id, 0, 1., makeRunData("output %d"%i))
+        pipeline.stop()
+        # the command that wasn't handled is queued again
+        self.assertEqual(self.cmdQueue.cmds, [ cmds[0] ])
+        # and the results are kept
+        self.assertEqual(sorted(os.listdir(self.spoolDir)), 
+                         [ "cmd0.json", "cmd0.tar.gz", 
+                           "cmd1.json", "cmd1.tar.gz" ])
+        stats=pipeline.getStats()
+        self.assertEqual(stats['handled'], 2)
+        self.assertEqual(stats['failed'], 2)
+
+    def testBackpressure(self):
+        rcl=SlowCmdList(self.cmdQueue)
+        rcl.go.clear()
+        pipeline=CompletionPipeline(rcl, self.spoolDir, 1, 1)
+        pipeline.start()
+        cmds=self.makeCmds(rcl, 3)
+        # one is being handled, one is queued
+        pipeline.receive(cmds[0].id, 0, 0, makeRunData("0"))
+        pipeline.receive(cmds[1].id, 0, 0, makeRunData("1"))
+        done=threading.Event()
+        def receiveLast():
+            pipeline.receive(cmds[2].id, 0, 0, makeRunData("2"))
+            done.set()
+        th=threading.Thread(target=receiveLast)
+        th.start()
+        # the queue is full
+        self.assertFalse(done.wait(0.3))
+        rcl.go.set()
+        self.assertTrue(done.wait(5.))
+        th.join()
+        pipeline.stop()
+        self.assertEqual([ cmd.id for cmd, rc in rcl.finished ],
+                         [ "cmd0", "cmd1", "cmd2" ])
+
+    def testRecover(self):
+        rcl=SlowCmdList(self.cmdQueue)
+        rcl.go.clear()
+        pipeline=CompletionPipeline(rcl, self.spoolDir, 1, 16)
+        pipeline.start()
+        cmds=self.makeCmds(rcl, 3)
+        for i, cmd in enumerate(cmds):
+            pipeline.receive(cmd.id, 3, 0, makeRunData("output %d"%i))
+        # the server stops with cmd0 in progress; the spooled results
+        # remain. After a restart, the projects queue the commands again.
+        self.assertEqual(len(os.listdir(self.spoolDir)), 6)
+        cmdQueue=FakeCmdQueue()
+        newCmds=[ FakeCmd(cmd.id, cmd.getDir()) for cmd in cmds ]
+        for cmd in newCmds:
+            cmd.running=True
+            cmdQueue.add(cmd)
+        cmdQueue.add(FakeCmd("other", self.dir))
+        newRcl=SlowCmdList(cmdQueue)
+        newPipeline=CompletionPipeline(newRcl, self.spoolDir, 1, 16)
+        newPipeline.start()
+        self.assertEqual(newPipeline.recover(cmdQueue), 3)
+        newPipeline.stop()
+        self.assertEqual([ cmd.id for cmd in cmdQueue.cmds ], [ "other" ])
+        self.assertEqual(sorted([ (cmd.id, rc) for cmd, rc in
+                                  newRcl.finished ]),
+                         [ ("cmd0", 3), ("cmd1", 3), ("cmd2", 3) ])
+        for cmd in newCmds:
+            self.assertFalse(cmd.running)
+        self.assertEqual(os.listdir(self.spoolDir), [])
+        rcl.go.set()
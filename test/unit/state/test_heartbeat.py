@@ -0,0 +1,228 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import time
+import threading
+import tempfile
+import tarfile
+import shutil
+import os
+from cStringIO import StringIO
+import cpc.util.file
+from cpc.command.heartbeat import HeartbeatItem
+from cpc.server.state.heartbeat import RunningCmdList, RunningCommand
+
+
+class FakeCmd(object):
+    def __init__(self, id):
+        self.id=id
+        self.running=False
+    def setRunning(self, running, server=None):
+        self.running=running
+
+
+class FakeCmdQueue(object):
+    """Collects the commands that are re-queued after heartbeat expiry."""
+    def __init__(self):
+        self.cmds=[]
+    def add(self, cmd):
+        self.cmds.append(cmd)
+
+
+class FakeConf(object):
+    def getDeadCommandFetchThreads(self):
+        return 4
+
+
+class RecoveringCmdList(RunningCmdList):
+    """A running command list that fakes fetching data from worker servers.
+       Data is available for commands with an even number."""
+    def __init__(self, cmdQueue):
+        RunningCmdList.__init__(self, FakeConf(), cmdQueue, None)
+        self.requests=[]
+        self.finished=[]
+        self.reqLock=threading.Lock()
+    def _fetchRemoteRunFiles(self, workerServer, rcs):
+        with self.reqLock:
+            self.requests.append( (workerServer, len(rcs)) )
+        time.sleep(0.05)
+        return set([ rc for rc in rcs if int(rc.cmd.id[3:])%2 == 0 ])
+    def _handleFinishedCmd(self, cmd, returncode, cputime):
+        with self.reqLock:
+            self.finished.append(cmd)
+
+
+class CountingRunningCommand(RunningCommand):
+    """A running command that counts how often its expiry is checked."""
+    nchecked=0
+    def getExpiryTime(self):
+        CountingRunningCommand.nchecked+=1
+        return RunningCommand.getExpiryTime(self)
+
+
+def makeList(nworkers, ncmds, interval=1):
+    """Make a running command list with ncmds commands spread over 
+       nworkers workers.
+       returns: a tuple of the list, the cmd queue and a list of heartbeat
+                items per worker."""
+    cmdQueue=FakeCmdQueue()
+    rcl=RunningCmdList(FakeConf(), cmdQueue, None)
+    items=[ [] for i in range(nworkers) ]
+    for i in range(ncmds):
+        cmd=FakeCmd("cmd%d"%i)
+        rcl.add([cmd], "server", interval)
+        items[i%nworkers].append(HeartbeatItem(cmd.id, "server", "/tmp"))
+    return (rcl, cmdQueue, items)
+
+def expire(rcl, seconds):
+    """Make all running commands seem to have been silent for seconds."""
+    for rc in rcl.runningCommands.itervalues():
+        rc.lastHeard-=seconds
+    rcl.expiryHeap=[ (expiryTime-seconds, cmdID, rc) for 
+                     (expiryTime, cmdID, rc) in rcl.expiryHeap ]
+
+
+class TestRunningCmdList(unittest.TestCase):
+    def testPing(self):
+        rcl, cmdQueue, items=makeList(2, 10)
+        faulty=[]
+        self.assertTrue(rcl.ping("w0", "/tmp", 1, items[0], True, faulty))
+        self.assertEqual(faulty, [])
+        for item in items[0]:
+            self.assertEqual(item.state, HeartbeatItem.stateOK)
+            rc=rcl.runningCommands[item.getCmdID()]
+            self.assertEqual(rc.getWorkerID(), "w0")
+            self.assertTrue(rc.getIsLocal())
+        # another worker claiming the same commands
+        self.assertFalse(rcl.ping("w1", "/tmp", 1, items[0][:2], True, 
+                                  faulty))
+        self.assertEqual(len(faulty), 2)
+        self.assertEqual(items[0][0].state, HeartbeatItem.stateWrongWorker)
+        unknown=HeartbeatItem("nonexistent", "server", "/tmp")
+        self.assertFalse(rcl.ping("w0", "/tmp", 1, [unknown], True, faulty))
+        self.assertEqual(unknown.state, HeartbeatItem.stateNotFound)
+
+    def testExpiry(self):
+        interval=10
+        rcl, cmdQueue, items=makeList(2, 10, interval)
+        firstExpiry=rcl.checkHeartbeatTimes(interval)
+        self.assertTrue(firstExpiry <= interval)
+        self.assertEqual(len(cmdQueue.cmds), 0)
+        expire(rcl, 3*interval)
+        # worker 0 is still alive
+        rcl.ping("w0", "/tmp", 1, items[0], False, [])
+        rcl.checkHeartbeatTimes(interval)
+        expired=set([ cmd.id for cmd in cmdQueue.cmds ])
+        self.assertEqual(expired, 
+                         set([ item.getCmdID() for item in items[1] ]))
+        self.assertEqual(len(rcl.runningCommands), len(items[0]))
+        # the surviving commands were rescheduled
+        self.assertEqual(len(rcl.expiryHeap), len(items[0]))
+
+    def testFinishedNotExpired(self):
+        rcl, cmdQueue, items=makeList(1, 4)
+        cmd=rcl.runningCommands["cmd0"].cmd
+        rcl.remove(cmd)
+        expire(rcl, 10)
+        rcl.checkHeartbeatTimes(1)
+        self.assertEqual(len(cmdQueue.cmds), 3)
+        self.assertFalse(cmd in cmdQueue.cmds)
+        self.assertEqual(len(rcl.expiryHeap), 0)
+
+
+    def testRecoveryPerServer(self):
+        nservers=8
+        cmdQueue=FakeCmdQueue()
+        rcl=RecoveringCmdList(cmdQueue)
+        for i in range(80):
+            rcl.add([FakeCmd("cmd%d"%i)], "server%d"%(i%nservers), 1)
+        expire(rcl, 10)
+        start=time.time()
+        rcl.checkHeartbeatTimes(1)
+        recoveryTime=time.time()-start
+        # a single request per worker server, handled concurrently
+        self.assertEqual(sorted(rcl.requests),
+                         [ ("server%d"%i, 10) for i in range(nservers) ])
+        self.assertTrue(recoveryTime < nservers*0.05)
+        self.assertEqual(len(rcl.finished), 40)
+        self.assertEqual(len(cmdQueue.cmds), 40)
+        for cmd in rcl.finished:
+            self.assertEqual(int(cmd.id[3:])%2, 0)
+
+
+class TestExtractMulti(unittest.TestCase):
+    def testExtract(self):
+        tmpdir=tempfile.mkdtemp()
+        try:
+            srcdirs=[]
+            for i in range(3):
+                srcdir=os.path.join(tmpdir, "src%d"%i)
+                os.makedirs(os.path.join(srcdir, "sub"))
+                outf=open(os.path.join(srcdir, "sub", "out.txt"), 'w')
+                outf.write("output %d"%i)
+                outf.close()
+                srcdirs.append(srcdir)
+            tff=StringIO()
+            tf=tarfile.open(fileobj=tff, mode="w:gz")
+            for i, srcdir in enumerate(srcdirs):
+                tf.add(srcdir, arcname=str(i), recursive=True)
+            tf.close()
+            destdirs={}
+            # directory 2 has no destination
+            for i in range(2):
+                destdirs[str(i)]=os.path.join(tmpdir, "dest%d"%i)
+                os.mkdir(destdirs[str(i)])
+            extracted=cpc.util.file.extractSafelyMulti(destdirs,
+                                                  StringIO(tff.getvalue()))
+            self.assertEqual(extracted, set(["0", "1"]))
+            for i in range(2):
+                inf=open(os.path.join(destdirs[str(i)], "sub", "out.txt"))
+                self.assertEqual(inf.read(), "output %d"%i)
+                inf.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestHeartbeatScaling(unittest.TestCase):
+    """N workers sending heartbeats for M running commands."""
+    def testHeartbeats(self):
+        nworkers=200
+        ncmds=20000
+        interval=120
+        rcl, cmdQueue, items=makeList(nworkers, ncmds, interval)
+        for rc in rcl.runningCommands.itervalues():
+            rc.__class__=CountingRunningCommand
+        CountingRunningCommand.nchecked=0
+        for i in range(nworkers):
+            rcl.ping("w%d"%i, "/tmp", 1, items[i], False, [])
+        for i in range(10):
+            rcl.checkHeartbeatTimes(interval)
+        # nothing has expired: the monitor doesn't touch any command
+        self.assertEqual(CountingRunningCommand.nchecked, 0)
+        # one worker dies
+        expire(rcl, 3*interval)
+        for i in range(1, nworkers):
+            rcl.ping("w%d"%i, "/tmp", 1, items[i], False, [])
+        rcl.checkHeartbeatTimes(interval)
+        self.assertEqual(len(cmdQueue.cmds), len(items[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
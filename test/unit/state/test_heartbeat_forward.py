@@ -0,0 +1,157 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import threading
+import time
+from cpc.server.state.heartbeat_forward import HeartbeatForwarder
+
+
+class FakeItem(object):
+    def __init__(self, cmdID):
+        self.cmdID=cmdID
+    def writeXML(self, outf):
+        outf.write('<heartbeat-item cmd_id="%s"/>'%self.cmdID)
+
+
+class FakeSender(object):
+    """Records the requests per destination server, and reports the
+       commands that are not known there as faulty."""
+    def __init__(self, known=None, delays=None):
+        self.known=known
+        self.delays=delays or dict()
+        self.requests=[]
+        self.lock=threading.Lock()
+    def __call__(self, dest, workerServer, heartbeats):
+        time.sleep(self.delays.get(dest, 0.))
+        with self.lock:
+            self.requests.append( (dest, sorted(hb.workerID
+                                                for hb in heartbeats)) )
+        faulty=dict()
+        for hb in heartbeats:
+            self.assertXML(hb.getItemsXML(workerServer), hb)
+            if self.known is not None:
+                bad=[ item.cmdID for item in hb.items
+                      if item.cmdID not in self.known ]
+                if len(bad) > 0:
+                    faulty[hb.workerID]=bad
+        return faulty
+    def assertXML(self, xml, hb):
+        assert xml.startswith('<heartbeat worker_id="%s"'%hb.workerID)
+    def getRequests(self, dest):
+        with self.lock:
+            return [ workers for d, workers in self.requests if d == dest ]
+
+
+class TestHeartbeatForwarder(unittest.TestCase):
+    def testBatching(self):
+        sender=FakeSender()
+        fwd=HeartbeatForwarder("self", 0.2, sender)
+        fwd.start()
+        for i in range(100):
+            for dest in [ "server1", "server2" ]:
+                fwd.add(dest, "worker%d"%i, "/tmp/worker%d"%i, "none",
+                        [ FakeItem("%s-cmd%d"%(dest, i)) ])
+        # a second heartbeat of the same worker replaces the first
+        fwd.add("server1", "worker0", "/tmp/worker0", "update",
+                [ FakeItem("server1-cmd0") ])
+        fwd.stop()
+        for dest in [ "server1", "server2" ]:
+            reqs=sender.getRequests(dest)
+            self.assertEqual(len(reqs), 1)
+            self.assertEqual(len(reqs[0]), 100)
+        self.assertEqual(fwd.getStats()['requests'], 2)
+
+    def testFaulty(self):
+        sender=FakeSender(known=set([ "cmd0" ]))
+        fwd=HeartbeatForwarder("self", 0.05, sender)
+        fwd.start()
+        fwd.add("server1", "worker0", "/tmp/w0", "none",
+                [ FakeItem("cmd0"), FakeItem("cmd1") ])
+        fwd.add("server1", "worker1", "/tmp/w1", "none", [ FakeItem("cmd0") ])
+        end=time.time()+5
+        while len(sender.getRequests("server1")) == 0 and time.time() < end:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        # the faulty items are returned once, with the next heartbeat
+        self.assertEqual(fwd.takeFaulty("worker0"), [ "cmd1" ])
+        self.assertEqual(fwd.takeFaulty("worker0"), [])
+        self.assertEqual(fwd.takeFaulty("worker1"), [])
+        fwd.stop()
+
+    def testSlowPeer(self):
+        sender=FakeSender(delays={ "slow" : 0.5 })
+        fwd=HeartbeatForwarder("self", 0.05, sender)
+        fwd.start()
+        fwd.add("slow", "worker0", "/tmp/w0", "none", [ FakeItem("cmd0") ])
+        time.sleep(0.1)
+        # heartbeats are accepted while the slow peer's request is in flight
+        t0=time.time()
+        fwd.add("slow", "worker1", "/tmp/w1", "none", [ FakeItem("cmd1") ])
+        fwd.add("fast", "worker1", "/tmp/w1", "none", [ FakeItem("cmd2") ])
+        self.assertTrue(time.time()-t0 < 0.05)
+        time.sleep(0.2)
+        # the fast peer isn't held up, and the slow one has a single request
+        # in flight
+        self.assertEqual(sender.getRequests("fast"), [ [ "worker1" ] ])
+        self.assertEqual(sender.getRequests("slow"), [])
+        fwd.stop()
+        self.assertEqual(sender.getRequests("slow"),
+                         [ [ "worker0" ], [ "worker1" ] ])
+
+    def testFailedPeer(self):
+        def failingSender(dest, workerServer, heartbeats):
+            raise IOError("connection refused")
+        fwd=HeartbeatForwarder("self", 0.01, failingSender, maxRetries=2)
+        fwd.start()
+        fwd.add("server1", "worker0", "/tmp/w0", "none", [ FakeItem("cmd0") ])
+        time.sleep(0.2)
+        fwd.stop()
+        self.assertEqual(fwd.takeFaulty("worker0"), [])
+        self.assertEqual(fwd.sending, set())
+        # the items are retried a limited number of times
+        stats=fwd.getStats()
+        self.assertEqual(stats['failed'], 3)
+        self.assertEqual(stats['retried'], 2)
+        self.assertEqual(fwd.pending.get("server1", {}), {})
+
+    def testRetry(self):
+        sent=dict()
+        failures=[ 1 ]
+        def flakySender(dest, workerServer, heartbeats):
+            if failures[0] > 0:
+                failures[0]-=1
+                # worker1 sends newer items while the request is in flight
+                fwd.add("server1", "worker1", "/tmp/w1", "update",
+                        [ FakeItem("cmd2") ])
+                raise IOError("connection refused")
+            for hb in heartbeats:
+                sent[hb.workerID]=[ item.cmdID for item in hb.items ]
+            return dict()
+        fwd=HeartbeatForwarder("self", 1000, flakySender)
+        fwd.add("server1", "worker0", "/tmp/w0", "none", [ FakeItem("cmd0") ])
+        fwd.add("server1", "worker1", "/tmp/w1", "none", [ FakeItem("cmd1") ])
+        for th in fwd.flush():
+            th.join()
+        for th in fwd.flush():
+            th.join()
+        # the failed items are sent again, unless newer ones replaced them
+        self.assertEqual(sent, { "worker0" : [ "cmd0" ],
+                                 "worker1" : [ "cmd2" ] })
+        self.assertEqual(fwd.getStats()['retried'], 1)
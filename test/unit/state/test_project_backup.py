@@ -0,0 +1,108 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import unittest
+import tempfile
+import shutil
+import os
+import tarfile
+from StringIO import StringIO
+from cpc.util.conf.server_conf import ServerConf
+# the server messages have to be imported before the server state
+import cpc.server.message
+from cpc.server.state.server_state import ServerState
+
+
+class FakeExecThreads(object):
+    def __init__(self):
+        self.paused=False
+        self.npauses=0
+    def acquire(self):
+        pass
+    def release(self):
+        pass
+    def pause(self):
+        self.paused=True
+        self.npauses+=1
+    def cont(self):
+        self.paused=False
+
+
+class TestProjectBackup(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.dir, "server"))
+        open(os.path.join(self.dir, "server", "server.conf"), 'w').close()
+        self.conf=ServerConf(confdir=self.dir)
+        self.conf.set("import_path", os.path.join(os.path.dirname(__file__),
+                                                  "..", "..", "..", "cpc",
+                                                  "lib"))
+        self.conf.set("run_dir", os.path.join(self.dir, "run"))
+        self.serverState=ServerState(self.conf)
+        self.serverState.taskExecThreads=FakeExecThreads()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testJournaledChange(self):
+        projectList=self.serverState.getProjectList()
+        projectList.add("p")
+        project=projectList.get("p")
+        project.importName("float")
+        project.addInstance("a", "float::add")
+        project.writeState()
+        out=StringIO()
+        project.scheduleSet("a:in.a", "1.5", out)
+        # the change only goes to the journal
+        self.serverState.writeChanges()
+        self.assertFalse(project.isDirty())
+        tff=self.serverState.saveProject("p")
+        self.assertFalse(self.serverState.taskExecThreads.paused)
+        # restore the backup as a new project
+        projectList.add("q")
+        tf=tarfile.open(fileobj=tff, mode="r")
+        tf.extractall(path=os.path.join(self.conf.getRunDir(), "q"))
+        tf.close()
+        self.serverState.readProjectState("q")
+        value=projectList.get("q").getNamedValue("a:in.a")
+        self.assertEqual(value.value, 1.5)
+
+    def testSnapshotPausesTasks(self):
+        projectList=self.serverState.getProjectList()
+        projectList.add("p")
+        project=projectList.get("p")
+        project.importName("float")
+        project.addInstance("a", "float::add")
+        # the structure changed: a snapshot is written with paused tasks.
+        self.serverState.writeChanges()
+        self.assertEqual(self.serverState.taskExecThreads.npauses, 1)
+        self.assertFalse(self.serverState.taskExecThreads.paused)
+        self.assertFalse(project.isDirty())
+        self.assertFalse(project.needsSnapshot())
+        out=StringIO()
+        project.scheduleSet("a:in.a", "1.5", out)
+        # journaled changes don't pause tasks.
+        self.serverState.writeChanges()
+        self.assertEqual(self.serverState.taskExecThreads.npauses, 1)
+        self.assertFalse(project.isDirty())
+
+
+if __name__ == "__main__":
+    unittest.main()
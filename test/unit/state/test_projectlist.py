@@ -0,0 +1,117 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import tempfile
+import shutil
+import os
+import threading
+import time
+from cpc.util.conf.server_conf import ServerConf
+from cpc.server.queue import CmdQueue
+from cpc.server.state.projectlist import ProjectList
+
+
+class FakeProject(object):
+    """A project that takes some time to save."""
+    running=0
+    maxRunning=0
+    lock=threading.Lock()
+
+    def __init__(self, name, dirty, saveTime=0.05, fail=False):
+        self.name=name
+        self.dirty=dirty
+        self.saveTime=saveTime
+        self.fail=fail
+        self.saved=0
+    def getName(self):
+        return self.name
+    def getBasedir(self):
+        return self.name
+    def isDirty(self):
+        return self.dirty
+    def getSaveStats(self):
+        return dict()
+    def writeState(self):
+        with FakeProject.lock:
+            FakeProject.running+=1
+            FakeProject.maxRunning=max(FakeProject.running,
+                                       FakeProject.maxRunning)
+        time.sleep(self.saveTime)
+        with FakeProject.lock:
+            FakeProject.running-=1
+        if self.fail:
+            raise IOError("disk full")
+        self.saved+=1
+        self.dirty=False
+    writeJournal=writeState
+
+
+class TestProjectListSave(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.dir, "server"))
+        open(os.path.join(self.dir, "server", "server.conf"), 'w').close()
+        self.conf=ServerConf(confdir=self.dir)
+        self.projectFile=os.path.join(self.dir, "projects.xml")
+        self.projectList=ProjectList(self.conf, CmdQueue())
+        FakeProject.running=0
+        FakeProject.maxRunning=0
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def addProjects(self, projects):
+        for proj in projects:
+            self.projectList.projects[proj.getName()]=proj
+
+    def testSkipClean(self):
+        projects=[ FakeProject("p%d"%i, i%2==0) for i in range(8) ]
+        self.addProjects(projects)
+        self.projectList.writeFullState(self.projectFile)
+        for i, proj in enumerate(projects):
+            self.assertEqual(proj.saved, 1 if i%2==0 else 0)
+        # nothing changed since: nothing is written
+        self.projectList.writeChanges(self.projectFile)
+        self.assertEqual(sum([ proj.saved for proj in projects ]), 4)
+        self.assertTrue(os.path.exists(self.projectFile))
+
+    def testConcurrentSave(self):
+        nthreads=self.conf.getStateSaveThreads()
+        projects=[ FakeProject("p%d"%i, True) for i in range(3*nthreads) ]
+        self.addProjects(projects)
+        start=time.time()
+        self.projectList.writeChanges(self.projectFile)
+        saveTime=time.time()-start
+        self.assertEqual(FakeProject.maxRunning, nthreads)
+        self.assertTrue(saveTime < len(projects)*projects[0].saveTime)
+        for proj in projects:
+            self.assertEqual(proj.saved, 1)
+
+    def testSaveError(self):
+        projects=[ FakeProject("p%d"%i, True, 0.01, i==0) for i in range(6) ]
+        self.addProjects(projects)
+        self.projectList.writeFullState(self.projectFile)
+        self.assertTrue(projects[0].dirty)
+        for proj in projects[1:]:
+            self.assertEqual(proj.saved, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import time
+from cpc.command.platform_exec_reader import PlatformExecutableReader
+from cpc.command.version import Version
+from cpc.server.queue import CmdQueue
+from cpc.server.state.worker_capabilities import WorkerCapabilityCache
+from test.unit.queue.test_cmdqueue import FakeProject, makeCommand
+from test.unit.queue.test_worker_matcher import workerDoc
+
+
+class TestWorkerCapabilityCache(unittest.TestCase):
+    def setUp(self):
+        self.cache=WorkerCapabilityCache(4)
+        self.queue=CmdQueue()
+        self.prj=FakeProject("prj")
+
+    def testRegister(self):
+        doc=workerDoc([("mdrun", "4.5"), ("grompp", "4.5")])
+        caps=self.cache.register(doc)
+        self.assertEquals(self.cache.get(caps.token), caps)
+        # the same capabilities give the same token and parsed objects
+        self.assertTrue(self.cache.register(doc) is caps)
+        self.assertNotEquals(self.cache.register(workerDoc([])).token,
+                             caps.token)
+        self.assertEquals(self.cache.get("unknown"), None)
+
+    def testEviction(self):
+        tokens=[ self.cache.register(workerDoc([("exe%d"%i, "1")])).token
+                 for i in xrange(4) ]
+        # keep the first one in use
+        self.cache.get(tokens[0])
+        self.cache.register(workerDoc([("exe4", "1")]))
+        self.assertNotEquals(self.cache.get(tokens[0]), None)
+        self.assertEquals(self.cache.get(tokens[1]), None)
+
+    def testFreeResources(self):
+        caps=self.cache.register(workerDoc([("mdrun", "4.5")], ncores=4))
+        cmds=[ makeCommand(self.prj, 0, "mdrun") for i in xrange(4) ]
+        for cmd in cmds:
+            self.queue.add(cmd)
+        # two cores in use
+        matcher=caps.getMatcher({ "smp" : { "cores" : 2 } })
+        self.assertEquals(matcher.getWork(self.queue), cmds[:2])
+        # the registered platforms are not changed
+        self.assertEquals(caps.platforms[0].getMaxResource("cores"), 4)
+        matcher=caps.getMatcher({ "smp" : { "cores" : 0 } })
+        self.assertEquals(matcher.getWork(self.queue), [])
+        matcher=caps.getMatcher()
+        self.assertEquals(matcher.getWork(self.queue), cmds[2:])
+
+    def testSharedLookups(self):
+        caps=self.cache.register(workerDoc([("mdrun", "4")]))
+        cmd=makeCommand(self.prj, 0, "mdrun")
+        cmd.minVersion=Version("5")
+        self.queue.add(cmd)
+        self.assertEquals(caps.getMatcher().getWork(self.queue), [])
+        self.assertEquals(len(caps.execIDs), 1)
+        self.assertEquals(caps.getMatcher().getWork(self.queue), [])
+        self.assertEquals(len(caps.execIDs), 1)
+
+    def testSpeed(self):
+        """Compare parsing the capabilities for every request with looking
+           them up by token."""
+        doc=workerDoc([ ("exe%d"%i, "1.%d"%i) for i in xrange(50) ])
+        n=500
+        t0=time.time()
+        for i in xrange(n):
+            rdr=PlatformExecutableReader()
+            rdr.readString(doc, "test worker")
+            rdr.getPlatforms()
+            rdr.getExecutableList()
+        tParse=time.time()-t0
+        token=self.cache.register(doc).token
+        t0=time.time()
+        for i in xrange(n):
+            self.cache.get(token).getMatcher({ "smp" : { "cores" : 2 } })
+        tToken=time.time()-t0
+        self.assertTrue(tToken < tParse)
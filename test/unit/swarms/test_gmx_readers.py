@@ -0,0 +1,228 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import numpy
+from cpc.lib.swarms import gmx_readers
+from cpc.lib.swarms import rwgro
+from cpc.lib.swarms import readxvg
+from cpc.lib.swarms import res_selection
+from cpc.lib.swarms import calc_dihedrals
+from cpc.lib.swarms import molecule
+
+
+# A GLIC-sized system: 5 chains of 5566 atoms (317 residues), in water.
+NCHAINS = 5
+CHAIN_ATOMS = 5566
+CHAIN_RES = 317
+NWATER = 60000
+
+# The original line-by-line readers, as reference.
+def ref_readgro_flat(grofn, atoms_ndx, nprot):
+    d = []
+    with open(grofn, 'r') as gro_f:
+        conf = gro_f.readlines()[2:][:-1]
+        apos = 0
+        for line in conf:
+            atomnr = int(line[15:20])
+            x = float(line[20:28])
+            y = float(line[28:36])
+            z = float(line[36:44])
+            if (atomnr in atoms_ndx) and apos < nprot:
+                d += [ x, y, z ]
+            apos += 1
+    return d
+
+def ref_readxvg_flat(xvg, rsel):
+    d = []
+    with open(xvg, 'r') as xvg_f:
+        for line in xvg_f:
+            if line[0] != '@' and line[0] != '#':
+                parts = line.split()
+                phipsi = [ float(parts[0]), float(parts[1]) ]
+                residue = int(parts[2].split('-')[1])
+                if residue in rsel:
+                    d += phipsi
+    return d
+
+def ref_dihedrals(conf, ndx):
+    conf = open(conf, 'r').readlines()[2:][:-1]
+    ndx = [ int(i) for i in open(ndx, 'r').readlines()[1].split() ]
+    p = {}
+    for line in conf:
+        p[int(line[15:20])] = calc_dihedrals.v3d([line[20:28], line[28:36],
+                                                  line[36:44]])
+    dihres = []
+    while len(ndx) != 0:
+        dihres.append(calc_dihedrals.calc_dihre(p[ndx[0]], p[ndx[1]],
+                                                p[ndx[2]], p[ndx[3]]))
+        ndx = ndx[4:]
+    return dihres
+
+
+def write_gro(fn, rnd):
+    with open(fn, 'w') as f:
+        f.write('GLIC-sized test system\n')
+        f.write('%5d\n' % (NCHAINS * CHAIN_ATOMS + 3 * NWATER))
+        n = 0
+        for ch in range(NCHAINS):
+            for i in range(CHAIN_ATOMS):
+                n += 1
+                resnr = 1 + (i * CHAIN_RES) // CHAIN_ATOMS
+                f.write('%5d%-5s%5s%5d%8.3f%8.3f%8.3f\n' %
+                        (resnr, 'ARG', 'CA', n % 100000,
+                         rnd.uniform(-9, 99), rnd.uniform(-9, 99),
+                         rnd.uniform(-9, 99)))
+        for i in range(NWATER):
+            for name in [ 'OW', 'HW1', 'HW2' ]:
+                n += 1
+                f.write('%5d%-5s%5s%5d%8.3f%8.3f%8.3f\n' %
+                        ((CHAIN_RES + 1 + i) % 100000, 'SOL', name,
+                         n % 100000, rnd.uniform(-9, 99),
+                         rnd.uniform(-9, 99), rnd.uniform(-9, 99)))
+        f.write('  12.00000  12.00000  12.00000\n')
+
+def write_xvg(fn, rnd):
+    with open(fn, 'w') as f:
+        f.write('# g_rama output\n@ title "Ramachandran Plot"\n')
+        for ch in range(NCHAINS):
+            for r in range(2, CHAIN_RES):
+                f.write('%12.5f  %12.5f  ARG-%d\n' %
+                        (rnd.uniform(-180, 180), rnd.uniform(-180, 180), r))
+
+
+class testGmxReaders(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rnd = random.Random(18)
+        self.gro = os.path.join(self.dir, 'conf.gro')
+        write_gro(self.gro, rnd)
+        self.xvg = os.path.join(self.dir, 'rama.xvg')
+        write_xvg(self.xvg, rnd)
+        self.ndx = sorted(rnd.sample(range(1, CHAIN_ATOMS + 1), 500))
+        self.ndxfn = os.path.join(self.dir, 'index.ndx')
+        with open(self.ndxfn, 'w') as f:
+            f.write('[ Selection ]\n')
+            for i in range(0, len(self.ndx), 15):
+                f.write('%s\n' % ' '.join([ str(a) for a in
+                                            self.ndx[i:i + 15] ]))
+        gmx_readers.clear_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        gmx_readers.clear_cache()
+
+    def testReadGro(self):
+        gro = gmx_readers.read_gro(self.gro)
+        self.assertEqual(len(gro), NCHAINS * CHAIN_ATOMS + 3 * NWATER)
+        self.assertEqual(gro.resname[0], 'ARG')
+        self.assertEqual(gro.atomname[-1], 'HW2')
+        self.assertEqual(gro.unwrapped(), 99999)
+        self.assertEqual(numpy.sum(~gro.sol), NCHAINS * CHAIN_ATOMS)
+
+    def testReadGroFlat(self):
+        # the atom numbers wrap around in the water, which must not alias
+        # the selected atoms
+        ref = ref_readgro_flat(self.gro, self.ndx, NCHAINS * CHAIN_ATOMS)
+        d = rwgro.readgro_flat(self.gro, self.ndx)
+        self.assertEqual(len(d), 3 * len(self.ndx))
+        self.assertTrue(numpy.allclose(d, ref))
+
+    def testReadXvg(self):
+        rsel = res_selection.res_select(self.gro, self.ndx)
+        ref = ref_readxvg_flat(self.xvg, rsel)
+        self.assertTrue(numpy.allclose(readxvg.readxvg_flat(self.xvg, rsel),
+                                       ref))
+        d = readxvg.readxvg(self.xvg, rsel)
+        self.assertEqual(sorted(d.keys()), sorted([ r for r in rsel
+                                                    if 2 <= r < CHAIN_RES ]))
+        for r in d:
+            self.assertEqual(len(d[r]), NCHAINS)
+
+    def testResSelect(self):
+        prot = res_selection._read_protein(self.gro)
+        ref = list(set([ prot[a - 1].resnr for a in self.ndx ]))
+        self.assertEqual(res_selection.res_select(self.gro, self.ndx), ref)
+        self.assertEqual(res_selection.read_ndx(self.ndxfn), self.ndx)
+
+    def testCache(self):
+        ndx = gmx_readers.read_ndx(self.ndxfn)
+        self.assertTrue(gmx_readers.read_ndx(self.ndxfn) is ndx)
+        # a changed file is read again
+        with open(self.ndxfn, 'w') as f:
+            f.write('[ Selection ]\n1 2 3\n')
+        st = os.stat(self.ndxfn)
+        os.utime(self.ndxfn, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(gmx_readers.read_ndx(self.ndxfn).tolist(), [1, 2, 3])
+
+    def testMolecule(self):
+        top = os.path.join(self.dir, 'topol.itp')
+        with open(top, 'w') as f:
+            f.write('[ atoms ]\n; nr type resnr res atom\n')
+            f.write('1 N 1 ARG N 1 0.0 14.0\n2 C 1 ARG CA 1 0.0 12.0\n')
+            f.write('[ bonds ]\n1 2 1\n')
+        mol = molecule.molecule(top)
+        self.assertEqual([ a.atomname for a in mol ], [ 'N', 'CA' ])
+        self.assertTrue(molecule.molecule(top) is mol)
+
+    def testDihedrals(self):
+        dihndx = os.path.join(self.dir, 'dih.ndx')
+        with open(dihndx, 'w') as f:
+            f.write('[ dihedrals ]\n%s\n' %
+                    ' '.join([ str(a) for a in range(1, 4001) ]))
+        ref = ref_dihedrals(self.gro, dihndx)
+        d = calc_dihedrals.dihedrals(self.gro, dihndx)
+        self.assertEqual(len(d), 1000)
+        self.assertTrue(numpy.allclose(d, ref))
+
+    @unittest.skipUnless(os.environ.get('CPC_BENCHMARKS'),
+                         "set CPC_BENCHMARKS to run benchmarks")
+    def testBenchmark(self):
+        """Time the readers on a GLIC-sized system against the original
+           readers."""
+        t0 = time.time()
+        ref_readgro_flat(self.gro, self.ndx, NCHAINS * CHAIN_ATOMS)
+        t1 = time.time()
+        rwgro.readgro_flat(self.gro, self.ndx)
+        t2 = time.time()
+        self.assertTrue(t2 - t1 < t1 - t0)
+
+        rsel = res_selection.res_select(self.gro, self.ndx)
+        t0 = time.time()
+        ref_readxvg_flat(self.xvg, rsel)
+        t1 = time.time()
+        readxvg.readxvg_flat(self.xvg, rsel)
+        t2 = time.time()
+        self.assertTrue(t2 - t1 < t1 - t0)
+
+        t0 = time.time()
+        prot = res_selection._read_protein(self.gro)
+        list(set([ prot[a - 1].resnr for a in self.ndx ]))
+        t1 = time.time()
+        res_selection.res_select(self.gro, self.ndx)
+        t2 = time.time()
+        res_selection.res_select(self.gro, self.ndx)
+        t3 = time.time()
+        self.assertTrue(t3 - t2 < t1 - t0)
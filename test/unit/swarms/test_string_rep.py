@@ -0,0 +1,144 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import unittest
+import math
+import random
+import numpy
+from cpc.lib.swarms import string_rep
+
+
+# The original pure-python reparametrization, as reference. It needs a
+# padding point at the end of the string.
+def ref_dist(v1, v2):
+    return sum([ (y-x)**2 for x, y in zip(v1, v2) ])**(.5)
+
+def ref_L(n, path):
+    if n==0:
+        return 1
+    pathlength = 0
+    for i in range(n - 1):
+        pathlength += ref_dist(path[i], path[i + 1])
+    return pathlength
+
+def ref_s(m, path):
+    R = len(path) - 1
+    return (m - 1) * ref_L(R, path) / (R - 1)
+
+def ref_rep_pts(newpts):
+    adjusted = [ newpts[0], newpts[ len(newpts) - 1 ] ]
+    for i in range(2, len(newpts)):
+        k = 2
+        while (ref_L(k - 1, newpts) >= ref_s(i, newpts) or
+               ref_s(i, newpts) > ref_L(k, newpts)):
+            k += 1
+        d = ref_dist(newpts[k - 2], newpts[k - 1])
+        scale = (ref_s(i, newpts) - ref_L(k - 1, newpts)) / d
+        reppt = [ x + scale*(y - x) for x, y in zip(newpts[k - 2],
+                                                     newpts[k - 1]) ]
+        adjusted.insert(i - 1, reppt)
+    return adjusted
+
+def ref_max_spread(adjusted):
+    dists = [ ref_dist(adjusted[i], adjusted[i + 1])
+              for i in range(len(adjusted) - 2) ]
+    avgdist = sum(dists) / (len(adjusted) - 1)
+    return max([ abs(d - avgdist) for d in dists ])
+
+def make_string(npts, ncvs, seed=1):
+    """Make a noisy curved string."""
+    rnd = random.Random(seed)
+    pts = []
+    for i in range(npts):
+        t = i / float(npts - 1)
+        pt = [ math.sin(2.*t + 0.1*j) + (t**2)*(j%3) + 0.05*rnd.random()
+               for j in range(ncvs) ]
+        pts.append(pt)
+    return pts
+
+
+class TestStringRep(unittest.TestCase):
+    def testEquidistant(self):
+        pts = string_rep.rep_pts(make_string(12, 20))
+        dists = numpy.diff(string_rep.arc_length(pts))
+        # all points are on the input path, so the distances can only be
+        # smaller than the average where the path has a corner.
+        self.assertTrue(numpy.all(dists <= dists.mean()*1.05))
+
+    def testEndpointsFixed(self):
+        inp = make_string(8, 6)
+        pts = string_rep.rep_pts(inp)
+        self.assertTrue(numpy.allclose(pts[0], inp[0]))
+        self.assertTrue(numpy.allclose(pts[-1], inp[-1]))
+
+    def testStraightLine(self):
+        inp = [ [0., 0.], [0.1, 0.2], [1.5, 3.], [2., 4.] ]
+        pts = string_rep.rep_pts(inp)
+        expected = [ [2.*i/3., 4.*i/3.] for i in range(4) ]
+        self.assertTrue(numpy.allclose(pts, expected))
+        self.assertTrue(string_rep.max_spread(pts) >= 0.)
+
+    def testDegenerate(self):
+        inp = [ [1., 1.] ] * 4
+        pts = string_rep.rep_pts(inp)
+        self.assertTrue(numpy.allclose(pts, inp))
+        self.assertEqual(len(string_rep.rep_pts([ [0., 1.], [2., 3.] ])), 2)
+
+    def testReference(self):
+        inp = make_string(10, 15)
+        ref = ref_rep_pts(inp + [ [0.]*15 ])[:-1]
+        pts = string_rep.rep_pts(inp)
+        self.assertTrue(numpy.allclose(pts, ref))
+
+    def testIterateReference(self):
+        inp = make_string(8, 4)
+        ref = ref_rep_pts(inp + [ [0.]*4 ])
+        maxspread = 100.
+        niter = 0
+        while niter < 10 and maxspread > 0.012:
+            ref = ref_rep_pts(ref)
+            maxspread = ref_max_spread(ref)
+            niter += 1
+        pts, spread, i = string_rep.reparametrize_string(inp, maxiter=10)
+        self.assertEqual(i, niter)
+        self.assertAlmostEqual(spread, maxspread)
+        self.assertTrue(numpy.allclose(pts, ref[:-1]))
+
+    def testFixedIterations(self):
+        pts, spread, i = string_rep.reparametrize_string(make_string(5, 3),
+                                                         maxiter=7,
+                                                         tolerance=None)
+        self.assertEqual(i, 7)
+
+
+class TestStringRepLarge(unittest.TestCase):
+    """One reparametrization pass of a position restraint string, against
+       the original implementation."""
+    def testLarge(self):
+        npts = 16
+        ncvs = 3*1555
+        inp = make_string(npts, ncvs)
+        ref = ref_rep_pts(inp + [ [0.]*ncvs ])[:-1]
+        pts = string_rep.rep_pts(inp)
+        self.assertTrue(numpy.allclose(pts, ref))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import cpc.command.executable
+import cpc.util.plugin
+from cpc.command.executable import ExecutableList
+from cpc.command.executable_cache import ExecutableCache
+from cpc.command.platform import Platform
+
+
+class FakeExecutablePlugin(object):
+    """An executable plugin that reports the binaries in its run count."""
+    runs=0
+    def __init__(self, location, conf):
+        self.location=location
+    def run(self, dir, platform):
+        FakeExecutablePlugin.runs+=1
+        out='<?xml version="1.0"?>\n<executable-list>\n'
+        out+=('<executable name="gromacs/mdrun" platform="%s" arch="" '
+              'version="5.0">\n'%platform)
+        out+='  <run in_path="yes" cmdline="$MPIRUN gmx mdrun -nt 1" />\n'
+        out+='</executable>\n</executable-list>\n'
+        return (0, out)
+
+
+class TestExecutableCache(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        # the executables dir with a plugin
+        self.execDir=os.path.join(self.dir, "executables")
+        os.makedirs(os.path.join(self.execDir, "gromacs"))
+        self.plugin=os.path.join(self.execDir, "gromacs", "plugin")
+        self.writeFile(self.plugin, "#!/bin/sh\n", 0755)
+        # a directory with binaries in the search path
+        self.binDir=os.path.join(self.dir, "bin")
+        os.mkdir(self.binDir)
+        self.gmx=os.path.join(self.binDir, "gmx")
+        self.writeFile(self.gmx, "#!/bin/sh\n", 0755)
+        self.oldPath=os.environ.get('PATH', '')
+        os.environ['PATH']="%s:%s"%(self.binDir, self.oldPath)
+        self.cacheFile=os.path.join(self.dir, "cache.json")
+        self.platforms=[ Platform("smp", "", False),
+                         Platform("mpi", "", False) ]
+        self.oldPlugin=cpc.util.plugin.ExecutablePlugin
+        self.oldServerConf=cpc.command.executable.ServerConf
+        cpc.util.plugin.ExecutablePlugin=FakeExecutablePlugin
+        cpc.command.executable.ServerConf=lambda: None
+        FakeExecutablePlugin.runs=0
+
+    def tearDown(self):
+        cpc.util.plugin.ExecutablePlugin=self.oldPlugin
+        cpc.command.executable.ServerConf=self.oldServerConf
+        os.environ['PATH']=self.oldPath
+        shutil.rmtree(self.dir)
+
+    def writeFile(self, name, contents, mode=0644):
+        outf=open(name, "w")
+        outf.write(contents)
+        outf.close()
+        os.chmod(name, mode)
+
+    def readExecutables(self, rescan=False):
+        cache=ExecutableCache(self.cacheFile, rescan)
+        exelist=ExecutableList([])
+        exelist.readDir(self.execDir, self.platforms, cache)
+        cache.save()
+        return exelist
+
+    def testCached(self):
+        exelist=self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 2)
+        self.assertEqual(len(exelist.executables), 2)
+        exelist=self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 2)
+        self.assertEqual(sorted(exe.platform for exe in exelist.executables),
+                         [ "mpi", "smp" ])
+        self.assertEqual(exelist.executables[0].cmdline,
+                         "$MPIRUN gmx mdrun -nt 1")
+        # a forced rescan
+        self.readExecutables(rescan=True)
+        self.assertEqual(FakeExecutablePlugin.runs, 4)
+
+    def testInvalidation(self):
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 2)
+        # a changed binary
+        self.writeFile(self.gmx, "#!/bin/sh\n# a new version\n", 0755)
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 4)
+        # a changed plugin
+        self.writeFile(self.plugin, "#!/bin/sh\n# a new version\n", 0755)
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 6)
+        # a different search path
+        os.environ['PATH']=self.binDir
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 8)
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 8)
+        # a newly installed binary in the search path
+        time.sleep(0.01)
+        self.writeFile(os.path.join(self.binDir, "mdrun_mpi"), "#!/bin/sh\n",
+                       0755)
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 10)
+
+    def testCorruptCache(self):
+        self.writeFile(self.cacheFile, "{ not json")
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 2)
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 2)
+
+    def testUntrustedCache(self):
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 2)
+        # the saved cache is only writable by its owner
+        self.assertEqual(os.stat(self.cacheFile).st_mode & 0077, 0)
+        # a cache file that others can write is ignored
+        os.chmod(self.cacheFile, 0666)
+        self.readExecutables()
+        self.assertEqual(FakeExecutablePlugin.runs, 4)
+        # and so is a link
+        linked=os.path.join(self.dir, "linked.json")
+        os.rename(self.cacheFile, linked)
+        os.chmod(linked, 0600)
+        os.symlink(linked, self.cacheFile)
+        cache=ExecutableCache(self.cacheFile)
+        self.assertEqual(cache.entries, dict())
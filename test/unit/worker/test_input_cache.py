@@ -0,0 +1,147 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import os
+import shutil
+import tarfile
+import tempfile
+import cpc.util.file
+from cpc.command.input_blobs import InputPackager, fileHash
+from cpc.worker.input_cache import InputCache
+
+
+class TestInputCache(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.serverDir=os.path.join(self.dir, "server")
+        os.mkdir(self.serverDir)
+        self.cache=InputCache(os.path.join(self.dir, "cache"), 3*100000)
+        self.iteration=0
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def makeCmdDir(self, name, files):
+        """Make a server-side command directory with a dict of files."""
+        cmddir=os.path.join(self.serverDir, name)
+        os.makedirs(os.path.join(cmddir, "sub"))
+        for fname, contents in files.iteritems():
+            outf=open(os.path.join(cmddir, fname), "w")
+            outf.write(contents)
+            outf.close()
+        return cmddir
+
+    def dispatch(self, cmddirs, useCache=True):
+        """Package command directories as the server does, and extract them
+           as the worker does.
+           returns: a tuple of the run directory and the tar file size."""
+        tff=tempfile.TemporaryFile()
+        tf=tarfile.open(fileobj=tff, mode="w:gz")
+        if useCache:
+            blobs=self.cache.getHashes()
+        else:
+            blobs=None
+        packager=InputPackager(tf, blobs, 1000)
+        for cmddir in cmddirs:
+            packager.addCommandDir(cmddir, os.path.basename(cmddir))
+        packager.finish()
+        tf.close()
+        size=tff.tell()
+        tff.seek(0)
+        rundir=os.path.join(self.dir, "run%d"%self.iteration)
+        self.iteration+=1
+        cpc.util.file.extractSafely(rundir, fileobj=tff)
+        self.cache.unpack(rundir)
+        return (rundir, size)
+
+    def checkFiles(self, rundir, name, files):
+        for fname, contents in files.iteritems():
+            inf=open(os.path.join(rundir, name, fname))
+            self.assertEqual(inf.read(), contents)
+            inf.close()
+
+    def testReuse(self):
+        topol=os.urandom(100000)
+        files={ "topol.tpr" : topol, "sub/index.ndx" : os.urandom(50000),
+                "command.xml" : "<command/>" }
+        cmd0=self.makeCmdDir("cmd0", files)
+        rundir, size0=self.dispatch([cmd0])
+        self.checkFiles(rundir, "cmd0", files)
+        self.assertEqual(sorted(os.listdir(rundir)), [ "cmd0" ])
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.cache.hits, 0)
+        # the same topology with a different command
+        files2={ "topol.tpr" : topol, "sub/index.ndx" : os.urandom(50000),
+                 "command.xml" : "<command/>" }
+        cmd1=self.makeCmdDir("cmd1", files2)
+        rundir, size1=self.dispatch([cmd1])
+        self.checkFiles(rundir, "cmd1", files2)
+        self.assertTrue(size1 < size0-90000)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 3)
+        self.assertEqual(self.cache.bytesSaved, 100000)
+        # cached files are linked in
+        st=os.stat(os.path.join(rundir, "cmd1", "topol.tpr"))
+        self.assertEqual(st.st_ino,
+                         os.stat(os.path.join(self.cache.cacheDir,
+                                              fileHash(os.path.join(cmd0,
+                                                       "topol.tpr")))).st_ino)
+
+    def testSameTar(self):
+        topol=os.urandom(100000)
+        cmddirs=[ self.makeCmdDir("cmd%d"%i, { "topol.tpr" : topol })
+                  for i in range(4) ]
+        rundir, size=self.dispatch(cmddirs)
+        for i in range(4):
+            self.checkFiles(rundir, "cmd%d"%i, { "topol.tpr" : topol })
+        # sent only once
+        self.assertTrue(size < 2*100000)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 3)
+
+    def testEviction(self):
+        contents=[ os.urandom(100000) for i in range(4) ]
+        cmddirs=[ self.makeCmdDir("cmd%d"%i, { "topol.tpr" : contents[i] })
+                  for i in range(4) ]
+        for cmddir in cmddirs[0:3]:
+            self.dispatch([cmddir])
+        self.assertEqual(len(self.cache.getHashes()), 3)
+        # use cmd0's file again, so cmd1's is the least recently used
+        self.dispatch(cmddirs[0:1])
+        rundir, size=self.dispatch(cmddirs[3:4])
+        self.checkFiles(rundir, "cmd3", { "topol.tpr" : contents[3] })
+        hashes=self.cache.getHashes()
+        self.assertEqual(len(hashes), 3)
+        self.assertFalse(fileHash(os.path.join(cmddirs[1], "topol.tpr"))
+                         in hashes)
+        self.assertTrue(fileHash(os.path.join(cmddirs[0], "topol.tpr"))
+                        in hashes)
+        self.assertTrue(self.cache.size <= 3*100000)
+        # files in run directories stay in place
+        self.checkFiles(os.path.join(self.dir, "run1"), "cmd1",
+                        { "topol.tpr" : contents[1] })
+
+    def testNoCache(self):
+        files={ "topol.tpr" : os.urandom(100000), "command.xml" : "<c/>" }
+        cmd0=self.makeCmdDir("cmd0", files)
+        rundir, size=self.dispatch([cmd0], useCache=False)
+        self.checkFiles(rundir, "cmd0", files)
+        self.assertEqual(self.cache.misses, 0)
+        self.assertEqual(self.cache.getHashes(), [])
@@ -0,0 +1,135 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import unittest
+import threading
+import time
+import tempfile
+from cpc.worker.uploader import ResultUploader
+
+
+class FakeCmd(object):
+    def __init__(self, id):
+        self.id=id
+
+
+class FakeWorkload(object):
+    """A workload with results that can only be sent after a number of
+       failed attempts."""
+    def __init__(self, id, failures=0, sendTime=0., joinedTo=None):
+        self.cmd=FakeCmd(id)
+        self.failures=failures
+        self.sendTime=sendTime
+        self.joinedTo=joinedTo or []
+        self.uploadPending=False
+        self.attempts=0
+        self.sent=None
+    def packResults(self):
+        tff=tempfile.TemporaryFile()
+        tff.write("results of %s"%self.cmd.id)
+        tff.seek(0)
+        return tff
+    def sendResults(self, tff):
+        self.attempts+=1
+        time.sleep(self.sendTime)
+        if self.attempts <= self.failures:
+            raise IOError("connection refused")
+        self.sent=tff.read()
+
+
+class TestResultUploader(unittest.TestCase):
+    def setUp(self):
+        self.condVar=threading.Condition()
+        self.done=[]
+
+    def makeUploader(self, nthreads=2, maxQueued=4, maxRetries=2):
+        uploader=ResultUploader(self.condVar, nthreads, maxQueued, maxRetries,
+                                retryDelay=0.01, doneFn=self.done.append)
+        uploader.start()
+        return uploader
+
+    def testUpload(self):
+        uploader=self.makeUploader()
+        joined=FakeWorkload("b")
+        workload=FakeWorkload("a", joinedTo=[joined])
+        uploader.submit(workload)
+        uploader.stop()
+        self.assertEqual(workload.sent, "results of a")
+        self.assertEqual(joined.sent, "results of b")
+        self.assertEqual(set(self.done), set([workload, joined]))
+        self.assertFalse(workload.uploadPending)
+        self.assertEqual(uploader.getPending(), [])
+
+    def testRetry(self):
+        uploader=self.makeUploader(maxRetries=2)
+        retried=FakeWorkload("a", failures=2)
+        failed=FakeWorkload("b", failures=3)
+        uploader.submit(retried)
+        uploader.submit(failed)
+        uploader.stop()
+        self.assertEqual(retried.attempts, 3)
+        self.assertEqual(retried.sent, "results of a")
+        self.assertEqual(failed.attempts, 3)
+        self.assertEqual(failed.sent, None)
+        # failed uploads are done too: they are not retried forever.
+        self.assertEqual(set(self.done), set([retried, failed]))
+
+    def testPending(self):
+        uploader=self.makeUploader(nthreads=1)
+        workload=FakeWorkload("a", sendTime=0.2)
+        uploader.submit(workload)
+        self.assertEqual(uploader.getPending(), [workload])
+        self.assertTrue(workload.uploadPending)
+        uploader.stop()
+        self.assertEqual(uploader.getPending(), [])
+
+    def testBackpressure(self):
+        uploader=self.makeUploader(nthreads=1, maxQueued=1)
+        workloads=[ FakeWorkload(str(i), sendTime=0.1) for i in range(3) ]
+        start=time.time()
+        for workload in workloads:
+            uploader.submit(workload)
+        # the third submit has to wait for the first upload to finish
+        self.assertTrue(time.time()-start >= 0.09)
+        uploader.stop()
+        for workload in workloads:
+            self.assertEqual(workload.attempts, 1)
+
+    def testPendingWhileBlocked(self):
+        uploader=self.makeUploader(nthreads=1, maxQueued=1)
+        workloads=[ FakeWorkload(str(i), sendTime=0.1) for i in range(4) ]
+        with self.condVar:
+            for workload in workloads:
+                uploader.addPending(workload)
+        submitter=threading.Thread(target=lambda: [ uploader.submit(wl) 
+                                                    for wl in workloads ])
+        submitter.start()
+        time.sleep(0.05)
+        # the workloads that wait for room in the queue are pending too
+        self.assertEqual(set(uploader.getPending()), set(workloads))
+        submitter.join()
+        uploader.stop()
+        self.assertEqual(uploader.getPending(), [])
+        for workload in workloads:
+            self.assertEqual(workload.attempts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
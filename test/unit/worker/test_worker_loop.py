@@ -0,0 +1,110 @@
+# This file is part of Copernicus
+# http://www.copernicus-computing.org/
+# 
+# Copyright (C) 2011, Sander Pronk, Iman Pouya, Erik Lindahl, and others.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published 
+# by the Free Software Foundation
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+import threading
+import time
+from cpc.worker.worker import Worker
+
+
+class FakeWorkload(object):
+    def __init__(self):
+        self.running=True
+
+
+class LoopWorker(Worker):
+    """A worker with only the state needed for its waiting loop."""
+    def __init__(self, nworkloads, remainingResources):
+        self.runLock=threading.Lock()
+        self.runCondVar=threading.Condition(self.runLock)
+        self.acceptCommands=True
+        self.workloads=[ FakeWorkload() for i in range(nworkloads) ]
+        self.remainingResources=remainingResources
+    def _haveRemainingResources(self):
+        return self.remainingResources
+    def finishLater(self, workloads, delay):
+        """Mark workloads as finished after a delay, like a workload's run
+           thread does."""
+        def finish():
+            with self.runCondVar:
+                for workload in workloads:
+                    workload.running=False
+                self.runCondVar.notifyAll()
+        timer=threading.Timer(delay, finish)
+        timer.start()
+        return timer
+
+
+class TestWorkerLoop(unittest.TestCase):
+    pollTime=2.
+    coalesceTime=0.2
+
+    def wait(self, worker, gotWork=False):
+        start=time.time()
+        finished=worker._waitForWorkloads(start, gotWork, self.pollTime,
+                                          self.coalesceTime)
+        return finished, time.time()-start
+
+    def testFinishedImmediately(self):
+        worker=LoopWorker(1, False)
+        timer=worker.finishLater(worker.workloads, 0.05)
+        finished, waitTime=self.wait(worker)
+        timer.join()
+        self.assertEqual(finished, worker.workloads)
+        # all workloads finished: no need to wait for others.
+        self.assertTrue(waitTime < self.coalesceTime)
+
+    def testCoalesce(self):
+        worker=LoopWorker(3, False)
+        timers=[ worker.finishLater(worker.workloads[:1], 0.05),
+                 worker.finishLater(worker.workloads[1:2], 0.1) ]
+        finished, waitTime=self.wait(worker)
+        for timer in timers:
+            timer.join()
+        self.assertEqual(finished, worker.workloads[:2])
+        self.assertTrue(waitTime >= 0.05+self.coalesceTime)
+        self.assertTrue(waitTime < 0.5*self.pollTime)
+
+    def testFreeResources(self):
+        worker=LoopWorker(1, True)
+        # after getting work, the worker asks for more right away
+        finished, waitTime=self.wait(worker, True)
+        self.assertEqual(finished, [])
+        self.assertTrue(waitTime < 0.1)
+        # otherwise it waits for a workload to finish, or the poll time
+        timer=worker.finishLater(worker.workloads, 0.05)
+        finished, waitTime=self.wait(worker)
+        timer.join()
+        self.assertEqual(len(finished), 1)
+        self.assertTrue(waitTime < 0.5*self.pollTime)
+        worker.workloads=[]
+        finished, waitTime=self.wait(worker)
+        self.assertEqual(finished, [])
+        self.assertTrue(waitTime >= self.pollTime)
+
+    def testQuit(self):
+        worker=LoopWorker(0, True)
+        worker.acceptCommands=False
+        finished, waitTime=self.wait(worker)
+        self.assertEqual(finished, [])
+        self.assertTrue(waitTime < 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()